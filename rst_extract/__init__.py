@@ -5,18 +5,40 @@ from Python files. It is useful for extracting docstrings from Python files and
 converting them to reStructuredText.
 """
 
-# Initialize logging if no other logging system is instantiated.
-import logging
+import importlib
+import typing
 
-from . import cli, extractor
-from .api import extract
-from .extractor import Extractor
-from .logs import configure_logging
-from .validator import Validator
+if typing.TYPE_CHECKING:
+    from . import cli, extractor
+    from .api import extract
+    from .extractor import Extractor
+    from .session import ExtractionSession
+    from .validator import Validator
 
-if not logging.getLogger().handlers:
-    # Use structlog for logging.
-    configure_logging(verbose=0)
+# These pull in structlog, click and pydantic, so they are only imported when
+# used: the daemon client (rst_extract.client) then starts without them.
+# Logging is initialized when the extractor is imported (see logs.py).
+_LAZY_ATTRIBUTES = {
+    'cli': ('.cli', None),
+    'extract': ('.api', 'extract'),
+    'extractor': ('.extractor', None),
+    'Extractor': ('.extractor', 'Extractor'),
+    'ExtractionSession': ('.session', 'ExtractionSession'),
+    'Validator': ('.validator', 'Validator'),
+}
+
+
+def __getattr__(name: str) -> typing.Any:
+    """Import the lazily loaded attributes on first use."""
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    module_name, attribute = _LAZY_ATTRIBUTES[name]
+    module = importlib.import_module(module_name, __name__)
+    value = module if attribute is None else getattr(module, attribute)
+    globals()[name] = value
+
+    return value
 
 
 __all__ = [
@@ -24,5 +46,6 @@ __all__ = [
     'extract',
     'extractor',
     'Extractor',
+    'ExtractionSession',
     'Validator',
 ]
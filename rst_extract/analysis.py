@@ -0,0 +1,293 @@
+"""Static analysis of extracted code blocks with ``ast``.
+
+Blocks are analysed on their own: the names a block imports, binds and uses
+only depend on its text, so results can be stored by block hash.
+``BlockGraph`` then links the blocks of a document that use names bound by
+earlier blocks.
+"""
+
+import ast
+import builtins
+from collections.abc import Iterable, Sequence
+from typing import NamedTuple
+
+import structlog
+
+log = structlog.get_logger()
+
+
+class BlockNames(NamedTuple):
+    """The names found in a block.
+
+    Attributes
+    ----------
+    imports : frozenset[str]
+        The modules imported, and the fully qualified names imported from
+        them (``from os import path`` gives ``os`` and ``os.path``).
+
+    defines : frozenset[str]
+        The names bound at the top level of the block by assignments,
+        functions and classes (not by imports).
+
+    valid : bool
+        Whether the block could be parsed. Invalid blocks have no names.
+    """
+
+    imports: frozenset[str]
+    defines: frozenset[str]
+    valid: bool = True
+
+
+class _NameCollector(ast.NodeVisitor):
+    """Collect the imports and top-level bindings of a module."""
+
+    imports: set[str]
+    defines: set[str]
+    imported: set[str]
+    wildcard: bool
+
+    def __init__(self) -> None:
+        """Initialize the collector with no names."""
+        self.imports = set()
+        self.defines = set()
+        self.imported = set()
+        self.wildcard = False
+
+    def visit_Import(self, node: ast.Import) -> None:  # noqa: N802
+        """Record ``import a.b [as c]``."""
+        for alias in node.names:
+            self.imports.add(alias.name)
+            self.imported.add(alias.asname or alias.name.partition('.')[0])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:  # noqa: N802
+        """Record ``from a import b [as c]``."""
+        module = '.' * node.level + (node.module or '')
+        self.imports.add(module)
+
+        for alias in node.names:
+            if alias.name == '*':
+                self.wildcard = True
+                continue
+
+            separator = '' if module.endswith('.') else '.'
+            self.imports.add(f'{module}{separator}{alias.name}')
+            self.imported.add(alias.asname or alias.name)
+
+    def _visit_definition(
+        self, node: ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef
+    ) -> None:
+        """Record the name of a definition, without entering its body."""
+        self.defines.add(node.name)
+
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+
+    visit_FunctionDef = _visit_definition  # noqa: N815
+    visit_AsyncFunctionDef = _visit_definition  # noqa: N815
+    visit_ClassDef = _visit_definition  # noqa: N815
+
+    def visit_Lambda(self, node: ast.Lambda) -> None:  # noqa: N802
+        """Skip lambdas, whose arguments are local."""
+
+    def _visit_comprehension(
+        self,
+        node: ast.ListComp | ast.SetComp | ast.DictComp | ast.GeneratorExp,
+    ) -> None:
+        """Skip comprehensions, whose targets are local."""
+
+    visit_ListComp = _visit_comprehension  # noqa: N815
+    visit_SetComp = _visit_comprehension  # noqa: N815
+    visit_DictComp = _visit_comprehension  # noqa: N815
+    visit_GeneratorExp = _visit_comprehension  # noqa: N815
+
+    def visit_Name(self, node: ast.Name) -> None:  # noqa: N802
+        """Record names assigned to (or deleted)."""
+        if isinstance(node.ctx, (ast.Store, ast.Del)):
+            self.defines.add(node.id)
+
+
+def block_names(text: str) -> BlockNames:
+    """Get the names imported and defined by the code ``text``."""
+    try:
+        tree = ast.parse(text)
+
+    except (SyntaxError, ValueError):
+        log.debug('Block could not be parsed')
+        return BlockNames(frozenset(), frozenset(), valid=False)
+
+    collector = _NameCollector()
+    collector.visit(tree)
+
+    return BlockNames(
+        frozenset(collector.imports), frozenset(collector.defines)
+    )
+
+
+class DefUse(NamedTuple):
+    """The names a block binds, and the names it uses.
+
+    Attributes
+    ----------
+    binds : frozenset[str]
+        The names bound (or deleted) at the top level of the block,
+        including imports, and names declared ``global`` in functions.
+
+    uses : frozenset[str]
+        The names read anywhere in the block, builtins excluded. Names read
+        in function bodies are included, as the function may be called
+        later; this over-approximates, so no dependency is missed.
+
+    wildcard : bool
+        Whether the block has a ``from ... import *``, which may bind any
+        name.
+
+    valid : bool
+        Whether the block could be parsed.
+    """
+
+    binds: frozenset[str]
+    uses: frozenset[str]
+    wildcard: bool = False
+    valid: bool = True
+
+
+_BUILTINS = frozenset(dir(builtins))
+
+
+def def_use(text: str) -> DefUse:
+    """Get the names bound and used by the code ``text``."""
+    try:
+        tree = ast.parse(text)
+
+    except (SyntaxError, ValueError):
+        log.debug('Block could not be parsed')
+        return DefUse(frozenset(), frozenset(), valid=False)
+
+    collector = _NameCollector()
+    collector.visit(tree)
+    binds = collector.defines | collector.imported
+    uses = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            uses.add(node.id)
+
+        elif isinstance(node, ast.AugAssign) and isinstance(
+            node.target, ast.Name
+        ):
+            uses.add(node.target.id)
+
+        elif isinstance(node, ast.Global):
+            binds.update(node.names)
+
+    return DefUse(
+        frozenset(binds), frozenset(uses - _BUILTINS), collector.wildcard
+    )
+
+
+class BlockGraph:
+    """Dependencies between the blocks of a document.
+
+    A block depends on every earlier block that binds a name it uses, or
+    that uses such a name too (and may have changed the object, e.g., by
+    calling a method on it). It also depends on every earlier block using a
+    name it binds: a function defined earlier may read a global bound later.
+    Blocks that cannot be parsed, and blocks with a wildcard import, are
+    dependencies of every later block.
+
+    Attributes
+    ----------
+    names : list[DefUse]
+        The names bound and used by each block.
+
+    dependencies : list[set[int]]
+        The indices of the blocks each block directly depends on.
+    """
+
+    names: list[DefUse]
+    dependencies: list[set[int]]
+
+    def __init__(self, texts: Sequence[str]):
+        """Analyse the blocks ``texts``, in document order."""
+        self.names = [def_use(text) for text in texts]
+        self.dependencies = []
+
+        # The blocks touching (or only using) each name so far, and the
+        # catch-all blocks.
+        touching: dict[str, set[int]] = {}
+        using: dict[str, set[int]] = {}
+        everything: set[int] = set()
+
+        for index, names in enumerate(self.names):
+            dependencies = set(everything)
+
+            for name in names.uses:
+                dependencies |= touching.get(name, set())
+
+            for name in names.binds:
+                dependencies |= using.get(name, set())
+
+            self.dependencies.append(dependencies)
+
+            if names.wildcard or not names.valid:
+                everything.add(index)
+
+            for name in names.binds | names.uses:
+                touching.setdefault(name, set()).add(index)
+
+            for name in names.uses:
+                using.setdefault(name, set()).add(index)
+
+    def __len__(self) -> int:
+        """Get the number of blocks."""
+        return len(self.names)
+
+    def prerequisites(self, indices: Iterable[int]) -> set[int]:
+        """Get ``indices`` and the blocks they (indirectly) depend on."""
+        found = set(indices)
+        pending = list(found)
+
+        while pending:
+            for dependency in self.dependencies[pending.pop()]:
+                if dependency not in found:
+                    found.add(dependency)
+                    pending.append(dependency)
+
+        return found
+
+    def dependents(self, indices: Iterable[int]) -> set[int]:
+        """Get ``indices`` and the blocks (indirectly) depending on them."""
+        found = set(indices)
+
+        # Dependencies always come first, so one pass in order suffices.
+        for index, dependencies in enumerate(self.dependencies):
+            if index not in found and dependencies & found:
+                found.add(index)
+
+        return found
+
+    def groups(self) -> list[list[int]]:
+        """Split the blocks into groups sharing no state.
+
+        Blocks linked by a dependency, directly or not, are in the same
+        group. Groups are in order of their first block, and each group is
+        in document order.
+        """
+        group_of: dict[int, list[int]] = {}
+        groups = []
+
+        for index, dependencies in enumerate(self.dependencies):
+            linked = {id(group_of[d]): group_of[d] for d in dependencies}
+            group = [index]
+
+            for other in linked.values():
+                group.extend(other)
+                groups.remove(other)
+
+            group.sort()
+            groups.append(group)
+
+            for member in group:
+                group_of[member] = group
+
+        return sorted(groups)
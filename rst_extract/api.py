@@ -4,10 +4,12 @@ import os
 import sys
 from pathlib import Path
 
-# TODO(teald): Bring this out of the CLI.
-from .cli import execute_command
+from .assembler import DEFAULT_HEADER_TEMPLATE
+from .doctests import doctest_registry
+from .execution import execute_command
 from .extractor import Extractor
 from .logs import configure_logging
+from .sourcemap import sidecar_path
 
 
 def extract(
@@ -17,9 +19,15 @@ def extract(
     *,
     execute: bool = False,
     verbose: int = 0,
+    header_template: str = DEFAULT_HEADER_TEMPLATE,
+    source_map: bool = False,
+    doctest: bool = False,
 ) -> str:
     """Extract reStructuredText from Python files.
 
+    Each call configures logging and starts a new interpreter to execute
+    the code; to extract many times, use ``session.ExtractionSession``.
+
     Arguments
     ---------
     filename : os.PathLike[str]
@@ -38,6 +46,18 @@ def extract(
         The verbosity level. 0 is the default, 1 is INFO, 2 is DEBUG. Default
         is 0.
 
+    header_template : str
+        Template for the header line written before each block, formatted
+        with the 1-based block ``number``. Default is ``'# Block {number}:'``.
+
+    source_map : bool
+        Whether to write a source map next to ``output``, mapping each line of
+        the output back to its line in the reStructuredText file. The sidecar
+        is named after the output, with ``.map.json`` appended.
+
+    doctest : bool
+        Whether to also extract doctest (``>>>``) examples as code.
+
     Returns
     -------
     str
@@ -49,17 +69,28 @@ def extract(
     safety guarantees.
     """
     configure_logging(verbose)
-    extractor = Extractor(filename)
+    extractor = Extractor(
+        filename,
+        header_template=header_template,
+        registry=doctest_registry() if doctest else None,
+    )
     result = extractor.extract()
 
     if output:
         with open(output, 'w') as f:
             f.write(result)
 
+        if source_map:
+            extractor.source_map.write(sidecar_path(output))
+
     if execute and Path(filename).exists():
         if python_bin is None:
             python_bin = sys.executable
 
-        execute_command(python_bin=python_bin, code=result)
+        execute_command(
+            python_bin=python_bin,
+            code=result,
+            source_map=extractor.source_map,
+        )
 
     return result
@@ -0,0 +1,201 @@
+"""Assemble extracted code blocks into a single output stream.
+
+Blocks are written straight to a text stream (an ``io.StringIO`` by default,
+or any open file handle) with a numbered header line before each block.
+Leading and trailing empty lines of each block are skipped by computing the
+trim bounds by index, so no intermediate per-line lists are built.
+
+If given a ``SourceMap``, the assembler also records where each written line
+came from.
+"""
+
+import io
+import os
+import typing
+from collections.abc import Iterable, Sequence
+
+import structlog
+
+from .sourcemap import SourceMap
+
+log = structlog.get_logger()
+
+DEFAULT_HEADER_TEMPLATE = '# Block {number}:'
+
+
+def trim_bounds(lines: Sequence[str]) -> tuple[int, int]:
+    """Get the bounds of ``lines`` without leading/trailing empty lines.
+
+    A line is considered empty if it only contains whitespace.
+
+    Arguments
+    ---------
+    lines : Sequence[str]
+        The lines to find the bounds for. This is not modified.
+
+    Returns
+    -------
+    tuple[int, int]
+        The ``(start, end)`` indices, such that ``lines[start:end]`` is the
+        trimmed block. ``start == end`` if all lines are empty.
+    """
+    start, end = 0, len(lines)
+
+    while start < end and not lines[start].strip():
+        start += 1
+
+    while end > start and not lines[end - 1].strip():
+        end -= 1
+
+    return start, end
+
+
+class OutputAssembler:
+    """Write code blocks, each with a numbered header, to a text stream."""
+
+    stream: typing.TextIO
+    header_template: str
+    block_count: int
+    source_map: SourceMap | None
+
+    def __init__(
+        self,
+        stream: typing.TextIO | None = None,
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+        source_map: SourceMap | None = None,
+    ):
+        """Initialize the OutputAssembler.
+
+        Arguments
+        ---------
+        stream : typing.TextIO | None
+            The stream to write to. If not provided, an ``io.StringIO`` is
+            used, and its contents are available through ``getvalue``.
+
+        header_template : str
+            Template for the line written before each block. It is formatted
+            with ``number``, the 1-based block number, and may span several
+            lines. Default is ``'# Block {number}:'``.
+
+        source_map : SourceMap | None
+            If provided, every line written is recorded in this map.
+
+        Raises
+        ------
+        ValueError
+            If the header template cannot be formatted with ``number``.
+        """
+        try:
+            _ = header_template.format(number=1)
+
+        except (
+            AttributeError,
+            IndexError,
+            KeyError,
+            TypeError,
+            ValueError,
+        ) as error:
+            raise ValueError(
+                f'Invalid header template {header_template!r}: only the '
+                f'{{number}} field is available.'
+            ) from error
+
+        self.stream = stream if stream is not None else io.StringIO()
+        self.header_template = header_template
+        self.block_count = 0
+        self.source_map = source_map
+
+    def write_block(
+        self,
+        lines: Sequence[str],
+        line_numbers: Sequence[int] | None = None,
+        source: str | os.PathLike[str] | None = None,
+    ) -> None:
+        """Write a single block, preceded by its header, to the stream.
+
+        Arguments
+        ---------
+        lines : Sequence[str]
+            The lines of the block.
+
+        line_numbers : Sequence[int] | None
+            The 0-based source line of each of ``lines``, used for the source
+            map. If not provided, the lines are recorded without a source.
+
+        source : str | os.PathLike[str] | None
+            The file the block came from, used for the source map.
+        """
+        start, end = trim_bounds(lines)
+        write = self.stream.write
+        source_map = self.source_map
+
+        # Blocks are separated by a single empty line.
+        if self.block_count:
+            write('\n')
+
+        self.block_count += 1
+        header = self.header_template.format(number=self.block_count)
+        write(header)
+        write('\n')
+
+        for i in range(start, end):
+            write(lines[i])
+            write('\n')
+
+        if source_map is None:
+            return
+
+        # The empty line separating blocks, and the lines of the header.
+        separator = 1 if self.block_count > 1 else 0
+        source_map.add_generated(separator + header.count('\n') + 1)
+
+        if line_numbers is None or source is None:
+            source_map.add_generated(end - start)
+
+        else:
+            source_id = source_map.add_source(source)
+            source_map.add_lines(source_id, line_numbers[start:end])
+
+    def write_blocks(
+        self,
+        blocks: Iterable[Sequence[str]],
+        source: str | os.PathLike[str] | None = None,
+    ) -> None:
+        """Write all blocks, in order, to the stream.
+
+        Blocks with a ``line_numbers`` attribute (such as
+        ``spans.SpanLines``) are recorded in the source map as coming from
+        their own ``source`` attribute if set, or ``source`` otherwise.
+        """
+        for block in blocks:
+            self.write_block(
+                block,
+                getattr(block, 'line_numbers', None),
+                getattr(block, 'source', None) or source,
+            )
+
+        log.debug('Blocks assembled', block_count=self.block_count)
+
+    def getvalue(self) -> str:
+        """Get the assembled output, if writing to an ``io.StringIO``."""
+        if not isinstance(self.stream, io.StringIO):
+            raise TypeError(
+                f'Can only get the value of an io.StringIO stream, '
+                f'not {type(self.stream)}.'
+            )
+
+        return self.stream.getvalue()
+
+
+def assemble(
+    blocks: Iterable[Sequence[str]],
+    header_template: str = DEFAULT_HEADER_TEMPLATE,
+    source_map: SourceMap | None = None,
+) -> str:
+    """Assemble ``blocks`` into a single string of python code."""
+    assembler = OutputAssembler(
+        header_template=header_template, source_map=source_map
+    )
+    assembler.write_blocks(blocks)
+
+    return assembler.getvalue()
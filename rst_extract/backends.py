@@ -0,0 +1,489 @@
+"""Backends executing the extracted code of documents.
+
+``ProcessBackend`` runs each document in a new interpreter process, as
+``rst-extract --execute`` always has. ``SubinterpreterBackend`` runs each
+document in its own subinterpreter, inside one worker process: documents
+get their own modules and namespace, a subinterpreter is much cheaper to
+create than a process, and on Python 3.12+ each has its own GIL, so
+documents run in parallel.
+
+Documents fall back to a process when subinterpreters are not available,
+when another python binary is requested, or when a document imports an
+extension module that cannot be loaded in a subinterpreter. The import is
+only known to fail when the code runs it, so the statements before it have
+run in the subinterpreter, and run again in the process; only the output of
+the process is kept.
+
+``WarmInterpreter`` keeps an interpreter running, and forks it for each
+run: runs are isolated from each other, as in new processes, without
+paying for the start of an interpreter each time.
+"""
+
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Literal
+
+import structlog
+
+from .execution import run_code
+from .scheduler import run_until
+
+log = structlog.get_logger()
+
+BackendName = Literal['process', 'subinterpreter']
+BACKENDS: tuple[BackendName, ...] = ('process', 'subinterpreter')
+
+# Runs ``CODE`` in a subinterpreter, like ``python -c`` would, and writes its
+# output to the file ``OUTPUT``: subinterpreters have no stdout of their own.
+# An import failing because a module does not support subinterpreters is
+# reported as ``unsupported``, so the code runs in a process instead.
+_WRAPPER = r"""
+import contextlib, io, json, sys, traceback
+
+stdout, stderr = io.StringIO(), io.StringIO()
+result = {'returncode': 0, 'unsupported': False}
+
+with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+    try:
+        exec(compile(CODE, '<string>', 'exec'), {'__name__': '__main__'})
+    except SystemExit as error:
+        if isinstance(error.code, int) or error.code is None:
+            result['returncode'] = error.code or 0
+        else:
+            print(error.code, file=sys.stderr)
+            result['returncode'] = 1
+    except BaseException as error:
+        if isinstance(error, ImportError) and 'subinterpreter' in str(error):
+            result['unsupported'] = True
+        traceback.print_exception(
+            type(error), error, error.__traceback__.tb_next
+        )
+        result['returncode'] = 1
+
+sys.stdout.flush()
+result['stdout'] = stdout.getvalue()
+result['stderr'] = stderr.getvalue()
+
+with open(OUTPUT, 'w', encoding='utf-8') as f:
+    json.dump(result, f)
+"""
+
+
+# Reads requests as JSON lines from stdin, and runs the code of each in a
+# forked child, like ``python -c`` would, with its output written to files.
+# Only uses the standard library, so it runs with any python binary.
+_FORK_SERVER = r"""
+import atexit, json, os, sys, threading, traceback
+
+def join_threads():
+    # Like the end of a process, wait for the threads the code started.
+    current = threading.current_thread()
+    while threads := [
+        thread for thread in threading.enumerate()
+        if thread is not current and not thread.daemon and thread.is_alive()
+    ]:
+        for thread in threads:
+            thread.join()
+
+def child(request):
+    for fd, name in ((1, 'stdout'), (2, 'stderr')):
+        output = os.open(request[name], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        os.dup2(output, fd)
+        os.close(output)
+    sys.stdin = open(os.devnull)
+    returncode = 0
+    try:
+        code = compile(request['code'], '<string>', 'exec')
+        exec(code, {'__name__': '__main__', '__builtins__': __builtins__})
+    except SystemExit as error:
+        if isinstance(error.code, int) or error.code is None:
+            returncode = error.code or 0
+        else:
+            print(error.code, file=sys.stderr)
+            returncode = 1
+    except BaseException as error:
+        traceback.print_exception(
+            type(error), error, error.__traceback__.tb_next
+        )
+        returncode = 1
+    try:
+        join_threads()
+        atexit._run_exitfuncs()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(returncode)
+
+for line in sys.stdin:
+    request = json.loads(line)
+    sys.stdout.flush()
+    pid = os.fork()
+    if not pid:
+        child(request)
+    status = os.waitpid(pid, 0)[1]
+    print(json.dumps(os.waitstatus_to_exitcode(status)), flush=True)
+"""
+
+
+def _interpreter_runner() -> Callable[[str], None] | None:
+    """Get a function running a script in a new subinterpreter, if any.
+
+    Subinterpreters are only used from Python 3.12, which gives each one
+    its own GIL.
+    """
+    if sys.version_info < (3, 12):
+        return None
+
+    try:
+        from concurrent import interpreters  # type: ignore[attr-defined]
+
+    except ImportError:
+        pass
+
+    else:
+
+        def _run(script: str) -> None:
+            interpreter = interpreters.create()
+
+            try:
+                interpreter.exec(script)
+
+            finally:
+                interpreter.close()
+
+        return _run
+
+    # Python 3.13, then 3.12.
+    for name, method in (
+        ('_interpreters', 'exec'),
+        ('_xxsubinterpreters', 'run_string'),
+    ):
+        try:
+            module: Any = importlib.import_module(name)
+
+        except ImportError:
+            continue
+
+        def _run_low_level(
+            script: str, module: Any = module, method: str = method
+        ) -> None:
+            interpreter = module.create()
+
+            try:
+                getattr(module, method)(interpreter, script)
+
+            finally:
+                module.destroy(interpreter)
+
+        return _run_low_level
+
+    return None
+
+
+def subinterpreters_supported() -> bool:
+    """Check if documents can run in subinterpreters."""
+    return _interpreter_runner() is not None
+
+
+def _run_in_interpreter(
+    run: Callable[[str], None], code: str
+) -> dict[str, Any] | None:
+    """Run ``code`` in a new subinterpreter.
+
+    Returns ``None`` if it imports a module that does not support
+    subinterpreters.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'result.json')
+        run(f'CODE = {code!r}\nOUTPUT = {output!r}\n{_WRAPPER}')
+
+        try:
+            with open(output, encoding='utf-8') as f:
+                result: dict[str, Any] = json.load(f)
+
+        except (OSError, ValueError):
+            return None
+
+    return None if result['unsupported'] else result
+
+
+def run_in_interpreters(
+    codes: Sequence[str],
+    jobs: int | None = None,
+    *,
+    fail_fast: bool = False,
+    ordered: bool = False,
+) -> list[dict[str, Any] | None]:
+    """Run each of ``codes`` in its own subinterpreter, ``jobs`` at a time.
+
+    Returns, for each code, its ``returncode``, ``stdout`` and ``stderr``,
+    or ``None`` if it could not run in a subinterpreter. Such a code ran up
+    to the failing import.
+    With ``fail_fast``, no new code is started once one failed; the codes
+    not run have a ``returncode`` of ``None``. The largest codes start
+    first, unless ``ordered``: then codes start in order.
+    """
+    run = _interpreter_runner()
+
+    if run is None:
+        return [None] * len(codes)
+
+    outputs = run_until(
+        codes,
+        lambda code: _run_in_interpreter(run, code),
+        [len(code) for code in codes],
+        stop=(
+            (lambda output: output is not None and output['returncode'] != 0)
+            if fail_fast
+            else None
+        ),
+        workers=jobs,
+        ordered=ordered,
+    )
+    skipped = {'returncode': None, 'stdout': '', 'stderr': ''}
+
+    return [outputs.get(index, skipped) for index in range(len(codes))]
+
+
+class ProcessBackend:
+    """Run each document in a new interpreter process."""
+
+    name: BackendName = 'process'
+    python_bin: str | os.PathLike[str]
+
+    def __init__(self, python_bin: str | os.PathLike[str] = sys.executable):
+        """Initialize the backend, running documents with ``python_bin``."""
+        self.python_bin = python_bin
+
+    def run(
+        self,
+        codes: Sequence[str],
+        *,
+        fail_fast: bool = False,
+        ordered: bool = True,
+    ) -> list[subprocess.CompletedProcess[str] | None]:
+        """Run each of ``codes``, in order.
+
+        With ``fail_fast``, the codes after the first failing one are not
+        run; their result is ``None``. Codes always run in order, whatever
+        ``ordered``.
+        """
+        results: list[subprocess.CompletedProcess[str] | None] = []
+        failed = False
+
+        for code in codes:
+            if failed:
+                results.append(None)
+                continue
+
+            result = run_code(self.python_bin, code)
+            results.append(result)
+            failed = fail_fast and result.returncode != 0
+
+        return results
+
+
+class SubinterpreterBackend:
+    """Run each document in its own subinterpreter, in a worker process.
+
+    Documents that cannot run in a subinterpreter run again in a process,
+    from the start.
+    """
+
+    name: BackendName = 'subinterpreter'
+    jobs: int | None
+    fallback: ProcessBackend
+
+    def __init__(self, jobs: int | None = None):
+        """Initialize the backend, running up to ``jobs`` documents at once."""
+        self.jobs = jobs
+        self.fallback = ProcessBackend(sys.executable)
+
+    def run(
+        self,
+        codes: Sequence[str],
+        *,
+        fail_fast: bool = False,
+        ordered: bool = False,
+    ) -> list[subprocess.CompletedProcess[str] | None]:
+        """Run each of ``codes``, returning the results in order.
+
+        With ``fail_fast``, no new code is started once one failed; the
+        result of the codes not run is ``None``. With ``ordered``, codes
+        start in order rather than largest first (see ``run_until``).
+        """
+        # The worker process keeps a crashing extension module from taking
+        # rst-extract down with it.
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            outputs = executor.submit(
+                run_in_interpreters,
+                codes,
+                self.jobs,
+                fail_fast=fail_fast,
+                ordered=ordered,
+            ).result()
+
+        results: list[subprocess.CompletedProcess[str] | None] = []
+        failed = False
+
+        for code, output in zip(codes, outputs):
+            if output is None and not failed:
+                log.info('Running in a process instead of a subinterpreter')
+                result = self.fallback.run([code])[0]
+
+            elif output is None or output['returncode'] is None:
+                result = None
+
+            else:
+                result = subprocess.CompletedProcess(
+                    ['<subinterpreter>'],
+                    output['returncode'],
+                    output['stdout'],
+                    output['stderr'],
+                )
+
+            results.append(result)
+            failed = failed or (
+                fail_fast and result is not None and result.returncode != 0
+            )
+
+        return results
+
+
+class WarmInterpreter:
+    """An interpreter kept running, forked to run each code.
+
+    Each run starts from the state of the idle interpreter, so runs do not
+    affect each other. One code runs at a time; use several interpreters to
+    run codes concurrently. Where ``os.fork`` is not available, each code
+    runs in a new process instead.
+    """
+
+    python_bin: str | os.PathLike[str]
+    _process: subprocess.Popen[str] | None
+    _lock: threading.Lock
+
+    def __init__(self, python_bin: str | os.PathLike[str] = sys.executable):
+        """Initialize the interpreter; it is started on the first run."""
+        self.python_bin = python_bin
+        self._process = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supported() -> bool:
+        """Check if interpreters can be forked on this platform."""
+        return hasattr(os, 'fork')
+
+    def _start(self) -> subprocess.Popen[str]:
+        """Start the interpreter, unless it is running."""
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                [os.fspath(self.python_bin), '-c', _FORK_SERVER],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                encoding='utf-8',
+            )
+            log.debug('Warm interpreter started', pid=self._process.pid)
+
+        return self._process
+
+    def _fork(self, code: str) -> subprocess.CompletedProcess[str] | None:
+        """Run ``code`` in a fork, or return None if the server died."""
+        process = self._start()
+        assert process.stdin is not None and process.stdout is not None
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {
+                name: os.path.join(directory, name)
+                for name in ('stdout', 'stderr')
+            }
+
+            try:
+                process.stdin.write(json.dumps({'code': code, **paths}) + '\n')
+                process.stdin.flush()
+                returncode = json.loads(process.stdout.readline())
+
+            except (OSError, ValueError):
+                log.warning('Warm interpreter died', pid=process.pid)
+                self._process = None
+                return None
+
+            output = {}
+            for name, path in paths.items():
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    output[name] = f.read()
+
+        return subprocess.CompletedProcess(
+            ['<warm interpreter>'],
+            returncode,
+            output['stdout'],
+            output['stderr'],
+        )
+
+    def run(self, code: str) -> subprocess.CompletedProcess[str]:
+        """Run ``code``, as ``python -c`` would, capturing its output."""
+        if self.supported():
+            with self._lock:
+                result = self._fork(code)
+
+            if result is not None:
+                return result
+
+        return run_code(self.python_bin, code)
+
+    def close(self) -> None:
+        """Stop the interpreter."""
+        with self._lock:
+            process, self._process = self._process, None
+
+        if process is None:
+            return
+
+        assert process.stdin is not None and process.stdout is not None
+        process.stdin.close()
+
+        try:
+            _ = process.wait(timeout=10)
+
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _ = process.wait()
+
+        process.stdout.close()
+        log.debug('Warm interpreter stopped', pid=process.pid)
+
+
+def get_backend(
+    name: BackendName,
+    python_bin: str | os.PathLike[str] = sys.executable,
+    jobs: int | None = None,
+) -> ProcessBackend | SubinterpreterBackend:
+    """Get the backend ``name``, or the process backend if it cannot be used.
+
+    Subinterpreters run the python running rst-extract, so another
+    ``python_bin`` needs processes.
+    """
+    if name == 'subinterpreter':
+        if os.fspath(python_bin) != sys.executable:
+            log.info(
+                'Subinterpreters need the current python, using processes',
+                python_bin=os.fspath(python_bin),
+            )
+
+        elif not subinterpreters_supported():
+            log.info(
+                'Subinterpreters are not supported, using processes',
+                version=sys.version,
+            )
+
+        else:
+            return SubinterpreterBackend(jobs)
+
+    return ProcessBackend(python_bin)
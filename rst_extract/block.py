@@ -5,6 +5,8 @@ from typing import ClassVar, Optional, Sequence
 
 from pydantic import BaseModel, FilePath, StrictInt, StrictStr, field_validator
 
+from .assembler import trim_bounds
+
 
 class BlockError(ValueError):
     """Error raised when a block is not properly formatted."""
@@ -121,13 +123,9 @@ class Block(BaseModel):
     @staticmethod
     def _trim_list(lines: list[StrictStr]) -> list[StrictStr]:
         """Remove whitespace from the beginning and end of a list of strings."""
-        while lines[0] == '':
-            lines.pop(0)
-
-        while lines[-1] == '':
-            lines.pop(-1)
+        start, end = trim_bounds(lines)
 
-        return lines
+        return lines[start:end]
 
     @staticmethod
     def _get_offset(
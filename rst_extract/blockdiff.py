@@ -0,0 +1,306 @@
+"""Block-level diff of the code extracted from two versions of documents.
+
+Every block is hashed, with trailing whitespace and empty lines ignored, and
+blocks are matched across the two versions by hash and by position. Blocks
+with the same hash are unchanged, wherever they moved, so only the text of
+the blocks that actually changed is ever rendered.
+"""
+
+import difflib
+import hashlib
+import os
+from collections import Counter
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import Literal, NamedTuple
+
+import structlog
+
+from .assembler import trim_bounds
+from .doctests import doctest_registry
+from .includes import IncludeGraph
+from .revisions import RevisionExtractor
+from .spans import TextBuffer
+
+log = structlog.get_logger()
+
+ChangeKind = Literal['added', 'removed', 'modified']
+
+
+def block_hash(lines: Iterable[str]) -> str:
+    """Hash the lines of a block, ignoring trailing whitespace/empty lines."""
+    digest = hashlib.blake2b(digest_size=16)
+
+    for line in lines:
+        line = line.rstrip()
+
+        if line:
+            digest.update(line.encode('utf-8'))
+            digest.update(b'\n')
+
+    return digest.hexdigest()
+
+
+class BlockRecord(NamedTuple):
+    """A hashed block, and where it is in its document.
+
+    Attributes
+    ----------
+    hash : str
+        The hash of the block, see ``block_hash``.
+
+    index : int
+        The 0-based position of the block in its document.
+
+    source : str | None
+        The file the block is in (an included file, for included blocks).
+
+    line : int | None
+        The 1-based line of the first line of code in ``source``.
+
+    block : Sequence[str]
+        The block itself, usually a lazy view over the source text.
+    """
+
+    hash: str
+    index: int
+    source: str | None
+    line: int | None
+    block: Sequence[str]
+
+    @property
+    def location(self) -> str:
+        """The location of the block, as ``source:line``."""
+        if self.line is None:
+            return f'{self.source or "<unknown>"} (block {self.index + 1})'
+
+        return f'{self.source}:{self.line}'
+
+
+def hash_blocks(blocks: Iterable[Sequence[str]]) -> list[BlockRecord]:
+    """Hash ``blocks``, recording where they came from."""
+    records = []
+
+    for index, block in enumerate(blocks):
+        line_numbers = getattr(block, 'line_numbers', None)
+        source = getattr(block, 'source', None)
+        start, end = trim_bounds(block)
+        line = (
+            line_numbers[start] + 1
+            if line_numbers is not None and start < end
+            else None
+        )
+
+        records.append(
+            BlockRecord(
+                block_hash(block),
+                index,
+                os.fspath(source) if source is not None else None,
+                line,
+                block,
+            )
+        )
+
+    return records
+
+
+def document_blocks(
+    path: str | os.PathLike[str],
+    *,
+    doctest: bool = False,
+    include_graph: IncludeGraph | None = None,
+) -> list[BlockRecord]:
+    """Scan the document at ``path`` and hash its blocks.
+
+    Raises
+    ------
+    OSError
+        If the document cannot be read.
+
+    IncludeCycleError
+        If the document (indirectly) includes itself.
+    """
+    if include_graph is None:
+        include_graph = IncludeGraph(doctest_registry() if doctest else None)
+
+    with open(path, encoding='utf-8') as f:
+        buffer = TextBuffer(f.read(), path)
+
+    return hash_blocks(include_graph.scan(buffer))
+
+
+class BlockChange(NamedTuple):
+    """A block that was added, removed or modified.
+
+    ``old`` is ``None`` for added blocks and ``new`` for removed blocks.
+    """
+
+    kind: ChangeKind
+    old: BlockRecord | None
+    new: BlockRecord | None
+
+    @property
+    def location(self) -> str:
+        """The location of the change, in the old and/or new version."""
+        if self.old is None:
+            assert self.new is not None
+            return self.new.location
+
+        if self.new is None:
+            return self.old.location
+
+        return f'{self.old.location} -> {self.new.location}'
+
+    def unified_diff(self) -> Iterator[str]:
+        """Get the lines of a unified diff of the old and new block."""
+        old = list(self.old.block) if self.old is not None else []
+        new = list(self.new.block) if self.new is not None else []
+
+        return difflib.unified_diff(
+            old,
+            new,
+            self.old.location if self.old is not None else '/dev/null',
+            self.new.location if self.new is not None else '/dev/null',
+            lineterm='',
+        )
+
+
+def diff_blocks(
+    old: Sequence[BlockRecord], new: Sequence[BlockRecord]
+) -> list[BlockChange]:
+    """Diff two versions of the blocks of a document.
+
+    Blocks are aligned by hash, in order. Blocks whose hash is in both
+    versions are unchanged, even if they moved. Remaining blocks that take
+    the same place in both versions are modified; the others are removed
+    or added.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [r.hash for r in old], [r.hash for r in new], autojunk=False
+    )
+    opcodes = [op for op in matcher.get_opcodes() if op[0] != 'equal']
+
+    # Blocks left over on both sides moved, and are not reported.
+    moved = Counter(r.hash for _, i1, i2, _, _ in opcodes for r in old[i1:i2])
+    moved &= Counter(r.hash for _, _, _, j1, j2 in opcodes for r in new[j1:j2])
+    moved_from, moved_to = moved, moved.copy()
+    changes = []
+
+    for _, i1, i2, j1, j2 in opcodes:
+        removed = [r for r in old[i1:i2] if not _take(moved_from, r.hash)]
+        added = [r for r in new[j1:j2] if not _take(moved_to, r.hash)]
+
+        for old_record, new_record in zip(removed, added):
+            changes.append(BlockChange('modified', old_record, new_record))
+
+        changes.extend(
+            BlockChange('removed', r, None) for r in removed[len(added) :]
+        )
+        changes.extend(
+            BlockChange('added', None, r) for r in added[len(removed) :]
+        )
+
+    return changes
+
+
+def _take(counter: Counter[str], key: str) -> bool:
+    """Take one ``key`` from ``counter``, if there is any left."""
+    if counter[key] > 0:
+        counter[key] -= 1
+        return True
+
+    return False
+
+
+def diff_files(
+    old: str | os.PathLike[str],
+    new: str | os.PathLike[str],
+    *,
+    doctest: bool = False,
+) -> list[BlockChange]:
+    """Diff the blocks of two documents.
+
+    A missing document has no blocks, so all blocks of the other one are
+    added (or removed).
+
+    Raises
+    ------
+    IncludeCycleError
+        If a document (indirectly) includes itself.
+    """
+    versions = []
+
+    for path in (old, new):
+        if not Path(path).is_file():
+            versions.append([])
+            continue
+
+        versions.append(document_blocks(path, doctest=doctest))
+
+    return diff_blocks(*versions)
+
+
+def _revision_records(
+    extractor: RevisionExtractor, rev: str, paths: Sequence[str] | None
+) -> dict[str, list[BlockRecord]]:
+    """Hash the blocks of the documents at ``rev``, by path.
+
+    Sources are given as ``rev:path``.
+    """
+    records = {}
+
+    for document, blocks in extractor.blocks(rev, paths).items():
+        records[document.path] = [
+            record._replace(
+                source=f'{rev}:{extractor.relative(record.source)}'
+                if record.source is not None
+                else None
+            )
+            for record in hash_blocks(blocks)
+        ]
+
+    return records
+
+
+def diff_revisions(
+    old_rev: str,
+    new_rev: str,
+    paths: Sequence[str] | None = None,
+    *,
+    cwd: str | os.PathLike[str] | None = None,
+    doctest: bool = False,
+) -> dict[str, list[BlockChange]]:
+    """Diff the blocks of the documents at two git revisions.
+
+    Arguments
+    ---------
+    old_rev, new_rev : str
+        The revisions to compare.
+
+    paths : Sequence[str] | None
+        The documents to compare, from the repository root. Defaults to all
+        documents at either revision.
+
+    Returns
+    -------
+    dict[str, list[BlockChange]]
+        The changes of each document that changed, by path. Locations are
+        given as ``rev:path:line``.
+
+    Raises
+    ------
+    GitError
+        If a revision does not exist.
+    """
+    with RevisionExtractor(cwd, doctest=doctest) as extractor:
+        old = _revision_records(extractor, old_rev, paths)
+        new = _revision_records(extractor, new_rev, paths)
+
+    changes = {}
+    for path in sorted(old.keys() | new.keys()):
+        if document_changes := diff_blocks(
+            old.get(path, []), new.get(path, [])
+        ):
+            changes[path] = document_changes
+
+    return changes
@@ -0,0 +1,361 @@
+"""Content-addressed store of the code blocks of many documents.
+
+Documentation often repeats the same blocks (imports, fixtures, setup code)
+on many pages. A ``BlockStore`` keeps the text of each distinct block once,
+keyed by the hash of its text, and records each document as the list of
+blocks it references. The store can be written as a JSON manifest, and every
+document's script rebuilt from it.
+
+Checking the syntax of a block does not depend on the blocks around it, so
+``check_syntax`` parses each distinct block once, however many documents use
+it. Running a block does depend on the blocks before it; only documents with
+identical code can share a run (see ``--dedup`` of ``rst-extract``).
+"""
+
+import ast
+import hashlib
+import json
+import os
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import structlog
+
+from .assembler import DEFAULT_HEADER_TEMPLATE, OutputAssembler, trim_bounds
+from .doctests import doctest_registry
+from .includes import IncludeGraph
+from .spans import SourceLines, TextBuffer
+
+log = structlog.get_logger()
+
+BLOCK_STORE_VERSION = 1
+
+
+class BlockStoreError(ValueError):
+    """Error raised when a block store cannot be read."""
+
+
+def content_hash(text: str) -> str:
+    """Hash the text of a block."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class BlockReference(NamedTuple):
+    """A use of a stored block in a document.
+
+    Attributes
+    ----------
+    hash : str
+        The hash of the block text, see ``content_hash``.
+
+    source : str | None
+        The file the block is in (an included file, for included blocks).
+
+    line : int | None
+        The 1-based line of the first line of code in ``source``.
+    """
+
+    hash: str
+    source: str | None
+    line: int | None
+
+
+class BlockStore:
+    """Blocks of many documents, each distinct block stored once.
+
+    Blocks are stored without their leading and trailing empty lines, as
+    they are written to the extracted code.
+    """
+
+    _blocks: dict[str, str]
+    _uses: dict[str, int]
+    documents: dict[str, list[BlockReference]]
+
+    def __init__(self) -> None:
+        """Initialize an empty BlockStore."""
+        self._blocks = {}
+        self._uses = {}
+        self.documents = {}
+
+    def __len__(self) -> int:
+        """Get the number of distinct blocks."""
+        return len(self._blocks)
+
+    def __contains__(self, block_hash: object) -> bool:
+        """Check if the block with hash ``block_hash`` is stored."""
+        return block_hash in self._blocks
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the hashes of the stored blocks."""
+        return iter(self._blocks)
+
+    def text(self, block_hash: str) -> str:
+        """Get the text of the block with hash ``block_hash``."""
+        return self._blocks[block_hash]
+
+    def uses(self, block_hash: str) -> int:
+        """Get the number of times the block is referenced."""
+        return self._uses.get(block_hash, 0)
+
+    def shared(self) -> list[str]:
+        """Get the hashes of the blocks referenced more than once."""
+        return [h for h, count in self._uses.items() if count > 1]
+
+    def add(self, lines: Sequence[str]) -> str:
+        """Store the block ``lines`` if new, returning its hash."""
+        start, end = trim_bounds(lines)
+        text = '\n'.join(lines[start:end])
+        block_hash = content_hash(text)
+
+        # Only the first copy of the text is kept.
+        _ = self._blocks.setdefault(block_hash, text)
+        self._uses[block_hash] = self._uses.get(block_hash, 0) + 1
+
+        return block_hash
+
+    def add_document(
+        self,
+        document: str | os.PathLike[str],
+        blocks: Iterable[Sequence[str]],
+    ) -> list[BlockReference]:
+        """Store the blocks of ``document``, replacing previous ones.
+
+        Blocks with ``line_numbers`` and ``source`` attributes (such as
+        ``spans.SpanLines``) are recorded with their location.
+        """
+        document = os.fspath(document)
+
+        for reference in self.documents.pop(document, []):
+            self._release(reference.hash)
+
+        references = []
+
+        for block in blocks:
+            line_numbers = getattr(block, 'line_numbers', None)
+            source = getattr(block, 'source', None)
+            start, end = trim_bounds(block)
+
+            references.append(
+                BlockReference(
+                    self.add(block),
+                    os.fspath(source) if source is not None else None,
+                    line_numbers[start] + 1
+                    if line_numbers is not None and start < end
+                    else None,
+                )
+            )
+
+        self.documents[document] = references
+
+        return references
+
+    def _release(self, block_hash: str) -> None:
+        """Drop one reference to a block, and the block if unused."""
+        self._uses[block_hash] -= 1
+
+        if not self._uses[block_hash]:
+            del self._uses[block_hash]
+            del self._blocks[block_hash]
+
+    def assemble(
+        self,
+        document: str | os.PathLike[str],
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+    ) -> str:
+        """Rebuild the extracted code of ``document`` from the store."""
+        assembler = OutputAssembler(header_template=header_template)
+
+        for reference in self.documents[os.fspath(document)]:
+            text = self._blocks[reference.hash]
+            assembler.write_block(text.split('\n') if text else [])
+
+        return assembler.getvalue()
+
+    def check_syntax(self) -> dict[str, SyntaxError]:
+        """Parse each distinct block once, returning errors by hash."""
+        errors = {}
+
+        for block_hash, text in self._blocks.items():
+            try:
+                _ = ast.parse(text, type_comments=True)
+
+            except SyntaxError as error:
+                errors[block_hash] = error
+
+        log.debug(
+            'Block syntax checked',
+            block_count=len(self._blocks),
+            error_count=len(errors),
+        )
+
+        return errors
+
+    def syntax_errors(
+        self,
+    ) -> list[tuple[str, BlockReference, SyntaxError]]:
+        """Get every block use with a syntax error, by document.
+
+        Each distinct block is only parsed once.
+        """
+        errors = self.check_syntax()
+
+        return [
+            (document, reference, errors[reference.hash])
+            for document, references in self.documents.items()
+            for reference in references
+            if reference.hash in errors
+        ]
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get the store as a JSON-serializable dict."""
+        return {
+            'version': BLOCK_STORE_VERSION,
+            'blocks': dict(self._blocks),
+            'documents': {
+                document: [reference._asdict() for reference in references]
+                for document, references in self.documents.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> 'BlockStore':
+        """Build a store from the result of ``to_dict``.
+
+        Raises
+        ------
+        BlockStoreError
+            If ``data`` is not a valid block store.
+        """
+        if data.get('version') != BLOCK_STORE_VERSION:
+            raise BlockStoreError(
+                f'Unsupported block store version: {data.get("version")!r}.'
+            )
+
+        store = cls()
+
+        try:
+            store._blocks = dict(data['blocks'])
+
+            for document, references in data['documents'].items():
+                store.documents[document] = [
+                    BlockReference(**reference) for reference in references
+                ]
+
+                for reference in store.documents[document]:
+                    if reference.hash not in store._blocks:
+                        raise BlockStoreError(
+                            f'Unknown block {reference.hash} in {document}.'
+                        )
+
+                    store._uses[reference.hash] = (
+                        store.uses(reference.hash) + 1
+                    )
+
+        except (KeyError, TypeError, AttributeError) as error:
+            raise BlockStoreError(f'Invalid block store: {error}') from error
+
+        return store
+
+    def write(self, path: str | os.PathLike[str]) -> None:
+        """Write the store to ``path`` as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+
+        log.debug(
+            'Block store written',
+            filename=os.fspath(path),
+            block_count=len(self),
+            document_count=len(self.documents),
+        )
+
+    @classmethod
+    def read(cls, path: str | os.PathLike[str]) -> 'BlockStore':
+        """Read a store written by ``write``.
+
+        Raises
+        ------
+        BlockStoreError
+            If the file is not a valid block store.
+        """
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+
+        except ValueError as error:
+            raise BlockStoreError(f'Invalid block store: {error}') from error
+
+        if not isinstance(data, dict):
+            raise BlockStoreError('Invalid block store: not an object.')
+
+        return cls.from_dict(data)
+
+
+def detach_block(block: Sequence[str]) -> Sequence[str]:
+    """Copy what a store keeps of ``block``: its trimmed lines and location.
+
+    Unlike a ``spans.SpanLines``, the copy does not keep the text of the
+    whole document alive, and is cheap to send to another process.
+    """
+    start, end = trim_bounds(block)
+    lines = list(block[start:end])
+    line_numbers = getattr(block, 'line_numbers', None)
+
+    if line_numbers is None:
+        return lines
+
+    return SourceLines(
+        lines, list(line_numbers[start:end]), getattr(block, 'source', None)
+    )
+
+
+def store_documents(
+    paths: Sequence[str | os.PathLike[str]],
+    *,
+    doctest: bool = False,
+    include_graph: IncludeGraph | None = None,
+    store: BlockStore | None = None,
+) -> BlockStore:
+    """Scan the documents at ``paths`` into a store, new unless given.
+
+    Documents already in ``store`` (e.g., added while they were extracted)
+    are not scanned again. The documents of the store are listed in the
+    order of ``paths``.
+
+    Raises
+    ------
+    OSError
+        If a document cannot be read.
+
+    IncludeCycleError
+        If a document (indirectly) includes itself.
+    """
+    if include_graph is None:
+        include_graph = IncludeGraph(doctest_registry() if doctest else None)
+
+    if store is None:
+        store = BlockStore()
+
+    for path in paths:
+        if os.fspath(path) not in store.documents:
+            text = Path(path).read_text(encoding='utf-8')
+            store.add_document(
+                path, include_graph.scan(TextBuffer(text, path))
+            )
+
+    order = {os.fspath(path): index for index, path in enumerate(paths)}
+    store.documents = dict(
+        sorted(
+            store.documents.items(),
+            key=lambda item: order.get(item[0], len(order)),
+        )
+    )
+
+    log.info(
+        'Documents stored',
+        document_count=len(store.documents),
+        block_count=len(store),
+        shared_count=len(store.shared()),
+    )
+
+    return store
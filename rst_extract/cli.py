@@ -16,88 +16,1398 @@ To-do
 - [ ] Implement a flag to output log messages to a file.
 """
 
+import contextlib
+import functools
+import json
 import os
 import subprocess
 import sys
+import time
 import typing
 from os import PathLike
+from pathlib import Path
 
 import click
 
-from .extractor import Extractor
+from .assembler import DEFAULT_HEADER_TEMPLATE, OutputAssembler
+from .doctests import doctest_registry, run_doctests
+from .execution import WARNING_EMOJI, execute_command, report_run, run_code
+from .extractor import ExtractionError, extract_code, read_document
+from .includes import IncludeCycleError, IncludeGraph
 from .logs import configure_logging
+from .project import (
+    ProjectError,
+    SphinxProject,
+    extract_documents,
+    split_output_path,
+)
+from .revisions import RevisionPath
+from .sourcemap import SourceMap, sidecar_path
 
 MAGNIFYING_GLASS = '\U0001f50d'
 EXCLAMATION_MARK = '\U00002757'
 RUNNER_EMOJI = '\U0001f3c3'
-WARNING_EMOJI = '\U0001f494'
 
 LOGGING_ENV_VAR = 'RST_EXTRACT_LOGGING'
 
+if typing.TYPE_CHECKING:
+    from .backends import ProcessBackend, SubinterpreterBackend
+    from .blockdiff import BlockChange, BlockRecord
+    from .blockstore import BlockStore
+    from .history import FileTiming
+    from .incremental import IncrementalRunner
+    from .journal import Status
+    from .sharding import FileResult, RunResult, Shard
+
+# A document in the work tree, or at a git revision (with --rev).
+_Document = PathLike[str] | RevisionPath
+
+# Executes the extracted documents, instead of running their whole code, and
+# returns the exit status of each.
+_Executor = typing.Callable[
+    [dict[_Document, str], dict[_Document, SourceMap]], dict[_Document, int]
+]
+
+
+def _validate_header_template(
+    ctx: click.Context, param: click.Parameter, value: str
+) -> str:
+    """Check that the header template can be formatted."""
+    try:
+        _ = OutputAssembler(header_template=value)
+
+    except ValueError as error:
+        raise click.BadParameter(str(error)) from error
+
+    return value
+
+
+def _extract_files(
+    filenames: typing.Sequence[PathLike[str]],
+    *,
+    header_template: str,
+    doctest: bool,
+    jobs: int | None,
+    parallel: bool,
+    stdout_to: typing.TextIO,
+    runtimes: typing.Mapping[str, float] | None = None,
+    timings: dict[str, float] | None = None,
+    store: 'BlockStore | None' = None,
+) -> tuple[dict[_Document, str], dict[_Document, SourceMap]]:
+    """Extract all files, in order.
+
+    If ``parallel``, the files are extracted in ``jobs`` worker processes,
+    the slowest of ``runtimes`` first. Otherwise, they are extracted here,
+    sharing one include graph. If given, ``timings`` gets the time spent
+    extracting each file, by ``shard_key``, and ``store`` the blocks of
+    each file as soon as it is extracted, for --block-store.
+    """
+    from .sharding import shard_key
+
+    results: dict[_Document, str] = {}
+    source_maps: dict[_Document, SourceMap] = {}
+
+    if parallel:
+        click.echo(
+            f'{MAGNIFYING_GLASS} Processing {len(filenames)} files...',
+            file=stdout_to,
+        )
+        extracted = extract_documents(
+            filenames,
+            jobs=jobs,
+            header_template=header_template,
+            doctest=doctest,
+            runtimes=runtimes,
+            timings=timings,
+            store=store,
+        )
+
+        for file, (result, source_map) in zip(filenames, extracted):
+            results[file] = result
+            source_maps[file] = source_map
+
+        return results, source_maps
+
+    include_graph = IncludeGraph(doctest_registry() if doctest else None)
+    for file in filenames:
+        click.echo(f'{MAGNIFYING_GLASS} Processing {file}...', file=stdout_to)
+        start = time.perf_counter()
+
+        blocks: list[typing.Sequence[str]] | None = (
+            [] if store is not None else None
+        )
+        results[file], source_maps[file] = extract_code(
+            read_document(file),
+            file,
+            header_template=header_template,
+            include_graph=include_graph,
+            blocks=blocks,
+        )
+
+        if store is not None and blocks is not None:
+            _ = store.add_document(file, blocks)
+
+        if timings is not None:
+            timings[shard_key(file)] = time.perf_counter() - start
+
+    return results, source_maps
+
+
+def _extract_revisions(
+    revs: typing.Sequence[str],
+    filenames: typing.Sequence[PathLike[str]],
+    *,
+    header_template: str,
+    doctest: bool,
+    stdout_to: typing.TextIO,
+) -> tuple[dict[_Document, str], dict[_Document, SourceMap]]:
+    """Extract the documents at git revisions, in order of ``revs``."""
+    from .git import GitError
+    from .revisions import RevisionExtractor
+
+    results: dict[_Document, str] = {}
+    source_maps: dict[_Document, SourceMap] = {}
+
+    try:
+        with RevisionExtractor(
+            header_template=header_template, doctest=doctest
+        ) as extractor:
+            paths = [extractor.relative(file) for file in filenames] or None
+
+            for rev in revs:
+                click.echo(
+                    f'{MAGNIFYING_GLASS} Processing {rev}...', file=stdout_to
+                )
+
+                for document, (code, code_map) in extractor.extract(
+                    rev, paths
+                ).items():
+                    results[document] = code
+                    source_maps[document] = code_map
+
+    except (GitError, ExtractionError, ValueError) as error:
+        raise click.ClickException(str(error)) from error
+
+    return results, source_maps
+
+
+def _read_project(project: Path) -> tuple[Path, list[Path]]:
+    """Get the source directory and documents of a Sphinx project."""
+    try:
+        sphinx_project = SphinxProject(project)
+
+    except ProjectError as error:
+        raise click.BadParameter(str(error), param_hint='--project') from error
+
+    return sphinx_project.source_dir, sphinx_project.documents()
+
+
+def _changed_documents(changed_since: str | None, staged: bool) -> list[Path]:
+    """Get the documents affected by the changes in the git repository."""
+    from .git import GitError, affected_documents
+
+    try:
+        return affected_documents(changed_since, staged=staged)
+
+    except GitError as error:
+        raise click.ClickException(str(error)) from error
+
+
+def _split_output_path(
+    file: PathLike[str], source_dir: Path | None, output_dir: Path
+) -> Path:
+    """Get the script path of a document, for --split-output."""
+    if source_dir is not None:
+        try:
+            return split_output_path(file, source_dir, output_dir)
+
+        except ValueError:
+            pass
+
+    return output_dir / Path(file).with_suffix('.py').name
+
+
+def _write_split_output(
+    output_dir: Path,
+    results: dict[_Document, str],
+    source_dir: Path | None,
+    stdout_to: typing.TextIO,
+) -> None:
+    """Write one script per document to ``output_dir``.
+
+    Documents of a Sphinx project keep their place in the source tree, and
+    documents at a git revision their place in the repository, under a
+    directory named after the revision. Other documents are written
+    directly into ``output_dir``.
+    """
+    for file, result in results.items():
+        if isinstance(file, RevisionPath):
+            path = output_dir / file.rev / Path(file.path).with_suffix('.py')
+
+        else:
+            path = _split_output_path(file, source_dir, output_dir)
+
+        click.echo(
+            f'{MAGNIFYING_GLASS} Writing {file} to {path}...',
+            file=stdout_to,
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _ = path.write_text(result, encoding='utf-8')
+
+
+def _check_doctests(
+    filenames: typing.Sequence[PathLike[str]], jobs: int | None
+) -> None:
+    """Check the doctests of all files, exiting with 1 on any failure."""
+    results = run_doctests(filenames, jobs)
+
+    for result in results:
+        status = WARNING_EMOJI if result.failed else RUNNER_EMOJI
+        click.echo(
+            f'{status} {result.filename}: {result.attempted} examples, '
+            f'{result.failed} failures.'
+        )
+
+        if result.report:
+            click.echo(result.report)
+
+    if any(result.failed for result in results):
+        raise SystemExit(1)
+
+
+def _emit_results(
+    results: dict[_Document, str],
+    source_maps: dict[_Document, SourceMap],
+    *,
+    output: typing.TextIO | None,
+    source_map: bool,
+    split_output: Path | None,
+    source_dir: Path | None,
+    execute: bool,
+    python_bin: PathLike[str],
+    dedup: bool,
+    stdout_to: typing.TextIO,
+    executor: _Executor | None = None,
+    fail_fast: bool = False,
+) -> dict[_Document, int]:
+    """Write, print or execute the extracted code, as requested.
+
+    An ``executor`` (see ``_block_executor``) replaces running the whole
+    code of each document. Returns the exit status of each document
+    executed; with ``fail_fast``, no document is executed after one failed.
+    """
+    # TODO: Output should be managed by a class, not in start().
+    if split_output is not None:
+        _write_split_output(split_output, results, source_dir, stdout_to)
+
+    if output:
+        _write_output(
+            output,
+            results,
+            source_maps if source_map else None,
+            stdout_to,
+        )
+
+    # TODO: Execution should be managed by a class, not in start().
+    if executor is not None:
+        return executor(results, source_maps)
+
+    if execute:
+        return _execute_results(
+            python_bin, results, source_maps, dedup, stdout_to, fail_fast
+        )
+
+    _print_results(results)
+
+    return {}
+
+
+def _print_results(results: dict[_Document, str]) -> None:
+    """Print the extracted code of every file."""
+    for file, result in results.items():
+        # TODO: Make primary output prettier and parsable.
+        msg = f'{MAGNIFYING_GLASS} {file}'.ljust(80, '-')
+        click.echo(msg)
+        click.echo(result)
+
+
+def _execute_results(
+    python_bin: PathLike[str],
+    results: dict[_Document, str],
+    source_maps: dict[_Document, SourceMap],
+    dedup: bool,
+    stdout_to: typing.TextIO,
+    fail_fast: bool = False,
+) -> dict[_Document, int]:
+    """Execute the extracted code of every file.
+
+    With ``dedup``, code identical to that of a file already executed is not
+    run again; the output of the first run is reported instead. With
+    ``fail_fast``, the files after the first failing one are not executed.
+    """
+    runs: dict[str, subprocess.CompletedProcess[str]] = {}
+    returncodes: dict[_Document, int] = {}
+
+    for file, result in results.items():
+        if not dedup:
+            click.echo(f'{RUNNER_EMOJI} Executing {file}...', file=stdout_to)
+            returncodes[file] = execute_command(
+                python_bin=python_bin,
+                code=result,
+                source_map=source_maps[file],
+            ).returncode
+
+        elif result in runs:
+            click.echo(
+                f'{RUNNER_EMOJI} Reusing the run of identical code for '
+                f'{file}...',
+                file=stdout_to,
+            )
+
+        else:
+            click.echo(f'{RUNNER_EMOJI} Executing {file}...', file=stdout_to)
+            runs[result] = run_code(python_bin, result)
+
+        if dedup:
+            run = runs[result]
+            returncodes[file] = run.returncode
+            report_run(
+                run.stdout, source_maps[file].rewrite_traceback(run.stderr)
+            )
+
+        if fail_fast and returncodes[file]:
+            _report_stop(len(results) - len(returncodes))
+            break
+
+    return returncodes
+
+
+def _report_stop(skipped: int) -> None:
+    """Print that --fail-fast stopped the run, if files were skipped."""
+    if skipped:
+        click.echo(
+            f'{WARNING_EMOJI} Stopping at the first failure (--fail-fast): '
+            f'{skipped} files not executed.'
+        )
+
+
+def _check_execution_modes(
+    execute: bool, revs: tuple[str, ...], **modes: bool
+) -> None:
+    """Check that execution ``modes`` are used with --execute, not --rev."""
+    for name, enabled in modes.items():
+        if enabled and (not execute or revs):
+            option = '--' + name.replace('_', '-')
+            raise click.UsageError(
+                f'{option} needs --execute, and cannot be used with --rev.'
+            )
+
+    if sum(modes.values()) > 1:
+        raise click.UsageError(
+            ' and '.join('--' + name.replace('_', '-') for name in modes)
+            + ' cannot be used together.'
+        )
+
+
+@contextlib.contextmanager
+def _block_executor(
+    *,
+    incremental: bool,
+    parallel_blocks: bool,
+    backend: str,
+    record: Path | None = None,
+    python_bin: PathLike[str],
+    header_template: str,
+    doctest: bool,
+    jobs: int | None,
+    dedup: bool,
+    stdout_to: typing.TextIO,
+    fail_fast: bool = False,
+    ordered: bool = False,
+) -> typing.Iterator[_Executor | None]:
+    """Get the executor replacing the default execution, if any.
+
+    --incremental and --parallel-blocks run blocks instead of documents;
+    other backends than processes run documents in batches. --incremental
+    reads and saves the runs in ``record``, if given. With ``fail_fast``,
+    executors stop at the first document failing. With ``ordered``
+    (--failed-first), backends start documents in order.
+    """
+    if incremental:
+        from .incremental import DEFAULT_RECORD_PATH, IncrementalRunner
+
+        with IncrementalRunner(
+            record or DEFAULT_RECORD_PATH,
+            header_template=header_template,
+            doctest=doctest,
+        ) as runner:
+            yield functools.partial(
+                _execute_incremental,
+                runner,
+                python_bin,
+                fail_fast=fail_fast,
+                stdout_to=stdout_to,
+            )
+
+    elif parallel_blocks:
+        yield functools.partial(
+            _execute_blocks,
+            python_bin,
+            jobs=jobs,
+            doctest=doctest,
+            fail_fast=fail_fast,
+            stdout_to=stdout_to,
+        )
+
+    elif backend != 'process':
+        from .backends import get_backend
+
+        yield functools.partial(
+            _execute_in_backend,
+            get_backend('subinterpreter', python_bin, jobs),
+            dedup=dedup,
+            fail_fast=fail_fast,
+            ordered=ordered,
+            stdout_to=stdout_to,
+        )
+
+    else:
+        yield None
+
+
+def _execute_in_backend(
+    backend: 'ProcessBackend | SubinterpreterBackend',
+    results: dict[_Document, str],
+    source_maps: dict[_Document, SourceMap],
+    *,
+    dedup: bool,
+    fail_fast: bool = False,
+    ordered: bool = False,
+    stdout_to: typing.TextIO,
+) -> dict[_Document, int]:
+    """Execute the extracted code of all files in one batch.
+
+    With ``fail_fast``, the backend starts no file once one failed. With
+    ``ordered``, it starts the files in order, instead of largest first.
+    """
+    files = list(results)
+    click.echo(
+        f'{RUNNER_EMOJI} Executing {len(files)} files with the '
+        f'{backend.name} backend...',
+        file=stdout_to,
+    )
+
+    if dedup:
+        codes = list(dict.fromkeys(results.values()))
+        runs_by_code = dict(
+            zip(
+                codes,
+                backend.run(codes, fail_fast=fail_fast, ordered=ordered),
+            )
+        )
+        runs = [runs_by_code[results[file]] for file in files]
+
+    else:
+        runs = backend.run(
+            [results[file] for file in files],
+            fail_fast=fail_fast,
+            ordered=ordered,
+        )
+
+    returncodes: dict[_Document, int] = {}
+
+    for file, run in zip(files, runs):
+        if run is None:
+            continue
+
+        click.echo(f'{RUNNER_EMOJI} Executed {file}.', file=stdout_to)
+        report_run(run.stdout, source_maps[file].rewrite_traceback(run.stderr))
+        returncodes[file] = run.returncode
+
+    _report_stop(len(files) - len(returncodes))
+
+    return returncodes
+
+
+def _execute_blocks(
+    python_bin: PathLike[str],
+    results: dict[_Document, str],
+    source_maps: dict[_Document, SourceMap],
+    *,
+    jobs: int | None,
+    doctest: bool,
+    fail_fast: bool = False,
+    stdout_to: typing.TextIO,
+) -> dict[_Document, int]:
+    """Execute the independent block groups of every file concurrently.
+
+    A file fails (with exit status 1) if any of its blocks fails. With
+    ``fail_fast``, no block group or file is started once a block failed.
+    """
+    from .parallel import run_document
+
+    include_graph = IncludeGraph(doctest_registry() if doctest else None)
+    returncodes: dict[_Document, int] = {}
+
+    for file in results:
+        click.echo(
+            f'{RUNNER_EMOJI} Executing the blocks of {file}...', file=stdout_to
+        )
+
+        try:
+            block_results = run_document(
+                typing.cast(PathLike[str], file),
+                python_bin,
+                jobs=jobs,
+                include_graph=include_graph,
+                fail_fast=fail_fast,
+            )
+
+        except (IncludeCycleError, OSError) as error:
+            raise click.ClickException(str(error)) from error
+
+        returncodes[file] = int(not all(b.passed for b in block_results))
+
+        for block in block_results:
+            location = f'{block.source}:{block.line}' if block.line else ''
+
+            if not block.ran:
+                click.echo(
+                    f'{WARNING_EMOJI} Block {block.index + 1} ({location}) '
+                    f'skipped, as an earlier block it depends on failed.'
+                )
+                continue
+
+            if block.stdout:
+                click.echo(block.stdout, nl=False)
+
+            if not block.passed:
+                click.echo(
+                    f'{WARNING_EMOJI} Block {block.index + 1} ({location}) '
+                    f'failed! Details:'
+                )
+                click.echo(block.stderr)
+
+        if fail_fast and returncodes[file]:
+            _report_stop(len(results) - len(returncodes))
+            break
+
+    return returncodes
+
+
+def _execute_incremental(
+    runner: 'IncrementalRunner',
+    python_bin: PathLike[str],
+    results: dict[_Document, str],
+    source_maps: dict[_Document, SourceMap],
+    *,
+    fail_fast: bool = False,
+    stdout_to: typing.TextIO,
+) -> dict[_Document, int]:
+    """Execute the blocks of every file affected since the last run.
+
+    Files skipped, as no block changed, passed. With ``fail_fast``, the
+    files after the first failing one are not executed. As with --execute,
+    tracebacks point at the reStructuredText files: through the source map
+    of the blocks run (see ``IncrementalRunner.run``), not ``source_maps``,
+    which maps all blocks.
+    """
+    returncodes: dict[_Document, int] = {}
+
+    for file in results:
+        try:
+            plan, result = runner.run(
+                typing.cast(PathLike[str], file), python_bin
+            )
+
+        except (IncludeCycleError, OSError) as error:
+            raise click.ClickException(str(error)) from error
+
+        if result is None:
+            click.echo(
+                f'{RUNNER_EMOJI} Skipping {file}: no block changed.',
+                file=stdout_to,
+            )
+            returncodes[file] = 0
+            continue
+
+        numbers = ', '.join(str(index + 1) for index in plan.selected)
+        click.echo(
+            f'{RUNNER_EMOJI} Executing blocks {numbers} of {plan.total} '
+            f'of {file}...',
+            file=stdout_to,
+        )
+        report_run(result.stdout, result.stderr)
+        returncodes[file] = result.returncode
+
+        if fail_fast and result.returncode:
+            _report_stop(len(results) - len(returncodes))
+            break
+
+    return returncodes
+
+
+def _check_run_options(
+    revs: tuple[str, ...],
+    *,
+    journal: Path | None,
+    resume: bool,
+    output: bool,
+    execute: bool = False,
+    fail_fast: bool = False,
+    failed_first: bool = False,
+    incremental: bool = False,
+    record: Path | None = None,
+    **options: object,
+) -> None:
+    """Check that --journal, --resume and the file ``options`` can be used.
+
+    ``options`` (e.g., --shard) work on files, so not with --rev.
+    """
+    if resume and journal is None:
+        raise click.UsageError('--resume needs --journal.')
+
+    if record is not None and not incremental:
+        raise click.UsageError('--record needs --incremental.')
+
+    if fail_fast and not execute:
+        raise click.UsageError('--fail-fast needs --execute.')
+
+    if failed_first and options.get('history') is None:
+        raise click.UsageError('--failed-first needs --history.')
+
+    for name, value in {'journal': journal, **options}.items():
+        if value is not None and revs:
+            option = '--' + name.replace('_', '-')
+            raise click.UsageError(f'{option} cannot be used with --rev.')
+
+    # A resumed run would only write the pending files to --output.
+    if journal is not None and output:
+        raise click.UsageError(
+            '--journal cannot be used with --output; use --split-output '
+            'instead.'
+        )
+
+
+def _output_location(
+    file: PathLike[str],
+    split_output: Path | None,
+    source_dir: Path | None,
+) -> str | None:
+    """Get where the code of ``file`` is written, for the journal."""
+    if split_output is None:
+        return None
+
+    return os.fspath(_split_output_path(file, source_dir, split_output))
+
+
+def _extract_and_emit(
+    filenames: typing.Sequence[PathLike[str]],
+    *,
+    extract: typing.Callable[
+        ..., tuple[dict[_Document, str], dict[_Document, SourceMap]]
+    ],
+    emit: typing.Callable[
+        [dict[_Document, str], dict[_Document, SourceMap]],
+        dict[_Document, int],
+    ],
+    journal: Path | None,
+    resume: bool,
+    locate: typing.Callable[[PathLike[str]], str | None],
+    record: bool,
+    fail_fast: bool = False,
+    stdout_to: typing.TextIO,
+) -> tuple[dict[_Document, int], dict[str, 'FileResult']]:
+    """Extract and emit all files, recording each in the ``journal``.
+
+    Without a journal, all files are extracted, then emitted. With one,
+    each file is extracted and emitted in turn, and its outcome appended to
+    the journal once done; with ``resume``, the files already in the
+    journal (and unchanged since) are skipped.
 
-def execute_command(python_bin: PathLike[str], code: str) -> None:
-    """Execute the extracted code."""
-    command = (python_bin, '-c', code)
-    result = subprocess.run(command, capture_output=True)
+    Returns the exit status of each file executed and, with ``record`` (or
+    a journal), the result of each file by ``shard_key``, timing the
+    extraction and emission of each file; ``extract`` then gets the
+    ``timings`` to fill in. With ``fail_fast``, no file is emitted after
+    one failed.
+    """
+    from .sharding import FileResult, shard_key
 
-    # Print the output of the command
-    click.echo(result.stdout.decode('utf-8'), file=sys.stdout)
+    if journal is None and not record:
+        return emit(*extract(filenames)), {}
 
-    # Also print stderr if there is any
-    if result.stderr:
-        click.echo(f'{WARNING_EMOJI} Error! Details:', file=sys.stdout)
-        click.echo(result.stderr.decode('utf-8'), file=sys.stdout)
+    from .journal import Journal
 
+    run_journal = Journal(journal) if journal is not None else None
 
-@click.command()
+    if run_journal is not None and resume:
+        pending = run_journal.pending(filenames)
+        click.echo(
+            f'{RUNNER_EMOJI} Resuming from {journal}: '
+            f'{len(filenames) - len(pending)} files already done.',
+            file=stdout_to,
+        )
+        filenames = pending
+
+    timings: dict[str, float] = {}
+    # Without a journal, the files can still be extracted all at once.
+    extracted = extract(filenames, timings=timings) if not journal else None
+    returncodes: dict[_Document, int] = {}
+    outcomes = {}
+
+    for position, file in enumerate(filenames):
+        key = shard_key(file)
+        results, source_maps = extracted or extract([file], timings=timings)
+        start = time.perf_counter()
+        returncode = emit(
+            {file: results[file]}, {file: source_maps[file]}
+        ).get(file)
+        outcomes[key] = FileResult(
+            results[file],
+            source_maps[file],
+            returncode,
+            timings.get(key, 0.0) + time.perf_counter() - start,
+            timings.get(key, 0.0),
+        )
+
+        if run_journal is not None:
+            _ = run_journal.record(
+                file,
+                _journal_status(returncode),
+                output=locate(file),
+                returncode=returncode,
+            )
+
+        if returncode is not None:
+            returncodes[file] = returncode
+
+        if fail_fast and returncode:
+            _report_stop(len(filenames) - position - 1)
+            break
+
+    return returncodes, outcomes
+
+
+def _journal_status(returncode: int | None) -> 'Status':
+    """Get the journal status of a file, from its exit status if run."""
+    if returncode is None:
+        return 'extracted'
+
+    return 'failed' if returncode else 'passed'
+
+
+def _parse_shard(
+    ctx: click.Context, param: click.Parameter, value: str | None
+) -> 'Shard | None':
+    """Parse --shard INDEX/COUNT."""
+    from .sharding import Shard, ShardError
+
+    if value is None:
+        return None
+
+    try:
+        return Shard.parse(value)
+
+    except ShardError as error:
+        raise click.BadParameter(str(error)) from error
+
+
+def _read_result(path: PathLike[str]) -> 'RunResult':
+    """Read the result of a run, for merge and --shard-history."""
+    from .sharding import RunResult, ShardError
+
+    try:
+        return RunResult.read(path)
+
+    except (OSError, ShardError) as error:
+        raise click.ClickException(f'{path}: {error}') from error
+
+
+def _select_shard(
+    filenames: typing.Sequence[PathLike[str]],
+    shard: 'Shard | None',
+    balance: str,
+    history: Path | None,
+    runtimes: typing.Mapping[str, float] | None,
+    stdout_to: typing.TextIO,
+) -> typing.Sequence[PathLike[str]]:
+    """Get the files of the --shard, if any.
+
+    Shards are balanced by the runtimes of the ``history`` result, or else
+    by ``runtimes`` (of --history).
+    """
+    from .sharding import select_shard
+
+    if shard is None:
+        return filenames
+
+    if history is not None:
+        runtimes = _read_result(history).runtimes()
+
+    if balance == 'runtime' and runtimes is None:
+        raise click.UsageError(
+            '--shard-balance runtime needs --shard-history or --history.'
+        )
+
+    selected = select_shard(
+        filenames,
+        shard,
+        balance=typing.cast(typing.Any, balance),
+        runtimes=runtimes,
+    )
+    click.echo(
+        f'{MAGNIFYING_GLASS} Shard {shard}: {len(selected)} of '
+        f'{len(filenames)} files.',
+        file=stdout_to,
+    )
+
+    return selected
+
+
+def _read_history(
+    path: Path | None, *, execution: bool
+) -> dict[str, float] | None:
+    """Read the runtimes of the files in the --history, if any.
+
+    Without ``execution``, only the time spent extracting counts.
+    """
+    from .history import RunHistory, RunHistoryError
+
+    if path is None:
+        return None
+
+    try:
+        with RunHistory(path) as history:
+            return history.runtimes(execution=execution)
+
+    except RunHistoryError as error:
+        raise click.ClickException(str(error)) from error
+
+
+def _failures_first(
+    filenames: list[PathLike[str]],
+    path: Path | None,
+    stdout_to: typing.TextIO,
+) -> list[PathLike[str]]:
+    """Order the files to run those that failed or changed first.
+
+    Without the path of the history (i.e., without --failed-first), the
+    files are kept in order.
+    """
+    from .history import RunHistory, RunHistoryError, failures_first
+
+    if path is None:
+        return filenames
+
+    try:
+        with RunHistory(path) as history:
+            ordered = failures_first(filenames, history.last_runs())
+
+    except RunHistoryError as error:
+        raise click.ClickException(str(error)) from error
+
+    click.echo(
+        f'{RUNNER_EMOJI} Running the files that failed or changed first.',
+        file=stdout_to,
+    )
+
+    return ordered
+
+
+def _record_history(
+    path: Path | None,
+    outcomes: dict[str, 'FileResult'],
+    started: float,
+    stdout_to: typing.TextIO,
+) -> None:
+    """Record the timings of the run in the --history, if any."""
+    from .history import RunHistory, RunHistoryError
+
+    if path is None:
+        return
+
+    try:
+        with RunHistory(path) as history:
+            run = history.record(outcomes, started=started)
+
+    except RunHistoryError as error:
+        raise click.ClickException(str(error)) from error
+
+    click.echo(
+        f'{MAGNIFYING_GLASS} Recorded run {run} in {path}.', file=stdout_to
+    )
+
+
+def _print_summary(run_result: 'RunResult') -> None:
+    """Print the number of files of a run, passed and failed."""
+    summary = run_result.summary()
+    click.echo(
+        f'{RUNNER_EMOJI} {summary["files"]} files: {summary["passed"]} '
+        f'passed, {summary["failed"]} failed.'
+    )
+
+
+def _write_result(
+    path: Path | None,
+    files: typing.Sequence[PathLike[str]],
+    shard: 'Shard | None',
+    outcomes: dict[str, 'FileResult'],
+    stdout_to: typing.TextIO,
+) -> None:
+    """Write the (partial, with --shard) result of the run to ``path``."""
+    from .sharding import RunResult, shard_key
+
+    if path is None:
+        return
+
+    run_result = RunResult(
+        [shard_key(file) for file in files],
+        [shard] if shard is not None else [],
+        outcomes,
+    )
+    click.echo(
+        f'{MAGNIFYING_GLASS} Writing the result to {path}...', file=stdout_to
+    )
+    run_result.write(path)
+    _print_summary(run_result)
+
+
+def _new_block_store(path: Path | None) -> 'BlockStore | None':
+    """Get the store filled while extracting, if --block-store is given.
+
+    Blocks are added as each file is extracted, so each distinct block is
+    kept once.
+    """
+    if path is None:
+        return None
+
+    from .blockstore import BlockStore
+
+    return BlockStore()
+
+
+def _write_block_store(
+    path: Path,
+    filenames: typing.Sequence[PathLike[str]],
+    doctest: bool,
+    stdout_to: typing.TextIO,
+    store: 'BlockStore | None' = None,
+) -> None:
+    """Write the block store of all files to ``path``.
+
+    The files already in ``store`` were extracted by this run, and are not
+    scanned again; the others (e.g., skipped by --resume) are.
+    """
+    from .blockstore import store_documents
+
+    try:
+        store = store_documents(filenames, doctest=doctest, store=store)
+
+    except (IncludeCycleError, OSError) as error:
+        raise click.ClickException(str(error)) from error
+
+    click.echo(
+        f'{MAGNIFYING_GLASS} Writing {len(store)} distinct blocks '
+        f'({len(store.shared())} shared) to {path}...',
+        file=stdout_to,
+    )
+    store.write(path)
+
+
+def _write_output(
+    output: typing.TextIO,
+    results: dict[_Document, str],
+    source_maps: dict[_Document, SourceMap] | None,
+    stdout_to: typing.TextIO,
+) -> None:
+    """Write all results to the output file.
+
+    If ``source_maps`` are given, their combined map is written as the
+    output's sidecar.
+    """
+    for file, result in results.items():
+        click.echo(
+            f'{MAGNIFYING_GLASS} Writing {file} to {output.name}...',
+            file=stdout_to,
+        )
+        _ = output.write(result)
+
+    if source_maps is None:
+        return
+
+    combined = SourceMap()
+    for file in results:
+        combined.extend(source_maps[file])
+
+    combined.write(sidecar_path(output.name))
+
+
+class DefaultGroup(click.Group):
+    """Group running its default command if no command is named.
+
+    ``rst-extract file.rst`` is then the same as
+    ``rst-extract extract file.rst``. A file named like a command, e.g.
+    ``diff``, is extracted if it exists; ``rst-extract -- diff`` always
+    extracts it.
+    """
+
+    default_command = 'extract'
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        """Insert the default command before arguments not naming one."""
+        if args[:1] != ['--help'] and (
+            not args or args[0] not in self.commands or os.path.exists(args[0])
+        ):
+            args = [self.default_command, *args]
+
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultGroup)
+def start() -> None:
+    """Extract reStructuredText from Python files.
+
+    Without a command, runs the extract command.
+    """
+
+
+@start.command('extract')
 @click.argument(
     'filename',
     nargs=-1,
     type=click.Path(exists=True),
 )
 @click.option(
-    '-o',
-    '--output',
-    type=click.File('w+'),
-    nargs=1,
+    '-o',
+    '--output',
+    type=click.File('w+'),
+    nargs=1,
+    show_default=True,
+    help='Output to a file. The output will be python code.',
+)
+@click.option(
+    '-v',
+    '--verbose',
+    default=0,
+    type=int,
+    count=True,
+    help='Increase verbosity. Can be used multiple times. Maximum is DEBUG (-vvv).',
+)
+@click.option(
+    '--execute',
+    is_flag=True,
+    help='Execute the extracted code.',
+)
+@click.option(
+    '--python-bin',
+    nargs=1,
+    type=click.Path(exists=True),
+    default=sys.executable,
+    help='Path to the Python binary to use for execution.',
+)
+@click.option(
+    '--header-template',
+    nargs=1,
+    type=str,
+    default=DEFAULT_HEADER_TEMPLATE,
+    show_default=True,
+    callback=_validate_header_template,
+    help='Header line written before each block. {number} is the block number.',
+)
+@click.option(
+    '--source-map',
+    is_flag=True,
+    help=(
+        'Write a source map next to the output file, mapping each output '
+        'line back to its reStructuredText file and line.'
+    ),
+)
+@click.option(
+    '--doctest',
+    is_flag=True,
+    help='Also extract doctest (>>>) examples as code.',
+)
+@click.option(
+    '--check-doctests',
+    is_flag=True,
+    help=(
+        'Run the doctest (>>>) examples and check their expected output, '
+        'instead of extracting code.'
+    ),
+)
+@click.option(
+    '-j',
+    '--jobs',
+    type=click.IntRange(min=1),
+    default=None,
+    help='Number of worker processes. Defaults to the number of CPUs.',
+)
+@click.option(
+    '--project',
+    type=click.Path(exists=True, path_type=Path),
+    default=None,
+    help=(
+        'Extract every document of a Sphinx project (its root, source '
+        'directory or conf.py), in toctree reading order.'
+    ),
+)
+@click.option(
+    '--split-output',
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help='Write one script per document to this directory.',
+)
+@click.option(
+    '--changed-since',
+    metavar='REF',
+    default=None,
+    help=(
+        'Only process documents changed since the git ref REF, and the '
+        'documents including them.'
+    ),
+)
+@click.option(
+    '--staged',
+    is_flag=True,
+    help=(
+        'Only process documents with staged changes, and the documents '
+        'including them (e.g., in a pre-commit hook).'
+    ),
+)
+@click.option(
+    '--rev',
+    'revs',
+    metavar='REV',
+    multiple=True,
+    help=(
+        'Extract the documents at the git revision REV, read from the '
+        'object store without a checkout. Can be used multiple times. '
+        'Filenames, if given, select the documents.'
+    ),
+)
+@click.option(
+    '--block-store',
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=(
+        'Write the distinct blocks of all documents, stored once each, and '
+        'the blocks each document references, to this JSON file.'
+    ),
+)
+@click.option(
+    '--dedup',
+    is_flag=True,
+    help='With --execute, run documents with identical code only once.',
+)
+@click.option(
+    '--incremental',
+    is_flag=True,
+    help=(
+        'With --execute, only run the blocks that changed since the last '
+        'run, the blocks depending on them, and the blocks they need.'
+    ),
+)
+@click.option(
+    '--record',
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=(
+        'With --incremental, the record of the last runs. Defaults to '
+        '.rst-extract/last-run.json.'
+    ),
+)
+@click.option(
+    '--parallel-blocks',
+    is_flag=True,
+    help=(
+        'With --execute, split each document into groups of blocks sharing '
+        'no state, and run the groups concurrently (see --jobs).'
+    ),
+)
+@click.option(
+    '--backend',
+    type=click.Choice(['process', 'subinterpreter']),
+    default='process',
     show_default=True,
-    help='Output to a file. The output will be python code.',
+    help=(
+        'How --execute runs documents: each in a new process, or each in '
+        'its own subinterpreter of a worker process (Python 3.12+, falling '
+        'back to processes).'
+    ),
 )
 @click.option(
-    '-v',
-    '--verbose',
-    default=0,
-    type=int,
-    count=True,
-    help='Increase verbosity. Can be used multiple times. Maximum is DEBUG (-vvv).',
+    '--journal',
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=(
+        'Append the outcome of each file (hash, status, output location) '
+        'to this append-only log as soon as it is done.'
+    ),
 )
 @click.option(
-    '--execute',
+    '--resume',
     is_flag=True,
-    help='Execute the extracted code.',
+    help=(
+        'With --journal, skip the files already recorded in the journal, '
+        'and unchanged since, continuing an interrupted run.'
+    ),
 )
 @click.option(
-    '--python-bin',
-    nargs=1,
-    type=click.Path(exists=True),
-    default=sys.executable,
-    help='Path to the Python binary to use for execution.',
+    '--shard',
+    metavar='INDEX/COUNT',
+    default=None,
+    callback=_parse_shard,
+    help=(
+        'Only process the files of shard INDEX (from 1) of COUNT, a stable '
+        'subset of the files, e.g., for one of COUNT CI machines.'
+    ),
+)
+@click.option(
+    '--shard-balance',
+    type=click.Choice(['hash', 'size', 'runtime']),
+    default='hash',
+    show_default=True,
+    help=(
+        'Assign files to shards by the hash of their path, or balance the '
+        'shards by file size or by the runtimes of --shard-history.'
+    ),
+)
+@click.option(
+    '--shard-history',
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help='The --result of an earlier run (or merge), for runtimes.',
+)
+@click.option(
+    '--result',
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=(
+        'Write the result of the run (the code and status of each file) '
+        'to this JSON file; with --shard, a partial result for merge.'
+    ),
+)
+@click.option(
+    '--history',
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=(
+        'Record the size, number of blocks and timings of each file in '
+        'this SQLite history (see rst-extract stats), and start the files '
+        'slow in earlier runs first.'
+    ),
+)
+@click.option(
+    '--fail-fast',
+    is_flag=True,
+    help=(
+        'With --execute, stop at the first document that fails, executing '
+        'no other document, and exit with 1.'
+    ),
 )
-def start(
+@click.option(
+    '--failed-first',
+    is_flag=True,
+    help=(
+        'Process the documents that failed in their last run of the '
+        '--history first, then those changed since, then the others.'
+    ),
+)
+def extract(
     filename: list[os.PathLike[str]],
     output: typing.TextIO,
     verbose: int,
     execute: bool,
     python_bin: os.PathLike[str],
+    header_template: str,
+    source_map: bool,
+    doctest: bool,
+    check_doctests: bool,
+    jobs: int | None,
+    project: Path | None,
+    split_output: Path | None,
+    changed_since: str | None,
+    staged: bool,
+    revs: tuple[str, ...],
+    block_store: Path | None,
+    dedup: bool,
+    incremental: bool,
+    record: Path | None,
+    parallel_blocks: bool,
+    backend: str,
+    journal: Path | None,
+    resume: bool,
+    shard: 'Shard | None',
+    shard_balance: str,
+    shard_history: Path | None,
+    result: Path | None,
+    history: Path | None,
+    fail_fast: bool,
+    failed_first: bool,
 ) -> None:
     """Extract reStructuredText from Python files."""
     configure_logging(verbose)
+    _check_execution_modes(
+        execute, revs, incremental=incremental, parallel_blocks=parallel_blocks
+    )
+    _check_run_options(
+        revs,
+        journal=journal,
+        resume=resume,
+        output=output is not None,
+        execute=execute,
+        fail_fast=fail_fast,
+        failed_first=failed_first,
+        incremental=incremental,
+        record=record,
+        shard=shard,
+        result=result,
+        history=history,
+    )
 
     # TODO: Should be managed by an STDOUT manager class.
     stdout_to = sys.stdout
     if not verbose:
         stdout_to = open(os.devnull, 'w')
 
+    emit = functools.partial(
+        _emit_results,
+        output=output,
+        source_map=source_map,
+        split_output=split_output,
+        execute=execute,
+        python_bin=python_bin,
+        dedup=dedup,
+        stdout_to=stdout_to,
+        fail_fast=fail_fast,
+    )
+
+    if revs:
+        results, source_maps = _extract_revisions(
+            revs,
+            filename,
+            header_template=header_template,
+            doctest=doctest,
+            stdout_to=stdout_to,
+        )
+        emit(results, source_maps, source_dir=None)
+        click.echo(f'{MAGNIFYING_GLASS} Done.'.ljust(80, '-'), file=stdout_to)
+        return
+
+    source_dir = None
+    if project is not None:
+        source_dir, documents = _read_project(project)
+        filename = [*documents, *filename]
+
+    if changed_since is not None or staged:
+        documents = _changed_documents(changed_since, staged)
+
+        if not documents and not filename:
+            click.echo(f'{MAGNIFYING_GLASS} No changes.', file=stdout_to)
+            return
+
+        filename = [*documents, *filename]
+
     # TODO: Should eventually escape into an interactive selector.
     if not filename:
         click.echo(
@@ -106,6 +1416,27 @@ def start(
         )
         return
 
+    started = time.time()
+    inputs = filename
+    filename = list(
+        _select_shard(
+            filename,
+            shard,
+            shard_balance,
+            shard_history,
+            _read_history(history, execution=True),
+            stdout_to,
+        )
+    )
+
+    filename = _failures_first(
+        filename, history if failed_first else None, stdout_to
+    )
+
+    if check_doctests:
+        _check_doctests(filename, jobs)
+        return
+
     click.echo(
         f'{MAGNIFYING_GLASS} Extracting reStructuredText from ',
         file=stdout_to,
@@ -117,36 +1448,618 @@ def start(
         file=stdout_to,
     )
 
-    # TODO: This should be managed by a class, not in start().
-    results: dict[PathLike[str], str] = {}
-    for file in filename:
-        click.echo(f'{MAGNIFYING_GLASS} Processing {file}...', file=stdout_to)
+    store = _new_block_store(block_store)
 
-        extractor = Extractor(file)
-        result = extractor.extract()
+    with _block_executor(
+        incremental=incremental,
+        parallel_blocks=parallel_blocks,
+        backend=backend if execute else 'process',
+        record=record,
+        python_bin=python_bin,
+        header_template=header_template,
+        doctest=doctest,
+        jobs=jobs,
+        dedup=dedup,
+        stdout_to=stdout_to,
+        fail_fast=fail_fast,
+        ordered=failed_first,
+    ) as executor:
+        # TODO: This should be managed by a class, not in start().
+        returncodes, outcomes = _extract_and_emit(
+            filename,
+            extract=functools.partial(
+                _extract_files,
+                header_template=header_template,
+                doctest=doctest,
+                jobs=jobs,
+                # Journaled files are extracted one at a time.
+                parallel=journal is None
+                and (project is not None or (jobs or 1) > 1),
+                stdout_to=stdout_to,
+                runtimes=_read_history(history, execution=False),
+                store=store,
+            ),
+            emit=functools.partial(
+                emit, source_dir=source_dir, executor=executor
+            ),
+            journal=journal,
+            resume=resume,
+            locate=functools.partial(
+                _output_location,
+                split_output=split_output,
+                source_dir=source_dir,
+            ),
+            record=result is not None or history is not None,
+            fail_fast=fail_fast,
+            stdout_to=stdout_to,
+        )
 
-        results[file] = result
+    if block_store is not None:
+        _write_block_store(block_store, filename, doctest, stdout_to, store)
+
+    _write_result(result, inputs, shard, outcomes, stdout_to)
+    _record_history(history, outcomes, started, stdout_to)
+    click.echo(f'{MAGNIFYING_GLASS} Done.'.ljust(80, '-'), file=stdout_to)
+
+    if fail_fast and any(returncodes.values()):
+        raise SystemExit(1)
+
+
+@start.command()
+@click.argument(
+    'results',
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    '-o',
+    '--output',
+    type=click.File('w+'),
+    default=None,
+    help='Write the code of all files to this file, instead of printing it.',
+)
+@click.option(
+    '--source-map',
+    is_flag=True,
+    help='Write a source map next to the output file.',
+)
+@click.option(
+    '--result',
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help='Write the merged result to this JSON file.',
+)
+def merge(
+    results: tuple[Path, ...],
+    output: typing.TextIO | None,
+    source_map: bool,
+    result: Path | None,
+) -> None:
+    """Merge the --result files of the shards of a run.
+
+    Prints (or writes) the code of all files in the order of the run, and
+    the summary, as the run on a single machine would have.
+    """
+    from .sharding import ShardError, merge_results
+
+    try:
+        merged = merge_results([_read_result(path) for path in results])
+
+    except ShardError as error:
+        raise click.ClickException(str(error)) from error
+
+    codes: dict[_Document, str] = {}
+    source_maps: dict[_Document, SourceMap] = {}
+
+    for key, file_result in merged.ordered():
+        codes[Path(key)] = file_result.code
+        source_maps[Path(key)] = file_result.source_map
 
-    # TODO: Output should be managed by a class, not in start().
     if output:
-        for file, result in results.items():
+        devnull = open(os.devnull, 'w')
+        _write_output(
+            output, codes, source_maps if source_map else None, devnull
+        )
+
+    # Like extract, print the code unless it was executed.
+    if all(outcome.returncode is None for outcome in merged.results.values()):
+        _print_results(codes)
+
+    if result is not None:
+        merged.write(result)
+
+    _print_summary(merged)
+
+
+@start.command()
+@click.option(
+    '--socket',
+    'socket_path',
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=(
+        'Unix domain socket to listen on. Defaults to $RST_EXTRACT_SOCKET, '
+        'or a per-user socket in $XDG_RUNTIME_DIR.'
+    ),
+)
+@click.option(
+    '--stdio',
+    is_flag=True,
+    help='Serve requests on stdin/stdout instead of a socket.',
+)
+@click.option(
+    '--python-bin',
+    nargs=1,
+    type=click.Path(exists=True),
+    default=sys.executable,
+    help='Path to the Python binary execute requests run code with.',
+)
+@click.option(
+    '--interpreters',
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help='Number of warm interpreters, i.e., of execute requests run at once.',
+)
+@click.option(
+    '-v',
+    '--verbose',
+    default=0,
+    type=int,
+    count=True,
+    help='Increase verbosity. Can be used multiple times.',
+)
+def serve(
+    socket_path: str | None,
+    stdio: bool,
+    python_bin: str,
+    interpreters: int,
+    verbose: int,
+) -> None:
+    """Serve extract/validate/execute requests as a long-lived daemon.
+
+    Requests are JSON-RPC 2.0, one per line. Parsed files and results stay
+    cached between requests. Use rst-extract-client to call the daemon.
+    """
+    from .client import default_socket_path
+    from .server import (
+        ExtractionService,
+        SocketInUseError,
+        serve_socket,
+        serve_stdio,
+    )
+
+    configure_logging(verbose)
+
+    with ExtractionService(python_bin, interpreters) as service:
+        if stdio:
+            serve_stdio(service)
+            return
+
+        socket_path = socket_path or default_socket_path()
+        click.echo(f'{RUNNER_EMOJI} Serving on {socket_path}...', err=True)
+
+        try:
+            serve_socket(service, socket_path)
+
+        except SocketInUseError as error:
+            raise click.ClickException(str(error)) from error
+
+        except KeyboardInterrupt:
+            pass
+
+
+@start.command()
+@click.argument('paths', nargs=-1, type=click.Path())
+@click.option(
+    '--rev',
+    'revs',
+    metavar='REV',
+    multiple=True,
+    help=(
+        'Compare the documents at two git revisions (use --rev twice). '
+        'PATHS, if given, select the documents.'
+    ),
+)
+@click.option(
+    '--doctest',
+    is_flag=True,
+    help='Also compare doctest (>>>) examples.',
+)
+@click.option(
+    '--json',
+    'as_json',
+    is_flag=True,
+    help='Print the changes as JSON.',
+)
+def diff(
+    paths: tuple[str, ...],
+    revs: tuple[str, ...],
+    doctest: bool,
+    as_json: bool,
+) -> None:
+    """Report the code blocks added, removed or modified between versions.
+
+    Compares the documents OLD and NEW given as PATHS, or the documents at
+    two git revisions. Exits with 1 if any block changed.
+    """
+    from .blockdiff import diff_files, diff_revisions
+    from .git import GitError, repository_root
+
+    try:
+        if revs:
+            if len(revs) != 2:
+                raise click.UsageError('Give --rev exactly twice.')
+
+            root = repository_root()
+            relative = [
+                Path(path).resolve().relative_to(root).as_posix()
+                for path in paths
+            ]
+            changes = diff_revisions(
+                *revs, relative or None, cwd=root, doctest=doctest
+            )
+
+        elif len(paths) == 2:
+            document_changes = diff_files(*paths, doctest=doctest)
+            changes = {paths[1]: document_changes} if document_changes else {}
+
+        else:
+            raise click.UsageError('Give two documents, or --rev twice.')
+
+    except (GitError, ExtractionError, IncludeCycleError, ValueError) as error:
+        raise click.ClickException(str(error)) from error
+
+    if as_json:
+        click.echo(json.dumps(_changes_to_json(changes), indent=2))
+
+    else:
+        _print_changes(changes)
+
+    if changes:
+        raise SystemExit(1)
+
+
+def _changes_to_json(
+    changes: dict[str, list['BlockChange']],
+) -> list[dict[str, typing.Any]]:
+    """Get the changes of ``diff`` as JSON-serializable objects."""
+
+    def _record(record: 'BlockRecord | None') -> dict[str, typing.Any] | None:
+        if record is None:
+            return None
+
+        return {
+            'source': record.source,
+            'line': record.line,
+            'index': record.index,
+            'hash': record.hash,
+        }
+
+    return [
+        {
+            'document': document,
+            'kind': change.kind,
+            'old': _record(change.old),
+            'new': _record(change.new),
+        }
+        for document, document_changes in changes.items()
+        for change in document_changes
+    ]
+
+
+def _print_changes(changes: dict[str, list['BlockChange']]) -> None:
+    """Print the changes of ``diff``, with a diff of each changed block."""
+    for document, document_changes in changes.items():
+        click.echo(f'{MAGNIFYING_GLASS} {document}'.ljust(80, '-'))
+
+        for change in document_changes:
+            click.echo(f'{change.kind} {change.location}')
+
+            for line in change.unified_diff():
+                click.echo(f'    {line}')
+
+
+def _find_documents(paths: typing.Iterable[Path]) -> list[Path]:
+    """Get the documents at ``paths``, searching directories recursively."""
+    from .git import DOCUMENT_SUFFIXES
+
+    documents = []
+
+    for path in paths:
+        if not path.is_dir():
+            documents.append(path)
+            continue
+
+        documents.extend(
+            sorted(
+                found
+                for found in path.rglob('*')
+                if found.suffix in DOCUMENT_SUFFIXES and found.is_file()
+            )
+        )
+
+    return documents
+
+
+_index_option = click.option(
+    '--index',
+    'index_path',
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help='The index database. Defaults to .rst-extract/index.sqlite3.',
+)
+
+
+@start.command()
+@click.argument(
+    'paths', nargs=-1, type=click.Path(exists=True, path_type=Path)
+)
+@_index_option
+@click.option(
+    '--project',
+    type=click.Path(exists=True, path_type=Path),
+    default=None,
+    help='Index every document of a Sphinx project.',
+)
+@click.option(
+    '--doctest',
+    is_flag=True,
+    help='Also index doctest (>>>) examples.',
+)
+@click.option(
+    '-v',
+    '--verbose',
+    default=0,
+    type=int,
+    count=True,
+    help='Increase verbosity. Can be used multiple times.',
+)
+def index(
+    paths: tuple[Path, ...],
+    index_path: Path | None,
+    project: Path | None,
+    doctest: bool,
+    verbose: int,
+) -> None:
+    """Index the blocks, imports and definitions of documents.
+
+    PATHS are documents, or directories searched for documents. Only
+    documents that changed since they were indexed are scanned again.
+    """
+    from .index import DEFAULT_INDEX_PATH, BlockIndex, BlockIndexError
+
+    configure_logging(verbose)
+    documents = _find_documents(paths)
+
+    if project is not None:
+        documents = [*_read_project(project)[1], *documents]
+
+    try:
+        with BlockIndex(index_path or DEFAULT_INDEX_PATH) as block_index:
+            update = block_index.update(documents, doctest=doctest)
+
+    except (BlockIndexError, IncludeCycleError, OSError) as error:
+        raise click.ClickException(str(error)) from error
+
+    click.echo(
+        f'{MAGNIFYING_GLASS} Indexed {len(update.indexed)} documents '
+        f'({len(update.unchanged)} unchanged, {len(update.removed)} removed).'
+    )
+
+
+@start.command()
+@click.argument('name')
+@_index_option
+@click.option(
+    '--imports',
+    'kind',
+    flag_value='import',
+    default=None,
+    help='Only find blocks importing NAME.',
+)
+@click.option(
+    '--defines',
+    'kind',
+    flag_value='define',
+    help='Only find blocks defining NAME.',
+)
+@click.option(
+    '--json',
+    'as_json',
+    is_flag=True,
+    help='Print the matches as JSON.',
+)
+def query(
+    name: str,
+    index_path: Path | None,
+    kind: typing.Literal['import', 'define'] | None,
+    as_json: bool,
+) -> None:
+    """Find the indexed blocks importing or defining NAME.
+
+    A dotted NAME also matches the names under it (numpy.random matches
+    numpy.random.default_rng), and a plain NAME matches dotted names ending
+    with it. Exits with 1 if nothing matches.
+    """
+    from .index import DEFAULT_INDEX_PATH, BlockIndex, BlockIndexError
+
+    index_path = index_path or DEFAULT_INDEX_PATH
+
+    if not index_path.is_file():
+        raise click.ClickException(
+            f'No index at {index_path}; run rst-extract index first.'
+        )
+
+    try:
+        with BlockIndex(index_path) as block_index:
+            matches = block_index.query(name, kind)
+
+    except BlockIndexError as error:
+        raise click.ClickException(str(error)) from error
+
+    if as_json:
+        click.echo(
+            json.dumps([match._asdict() for match in matches], indent=2)
+        )
+
+    else:
+        for match in matches:
+            click.echo(f'{match.location}: {match.kind} {match.name}')
+
+    if not matches:
+        raise SystemExit(1)
+
+
+@start.command()
+@click.argument('documents', nargs=-1, type=click.Path(path_type=Path))
+@click.option(
+    '--history',
+    'history_path',
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help='The run history. Defaults to .rst-extract/history.sqlite3.',
+)
+@click.option(
+    '-n',
+    '--limit',
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help='The number of slowest files, and of runs, to show.',
+)
+@click.option(
+    '--threshold',
+    type=click.FloatRange(min=1, min_open=True),
+    default=1.5,
+    show_default=True,
+    help=(
+        'Report the files this many times slower in the last run than in '
+        'the runs before.'
+    ),
+)
+@click.option(
+    '--json',
+    'as_json',
+    is_flag=True,
+    help='Print the statistics as JSON.',
+)
+def stats(
+    documents: tuple[Path, ...],
+    history_path: Path | None,
+    limit: int,
+    threshold: float,
+    as_json: bool,
+) -> None:
+    """Show the timings recorded by extract --history.
+
+    Shows the slowest files of the last run, the last runs, and the files
+    that regressed; or, for DOCUMENTS, their timings in each run. Exits with
+    1 if a file regressed.
+    """
+    from .history import DEFAULT_HISTORY_PATH, RunHistory, RunHistoryError
+    from .sharding import shard_key
+
+    history_path = history_path or DEFAULT_HISTORY_PATH
+
+    if not history_path.is_file():
+        raise click.ClickException(
+            f'No history at {history_path}; run rst-extract extract '
+            f'--history {history_path} first.'
+        )
+
+    try:
+        with RunHistory(history_path) as history:
+            statistics = {
+                'runs': history.runs(limit),
+                'slowest': [] if documents else history.slowest(limit),
+                'trends': {
+                    shard_key(document): history.trend(
+                        shard_key(document), limit
+                    )
+                    for document in documents
+                },
+                'regressions': history.regressions(threshold),
+            }
+
+    except RunHistoryError as error:
+        raise click.ClickException(str(error)) from error
+
+    if as_json:
+        click.echo(json.dumps(_stats_to_json(statistics), indent=2))
+
+    else:
+        _print_stats(statistics, threshold)
+
+    if statistics['regressions']:
+        raise SystemExit(1)
+
+
+def _stats_to_json(statistics: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    """Get the output of stats as a JSON-serializable ``dict``."""
+
+    def _timing(timing: 'FileTiming') -> dict[str, typing.Any]:
+        return {**timing._asdict(), 'duration': timing.duration}
+
+    return {
+        'runs': [run._asdict() for run in statistics['runs']],
+        'slowest': [_timing(timing) for timing in statistics['slowest']],
+        'trends': {
+            document: [_timing(timing) for timing in timings]
+            for document, timings in statistics['trends'].items()
+        },
+        'regressions': [
+            {**regression._asdict(), 'ratio': regression.ratio}
+            for regression in statistics['regressions']
+        ],
+    }
+
+
+def _print_stats(statistics: dict[str, typing.Any], threshold: float) -> None:
+    """Print the output of stats."""
+    started = {
+        run.id: time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run.started))
+        for run in statistics['runs']
+    }
+
+    if statistics['slowest']:
+        click.echo(
+            f'{MAGNIFYING_GLASS} Slowest files of run '
+            f'{statistics["slowest"][0].run}:'
+        )
+
+    for timing in statistics['slowest']:
+        click.echo(
+            f'  {timing.duration:8.3f}s  {timing.document} '
+            f'({timing.blocks} blocks, {timing.size} bytes)'
+        )
+
+    for document, timings in statistics['trends'].items():
+        click.echo(f'{MAGNIFYING_GLASS} {document}:')
+
+        for timing in timings:
             click.echo(
-                f'{MAGNIFYING_GLASS} Writing {file} to {output.name}...',
-                file=stdout_to,
+                f'  run {timing.run:<5d} {timing.duration:8.3f}s  '
+                f'({timing.blocks} blocks, {timing.size} bytes)'
             )
-            _ = output.write(result)
 
-    # TODO: Execution should be managed by a class, not in start().
-    if not execute:
-        for file, result in results.items():
-            # TODO: Make primary output prettier and parsable.
-            msg = f'{MAGNIFYING_GLASS} {file}'.ljust(80, '-')
-            click.echo(msg)
-            click.echo(result)
+    click.echo(f'{MAGNIFYING_GLASS} Last {len(started)} runs:')
 
-    if execute:
-        for file, result in results.items():
-            click.echo(f'{RUNNER_EMOJI} Executing {file}...', file=stdout_to)
-            execute_command(python_bin=python_bin, code=result)
+    for run in statistics['runs']:
+        click.echo(
+            f'  run {run.id:<5d} {started[run.id]}  {run.files:5d} files '
+            f'{run.duration:8.3f}s  {run.failed} failed'
+        )
 
-    click.echo(f'{MAGNIFYING_GLASS} Done.'.ljust(80, '-'), file=stdout_to)
+    if not statistics['regressions']:
+        click.echo(f'{RUNNER_EMOJI} No regressions past {threshold}x.')
+        return
+
+    click.echo(f'{WARNING_EMOJI} Regressions past {threshold}x:')
+
+    for regression in statistics['regressions']:
+        click.echo(
+            f'  {regression.document}: {regression.baseline:.3f}s -> '
+            f'{regression.latest:.3f}s ({regression.ratio:.1f}x)'
+        )
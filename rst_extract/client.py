@@ -0,0 +1,220 @@
+"""Thin client for the ``rst-extract serve`` daemon.
+
+This module only uses the standard library, and the package ``__init__``
+imports its heavier modules lazily: calling a running daemon does not pay
+for importing click, pydantic or structlog::
+
+    rst-extract-client extract docs/index.rst
+    rst-extract-client validate docs/index.rst
+    rst-extract-client execute docs/index.rst
+
+Requests are JSON-RPC 2.0 objects, one per line, over a Unix domain socket.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import sys
+import tempfile
+import typing
+
+SOCKET_ENV_VAR = 'RST_EXTRACT_SOCKET'
+
+
+def default_socket_path() -> str:
+    """Get the socket path used if none is given.
+
+    This is ``$RST_EXTRACT_SOCKET`` if set, or a per-user socket in
+    ``$XDG_RUNTIME_DIR`` (or the temporary directory) otherwise.
+    """
+    if path := os.getenv(SOCKET_ENV_VAR):
+        return path
+
+    directory = os.getenv('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+
+    return os.path.join(directory, f'rst-extract-{os.getuid()}.sock')
+
+
+class ClientError(Exception):
+    """Error returned by the daemon for a request."""
+
+    code: int
+    data: typing.Any
+
+    def __init__(self, code: int, message: str, data: typing.Any = None):
+        """Initialize the ClientError from a JSON-RPC error object."""
+        super().__init__(message)
+        self.code = code
+        self.data = data
+
+
+class Client:
+    """Connection to a running ``rst-extract serve`` daemon.
+
+    The connection is opened on the first call and reused for the next
+    ones, so each call only costs a round trip over the socket.
+    """
+
+    socket_path: str
+    timeout: float | None
+
+    def __init__(
+        self, socket_path: str | None = None, timeout: float | None = None
+    ):
+        """Initialize the Client.
+
+        Arguments
+        ---------
+        socket_path : str | None
+            The socket the daemon listens on. Defaults to
+            ``default_socket_path()``.
+
+        timeout : float | None
+            Timeout for each call, in seconds. Default is no timeout.
+        """
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self._socket: socket.socket | None = None
+        self._file: typing.BinaryIO | None = None
+        self._ids = itertools.count(1)
+
+    def _connect(self) -> typing.BinaryIO:
+        """Connect to the daemon, if not connected yet."""
+        if self._file is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(self.timeout)
+            self._socket.connect(self.socket_path)
+            self._file = self._socket.makefile('rwb')
+
+        return self._file
+
+    def call(self, method: str, **params: typing.Any) -> typing.Any:
+        """Call ``method`` on the daemon and return its result.
+
+        Raises
+        ------
+        ClientError
+            If the daemon returns an error.
+
+        ConnectionError
+            If the daemon closes the connection.
+        """
+        request = {
+            'jsonrpc': '2.0',
+            'id': next(self._ids),
+            'method': method,
+            'params': params,
+        }
+        file = self._connect()
+        file.write(json.dumps(request).encode('utf-8') + b'\n')
+        file.flush()
+
+        line = file.readline()
+
+        if not line:
+            self.close()
+            raise ConnectionError(
+                'The rst-extract daemon closed the connection.'
+            )
+
+        response = json.loads(line)
+
+        if 'error' in response:
+            error = response['error']
+            raise ClientError(
+                error['code'], error['message'], error.get('data')
+            )
+
+        return response['result']
+
+    def close(self) -> None:
+        """Close the connection, if open."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self) -> 'Client':
+        """Use the client as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the connection."""
+        self.close()
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    """Parse the command line of the client."""
+    parser = argparse.ArgumentParser(
+        prog='rst-extract-client',
+        description='Call a running rst-extract serve daemon.',
+    )
+    parser.add_argument(
+        'method',
+        choices=('extract', 'validate', 'execute', 'ping', 'shutdown'),
+    )
+    parser.add_argument('filename', nargs='*')
+    parser.add_argument('--socket', default=None, help='The daemon socket.')
+    parser.add_argument('--header-template', default=None)
+    parser.add_argument('--doctest', action='store_true')
+
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the client from the command line, returning the exit code."""
+    args = _parse_args(argv)
+    options: dict[str, typing.Any] = {'doctest': args.doctest}
+
+    if args.header_template is not None:
+        options['header_template'] = args.header_template
+
+    status = 0
+
+    try:
+        with Client(args.socket) as client:
+            if args.method in ('ping', 'shutdown'):
+                print(client.call(args.method))
+                return 0
+
+            for filename in args.filename:
+                path = os.path.abspath(filename)
+                result = client.call(args.method, path=path, **options)
+
+                if args.method == 'extract':
+                    sys.stdout.write(result['code'])
+
+                elif args.method == 'validate':
+                    if not result['valid']:
+                        status = 1
+                        print(
+                            f'{result["filename"]}:{result["line"]}: '
+                            f'{result["error"]}'
+                        )
+
+                else:
+                    sys.stdout.write(result['stdout'])
+                    sys.stderr.write(result['stderr'])
+                    status = status or result['returncode']
+
+    except ClientError as error:
+        print(f'rst-extract-client: {error}', file=sys.stderr)
+        return 1
+
+    except OSError as error:
+        print(
+            f'rst-extract-client: could not reach the daemon: {error}',
+            file=sys.stderr,
+        )
+        return 2
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,609 @@
+"""Registry of reStructuredText directives that contain python code.
+
+Every registered directive name is compiled, together with a rule for
+comments, into a single alternation regex. One scan over a document then
+classifies each directive it finds and routes it to its handler through a
+dispatch table. Handlers consume the directive's body, so nested directives
+(e.g., in comments or in non-python code blocks) are never scanned twice.
+
+Directives that are not registered, such as ``.. note::``, are not consumed:
+code blocks nested in their bodies are still found.
+"""
+
+import ast
+import dataclasses
+import os
+import re
+from collections.abc import Callable, Iterator, Sequence
+from pathlib import Path
+from typing import NamedTuple
+
+import structlog
+
+from .spans import SourceLines, Span, TextBuffer
+
+log = structlog.get_logger()
+
+PYTHON_LANGUAGES = frozenset({'python', 'py', 'python3', 'py3'})
+
+# Matched from the start of a line with ``re.Pattern.match(text, pos)``.
+_OPTION_RE = re.compile(r'[ \t]+:([\w\-]+):(?:[ \t]+(.*))?$')
+
+# Options of ``literalinclude`` adding text that is not in the included file,
+# or showing something else than its code.
+_UNSUPPORTED_INCLUDE_OPTIONS = ('prepend', 'append', 'diff')
+
+# Everything after '.. ' that makes explicit markup something other than a
+# comment: directives, targets, footnotes/citations and substitutions.
+_NOT_COMMENT = r'(?![\w\-+.:]+::)(?![_\[|])'
+
+
+class LiteralIncludeError(ValueError):
+    """Raised when the options of a ``literalinclude`` cannot be applied."""
+
+
+class DirectiveMatch(NamedTuple):
+    """A directive found while scanning a document.
+
+    Attributes
+    ----------
+    name : str
+        The directive name, e.g. ``code-block``.
+
+    argument : str
+        The directive argument, e.g. ``python``. Empty if there is none.
+
+    line : int
+        The 0-based line number of the directive.
+
+    indent : int
+        The indent of the directive marker.
+    """
+
+    name: str
+    argument: str
+    line: int
+    indent: int
+
+
+# A handler gets the buffer and directive, and returns the extracted block
+# (None for no block, or a BlockList for several), and the line the scan
+# should continue from.
+Handler = Callable[
+    [TextBuffer, DirectiveMatch], tuple[Sequence[str] | None, int]
+]
+
+
+class BlockList(list[Sequence[str]]):
+    """Several blocks returned by a single handler, e.g. for an include."""
+
+
+@dataclasses.dataclass(frozen=True)
+class Directive:
+    """A registered directive and its handler."""
+
+    name: str
+    handler: Handler
+
+
+class DirectiveRegistry:
+    """Directives compiled into a single scanning regex and dispatch table."""
+
+    _directives: dict[str, Directive]
+    _prompt_handler: Handler | None
+    _pattern: re.Pattern[str] | None
+
+    def __init__(self) -> None:
+        """Initialize an empty registry."""
+        self._directives = {}
+        self._prompt_handler = None
+        self._pattern = None
+
+    def register(self, name: str, handler: Handler) -> None:
+        """Register ``handler`` for the directive called ``name``.
+
+        Registering a name again replaces its handler.
+        """
+        self._directives[name] = Directive(name, handler)
+        self._pattern = None
+
+    def register_prompt(self, handler: Handler) -> None:
+        """Register ``handler`` for doctest blocks, i.e. ``>>>`` prompts.
+
+        The handler is called with a ``DirectiveMatch`` named ``'>>>'``.
+        """
+        self._prompt_handler = handler
+        self._pattern = None
+
+    def copy(self) -> 'DirectiveRegistry':
+        """Get a copy of the registry, which can be extended separately."""
+        registry = DirectiveRegistry()
+        registry._directives = dict(self._directives)
+        registry._prompt_handler = self._prompt_handler
+
+        return registry
+
+    def __contains__(self, name: object) -> bool:
+        """Check if a directive is registered."""
+        return name in self._directives
+
+    @property
+    def names(self) -> list[str]:
+        """The registered directive names."""
+        return list(self._directives)
+
+    @property
+    def pattern(self) -> re.Pattern[str]:
+        """The single regex matching every registered directive and comment.
+
+        The ``name`` group is set for directives, ``comment`` for comments
+        and, if a prompt handler is registered, ``prompt`` for doctest
+        blocks.
+        """
+        if self._pattern is None:
+            # Longest names first, so e.g. 'code-block' is not cut to 'code'.
+            names = sorted(self._directives, key=len, reverse=True)
+            alternation = '|'.join(re.escape(name) for name in names)
+
+            alternatives = [
+                r'\.\.(?:'
+                rf'[ \t]+(?P<name>{alternation or "(?!)"})::'
+                # docutils also takes an argument right after the '::'.
+                r'(?:[ \t]*(?P<argument>[^\n]*?))?[ \t]*'
+                r'|(?P<comment>[ \t]*'
+                rf'|[ \t]+(?=[^ \t\r\n]){_NOT_COMMENT}[^\n]*?)'
+                r')\r?$'
+            ]
+
+            if self._prompt_handler is not None:
+                alternatives.append(r'(?P<prompt>>>>)(?=[ \t]|\r?$)')
+
+            self._pattern = re.compile(
+                rf'^(?P<indent>[ \t]*)(?:{"|".join(alternatives)})',
+                re.MULTILINE,
+            )
+
+        return self._pattern
+
+    def scan(self, buffer: TextBuffer) -> Iterator[Sequence[str]]:
+        """Scan ``buffer`` once, yielding the blocks of every directive."""
+        text = buffer.text
+        pattern = self.pattern
+        position = 0
+
+        while (match := pattern.search(text, position)) is not None:
+            line = buffer.line_of(match.start())
+            indent = len(match.group('indent'))
+            name = match.group('name')
+
+            if match.groupdict().get('prompt') is not None:
+                assert self._prompt_handler is not None
+                directive = DirectiveMatch('>>>', '', line, indent)
+                block, next_line = self._prompt_handler(buffer, directive)
+
+            elif name is None:
+                block = None
+                next_line = skip_body(buffer, line + 1, indent)
+
+            else:
+                directive = DirectiveMatch(
+                    name, match.group('argument') or '', line, indent
+                )
+                block, next_line = self._directives[name].handler(
+                    buffer, directive
+                )
+
+            if isinstance(block, BlockList):
+                yield from block
+
+            elif block is not None:
+                yield block
+
+            position = buffer.line_start(max(next_line, line + 1))
+
+
+def read_options(
+    buffer: TextBuffer, line: int, indent: int
+) -> tuple[dict[str, str], int]:
+    """Read directive options starting at ``line``.
+
+    Returns
+    -------
+    tuple[dict[str, str], int]
+        The options, and the first line after them.
+    """
+    options = {}
+
+    while line < len(buffer) and buffer.indent_of(line) > indent:
+        match = _OPTION_RE.match(
+            buffer.text, buffer.line_start(line), buffer.line_end(line)
+        )
+
+        if match is None:
+            break
+
+        options[match.group(1)] = (match.group(2) or '').strip()
+        line += 1
+
+    return options, line
+
+
+def read_body(buffer: TextBuffer, line: int, indent: int) -> tuple[Span, int]:
+    """Read the body of the directive at ``indent``, starting at ``line``.
+
+    The body is dedented to its first line. It ends at the first non-empty
+    line indented less than that, and leading/trailing empty lines are
+    excluded from the span.
+
+    Returns
+    -------
+    tuple[Span, int]
+        The span of the body, and the first line after it.
+    """
+    line = buffer.next_line(line)
+
+    # The body is empty.
+    if line == len(buffer) or buffer.indent_of(line) <= indent:
+        return buffer.span(line, line, 0), line
+
+    first = line
+    body_indent = buffer.indent_of(first)
+    end = buffer.next_line(first + 1, body_indent - 1)
+    last = end - 1
+
+    while buffer.is_blank(last):
+        last -= 1
+
+    return buffer.span(first, last + 1, body_indent), end
+
+
+def skip_body(buffer: TextBuffer, line: int, indent: int) -> int:
+    """Get the first line after the body of markup at ``indent``."""
+    return buffer.next_line(line, indent)
+
+
+def is_python(language: str) -> bool:
+    """Check if ``language`` is an alias of python."""
+    return language.strip().lower() in PYTHON_LANGUAGES
+
+
+def handle_code(
+    buffer: TextBuffer, directive: DirectiveMatch
+) -> tuple[Sequence[str] | None, int]:
+    """Handle ``code``, ``code-block`` and ``sourcecode`` directives."""
+    _, line = read_options(buffer, directive.line + 1, directive.indent)
+
+    if not is_python(directive.argument):
+        return None, skip_body(buffer, line, directive.indent)
+
+    span, next_line = read_body(buffer, line, directive.indent)
+
+    return buffer.lines(span), next_line
+
+
+_IPYTHON_INPUT_RE = re.compile(r'In \[\d*\]:(?: (.*))?$')
+_IPYTHON_CONTINUATION_RE = re.compile(r'[ \t]*\.\.\.+:(?: (.*))?$')
+_IPYTHON_PSEUDO_DECORATOR_RE = re.compile(
+    r'@(?:suppress|savefig|doctest|verbatim|okexcept|okwarning)\b'
+)
+_IPYTHON_MAGIC_RE = re.compile(r'[%!]')
+
+
+def handle_ipython(
+    buffer: TextBuffer, directive: DirectiveMatch
+) -> tuple[Sequence[str] | None, int]:
+    """Handle ``ipython`` directives.
+
+    Sessions with ``In [N]:`` prompts keep only their input, without the
+    prompts. Bodies without prompts are taken as plain code. Either way,
+    IPython pseudo-decorators are dropped and magics are commented out.
+    """
+    _, line = read_options(buffer, directive.line + 1, directive.indent)
+    span, next_line = read_body(buffer, line, directive.indent)
+    body = buffer.lines(span)
+
+    has_prompts = any(_IPYTHON_INPUT_RE.match(text) for text in body)
+    lines: list[str] = []
+    line_numbers: list[int] = []
+    in_input = False
+
+    for text, number in zip(body, body.line_numbers):
+        if has_prompts:
+            match = _IPYTHON_INPUT_RE.match(text)
+
+            if match is None and in_input:
+                match = _IPYTHON_CONTINUATION_RE.match(text)
+
+            in_input = match is not None
+
+            if match is None:
+                continue
+
+            text = match.group(1) or ''
+
+        elif _IPYTHON_PSEUDO_DECORATOR_RE.match(text):
+            continue
+
+        if _IPYTHON_MAGIC_RE.match(text):
+            text = f'# {text}'
+
+        lines.append(text)
+        line_numbers.append(number)
+
+    return SourceLines(lines, line_numbers, buffer.path), next_line
+
+
+def resolve_include_path(buffer: TextBuffer, argument: str) -> Path:
+    """Resolve an include argument relative to the including document."""
+    if buffer.path is None:
+        return Path(argument)
+
+    return Path(os.fspath(buffer.path)).parent / argument
+
+
+def read_text_buffer(
+    buffer: TextBuffer | None, path: Path
+) -> TextBuffer | None:
+    """Read the file at ``path``, included from ``buffer`` (if known).
+
+    Returns ``None`` (and logs a warning) if the file cannot be read.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return TextBuffer(f.read(), path)
+
+    except OSError as error:
+        log.warning(
+            'Could not read included file',
+            filename=buffer.path if buffer is not None else None,
+            include=str(path),
+            error=str(error),
+        )
+        return None
+
+
+# Reads a file included from a buffer (if known), see ``read_text_buffer``.
+Reader = Callable[[TextBuffer | None, Path], TextBuffer | None]
+
+
+# The 0-based number and text of included lines.
+_NumberedLines = list[tuple[int, str]]
+
+
+def _pyobject_lines(lines: _NumberedLines, name: str) -> _NumberedLines:
+    """Get the lines of the class or function ``name``, e.g. ``A.method``.
+
+    Decorators are part of the object, as in Sphinx.
+    """
+    try:
+        tree = ast.parse('\n'.join(text for _, text in lines))
+
+    except SyntaxError:
+        raise LiteralIncludeError(
+            'The included file is not valid python.'
+        ) from None
+
+    body = tree.body
+    node: ast.stmt | None = None
+
+    for part in name.split('.'):
+        node = next(
+            (
+                child
+                for child in body
+                if isinstance(
+                    child,
+                    (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef),
+                )
+                and child.name == part
+            ),
+            None,
+        )
+
+        if node is None:
+            raise LiteralIncludeError(f'Object named {name!r} not found.')
+
+        body = node.body
+
+    assert node is not None and node.end_lineno is not None
+    decorators = getattr(node, 'decorator_list', [])
+    start = min([node.lineno, *(d.lineno for d in decorators)])
+
+    return lines[start - 1 : node.end_lineno]
+
+
+def _after_match(
+    lines: _NumberedLines, pattern: str, option: str
+) -> _NumberedLines:
+    """Get the lines from (start-at) or after (start-after) ``pattern``."""
+    for index, (_, text) in enumerate(lines):
+        if pattern in text:
+            return lines[index + (option == 'start-after') :]
+
+    raise LiteralIncludeError(f'{option} pattern not found: {pattern!r}.')
+
+
+def _before_match(
+    lines: _NumberedLines, pattern: str, option: str
+) -> _NumberedLines:
+    """Get the lines up to (end-at) or before (end-before) ``pattern``."""
+    for index, (_, text) in enumerate(lines):
+        # Like Sphinx, end-before does not end on the first line.
+        if pattern in text and (index or option == 'end-at'):
+            return lines[: index + (option == 'end-at')]
+
+    raise LiteralIncludeError(f'{option} pattern not found: {pattern!r}.')
+
+
+def _selected_lines(lines: _NumberedLines, spec: str) -> _NumberedLines:
+    """Get the lines selected by a ``:lines:`` spec, e.g. ``1,3-5,8-``."""
+    indices: list[int] = []
+
+    for part in spec.split(','):
+        first, dash, last = part.strip().partition('-')
+
+        try:
+            start = int(first) if first else 1
+            stop = (int(last) if last else len(lines)) if dash else start
+
+        except ValueError:
+            raise LiteralIncludeError(f'Invalid lines: {spec!r}.') from None
+
+        if start < 1 or stop < start:
+            raise LiteralIncludeError(f'Invalid lines: {spec!r}.')
+
+        indices.extend(range(start - 1, min(stop, len(lines))))
+
+    if not indices:
+        raise LiteralIncludeError(f'Lines out of range: {spec!r}.')
+
+    return [lines[index] for index in indices]
+
+
+def _dedented(lines: _NumberedLines, dedent: str) -> _NumberedLines:
+    """Remove ``dedent`` characters, or the common indent, from each line."""
+    if dedent:
+        try:
+            width = int(dedent)
+
+        except ValueError:
+            raise LiteralIncludeError(f'Invalid dedent: {dedent!r}.') from None
+
+    else:
+        width = min(
+            (len(t) - len(t.lstrip()) for _, t in lines if t.strip()),
+            default=0,
+        )
+
+    if any(text[:width].strip() for _, text in lines):
+        raise LiteralIncludeError('The dedent would remove code.')
+
+    return [(number, text[width:]) for number, text in lines]
+
+
+def _check_include_options(options: dict[str, str]) -> None:
+    """Raise LiteralIncludeError for options ``include_lines`` cannot use."""
+    unsupported = [o for o in _UNSUPPORTED_INCLUDE_OPTIONS if o in options]
+    encoding = options.get('encoding', 'utf-8').lower().replace('_', '-')
+
+    if unsupported or encoding not in ('utf-8', 'utf8'):
+        names = ', '.join(f':{o}:' for o in unsupported or ['encoding'])
+        raise LiteralIncludeError(f'Unsupported options: {names}.')
+
+    for first, second in (
+        ('pyobject', 'lines'),
+        ('start-after', 'start-at'),
+        ('end-before', 'end-at'),
+    ):
+        if first in options and second in options:
+            raise LiteralIncludeError(
+                f'Cannot use both :{first}: and :{second}:.'
+            )
+
+
+def include_lines(
+    included: TextBuffer, options: dict[str, str]
+) -> SourceLines:
+    """Get the lines of ``included`` selected by ``literalinclude`` options.
+
+    The options are applied as Sphinx applies them: ``:pyobject:``, then
+    ``:start-after:``/``:start-at:``, ``:end-before:``/``:end-at:``,
+    ``:lines:`` (relative to the lines left) and ``:dedent:``.
+
+    Raises
+    ------
+    LiteralIncludeError
+        If an option is not supported or conflicts with another, or
+        selects nothing.
+    """
+    _check_include_options(options)
+    lines = [
+        (number, included.line(number)) for number in range(len(included))
+    ]
+
+    if 'pyobject' in options:
+        lines = _pyobject_lines(lines, options['pyobject'])
+
+    for option in ('start-after', 'start-at'):
+        if option in options:
+            lines = _after_match(lines, options[option], option)
+
+    for option in ('end-before', 'end-at'):
+        if option in options:
+            lines = _before_match(lines, options[option], option)
+
+    if 'lines' in options:
+        lines = _selected_lines(lines, options['lines'])
+
+    if 'dedent' in options:
+        lines = _dedented(lines, options['dedent'])
+
+    return SourceLines(
+        [text for _, text in lines],
+        [number for number, _ in lines],
+        included.path,
+    )
+
+
+def literalinclude_handler(read: Reader) -> Handler:
+    """Get a handler for ``literalinclude`` that reads files with ``read``.
+
+    The file is python if the ``:language:`` option is a python alias or,
+    without the option, if it has a ``.py`` suffix. The lines selected by
+    the options are included (see ``include_lines``); a ``literalinclude``
+    with options that cannot be applied is skipped, with a warning.
+    """
+
+    def handle_literalinclude(
+        buffer: TextBuffer, directive: DirectiveMatch
+    ) -> tuple[Sequence[str] | None, int]:
+        """Handle ``literalinclude`` directives for python files."""
+        options, line = read_options(
+            buffer, directive.line + 1, directive.indent
+        )
+        next_line = skip_body(buffer, line, directive.indent)
+        path = resolve_include_path(buffer, directive.argument)
+
+        language = options.get('language')
+        if not (is_python(language) if language else path.suffix == '.py'):
+            return None, next_line
+
+        included = read(buffer, path)
+
+        if included is None:
+            return None, next_line
+
+        if not options:
+            span = included.span(0, len(included), 0)
+            return included.lines(span), next_line
+
+        try:
+            return include_lines(included, options), next_line
+
+        except LiteralIncludeError as error:
+            log.warning(
+                'Skipped literalinclude',
+                filename=buffer.path,
+                line=directive.line + 1,
+                include=str(path),
+                reason=str(error),
+            )
+            return None, next_line
+
+    return handle_literalinclude
+
+
+handle_literalinclude = literalinclude_handler(read_text_buffer)
+
+
+def default_registry() -> DirectiveRegistry:
+    """Get a registry with all directives supported by rst_extract."""
+    registry = DirectiveRegistry()
+
+    for name in ('code', 'code-block', 'sourcecode'):
+        registry.register(name, handle_code)
+
+    registry.register('ipython', handle_ipython)
+    registry.register('literalinclude', handle_literalinclude)
+
+    return registry
@@ -0,0 +1,246 @@
+"""Doctest (``>>>``) extraction and parallel doctest execution.
+
+Doctest blocks are found by the same single scan as code directives (see
+``directives.DirectiveRegistry.register_prompt``). Each block is turned into
+runnable code, with the prompts removed, and its ``doctest.Example`` objects,
+which hold the expected output and point at the lines of the RST file.
+
+``run_doctests`` checks the expected output of many files in parallel, in
+worker processes. Like ``python -m doctest``, it also checks the examples in
+python and ``pycon`` code blocks (see ``check_registry``).
+"""
+
+import doctest
+import io
+import os
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import structlog
+
+from .directives import (
+    PYTHON_LANGUAGES,
+    DirectiveMatch,
+    DirectiveRegistry,
+    default_registry,
+    read_body,
+    read_options,
+    skip_body,
+)
+from .spans import SourceLines, TextBuffer
+
+log = structlog.get_logger()
+
+_PARSER = doctest.DocTestParser()
+
+# Code blocks whose examples are checked, though they are not extracted.
+DOCTEST_LANGUAGES = PYTHON_LANGUAGES | {'pycon'}
+
+
+class DoctestLines(SourceLines):
+    """Code of a doctest block, with its examples and expected output.
+
+    The ``lineno`` of every example is its 0-based line in the source.
+    """
+
+    __slots__ = ('examples',)
+
+    examples: list[doctest.Example]
+
+    def __init__(
+        self,
+        lines: list[str],
+        line_numbers: list[int],
+        source: str | os.PathLike[str] | None,
+        examples: list[doctest.Example],
+    ):
+        """Initialize the DoctestLines."""
+        super().__init__(lines, line_numbers, source)
+        self.examples = examples
+
+
+def parse_doctest(
+    lines: Sequence[str],
+    line_numbers: Sequence[int],
+    source: str | os.PathLike[str] | None = None,
+) -> DoctestLines | None:
+    """Parse dedented doctest ``lines`` into code and examples.
+
+    Returns ``None`` (and logs a warning) if the lines are not a valid
+    doctest.
+    """
+    try:
+        examples = _PARSER.get_examples(
+            '\n'.join(lines), name=os.fspath(source or '<doctest>')
+        )
+
+    except ValueError as error:
+        log.warning('Invalid doctest', filename=source, error=str(error))
+        return None
+
+    code: list[str] = []
+    code_line_numbers: list[int] = []
+
+    for example in examples:
+        for i, text in enumerate(example.source.splitlines()):
+            code.append(text)
+            code_line_numbers.append(line_numbers[example.lineno + i])
+
+        example.lineno = line_numbers[example.lineno]
+
+    return DoctestLines(code, code_line_numbers, source, examples)
+
+
+def handle_doctest_block(
+    buffer: TextBuffer, directive: DirectiveMatch
+) -> tuple[Sequence[str] | None, int]:
+    """Handle a doctest block, starting at a ``>>>`` prompt.
+
+    The block ends at the first empty line.
+    """
+    end = directive.line
+
+    while end < len(buffer) and not buffer.is_blank(end):
+        end += 1
+
+    span = buffer.span(directive.line, end, directive.indent)
+    lines = buffer.lines(span)
+
+    return parse_doctest(lines, lines.line_numbers, buffer.path), end
+
+
+def handle_doctest_directive(
+    buffer: TextBuffer, directive: DirectiveMatch
+) -> tuple[Sequence[str] | None, int]:
+    """Handle the ``doctest`` directive of ``sphinx.ext.doctest``."""
+    _, line = read_options(buffer, directive.line + 1, directive.indent)
+    span, next_line = read_body(buffer, line, directive.indent)
+    lines = buffer.lines(span)
+
+    return parse_doctest(lines, lines.line_numbers, buffer.path), next_line
+
+
+def doctest_registry() -> DirectiveRegistry:
+    """Get the default registry, extended with doctest blocks."""
+    registry = default_registry()
+    registry.register('doctest', handle_doctest_directive)
+    registry.register_prompt(handle_doctest_block)
+
+    return registry
+
+
+def handle_code_examples(
+    buffer: TextBuffer, directive: DirectiveMatch
+) -> tuple[Sequence[str] | None, int]:
+    """Handle a code directive, giving the examples in its body, if any."""
+    _, line = read_options(buffer, directive.line + 1, directive.indent)
+
+    if directive.argument.strip().lower() not in DOCTEST_LANGUAGES:
+        return None, skip_body(buffer, line, directive.indent)
+
+    span, next_line = read_body(buffer, line, directive.indent)
+    lines = buffer.lines(span)
+
+    return parse_doctest(lines, lines.line_numbers, buffer.path), next_line
+
+
+def check_registry() -> DirectiveRegistry:
+    """Get the doctest registry, also finding examples in code blocks.
+
+    Only used to check doctests: the code of a ``python`` block is not run
+    a second time, only its ``>>>`` examples are.
+    """
+    registry = doctest_registry()
+
+    for name in ('code', 'code-block', 'sourcecode'):
+        registry.register(name, handle_code_examples)
+
+    return registry
+
+
+class DoctestResult(NamedTuple):
+    """Outcome of checking the doctests of one file."""
+
+    filename: str
+    attempted: int
+    failed: int
+    report: str
+
+
+def check_file(
+    filename: str | os.PathLike[str],
+    optionflags: int = doctest.ELLIPSIS,
+) -> DoctestResult:
+    """Run the doctests of a reStructuredText file.
+
+    All examples in the file share a single namespace, as with
+    ``python -m doctest``, which also runs the examples in code blocks. A
+    file that cannot be read counts as one failure, reported with its error,
+    so the other files of ``run_doctests`` are still checked.
+    """
+    filename = os.fspath(filename)
+
+    try:
+        with open(filename, encoding='utf-8') as f:
+            text = f.read()
+
+    except (OSError, UnicodeDecodeError) as error:
+        log.error('Could not read file', filename=filename, error=str(error))
+        return DoctestResult(filename, 0, 1, f'Could not read file: {error}\n')
+
+    examples = [
+        example
+        for block in check_registry().scan(TextBuffer(text, filename))
+        if isinstance(block, DoctestLines)
+        for example in block.examples
+    ]
+
+    test = doctest.DocTest(
+        examples,
+        globs={'__name__': '__main__'},
+        name=filename,
+        filename=filename,
+        lineno=0,
+        docstring=text,
+    )
+
+    report = io.StringIO()
+    runner = doctest.DocTestRunner(verbose=False, optionflags=optionflags)
+    failed, attempted = runner.run(test, out=report.write)
+
+    log.debug(
+        'Doctests run',
+        filename=filename,
+        attempted=attempted,
+        failed=failed,
+    )
+
+    return DoctestResult(filename, attempted, failed, report.getvalue())
+
+
+def run_doctests(
+    filenames: Sequence[str | os.PathLike[str]],
+    jobs: int | None = None,
+) -> list[DoctestResult]:
+    """Check the doctests of many files in parallel worker processes.
+
+    Arguments
+    ---------
+    filenames : Sequence[str | os.PathLike[str]]
+        The reStructuredText files to check.
+
+    jobs : int | None
+        The number of worker processes. Defaults to the number of CPUs. With
+        a single job (or file), the doctests run in this process.
+
+    Returns
+    -------
+    list[DoctestResult]
+        The results, in the same order as ``filenames``.
+    """
+    if jobs == 1 or len(filenames) <= 1:
+        return [check_file(filename) for filename in filenames]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(check_file, filenames))
@@ -0,0 +1,61 @@
+"""Running extracted code in a new interpreter.
+
+``run_code`` is shared by the command line interface, the execution
+backends, sessions and the daemon, and ``execute_command`` by the command
+line interface and the API, so they live apart from the click commands:
+importing them does not import click.
+"""
+
+import subprocess
+import sys
+from os import PathLike
+
+from .sourcemap import SourceMap
+
+WARNING_EMOJI = '\U0001f494'
+
+
+def run_code(
+    python_bin: PathLike[str] | str,
+    code: str,
+    source_map: SourceMap | None = None,
+) -> subprocess.CompletedProcess[str]:
+    """Run the extracted code in a new interpreter, capturing its output.
+
+    If a source map is given, tracebacks in stderr are rewritten to point at
+    the lines of the original reStructuredText files.
+    """
+    command = (python_bin, '-c', code)
+    result = subprocess.run(command, capture_output=True, encoding='utf-8')
+
+    if result.stderr and source_map is not None:
+        result.stderr = source_map.rewrite_traceback(result.stderr)
+
+    return result
+
+
+def execute_command(
+    python_bin: PathLike[str] | str,
+    code: str,
+    source_map: SourceMap | None = None,
+) -> subprocess.CompletedProcess[str]:
+    """Execute the extracted code, printing its output.
+
+    If a source map is given, tracebacks are rewritten to point at the lines
+    of the original reStructuredText files.
+    """
+    result = run_code(python_bin, code, source_map)
+    report_run(result.stdout, result.stderr)
+
+    return result
+
+
+def report_run(stdout: str, stderr: str) -> None:
+    """Print the output of executed code."""
+    # Print the output of the command
+    print(stdout, file=sys.stdout)
+
+    # Also print stderr if there is any
+    if stderr:
+        print(f'{WARNING_EMOJI} Error! Details:', file=sys.stdout)
+        print(stderr, file=sys.stdout)
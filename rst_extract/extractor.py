@@ -1,12 +1,26 @@
-"""Primary extraction class for extracting data from reStructuredText files."""
+"""Primary extraction class for extracting data from reStructuredText files.
+
+The extraction itself is done by the functions ``read_document``,
+``extract_blocks`` and ``extract_code``: they keep no state between calls,
+so they can run concurrently in threads, as long as each thread uses its
+own ``IncludeGraph``. ``Extractor`` wraps them for a single file.
+"""
 
 import os
-import re
 import typing
+from collections.abc import Sequence
 
 import structlog
 
-# Log initialization
+from .assembler import DEFAULT_HEADER_TEMPLATE, OutputAssembler
+from .directives import DirectiveRegistry, default_registry
+from .includes import IncludeCycleError, IncludeGraph
+from .logs import configure_default_logging
+from .sourcemap import SourceMap
+from .spans import TextBuffer
+
+# Log initialization, if no other logging system is instantiated.
+configure_default_logging()
 log = structlog.get_logger()
 
 
@@ -18,24 +32,176 @@ class ExtractionError(Exception):
     """Exception raised when an error occurs during extraction."""
 
 
+def read_document(filename: _FILE_TYPE) -> str:
+    """Read the reStructuredText file ``filename``.
+
+    Broadly, we are assuming this isn't a large (>> 1MB) file, so we can
+    read the contents into memory in full.
+
+    Raises
+    ------
+    ExtractionError
+        If the file does not exist, or is empty.
+    """
+    # TODO: Encoding should probably be configurable, just in case.
+    try:
+        with open(filename, encoding='utf-8') as file:
+            data = file.read()
+
+    except FileNotFoundError as error:
+        log.error('File not found', filename=filename)
+        raise ExtractionError(str(error)) from error
+
+    log.debug('File contents loaded', filename=filename)
+
+    if not data:
+        raise ExtractionError('Empty file encountered')
+
+    return data
+
+
+def extract_blocks(
+    text: str,
+    filename: _FILE_TYPE | None = None,
+    *,
+    registry: DirectiveRegistry | None = None,
+    include_graph: IncludeGraph | None = None,
+) -> list[Sequence[str]]:
+    """Extract the code blocks of the reStructuredText ``text``.
+
+    The text is scanned once for all registered directives, and included
+    files are resolved through the include graph. Most blocks are lazy views
+    over the text; line text is only copied out when the blocks are
+    rendered.
+
+    Arguments
+    ---------
+    text : str
+        The reStructuredText to extract code blocks from.
+
+    filename : str | os.PathLike[str] | None
+        The file ``text`` was read from. Blocks point at its lines, and
+        includes are resolved relative to it.
+
+    registry : DirectiveRegistry | None
+        The directives to extract code from, if no ``include_graph`` is
+        given. Defaults to all directives supported by rst_extract.
+
+    include_graph : IncludeGraph | None
+        The include graph to resolve includes with, and to cache included
+        files in. An include graph must not be used by two threads at once.
+
+    Raises
+    ------
+    ExtractionError
+        If the text (indirectly) includes itself.
+    """
+    if include_graph is None:
+        include_graph = IncludeGraph(registry)
+
+    try:
+        blocks = include_graph.scan(TextBuffer(text, filename))
+
+    except IncludeCycleError as error:
+        log.error('Include cycle', filename=filename)
+        raise ExtractionError(str(error)) from error
+
+    log.debug('Code blocks extracted', filename=filename)
+
+    return blocks
+
+
+def extract_code(
+    text: str,
+    filename: _FILE_TYPE | None = None,
+    *,
+    header_template: str = DEFAULT_HEADER_TEMPLATE,
+    registry: DirectiveRegistry | None = None,
+    include_graph: IncludeGraph | None = None,
+    blocks: list[Sequence[str]] | None = None,
+) -> tuple[str, SourceMap]:
+    """Extract the code of the reStructuredText ``text``.
+
+    See ``extract_blocks`` for the arguments; ``header_template`` is the
+    header line written before each block. If given, the extracted blocks
+    are appended to ``blocks``, e.g., to store them (see ``blockstore``).
+
+    Returns
+    -------
+    tuple[str, SourceMap]
+        The extracted code, and the map of its lines back to ``filename``
+        (and the files it includes).
+    """
+    extracted = extract_blocks(
+        text, filename, registry=registry, include_graph=include_graph
+    )
+    source_map = SourceMap()
+    assembler = OutputAssembler(
+        header_template=header_template, source_map=source_map
+    )
+    assembler.write_blocks(extracted, filename)
+
+    if blocks is not None:
+        blocks.extend(extracted)
+
+    return assembler.getvalue(), source_map
+
+
 class Extractor:
-    """Extract data from reStructuredText files."""
+    """Extract data from reStructuredText files.
+
+    An Extractor keeps the last extracted code and source map, and caches
+    included files in its include graph, so it must not be shared between
+    threads; use ``extract_code`` with one include graph per thread instead.
+    """
 
     _filename: _FILE_TYPE
     _data: str | None
-
-    _code_block_re = re.compile(r'^.. code-block::\s*python\s*$', re.MULTILINE)
-    _option_re = re.compile(r'^\s*:(\w+):\s*(.*)$', re.MULTILINE)
-
-    def __init__(self, filename: _FILE_TYPE):
+    header_template: str
+    source_map: SourceMap
+
+    registry: DirectiveRegistry = default_registry()
+    include_graph: IncludeGraph
+
+    def __init__(
+        self,
+        filename: _FILE_TYPE,
+        *,
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+        registry: DirectiveRegistry | None = None,
+        include_graph: IncludeGraph | None = None,
+    ):
         """Initialize Extractor object.
 
         Arguments
         ---------
         filename
             The filename of the reStructuredText file to extract data from.
+
+        header_template
+            Template for the header line written before each block, formatted
+            with the 1-based block ``number``.
+
+        registry
+            The directives to extract code from. Defaults to all directives
+            supported by rst_extract.
+
+        include_graph
+            The include graph to resolve ``include`` and ``literalinclude``
+            with. Share one graph between Extractors so included files are
+            only read and parsed once. If given, its registry is used instead
+            of ``registry``.
         """
         self.filename = filename
+        self.header_template = header_template
+
+        if registry is not None:
+            self.registry = registry
+
+        if include_graph is None:
+            include_graph = IncludeGraph(self.registry)
+
+        self.include_graph = include_graph
 
         log.info('Extractor initialized', filename=self.filename)
 
@@ -70,28 +236,18 @@ class Extractor:
             )
 
     def _load_file_contents(self) -> str:
-        """Load the contents of the reStructuredText file.
-
-        Broadly, we are assuming this isn't a large (>> 1MB) file, so we can
-        read the contents into memory in full.
-        """
-        # TODO: Encoding should probably be configurable, just in case.
-        with open(self.filename, encoding='utf-8') as file:
-            data = file.read()
-
-        self._data = data
-
-        log.debug('File contents loaded', filename=self.filename)
-
-        if not self._data:
-            raise ExtractionError('Empty file encountered')
+        """Load the contents of the reStructuredText file."""
+        self._data = read_document(self.filename)
 
         return self._data
 
     def _extract_code_blocks(
         self, rst_string: str | None = None
-    ) -> list[list[str]]:
-        """Extract code blocks from the reStructuredText string."""
+    ) -> list[Sequence[str]]:
+        """Extract code blocks from the reStructuredText string.
+
+        See ``extract_blocks``.
+        """
         log.debug('Extracting code blocks from file', filename=self.filename)
 
         if rst_string is None:
@@ -101,142 +257,33 @@ class Extractor:
         if rst_string is None:
             raise ExtractionError('No data to extract code blocks from')
 
-        lines = rst_string.splitlines()
-
-        # Get the lines where the code blocks start
-        start_lines = [
-            i
-            for i, line in enumerate(lines)
-            if self._code_block_re.match(line)
-        ]
-
-        # TODO: This is just brute force implementation, could be cleaner.
-        blocks_iter = (
-            self._get_next_code_block(lines[start_line:])
-            for start_line in start_lines
-        )
-
-        # Consuming all above generators here.
-        blocks = [self._filter_rst_options(block) for block in blocks_iter]
-        log.debug('Code blocks extracted', filename=self.filename)
-
-        return blocks
-
-    def _filter_rst_options(self, block: list[str]) -> list[str]:
-        """Filter out the reStructuredText options from the code block."""
-        return [line for line in block if not self._option_re.match(line)]
-
-    @staticmethod
-    def _get_indent_space_count(line: str) -> int:
-        """Get the number of spaces in the indent of the line."""
-        return len(line) - len(line.lstrip())
-
-    def _get_next_code_block(self, lines: list[str]) -> list[str]:
-        """Get the next code block from the lines. This just gets the next
-        dedent and returns those strings as a list.
-
-        Arguments
-        ---------
-        lines
-            The lines to extract the code block from.
-
-        Returns
-        -------
-        list[str]
-            The extracted code block.
-
-        Raises
-        ------
-        ExtractionError
-            If the code block does not start with the correct syntax. This
-            should not happen if the code block is extracted from the
-            reStructuredText file correctly. It should *include* the start of
-            the block, which will be something along the lines of:
-            ``.. code-block:: python``.
-        """
-        lines_iter = iter(lines)
-        block_line = next(lines_iter)
-
-        if not self._code_block_re.match(block_line):
-            log.error(
-                'Got string without code block start',
-                line=block_line,
-                lines=lines,
-            )
-            raise ExtractionError('Got string without code block start.')
-
-        min_indent = None
-
-        for i, line in enumerate(lines_iter):
-            if min_indent is None and line.strip():
-                min_indent = self._get_indent_space_count(line)
-
-            # Occurs if there is no content at the top of the code block.
-            if min_indent is None:
-                continue
-
-            if line and self._get_indent_space_count(line) < min_indent:
-                return self._dedent_code_block(lines[1:i])
-
-        # The whole block is indented the same amount, assume the entire thing
-        # is a code block.
-        return self._dedent_code_block(lines[1:])
-
-    @staticmethod
-    def _dedent_code_block(block: list[str]) -> list[str]:
-        """Dedent the code block. Does not modify the original list."""
-        # Get the minimum indent
-        # TODO: Could reimplement dedent with re.
-        get_indent_space_count = Extractor._get_indent_space_count
-        min_indent = min(
-            get_indent_space_count(line) for line in block if line.strip()
+        return extract_blocks(
+            rst_string, self.filename, include_graph=self.include_graph
         )
 
-        return [line[min_indent:] for line in block]
-
     @staticmethod
     def _strip_empty_lines(block: list[str]) -> list[str]:
         """Strip empty lines from the code block."""
         return [line for line in block if line.strip()]
 
-    @staticmethod
-    def _trim_empty_lines(block: list[str]) -> list[str]:
-        """Trim empty lines from the end of the code block."""
-        while block and not block[0].strip():
-            block.pop(0)
-
-        while block and not block[-1].strip():
-            block.pop()
-
-        return block
+    def _process_file(self, output: typing.TextIO | None = None) -> None:
+        """Process the data to extract data.
 
-    @staticmethod
-    def _convert_to_list_with_block_numbers(
-        blocks: list[list[str]],
-    ) -> list[str]:
-        """Convert the block to a list of tuples with line numbers."""
-        all_lines = []
-
-        # TODO: The start block label should be configurable.
-        for i, block in enumerate(blocks, start=1):
-            all_lines.append(f'# Block {i}:')
-            all_lines.extend(Extractor._trim_empty_lines(block))
-
-            # The last line of the block should have a newline after it.
-            all_lines.append('')
-
-        while all_lines and all(not line.strip() for line in all_lines[-2:]):
-            all_lines.pop()
-
-        return all_lines
-
-    def _process_file(self) -> None:
-        """Process the data to extract data."""
+        If ``output`` is given, the extracted code is written straight to it
+        instead of being kept on the Extractor. Either way, ``source_map`` is
+        updated to map the extracted code back to the file.
+        """
         log.debug('Processing file', filename=self.filename)
         blocks = self._extract_code_blocks()
-        lines = self._convert_to_list_with_block_numbers(blocks)
 
-        self._extracted_code = '\n'.join(lines)
+        self.source_map = SourceMap()
+        assembler = OutputAssembler(
+            output, self.header_template, self.source_map
+        )
+        assembler.write_blocks(blocks, self.filename)
+
+        if output is None:
+            self._extracted_code = assembler.getvalue()
 
     def extract(self) -> str:
         """Extract data from the reStructuredText file.
@@ -248,17 +295,32 @@ class Extractor:
         """
         log.info('Extracting data from', filename=self.filename)
 
-        try:
-            self._load_file_contents()
+        code, source_map = extract_code(
+            self._load_file_contents(),
+            self.filename,
+            header_template=self.header_template,
+            include_graph=self.include_graph,
+        )
+        self.source_map = source_map
+        self._extracted_code = code
+
+        return code
+
+    def extract_to(self, output: typing.TextIO) -> None:
+        """Extract data from the reStructuredText file straight to a stream.
+
+        Unlike ``extract``, the extracted code is not kept in memory.
 
-        except FileNotFoundError as error:
-            log.error('File not found', filename=self.filename)
-            msg = str(error)
-            raise ExtractionError(msg) from error
+        Arguments
+        ---------
+        output
+            The file stream to write the extracted data to.
+        """
+        log.info('Extracting data to', filename=self.filename, output=output)
 
-        self._process_file()
+        self._load_file_contents()
 
-        return self._extracted_code
+        self._process_file(output)
 
     def export_to_file(self, output: typing.TextIO) -> None:
         """Export the extracted data to a file.
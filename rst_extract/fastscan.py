@@ -0,0 +1,280 @@
+"""Vectorised line scanning of large texts, when numpy is installed.
+
+A ``TextBuffer`` finds the indent of a line with a regex, and the end of a
+directive body by looping over its lines in python. For generated documents
+of hundreds of megabytes, ``LineIndex`` instead computes where every line
+starts, and how far it is indented, with array operations over the UTF-8
+bytes of the text. It also builds, in one batch, the tables that answer
+every later "next line indented at most this far" query with a bisect and a
+few jumps, so finding the end of a body does not loop over its lines.
+
+The results are the same as those of the pure-python scan, which is used
+when numpy is not installed, or the text is small.
+"""
+
+import functools
+import importlib
+import re
+from array import array
+from bisect import bisect_left
+from typing import Any
+
+import structlog
+
+log = structlog.get_logger()
+
+# Texts smaller than this are scanned in pure python: building the arrays
+# costs more than it saves.
+MIN_SIZE = 1 << 20
+
+# Indents are counted one column at a time for all lines at once; the few
+# lines indented deeper than this, or with non-ASCII whitespace, are
+# finished in python.
+MAX_VECTOR_INDENT = 64
+
+# What ``\s`` matches in the text of a line, as in ``TextBuffer.indent_of``.
+_INDENT_RE = re.compile(r'\s*')
+
+
+@functools.cache
+def _numpy() -> Any | None:
+    """Import numpy, if installed."""
+    try:
+        return importlib.import_module('numpy')
+
+    except ImportError:
+        return None
+
+
+def available() -> bool:
+    """Check if numpy is installed, so texts can be scanned with arrays."""
+    return _numpy() is not None
+
+
+@functools.cache
+def _whitespace_table() -> Any:
+    """Get whether each byte is ASCII whitespace, as an array."""
+    np = _numpy()
+
+    return np.array(
+        [code < 0x80 and chr(code).isspace() for code in range(256)],
+        dtype=bool,
+    )
+
+
+def _to_array(values: Any) -> 'array[int]':
+    """Copy a numpy array of integers into an ``array('q')``."""
+    np = _numpy()
+
+    return array('q', values.astype(np.int64).tobytes())
+
+
+class LineIndex:
+    """The start and indent of every line of a text.
+
+    Lines follow ``TextBuffer``: ``\\n`` and ``\\r\\n`` line endings, and a
+    trailing newline does not start a new, empty line.
+
+    The index is built with array operations, but kept as ``array('q')``,
+    so a ``TextBuffer`` uses it as is and queries do not call into numpy.
+
+    Attributes
+    ----------
+    starts : array[int]
+        The offset of the first character of each line.
+
+    indents : array[int]
+        The number of leading whitespace characters of each line.
+
+    nonblank : array[int]
+        The lines that do not only contain whitespace, in order.
+
+    next_lower : array[int]
+        For each item of ``nonblank``, the position in ``nonblank`` of the
+        next line indented less, or ``len(nonblank)`` if there is none.
+    """
+
+    __slots__ = ('starts', 'indents', 'nonblank', 'next_lower')
+
+    starts: 'array[int]'
+    indents: 'array[int]'
+    nonblank: 'array[int]'
+    next_lower: 'array[int]'
+
+    def __init__(self, text: str):
+        """Index the lines of ``text``.
+
+        Raises
+        ------
+        RuntimeError
+            If numpy is not installed.
+        """
+        np = _numpy()
+
+        if np is None:
+            raise RuntimeError('Scanning with arrays needs numpy.')
+
+        ascii_only = text.isascii()
+        data = np.frombuffer(
+            text.encode('ascii' if ascii_only else 'utf-8', 'surrogatepass'),
+            dtype=np.uint8,
+        )
+        newlines = np.flatnonzero(data == ord('\n'))
+        starts = np.concatenate(([0], newlines + 1)).astype(np.int64)
+
+        if not len(data) or starts[-1] == len(data):
+            starts = starts[:-1]
+
+        ends = self._line_ends(data, starts)
+
+        if ascii_only:
+            characters = np.zeros(len(starts), dtype=np.int64)
+
+        else:
+            characters = self._continuation_counts(data, starts)
+
+        indents, blank = self._indents(text, data, starts, ends, characters)
+        nonblank = np.flatnonzero(~blank)
+
+        self.starts = _to_array(starts - characters)
+        self.indents = _to_array(indents)
+        self.nonblank = _to_array(nonblank)
+        self.next_lower = _to_array(self._next_lower(indents[nonblank]))
+
+        log.debug('Lines indexed with arrays', line_count=len(starts))
+
+    def __len__(self) -> int:
+        """Get the number of lines."""
+        return len(self.starts)
+
+    @staticmethod
+    def _line_ends(data: Any, starts: Any) -> Any:
+        """Get where each line ends, before its ``\\n`` or ``\\r\\n``."""
+        np = _numpy()
+        ends = np.append(starts[1:], len(data))[: len(starts)]
+        # ends - 1 wraps around for an empty first line, which the masks
+        # exclude.
+        newline = (ends > starts) & (data[ends - 1] == ord('\n'))
+        ends[newline] -= 1
+        carriage = newline & (ends > starts) & (data[ends - 1] == ord('\r'))
+        ends[carriage] -= 1
+
+        return ends
+
+    @staticmethod
+    def _continuation_counts(data: Any, starts: Any) -> Any:
+        """Count the UTF-8 continuation bytes before each line.
+
+        A byte offset minus the continuation bytes before it is the
+        character offset in the text.
+        """
+        np = _numpy()
+        continuation = (data & 0xC0) == 0x80
+
+        if not len(starts):
+            return np.zeros(0, dtype=np.int64)
+
+        per_line = np.add.reduceat(continuation, starts, dtype=np.int64)
+
+        return np.concatenate(([0], np.cumsum(per_line[:-1])))
+
+    @staticmethod
+    def _indents(
+        text: str, data: Any, starts: Any, ends: Any, characters: Any
+    ) -> tuple[Any, Any]:
+        """Count the leading whitespace characters of each line.
+
+        Each step checks the next byte of the lines still indented, so the
+        steps are as many as the deepest indent. Lines stopped by a
+        non-ASCII byte, or indented deeper than ``MAX_VECTOR_INDENT``, are
+        finished with the regex on ``text``.
+
+        Returns
+        -------
+        tuple[numpy.ndarray, numpy.ndarray]
+            The indent of each line, and whether it only has whitespace.
+        """
+        np = _numpy()
+        whitespace = _whitespace_table()
+        indents = np.zeros(len(starts), dtype=np.int64)
+        active = np.arange(len(starts))
+        unfinished = []
+
+        for _ in range(MAX_VECTOR_INDENT):
+            positions = starts[active] + indents[active]
+            inside = positions < ends[active]
+            active = active[inside]
+            codes = data[positions[inside]]
+            unfinished.append(active[codes >= 0x80])
+            active = active[whitespace[codes]]
+
+            if not active.size:
+                break
+
+            indents[active] += 1
+
+        else:
+            unfinished.append(active)
+
+        blank = starts + indents == ends
+
+        for line in np.concatenate(unfinished).tolist():
+            start = int(starts[line] - characters[line])
+            # The indent so far is ASCII, so as many characters as bytes.
+            end = int(ends[line] - characters[line]) - int(
+                np.count_nonzero(
+                    (data[starts[line] : ends[line]] & 0xC0) == 0x80
+                )
+            )
+            match = _INDENT_RE.match(text, start + int(indents[line]), end)
+            assert match is not None
+            indents[line] = match.end() - start
+            blank[line] = match.end() == end
+
+        return indents, blank
+
+    @staticmethod
+    def _next_lower(indents: Any) -> Any:
+        """Get the position of the next item less than each of ``indents``.
+
+        For each indent level, the positions of the items below it are
+        carried back with a reversed running minimum. Documents have few
+        levels, so this is a few passes over the array.
+        """
+        np = _numpy()
+        count = len(indents)
+        positions = np.arange(count)
+        next_lower = np.full(count, count, dtype=np.int64)
+
+        for level in np.unique(indents)[1:].tolist():
+            lower = np.where(indents < level, positions, count)
+            following = np.minimum.accumulate(lower[::-1])[::-1]
+            at_level = indents == level
+            next_lower[at_level] = np.append(following[1:], count)[at_level]
+
+        return next_lower
+
+    def next_line(self, line: int, indent: int | None = None) -> int:
+        """Get the first non-blank line from ``line``, indented <= ``indent``.
+
+        Any non-blank line matches if ``indent`` is None. Returns the number
+        of lines if no line matches.
+
+        Every line between a line and its ``next_lower`` is indented at
+        least as far, so each jump skips lines that cannot match, and the
+        jumps are at most as many as the indent levels.
+        """
+        nonblank = self.nonblank
+        position = bisect_left(nonblank, line)
+
+        if indent is not None:
+            while (
+                position < len(nonblank)
+                and self.indents[nonblank[position]] > indent
+            ):
+                position = self.next_lower[position]
+
+        if position == len(nonblank):
+            return len(self.starts)
+
+        return nonblank[position]
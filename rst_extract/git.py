@@ -0,0 +1,302 @@
+"""Find the documents affected by the changes in a git repository.
+
+Used by ``--staged`` and ``--changed-since`` (e.g., in a pre-commit hook),
+so only the documents that changed, or that include a file that changed,
+are processed. When nothing changed, no document is read at all: this only
+costs a few quick git commands.
+"""
+
+import os
+import subprocess
+from collections.abc import Iterable
+from pathlib import Path
+
+import structlog
+
+from .includes import IncludeCycleError, IncludeGraph
+
+log = structlog.get_logger()
+
+DOCUMENT_SUFFIXES = ('.rst',)
+
+# Lines that may include another file; used to pre-filter the documents
+# scanned for the include graph.
+_INCLUDE_PATTERN = r'^[[:space:]]*\.\.[[:space:]]+(literal)?include::'
+
+# The most file names searched for in the documents at once; beyond this,
+# the changed files are taken to be included.
+_MAX_SEARCHED_NAMES = 256
+
+
+class GitError(Exception):
+    """Error raised when a git command fails."""
+
+
+class BlobReader:
+    """Read objects through one persistent ``git cat-file --batch`` process.
+
+    Reading many files this way costs one git process in total, instead of
+    one per file, and does not need a checkout.
+    """
+
+    _process: subprocess.Popen[bytes]
+
+    def __init__(self, cwd: str | os.PathLike[str] | None = None):
+        """Start ``git cat-file --batch`` in the repository at ``cwd``.
+
+        Raises
+        ------
+        GitError
+            If git is not installed.
+        """
+        try:
+            self._process = subprocess.Popen(
+                ['git', 'cat-file', '--batch'],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=cwd,
+            )
+
+        except FileNotFoundError as error:
+            raise GitError('git is not installed.') from error
+
+    def read(self, name: str) -> bytes | None:
+        """Read the object ``name`` (e.g., a blob id, or ``rev:path``).
+
+        Returns ``None`` if there is no such object.
+        """
+        stdin, stdout = self._process.stdin, self._process.stdout
+        assert stdin is not None and stdout is not None
+
+        stdin.write(name.encode('utf-8') + b'\n')
+        stdin.flush()
+        header = stdout.readline()
+
+        if not header:
+            raise GitError('git cat-file exited unexpectedly.')
+
+        fields = header.split()
+
+        if fields[-1] in (b'missing', b'ambiguous'):
+            return None
+
+        data = stdout.read(int(fields[2]))
+        _ = stdout.read(1)
+
+        return data
+
+    def close(self) -> None:
+        """Stop the git process."""
+        if self._process.stdin is not None:
+            self._process.stdin.close()
+
+        _ = self._process.wait()
+
+        if self._process.stdout is not None:
+            self._process.stdout.close()
+
+    def __enter__(self) -> 'BlobReader':
+        """Use the reader as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Stop the git process."""
+        self.close()
+
+
+def _git(*args: str, cwd: str | os.PathLike[str] | None = None) -> bytes:
+    """Run git, returning its output.
+
+    Raises
+    ------
+    GitError
+        If git is not installed or the command fails.
+    """
+    try:
+        result = subprocess.run(['git', *args], capture_output=True, cwd=cwd)
+
+    except FileNotFoundError as error:
+        raise GitError('git is not installed.') from error
+
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', 'replace').strip()
+        raise GitError(f'git {args[0]} failed: {message}')
+
+    return result.stdout
+
+
+def _paths(root: Path, output: bytes) -> list[Path]:
+    """Get the paths in NUL-separated git output, relative to ``root``."""
+    return [root / os.fsdecode(name) for name in output.split(b'\0') if name]
+
+
+def repository_root(cwd: str | os.PathLike[str] | None = None) -> Path:
+    """Get the root of the work tree containing ``cwd``."""
+    output = _git('rev-parse', '--show-toplevel', cwd=cwd)
+
+    return Path(os.fsdecode(output.strip())).resolve()
+
+
+def tree_files(
+    rev: str, cwd: str | os.PathLike[str] | None = None
+) -> dict[str, str]:
+    """Get the blob id of every file at ``rev``, by path from the root."""
+    output = _git('ls-tree', '-r', '-z', '--full-tree', rev, cwd=cwd)
+    files = {}
+
+    for entry in output.split(b'\0'):
+        if not entry:
+            continue
+
+        info, _, name = entry.partition(b'\t')
+        _, kind, oid = info.split()
+
+        if kind == b'blob':
+            files[os.fsdecode(name)] = oid.decode('ascii')
+
+    return files
+
+
+def changed_files(
+    base: str | None = None,
+    *,
+    staged: bool = False,
+    cwd: str | os.PathLike[str] | None = None,
+) -> list[Path]:
+    """Get the files that changed, including deleted files.
+
+    Arguments
+    ---------
+    base : str | None
+        The ref to compare with. Defaults to ``HEAD``.
+
+    staged : bool
+        Whether to only consider staged changes. Otherwise, changes in the
+        work tree and untracked files are included.
+
+    cwd : str | os.PathLike[str] | None
+        A directory in the repository. Defaults to the working directory.
+
+    Returns
+    -------
+    list[Path]
+        The absolute paths of the changed files.
+    """
+    root = repository_root(cwd)
+    arguments = ['diff', '--name-only', '--no-renames', '-z']
+
+    if staged:
+        arguments.append('--cached')
+
+    changed = _paths(root, _git(*arguments, base or 'HEAD', cwd=root))
+
+    if not staged:
+        untracked = _git(
+            'ls-files', '--others', '--exclude-standard', '-z', cwd=root
+        )
+        changed.extend(_paths(root, untracked))
+
+    log.debug('Changed files found', files=[str(path) for path in changed])
+
+    return changed
+
+
+def including_documents(
+    root: Path, suffixes: Iterable[str] = DOCUMENT_SUFFIXES
+) -> list[Path]:
+    """Get the documents that may include other files, using ``git grep``."""
+    arguments = ['grep', '-l', '-z', '-E', '--untracked', _INCLUDE_PATTERN]
+    pathspecs = [f'*{suffix}' for suffix in suffixes]
+
+    try:
+        output = _git(*arguments, '--', *pathspecs, cwd=root)
+
+    except GitError:
+        # git grep exits with 1 when nothing matches.
+        return []
+
+    return _paths(root, output)
+
+
+def _mentioned(
+    root: Path, paths: Iterable[Path], suffixes: Iterable[str]
+) -> bool:
+    """Check if a document mentions the name of one of ``paths``.
+
+    Only such a document can include one of them. ``git grep -q`` stops at
+    the first match.
+    """
+    names = sorted({path.name for path in paths})
+
+    if not names:
+        return False
+
+    if len(names) > _MAX_SEARCHED_NAMES:
+        return True
+
+    patterns = [argument for name in names for argument in ('-e', name)]
+    pathspecs = [f'*{suffix}' for suffix in suffixes]
+
+    try:
+        _ = _git(
+            'grep',
+            '-q',
+            '-F',
+            '--untracked',
+            *patterns,
+            '--',
+            *pathspecs,
+            cwd=root,
+        )
+
+    except GitError:
+        # git grep exits with 1 when nothing matches.
+        return False
+
+    return True
+
+
+def affected_documents(
+    base: str | None = None,
+    *,
+    staged: bool = False,
+    cwd: str | os.PathLike[str] | None = None,
+    suffixes: Iterable[str] = DOCUMENT_SUFFIXES,
+) -> list[Path]:
+    """Get the documents that changed, or include a file that changed.
+
+    See ``changed_files`` for the arguments. Only documents with one of
+    ``suffixes`` that still exist are returned, sorted.
+
+    If no document changed, and no document mentions the name of a changed
+    file, no document can be affected: the documents are not scanned.
+    """
+    suffixes = tuple(suffixes)
+    root = repository_root(cwd)
+    changed = changed_files(base, staged=staged, cwd=root)
+    affected = {path for path in changed if path.suffix in suffixes}
+
+    if not affected and not _mentioned(root, changed, suffixes):
+        log.debug('No document or included file changed')
+        return []
+
+    includers = including_documents(root, suffixes)
+
+    if includers:
+        graph = IncludeGraph()
+
+        for document in includers:
+            try:
+                _ = graph.blocks(document)
+
+            except IncludeCycleError as error:
+                log.warning('Include cycle', error=str(error))
+
+        affected |= {
+            path
+            for path in graph.dependents(changed)
+            if path.suffix in suffixes
+        }
+
+    return sorted(path for path in affected if path.is_file())
@@ -0,0 +1,497 @@
+"""Local SQLite history of the timings of runs, per file.
+
+With ``rst-extract extract --history FILE``, each run records, for every
+file, its size and number of blocks, the time spent extracting it and, with
+``--execute``, the time spent executing it. ``rst-extract stats`` then
+shows the slowest files, the runs over time, and the files that became
+slower; and later runs start the files that were slow first (see
+``RunHistory.runtimes`` and ``scheduler.estimate_costs``), or, with
+``--failed-first``, the files that failed or changed (see
+``failures_first``).
+
+Files are recorded by ``sharding.shard_key``, so a history is best kept
+for runs started from the same directory.
+"""
+
+import os
+import sqlite3
+import statistics
+import time
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import NamedTuple, TypeVar, cast
+
+import structlog
+
+from .scheduler import count_blocks
+from .sharding import FileResult, shard_key
+
+log = structlog.get_logger()
+
+DEFAULT_HISTORY_PATH = Path('.rst-extract') / 'history.sqlite3'
+
+# Bumped when the schema changes; older histories are then dropped.
+SCHEMA_VERSION = 1
+
+# The number of runs kept; older runs are dropped when a run is recorded.
+DEFAULT_KEEP_RUNS = 100
+
+# The number of earlier runs a file is compared with.
+DEFAULT_WINDOW = 5
+
+_SCHEMA = """
+CREATE TABLE runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL
+);
+CREATE TABLE timings (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    document TEXT NOT NULL,
+    size INTEGER,
+    blocks INTEGER,
+    extract_time REAL NOT NULL,
+    execute_time REAL,
+    returncode INTEGER,
+    PRIMARY KEY (run, document)
+);
+CREATE INDEX timings_document ON timings (document, run);
+"""
+
+_Path = TypeVar('_Path', bound=str | os.PathLike[str])
+
+_TIMING_COLUMNS = (
+    'run, document, size, blocks, extract_time, execute_time, returncode'
+)
+
+
+class RunHistoryError(Exception):
+    """Error raised when the history cannot be read or updated."""
+
+
+class FileTiming(NamedTuple):
+    """The timings of one file in one run.
+
+    Attributes
+    ----------
+    run : int
+        The run, see ``RunSummary``.
+
+    document : str
+        The ``shard_key`` of the file.
+
+    size, blocks : int | None
+        The size of the file, in bytes, and its number of blocks (see
+        ``scheduler.count_blocks``), if it could be read.
+
+    extract_time : float
+        The time spent extracting the file, in seconds.
+
+    execute_time : float | None
+        The time spent executing its code, if executed.
+
+    returncode : int | None
+        The exit status of its code, if executed.
+    """
+
+    run: int
+    document: str
+    size: int | None
+    blocks: int | None
+    extract_time: float
+    execute_time: float | None
+    returncode: int | None
+
+    @property
+    def duration(self) -> float:
+        """The time spent on the file, in seconds."""
+        return self.extract_time + (self.execute_time or 0.0)
+
+
+class RunSummary(NamedTuple):
+    """A recorded run.
+
+    Attributes
+    ----------
+    id : int
+        The run number, increasing with each run.
+
+    started : float
+        When the run was recorded, as a Unix timestamp.
+
+    files : int
+        The number of files of the run.
+
+    failed : int
+        The number of files whose code was executed and failed.
+
+    duration : float
+        The total time spent on the files, in seconds.
+    """
+
+    id: int
+    started: float
+    files: int
+    failed: int
+    duration: float
+
+
+class Regression(NamedTuple):
+    """A file slower in the last run than in the runs before.
+
+    Attributes
+    ----------
+    document : str
+        The ``shard_key`` of the file.
+
+    baseline : float
+        The median duration of the file in the earlier runs, in seconds.
+
+    latest : float
+        The duration of the file in the last run, in seconds.
+    """
+
+    document: str
+    baseline: float
+    latest: float
+
+    @property
+    def ratio(self) -> float:
+        """How many times slower the file became."""
+        return self.latest / self.baseline if self.baseline else float('inf')
+
+
+class LastRun(NamedTuple):
+    """The last run of a file.
+
+    Attributes
+    ----------
+    started : float
+        When the run started, as a Unix timestamp.
+
+    returncode : int | None
+        The exit status of the code of the file, if executed.
+    """
+
+    started: float
+    returncode: int | None
+
+
+def _file_stats(path: str) -> tuple[int | None, int | None]:
+    """Get the size and number of blocks of ``path``, if it can be read."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+    except OSError:
+        return None, None
+
+    return len(data), count_blocks(data)
+
+
+class RunHistory:
+    """A SQLite history of the timings of the files of each run."""
+
+    path: Path
+    _connection: sqlite3.Connection
+
+    def __init__(self, path: str | os.PathLike[str] = DEFAULT_HISTORY_PATH):
+        """Open the history at ``path``, creating it if needed.
+
+        Raises
+        ------
+        RunHistoryError
+            If the file is not a SQLite database.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute('PRAGMA foreign_keys = ON')
+            self._create_schema()
+
+        except sqlite3.DatabaseError as error:
+            raise RunHistoryError(
+                f'Cannot open the history {self.path}: {error}'
+            ) from error
+
+    def _create_schema(self) -> None:
+        """Create the tables, replacing those of an older schema."""
+        connection = self._connection
+        (version,) = connection.execute('PRAGMA user_version').fetchone()
+
+        if version == SCHEMA_VERSION:
+            return
+
+        with connection:
+            for table in ('timings', 'runs'):
+                connection.execute(f'DROP TABLE IF EXISTS {table}')
+
+        connection.executescript(_SCHEMA)
+        connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        log.debug('History created', filename=str(self.path))
+
+    def record(
+        self,
+        results: Mapping[str, FileResult],
+        *,
+        started: float | None = None,
+        keep: int = DEFAULT_KEEP_RUNS,
+    ) -> int:
+        """Record the timings of a run.
+
+        Arguments
+        ---------
+        results : Mapping[str, FileResult]
+            The result of each file of the run, by ``shard_key``. The files
+            are read again for their size and number of blocks.
+
+        started : float | None
+            When the run started, as a Unix timestamp. Defaults to now.
+
+        keep : int
+            The number of runs to keep; older runs are dropped.
+
+        Returns
+        -------
+        int
+            The id of the run.
+        """
+        rows = []
+
+        for document, result in results.items():
+            executed = result.returncode is not None
+            rows.append(
+                (
+                    document,
+                    *_file_stats(document),
+                    result.extract_duration,
+                    result.duration - result.extract_duration
+                    if executed
+                    else None,
+                    result.returncode,
+                )
+            )
+
+        with self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO runs (started) VALUES (?)',
+                (time.time() if started is None else started,),
+            )
+            run = cast(int, cursor.lastrowid)
+            self._connection.executemany(
+                f'INSERT INTO timings VALUES ({run}, ?, ?, ?, ?, ?, ?)', rows
+            )
+            self._connection.execute(
+                'DELETE FROM runs WHERE id <= ?', (run - keep,)
+            )
+
+        log.info('Run recorded', run=run, file_count=len(rows))
+
+        return run
+
+    def runs(self, limit: int | None = None) -> list[RunSummary]:
+        """Get the last ``limit`` runs (default all), oldest first."""
+        rows = self._connection.execute(
+            'SELECT runs.id, runs.started, COUNT(timings.document), '
+            'COUNT(NULLIF(timings.returncode, 0)), '
+            'TOTAL(timings.extract_time) + TOTAL(timings.execute_time) '
+            'FROM runs LEFT JOIN timings ON timings.run = runs.id '
+            'GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?',
+            (-1 if limit is None else limit,),
+        ).fetchall()
+
+        return [RunSummary(*row) for row in reversed(rows)]
+
+    def timings(self, run: int | None = None) -> list[FileTiming]:
+        """Get the timings of the files of ``run``, by default the last."""
+        rows = self._connection.execute(
+            f'SELECT {_TIMING_COLUMNS} FROM timings '
+            'WHERE run = COALESCE(?, (SELECT MAX(id) FROM runs)) '
+            'ORDER BY document',
+            (run,),
+        )
+
+        return [FileTiming(*row) for row in rows]
+
+    def slowest(
+        self, limit: int = 10, run: int | None = None
+    ) -> list[FileTiming]:
+        """Get the ``limit`` slowest files of ``run``, by default the last."""
+        timings = sorted(
+            self.timings(run), key=lambda timing: -timing.duration
+        )
+
+        return timings[:limit]
+
+    def trend(
+        self, document: str, limit: int | None = None
+    ) -> list[FileTiming]:
+        """Get the timings of ``document`` in its last ``limit`` runs.
+
+        The timings are oldest first.
+        """
+        rows = self._connection.execute(
+            f'SELECT {_TIMING_COLUMNS} FROM timings WHERE document = ? '
+            'ORDER BY run DESC LIMIT ?',
+            (document, -1 if limit is None else limit),
+        ).fetchall()
+
+        return [FileTiming(*row) for row in reversed(rows)]
+
+    def last_runs(self) -> dict[str, LastRun]:
+        """Get the last run of each file, by ``shard_key``."""
+        rows = self._connection.execute(
+            'SELECT timings.document, runs.started, timings.returncode '
+            'FROM timings JOIN runs ON runs.id = timings.run '
+            'WHERE timings.run = (SELECT MAX(last.run) FROM timings AS last '
+            'WHERE last.document = timings.document)'
+        )
+
+        return {document: LastRun(*row) for document, *row in rows}
+
+    def _durations(
+        self, window: int, *, execution: bool = True
+    ) -> dict[str, list[float]]:
+        """Get the durations of each file in the last ``window`` runs.
+
+        The durations are newest first. Without ``execution``, only the
+        time spent extracting counts.
+        """
+        duration = (
+            'extract_time + COALESCE(execute_time, 0)'
+            if execution
+            else 'extract_time'
+        )
+        rows = self._connection.execute(
+            f'SELECT document, {duration} FROM timings WHERE run IN '
+            '(SELECT id FROM runs ORDER BY id DESC LIMIT ?) '
+            'ORDER BY run DESC',
+            (window,),
+        )
+        durations: dict[str, list[float]] = {}
+
+        for document, value in rows:
+            durations.setdefault(document, []).append(value)
+
+        return durations
+
+    def regressions(
+        self,
+        threshold: float = 1.5,
+        *,
+        window: int = DEFAULT_WINDOW,
+        min_increase: float = 0.01,
+    ) -> list[Regression]:
+        """Find the files that became slower in the last run.
+
+        Arguments
+        ---------
+        threshold : float
+            How many times slower than its baseline a file must be.
+
+        window : int
+            The number of earlier runs whose median is the baseline.
+
+        min_increase : float
+            How many seconds slower a file must be, so the noise in the
+            timings of fast files is not reported.
+
+        Returns
+        -------
+        list[Regression]
+            The files of the last run that regressed, worst first.
+        """
+        runs = self.runs(1)
+
+        if not runs:
+            return []
+
+        latest = {timing.document for timing in self.timings(runs[0].id)}
+        found = []
+
+        for document, durations in self._durations(window + 1).items():
+            if document not in latest or len(durations) < 2:
+                continue
+
+            baseline = statistics.median(durations[1:])
+
+            if (
+                durations[0] > threshold * baseline
+                and durations[0] - baseline >= min_increase
+            ):
+                found.append(Regression(document, baseline, durations[0]))
+
+        return sorted(found, key=lambda regression: -regression.ratio)
+
+    def runtimes(
+        self, *, execution: bool = True, window: int = DEFAULT_WINDOW
+    ) -> dict[str, float]:
+        """Get the median runtime of each file in the last ``window`` runs.
+
+        For ``scheduler.estimate_costs``, or to balance shards. Without
+        ``execution``, only the time spent extracting each file counts.
+        """
+        durations = self._durations(window, execution=execution)
+
+        return {
+            document: statistics.median(values)
+            for document, values in durations.items()
+        }
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def __enter__(self) -> 'RunHistory':
+        """Use the history as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the database."""
+        self.close()
+
+
+def _failure_rank(
+    path: str | os.PathLike[str], last_run: LastRun | None
+) -> tuple[int, float]:
+    """Rank a file for ``failures_first``: the lowest rank runs first."""
+    if last_run is not None and last_run.returncode:
+        return 0, -last_run.started
+
+    try:
+        mtime = os.stat(path).st_mtime
+
+    except OSError:
+        mtime = None
+
+    if last_run is None or (mtime is not None and mtime > last_run.started):
+        return 1, -(mtime or 0.0)
+
+    return 2, 0.0
+
+
+def failures_first(
+    paths: Sequence[_Path], last_runs: Mapping[str, LastRun]
+) -> list[_Path]:
+    """Order ``paths`` to run the files likely to fail first.
+
+    The files that failed in their last run come first, most recent
+    failures first; then the files changed since their last run, or never
+    run, most recently changed first; then the other files, in order.
+
+    Arguments
+    ---------
+    paths : Sequence[str | os.PathLike[str]]
+        The files to order.
+
+    last_runs : Mapping[str, LastRun]
+        The last run of files, by ``shard_key``; see
+        ``RunHistory.last_runs``.
+    """
+    ranks = {
+        index: _failure_rank(path, last_runs.get(shard_key(path)))
+        for index, path in enumerate(paths)
+    }
+
+    return [paths[index] for index in sorted(ranks, key=ranks.__getitem__)]
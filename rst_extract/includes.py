@@ -0,0 +1,278 @@
+"""Resolution of ``include`` and ``literalinclude`` with a cached graph.
+
+An ``IncludeGraph`` is shared by all documents of a run. It reads and parses
+every included file only once, however many documents include it, and
+records which document includes which file. When files change, the graph
+finds the documents that depend on them, so only those are re-extracted.
+"""
+
+import os
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+
+import structlog
+
+from .directives import (
+    BlockList,
+    DirectiveMatch,
+    DirectiveRegistry,
+    Reader,
+    default_registry,
+    is_python,
+    literalinclude_handler,
+    read_options,
+    read_text_buffer,
+    resolve_include_path,
+    skip_body,
+)
+from .spans import TextBuffer
+
+log = structlog.get_logger()
+
+
+class IncludeCycleError(ValueError):
+    """Error raised when files include each other in a cycle."""
+
+
+def _key(path: str | os.PathLike[str]) -> Path:
+    """Get the key of ``path`` in the graph."""
+    return Path(path).resolve()
+
+
+def _mtime(path: Path) -> int | None:
+    """Get the modification time of ``path``, or None if it is missing."""
+    try:
+        return os.stat(path).st_mtime_ns
+
+    except OSError:
+        return None
+
+
+class IncludeGraph:
+    """Include dependency graph and parse cache for a whole run.
+
+    Attributes
+    ----------
+    registry : DirectiveRegistry
+        The registry used for scanning, extended with ``include`` and a
+        cached ``literalinclude``.
+    """
+
+    registry: DirectiveRegistry
+    _buffers: dict[Path, TextBuffer | None]
+    _blocks: dict[Path, list[Sequence[str]]]
+    _includes: dict[Path, set[Path]]
+    _mtimes: dict[Path, int | None]
+    _active: list[Path]
+    _reader: Reader | None
+
+    def __init__(
+        self,
+        registry: DirectiveRegistry | None = None,
+        reader: Reader | None = None,
+    ):
+        """Initialize the graph.
+
+        Arguments
+        ---------
+        registry
+            The directives to extract. Defaults to all directives supported
+            by rst_extract.
+
+        reader
+            Reads included files, e.g. from a git revision instead of the
+            work tree. Defaults to ``directives.read_text_buffer``.
+        """
+        self.registry = (registry or default_registry()).copy()
+        self.registry.register('include', self._handle_include)
+        self.registry.register(
+            'literalinclude', literalinclude_handler(self._read_included)
+        )
+
+        self._buffers = {}
+        self._blocks = {}
+        self._includes = {}
+        self._mtimes = {}
+        self._active = []
+        self._reader = reader
+
+    def __contains__(self, path: object) -> bool:
+        """Check if ``path`` has been read into the graph."""
+        if not isinstance(path, (str, os.PathLike)):
+            return False
+
+        return _key(path) in self._buffers
+
+    def read(
+        self,
+        path: str | os.PathLike[str],
+        included_from: TextBuffer | None = None,
+    ) -> TextBuffer | None:
+        """Read ``path`` (only once), returning None if it is unreadable."""
+        key = _key(path)
+
+        if key not in self._buffers:
+            self._mtimes[key] = _mtime(key)
+            read = self._reader or read_text_buffer
+            self._buffers[key] = read(included_from, Path(path))
+            log.debug('File read into include graph', filename=str(path))
+
+        return self._buffers[key]
+
+    def scan(self, buffer: TextBuffer) -> list[Sequence[str]]:
+        """Scan a document, following and recording its includes.
+
+        Raises
+        ------
+        IncludeCycleError
+            If the document (indirectly) includes itself.
+        """
+        if buffer.path is None:
+            return list(self.registry.scan(buffer))
+
+        key = _key(buffer.path)
+
+        if key in self._active:
+            chain = ' -> '.join(
+                str(path)
+                for path in self._active[self._active.index(key) :] + [key]
+            )
+            raise IncludeCycleError(f'Include cycle detected: {chain}')
+
+        self._buffers[key] = buffer
+        self._mtimes[key] = _mtime(key)
+        self._includes[key] = set()
+        self._active.append(key)
+
+        try:
+            blocks = list(self.registry.scan(buffer))
+
+        finally:
+            _ = self._active.pop()
+
+        self._blocks[key] = blocks
+
+        return blocks
+
+    def blocks(
+        self,
+        path: str | os.PathLike[str],
+        included_from: TextBuffer | None = None,
+    ) -> list[Sequence[str]]:
+        """Get the blocks of the document at ``path``, parsing it only once."""
+        key = _key(path)
+
+        if key in self._blocks and key not in self._active:
+            return self._blocks[key]
+
+        buffer = self.read(path, included_from)
+
+        if buffer is None:
+            return []
+
+        return self.scan(buffer)
+
+    def includes(self, path: str | os.PathLike[str]) -> set[Path]:
+        """Get the files directly included by ``path``."""
+        return set(self._includes.get(_key(path), ()))
+
+    def dependents(self, paths: Iterable[str | os.PathLike[str]]) -> set[Path]:
+        """Get ``paths`` and every document that (indirectly) includes them."""
+        included_by: dict[Path, set[Path]] = {}
+        for document, included in self._includes.items():
+            for path in included:
+                included_by.setdefault(path, set()).add(document)
+
+        pending = [_key(path) for path in paths]
+        found = set(pending)
+
+        while pending:
+            for document in included_by.get(pending.pop(), ()):
+                if document not in found:
+                    found.add(document)
+                    pending.append(document)
+
+        return found
+
+    def changed(self) -> set[Path]:
+        """Get the files that were modified since they were read."""
+        return {
+            path
+            for path, mtime in self._mtimes.items()
+            if _mtime(path) != mtime
+        }
+
+    def invalidate(
+        self, paths: Iterable[str | os.PathLike[str]] | None = None
+    ) -> set[Path]:
+        """Drop ``paths`` and their dependents from the cache.
+
+        Arguments
+        ---------
+        paths
+            The files that changed. Defaults to the result of ``changed``.
+
+        Returns
+        -------
+        set[Path]
+            The files that were dropped; documents among them need to be
+            extracted again.
+        """
+        stale = self.dependents(self.changed() if paths is None else paths)
+
+        for path in stale:
+            _ = self._buffers.pop(path, None)
+            _ = self._blocks.pop(path, None)
+            _ = self._includes.pop(path, None)
+            _ = self._mtimes.pop(path, None)
+
+        log.debug('Include graph invalidated', files=sorted(map(str, stale)))
+
+        return stale
+
+    def _add_edge(self, buffer: TextBuffer, path: Path) -> None:
+        """Record that the document in ``buffer`` includes ``path``."""
+        if buffer.path is not None:
+            self._includes.setdefault(_key(buffer.path), set()).add(_key(path))
+
+    def _read_included(
+        self, buffer: TextBuffer, path: Path
+    ) -> TextBuffer | None:
+        """Read a file included from ``buffer``, recording the edge."""
+        self._add_edge(buffer, path)
+
+        return self.read(path, buffer)
+
+    def _handle_include(
+        self, buffer: TextBuffer, directive: DirectiveMatch
+    ) -> tuple[Sequence[str] | None, int]:
+        """Handle ``include`` directives.
+
+        Included reStructuredText is scanned as if it were part of the
+        document. With the ``:code:`` option, the file is included as code
+        if the language is python. Standard includes (``<name>``) and
+        ``:literal:`` includes are skipped.
+        """
+        options, line = read_options(
+            buffer, directive.line + 1, directive.indent
+        )
+        next_line = skip_body(buffer, line, directive.indent)
+        argument = directive.argument.strip()
+
+        if argument.startswith('<') or 'literal' in options:
+            return None, next_line
+
+        path = resolve_include_path(buffer, argument)
+        self._add_edge(buffer, path)
+
+        if 'code' in options:
+            included = self.read(path, buffer)
+
+            if included is None or not is_python(options['code']):
+                return None, next_line
+
+            span = included.span(0, len(included), 0)
+
+            return included.lines(span), next_line
+
+        return BlockList(self.blocks(path, buffer)), next_line
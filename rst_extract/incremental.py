@@ -0,0 +1,297 @@
+"""Incremental execution: only run the blocks affected by a change.
+
+After each run, the hash of every block of a document, and the names it
+binds, are recorded (in ``.rst-extract/last-run.json`` by default, relative
+to the current directory; ``rst-extract --record`` chooses another). On the
+next run, the blocks that changed are found by comparing hashes, and the
+``analysis.BlockGraph`` of the document gives the blocks depending on them.
+Only those blocks, and the blocks they need to run, are executed; the other
+blocks are skipped.
+
+A document whose last run failed (or was never recorded) is run in full.
+"""
+
+import difflib
+import json
+import os
+import subprocess
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import structlog
+
+from .analysis import BlockGraph
+from .assembler import DEFAULT_HEADER_TEMPLATE, OutputAssembler, trim_bounds
+from .blockstore import content_hash
+from .doctests import doctest_registry
+from .execution import run_code
+from .includes import IncludeGraph
+from .sourcemap import SourceMap
+from .spans import TextBuffer
+
+log = structlog.get_logger()
+
+DEFAULT_RECORD_PATH = Path('.rst-extract') / 'last-run.json'
+RECORD_VERSION = 1
+
+
+class RecordedBlock(NamedTuple):
+    """A block of a recorded run: its hash, and the names it binds."""
+
+    hash: str
+    binds: tuple[str, ...]
+
+
+class RunRecord:
+    """The blocks of the last run of each document, stored as JSON.
+
+    Attributes
+    ----------
+    path : Path
+        The file the record is read from and saved to.
+    """
+
+    path: Path
+    _documents: dict[str, dict[str, Any]]
+
+    def __init__(self, path: str | os.PathLike[str] = DEFAULT_RECORD_PATH):
+        """Load the record at ``path``, if any.
+
+        An unreadable or outdated record is ignored, so every document is
+        run in full.
+        """
+        self.path = Path(path)
+        self._documents = {}
+
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict) and data.get('version') == RECORD_VERSION:
+            self._documents = data.get('documents', {})
+
+        else:
+            log.warning('Ignoring outdated run record', filename=str(path))
+
+    def get(self, document: str) -> list[RecordedBlock] | None:
+        """Get the blocks of the last run of ``document``, if it passed."""
+        entry = self._documents.get(document)
+
+        if entry is None or not entry.get('passed'):
+            return None
+
+        return [
+            RecordedBlock(block['hash'], tuple(block['binds']))
+            for block in entry['blocks']
+        ]
+
+    def set(
+        self, document: str, blocks: Sequence[RecordedBlock], passed: bool
+    ) -> None:
+        """Record a run of ``document``."""
+        self._documents[document] = {
+            'passed': passed,
+            'blocks': [
+                {'hash': block.hash, 'binds': list(block.binds)}
+                for block in blocks
+            ],
+        }
+
+    def save(self) -> None:
+        """Write the record to its file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {'version': RECORD_VERSION, 'documents': self._documents}
+        _ = self.path.write_text(json.dumps(data), encoding='utf-8')
+
+
+def changed_blocks(
+    previous: Sequence[RecordedBlock],
+    hashes: Sequence[str],
+    graph: BlockGraph,
+) -> set[int]:
+    """Get the indices of the blocks that changed since ``previous``.
+
+    New, modified and moved blocks changed. Blocks using a name bound by a
+    block that was removed (or modified) changed as well, as they may now
+    fail.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [block.hash for block in previous], hashes, autojunk=False
+    )
+    changed = set()
+    lost: set[str] = set()
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            changed.update(range(j1, j2))
+
+            for block in previous[i1:i2]:
+                lost.update(block.binds)
+
+    changed.update(
+        index for index, names in enumerate(graph.names) if names.uses & lost
+    )
+
+    return changed
+
+
+class RunPlan(NamedTuple):
+    """The blocks of a document to run.
+
+    Attributes
+    ----------
+    selected : list[int]
+        The indices of the blocks to run, in order. Empty if nothing
+        changed.
+
+    total : int
+        The number of blocks in the document.
+
+    code : str
+        The code of the selected blocks.
+
+    source_map : SourceMap
+        The source map of ``code``.
+
+    blocks : list[RecordedBlock]
+        All blocks of the document, to record after the run.
+    """
+
+    selected: list[int]
+    total: int
+    code: str
+    source_map: SourceMap
+    blocks: list[RecordedBlock]
+
+
+class IncrementalRunner:
+    """Run documents, skipping the blocks unaffected since the last run.
+
+    Use as a context manager to save the record on exit.
+    """
+
+    record: RunRecord
+    header_template: str
+    include_graph: IncludeGraph
+
+    def __init__(
+        self,
+        record_path: str | os.PathLike[str] = DEFAULT_RECORD_PATH,
+        *,
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+        doctest: bool = False,
+    ):
+        """Initialize the runner.
+
+        Arguments
+        ---------
+        record_path : str | os.PathLike[str]
+            The record of the last runs. Defaults to
+            ``.rst-extract/last-run.json``.
+
+        header_template : str
+            Template for the header line written before each block.
+
+        doctest : bool
+            Whether to also run doctest (``>>>``) examples as code.
+        """
+        self.record = RunRecord(record_path)
+        self.header_template = header_template
+        self.include_graph = IncludeGraph(
+            doctest_registry() if doctest else None
+        )
+
+    def plan(self, path: str | os.PathLike[str]) -> RunPlan:
+        """Find the blocks of the document at ``path`` to run.
+
+        Raises
+        ------
+        OSError
+            If the document cannot be read.
+
+        IncludeCycleError
+            If the document (indirectly) includes itself.
+        """
+        document = os.fspath(Path(path).resolve())
+        buffer = TextBuffer(Path(path).read_text(encoding='utf-8'), path)
+        blocks = self.include_graph.scan(buffer)
+
+        texts = []
+        for block in blocks:
+            start, end = trim_bounds(block)
+            texts.append('\n'.join(block[start:end]))
+
+        graph = BlockGraph(texts)
+        hashes = [content_hash(text) for text in texts]
+        previous = self.record.get(document)
+
+        if previous is None:
+            selected = set(range(len(blocks)))
+
+        else:
+            changed = changed_blocks(previous, hashes, graph)
+            selected = graph.prerequisites(graph.dependents(changed))
+
+        source_map = SourceMap()
+        assembler = OutputAssembler(
+            header_template=self.header_template, source_map=source_map
+        )
+        assembler.write_blocks(
+            (blocks[index] for index in sorted(selected)), path
+        )
+
+        log.debug(
+            'Run planned',
+            filename=document,
+            selected=sorted(selected),
+            block_count=len(blocks),
+        )
+
+        return RunPlan(
+            sorted(selected),
+            len(blocks),
+            assembler.getvalue(),
+            source_map,
+            [
+                RecordedBlock(block_hash, tuple(sorted(names.binds)))
+                for block_hash, names in zip(hashes, graph.names)
+            ],
+        )
+
+    def run(
+        self,
+        path: str | os.PathLike[str],
+        python_bin: str | os.PathLike[str],
+    ) -> tuple[RunPlan, subprocess.CompletedProcess[str] | None]:
+        """Run the blocks of ``path`` affected since the last run.
+
+        Returns the plan, and the result of the run (``None`` if no block
+        needed to run). Tracebacks in the result are rewritten with the
+        source map of the plan, to point at the lines of the documents. The
+        run is recorded; a failed run makes the next one run the whole
+        document.
+        """
+        plan = self.plan(path)
+        document = os.fspath(Path(path).resolve())
+
+        if not plan.selected:
+            log.info('Document skipped, no block changed', filename=document)
+            self.record.set(document, plan.blocks, passed=True)
+
+            return plan, None
+
+        result = run_code(python_bin, plan.code, plan.source_map)
+        self.record.set(document, plan.blocks, result.returncode == 0)
+
+        return plan, result
+
+    def __enter__(self) -> 'IncrementalRunner':
+        """Use the runner as a context manager, saving the record on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Save the record."""
+        self.record.save()
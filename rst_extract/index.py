@@ -0,0 +1,396 @@
+"""Searchable SQLite index of the code blocks of many documents.
+
+``rst-extract index`` records, for every block of every document, its hash
+and location, and the modules it imports and the names it defines (see
+``analysis.block_names``). ``rst-extract query`` then answers questions like
+"which documents use ``numpy.random``" without extracting anything.
+
+The index is updated incrementally: a document is only scanned again when
+it, or a file it includes, changed since it was indexed. Names are stored
+once per distinct block, so a block repeated on many pages is only analysed
+once.
+"""
+
+import os
+import sqlite3
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+from typing import Literal, NamedTuple
+
+import structlog
+
+from .analysis import block_names
+from .assembler import trim_bounds
+from .blockstore import content_hash
+from .doctests import doctest_registry
+from .includes import IncludeGraph
+from .spans import TextBuffer
+
+log = structlog.get_logger()
+
+DEFAULT_INDEX_PATH = Path('.rst-extract') / 'index.sqlite3'
+
+# Bumped when the schema changes; older indexes are then rebuilt.
+SCHEMA_VERSION = 1
+
+NameKind = Literal['import', 'define']
+
+_SCHEMA = """
+CREATE TABLE documents (path TEXT PRIMARY KEY);
+CREATE TABLE files (
+    document TEXT NOT NULL REFERENCES documents (path) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE blocks (
+    document TEXT NOT NULL REFERENCES documents (path) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    source TEXT,
+    line INTEGER,
+    PRIMARY KEY (document, position)
+);
+CREATE TABLE analysed (hash TEXT PRIMARY KEY, valid INTEGER NOT NULL);
+CREATE TABLE names (
+    hash TEXT NOT NULL REFERENCES analysed (hash) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX files_document ON files (document);
+CREATE INDEX blocks_hash ON blocks (hash);
+CREATE INDEX names_name ON names (name);
+CREATE INDEX names_hash ON names (hash);
+"""
+
+
+class BlockIndexError(Exception):
+    """Error raised when the index cannot be read or updated."""
+
+
+class IndexUpdate(NamedTuple):
+    """The outcome of ``BlockIndex.update``.
+
+    Attributes
+    ----------
+    indexed : list[str]
+        The documents (re-)indexed.
+
+    unchanged : list[str]
+        The documents skipped, as they did not change.
+
+    removed : list[str]
+        The documents dropped from the index, as they no longer exist.
+    """
+
+    indexed: list[str]
+    unchanged: list[str]
+    removed: list[str]
+
+
+class IndexMatch(NamedTuple):
+    """A block matching a query.
+
+    Attributes
+    ----------
+    document : str
+        The document the block is extracted from.
+
+    source : str | None
+        The file the block is in (an included file, for included blocks).
+
+    line : int | None
+        The 1-based line of the first line of code in ``source``.
+
+    hash : str
+        The hash of the block, see ``blockstore.content_hash``.
+
+    kind : NameKind
+        Whether the block imports or defines ``name``.
+
+    name : str
+        The matching module or name.
+    """
+
+    document: str
+    source: str | None
+    line: int | None
+    hash: str
+    kind: NameKind
+    name: str
+
+    @property
+    def location(self) -> str:
+        """The location of the block, as ``source:line``."""
+        return f'{self.source or self.document}:{self.line or 1}'
+
+
+def _escape_like(text: str) -> str:
+    """Escape the wildcards of a ``LIKE`` pattern."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _stat(path: str) -> tuple[int, int] | None:
+    """Get the modification time and size of ``path``, if it exists."""
+    try:
+        stat = os.stat(path)
+
+    except OSError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _dependencies(graph: IncludeGraph, path: Path) -> set[Path]:
+    """Get ``path`` and every file it (indirectly) includes."""
+    found = {path}
+    pending = [path]
+
+    while pending:
+        for included in graph.includes(pending.pop()):
+            if included not in found:
+                found.add(included)
+                pending.append(included)
+
+    return found
+
+
+class BlockIndex:
+    """A SQLite index of blocks, their locations and names."""
+
+    path: Path
+    _connection: sqlite3.Connection
+
+    def __init__(self, path: str | os.PathLike[str] = DEFAULT_INDEX_PATH):
+        """Open the index at ``path``, creating it if needed.
+
+        Raises
+        ------
+        BlockIndexError
+            If the file is not a SQLite database.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute('PRAGMA foreign_keys = ON')
+            self._create_schema()
+
+        except sqlite3.DatabaseError as error:
+            raise BlockIndexError(
+                f'Cannot open the index {self.path}: {error}'
+            ) from error
+
+    def _create_schema(self) -> None:
+        """Create the tables, replacing those of an older schema."""
+        connection = self._connection
+        (version,) = connection.execute('PRAGMA user_version').fetchone()
+
+        if version == SCHEMA_VERSION:
+            return
+
+        with connection:
+            for table in ('names', 'analysed', 'blocks', 'files', 'documents'):
+                connection.execute(f'DROP TABLE IF EXISTS {table}')
+
+        connection.executescript(_SCHEMA)
+        connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        log.debug('Index created', filename=str(self.path))
+
+    def documents(self) -> list[str]:
+        """Get the indexed documents."""
+        rows = self._connection.execute(
+            'SELECT path FROM documents ORDER BY path'
+        )
+
+        return [path for (path,) in rows]
+
+    def _is_current(self, document: str) -> bool:
+        """Check if no file of ``document`` changed since it was indexed."""
+        rows = self._connection.execute(
+            'SELECT path, mtime_ns, size FROM files WHERE document = ?',
+            (document,),
+        ).fetchall()
+
+        return bool(rows) and all(
+            _stat(path) == (mtime_ns, size) for path, mtime_ns, size in rows
+        )
+
+    def update(
+        self,
+        paths: Iterable[str | os.PathLike[str]],
+        *,
+        doctest: bool = False,
+    ) -> IndexUpdate:
+        """Index the documents at ``paths`` that changed.
+
+        Indexed documents that no longer exist are dropped as well.
+
+        Raises
+        ------
+        OSError
+            If a document cannot be read.
+
+        IncludeCycleError
+            If a document (indirectly) includes itself.
+        """
+        graph = IncludeGraph(doctest_registry() if doctest else None)
+        update = IndexUpdate([], [], [])
+
+        for path in paths:
+            document = os.fspath(Path(path).resolve())
+
+            if self._is_current(document):
+                update.unchanged.append(document)
+                continue
+
+            buffer = TextBuffer(
+                Path(document).read_text(encoding='utf-8'), document
+            )
+            blocks = graph.scan(buffer)
+            files = _dependencies(graph, Path(document))
+
+            with self._connection:
+                self._remove(document)
+                self._add(document, blocks, files)
+
+            update.indexed.append(document)
+
+        with self._connection:
+            for document in self.documents():
+                if not os.path.isfile(document):
+                    self._remove(document)
+                    update.removed.append(document)
+
+            self._connection.execute(
+                'DELETE FROM analysed WHERE hash NOT IN '
+                '(SELECT hash FROM blocks)'
+            )
+
+        log.info(
+            'Index updated',
+            indexed=len(update.indexed),
+            unchanged=len(update.unchanged),
+            removed=len(update.removed),
+        )
+
+        return update
+
+    def _remove(self, document: str) -> None:
+        """Drop ``document`` and its blocks."""
+        self._connection.execute(
+            'DELETE FROM documents WHERE path = ?', (document,)
+        )
+
+    def _add(
+        self,
+        document: str,
+        blocks: Sequence[Sequence[str]],
+        files: Iterable[Path],
+    ) -> None:
+        """Record ``document``, its blocks and the files it was read from."""
+        connection = self._connection
+        connection.execute('INSERT INTO documents VALUES (?)', (document,))
+
+        for file in files:
+            if (stat := _stat(os.fspath(file))) is not None:
+                connection.execute(
+                    'INSERT INTO files VALUES (?, ?, ?, ?)',
+                    (document, os.fspath(file), *stat),
+                )
+
+        for position, block in enumerate(blocks):
+            start, end = trim_bounds(block)
+            text = '\n'.join(block[start:end])
+            block_hash = content_hash(text)
+            line_numbers = getattr(block, 'line_numbers', None)
+            source = getattr(block, 'source', None)
+
+            connection.execute(
+                'INSERT INTO blocks VALUES (?, ?, ?, ?, ?)',
+                (
+                    document,
+                    position,
+                    block_hash,
+                    os.fspath(source) if source is not None else None,
+                    line_numbers[start] + 1
+                    if line_numbers is not None and start < end
+                    else None,
+                ),
+            )
+            self._analyse(block_hash, text)
+
+    def _analyse(self, block_hash: str, text: str) -> None:
+        """Record the names of a block, if not analysed yet."""
+        connection = self._connection
+        known = connection.execute(
+            'SELECT 1 FROM analysed WHERE hash = ?', (block_hash,)
+        ).fetchone()
+
+        if known:
+            return
+
+        names = block_names(text)
+        connection.execute(
+            'INSERT INTO analysed VALUES (?, ?)', (block_hash, names.valid)
+        )
+        connection.executemany(
+            'INSERT INTO names VALUES (?, ?, ?)',
+            [(block_hash, 'import', name) for name in names.imports]
+            + [(block_hash, 'define', name) for name in names.defines],
+        )
+
+    def query(
+        self, name: str, kind: NameKind | None = None
+    ) -> list[IndexMatch]:
+        """Find the blocks importing or defining ``name``.
+
+        A dotted name also matches the names under it, and the names it
+        ends with: ``numpy.random`` matches ``numpy.random.default_rng``,
+        and ``configure_logging`` matches ``rst_extract.configure_logging``.
+
+        Arguments
+        ---------
+        name : str
+            The module or name to look for.
+
+        kind : NameKind | None
+            Only find blocks that ``'import'`` or ``'define'`` the name.
+            Default is both.
+
+        Returns
+        -------
+        list[IndexMatch]
+            The matches, by document and in document order.
+        """
+        escaped = _escape_like(name)
+        sql = (
+            'SELECT blocks.document, blocks.source, blocks.line, '
+            'blocks.hash, names.kind, names.name '
+            'FROM names JOIN blocks ON blocks.hash = names.hash '
+            "WHERE (names.name = ? OR names.name LIKE ? ESCAPE '\\' "
+            "OR names.name LIKE ? ESCAPE '\\')"
+        )
+        parameters = [name, f'{escaped}.%', f'%.{escaped}']
+
+        if kind is not None:
+            sql += ' AND names.kind = ?'
+            parameters.append(kind)
+
+        sql += ' ORDER BY blocks.document, blocks.position, names.name'
+        rows = self._connection.execute(sql, parameters)
+
+        return [IndexMatch(*row) for row in rows]
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def __enter__(self) -> 'BlockIndex':
+        """Use the index as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the database."""
+        self.close()
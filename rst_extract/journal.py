@@ -0,0 +1,167 @@
+"""Append-only journal of the documents completed by a run.
+
+With ``--journal PATH``, the outcome of every document is appended to the
+journal as soon as the document is done: one JSON object per line, flushed
+to disk, so the journal survives the run being killed. With ``--resume``,
+the documents already in the journal are skipped, unless they changed
+since; the run continues where the previous one stopped.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Literal, NamedTuple
+
+import structlog
+
+log = structlog.get_logger()
+
+Status = Literal['extracted', 'passed', 'failed']
+
+
+def file_hash(path: str | os.PathLike[str]) -> str:
+    """Hash the contents of the file at ``path``."""
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class JournalEntry(NamedTuple):
+    """The outcome of one document.
+
+    Attributes
+    ----------
+    document : str
+        The absolute path of the document.
+
+    hash : str
+        The hash of the document when it was processed, see ``file_hash``.
+
+    status : Status
+        ``'extracted'`` if the code was not executed, and ``'passed'`` or
+        ``'failed'`` otherwise.
+
+    output : str | None
+        Where the extracted code was written, if anywhere.
+
+    returncode : int | None
+        The exit status of the executed code.
+
+    time : float
+        When the document was done, as a UNIX timestamp.
+    """
+
+    document: str
+    hash: str
+    status: Status
+    output: str | None = None
+    returncode: int | None = None
+    time: float = 0.0
+
+
+class Journal:
+    """An append-only journal file, read back with ``entries``."""
+
+    path: Path
+
+    def __init__(self, path: str | os.PathLike[str]):
+        """Use the journal at ``path``; it is created on the first record."""
+        self.path = Path(path)
+
+    def entries(self) -> dict[str, JournalEntry]:
+        """Get the last entry of every document in the journal.
+
+        Lines that cannot be read, such as a last line cut short by a
+        crash, are skipped.
+        """
+        entries: dict[str, JournalEntry] = {}
+
+        try:
+            f = open(self.path, encoding='utf-8')
+
+        except FileNotFoundError:
+            return entries
+
+        with f:
+            for number, line in enumerate(f, start=1):
+                try:
+                    entry = JournalEntry(**json.loads(line))
+
+                except (ValueError, TypeError):
+                    log.warning(
+                        'Skipping unreadable journal line',
+                        filename=str(self.path),
+                        line=number,
+                    )
+                    continue
+
+                entries[entry.document] = entry
+
+        return entries
+
+    def record(
+        self,
+        document: str | os.PathLike[str],
+        status: Status,
+        *,
+        output: str | os.PathLike[str] | None = None,
+        returncode: int | None = None,
+    ) -> JournalEntry:
+        """Append the outcome of ``document`` to the journal.
+
+        The entry is on disk when this returns.
+        """
+        entry = JournalEntry(
+            os.fspath(Path(document).resolve()),
+            file_hash(document),
+            status,
+            os.fspath(output) if output is not None else None,
+            returncode,
+            time.time(),
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry._asdict()) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        log.debug('Journal entry recorded', **entry._asdict())
+
+        return entry
+
+    def pending(
+        self, documents: Iterable[str | os.PathLike[str]]
+    ) -> list[str | os.PathLike[str]]:
+        """Get the ``documents`` not in the journal, or changed since.
+
+        Only the document itself is compared, not the files it includes.
+        """
+        entries = self.entries()
+        pending = []
+        skipped = 0
+
+        for document in documents:
+            entry = entries.get(os.fspath(Path(document).resolve()))
+
+            if entry is None or entry.hash != file_hash(document):
+                pending.append(document)
+
+            else:
+                skipped += 1
+
+        log.info(
+            'Resuming from journal',
+            filename=str(self.path),
+            skipped=skipped,
+            pending=len(pending),
+        )
+
+        return pending
@@ -65,3 +65,10 @@ def configure_logging(verbose: int) -> None:
     )
 
     logging.info('Logging configured to %s.', logging.getLevelName(level))
+
+
+def configure_default_logging() -> None:
+    """Configure logging, unless another logging system is instantiated."""
+    if not logging.getLogger().handlers:
+        # Use structlog for logging.
+        configure_logging(verbose=0)
@@ -0,0 +1,295 @@
+"""Parallel execution of the independent blocks of a document.
+
+The ``analysis.BlockGraph`` of a document splits its blocks into groups that
+share no state. Each group runs in its own interpreter process, and groups
+run concurrently. Within a group, blocks run in order in one namespace, as
+they would in the extracted script; a failing block stops its group only.
+
+The output of every block is captured separately, and results are reported
+in document order. Tracebacks point at the lines of the reStructuredText
+files directly, as each block is compiled with its source lines.
+"""
+
+import json
+import os
+import subprocess
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import structlog
+
+from .analysis import BlockGraph
+from .assembler import trim_bounds
+from .doctests import doctest_registry
+from .includes import IncludeGraph
+from .scheduler import run_until
+from .spans import TextBuffer
+
+log = structlog.get_logger()
+
+# Runs the blocks of a group, read as JSON from stdin, in one namespace, and
+# writes the output of each block as JSON to stdout. Only uses the standard
+# library, so it runs with any python binary.
+_DRIVER = r"""
+import ast, contextlib, io, json, sys, traceback
+
+def compile_block(block):
+    lines = block['lines']
+    try:
+        tree = ast.parse(block['code'], block['filename'])
+    except SyntaxError as error:
+        if error.lineno and 0 < error.lineno <= len(lines):
+            error.lineno = lines[error.lineno - 1]
+        raise
+    if lines:
+        for node in ast.walk(tree):
+            for attribute in ('lineno', 'end_lineno'):
+                value = getattr(node, attribute, None)
+                if value is not None and 0 < value <= len(lines):
+                    setattr(node, attribute, lines[value - 1])
+    return compile(tree, block['filename'], 'exec')
+
+namespace = {'__name__': '__main__', '__builtins__': __builtins__}
+results = []
+for block in json.load(sys.stdin):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    passed = True
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            exec(compile_block(block), namespace)
+        except BaseException as error:
+            passed = False
+            tb = None if isinstance(error, SyntaxError) else error.__traceback__
+            traceback.print_exception(type(error), error, tb and tb.tb_next)
+    results.append(
+        {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(),
+         'passed': passed}
+    )
+    if not passed:
+        break
+json.dump(results, sys.__stdout__)
+"""
+
+
+class BlockResult(NamedTuple):
+    """The outcome of running one block.
+
+    Attributes
+    ----------
+    index : int
+        The 0-based position of the block in its document.
+
+    source : str | None
+        The file the block is in.
+
+    line : int | None
+        The 1-based line of the first line of code in ``source``.
+
+    stdout, stderr : str
+        The output of the block.
+
+    passed : bool
+        Whether the block ran without raising.
+
+    ran : bool
+        Whether the block ran at all: blocks after a failing block of the
+        same group do not, nor, with ``fail_fast``, the blocks of groups not
+        started before a block failed.
+    """
+
+    index: int
+    source: str | None
+    line: int | None
+    stdout: str
+    stderr: str
+    passed: bool
+    ran: bool = True
+
+
+class _Block(NamedTuple):
+    """A block to run: its code, and where its lines come from."""
+
+    code: str
+    source: str | None
+    lines: list[int]
+
+
+def _prepare(blocks: Sequence[Sequence[str]]) -> list[_Block]:
+    """Get the code and 1-based source lines of each block."""
+    prepared = []
+
+    for block in blocks:
+        start, end = trim_bounds(block)
+        line_numbers = getattr(block, 'line_numbers', None)
+        source = getattr(block, 'source', None)
+
+        prepared.append(
+            _Block(
+                '\n'.join(block[start:end]),
+                os.fspath(source) if source is not None else None,
+                [n + 1 for n in line_numbers[start:end]]
+                if line_numbers is not None
+                else [],
+            )
+        )
+
+    return prepared
+
+
+def _skipped(
+    blocks: Sequence[_Block], indices: Sequence[int]
+) -> list[BlockResult]:
+    """Get the results of a group of blocks that was not run."""
+    return [
+        BlockResult(
+            index,
+            blocks[index].source,
+            blocks[index].lines[0] if blocks[index].lines else None,
+            '',
+            '',
+            False,
+            False,
+        )
+        for index in indices
+    ]
+
+
+def _run_group(
+    python_bin: str | os.PathLike[str],
+    blocks: Sequence[_Block],
+    indices: Sequence[int],
+) -> list[BlockResult]:
+    """Run a group of blocks in a new interpreter."""
+    request = [
+        {
+            'code': blocks[index].code,
+            'filename': blocks[index].source or f'<block {index + 1}>',
+            'lines': blocks[index].lines,
+        }
+        for index in indices
+    ]
+    process = subprocess.run(
+        [os.fspath(python_bin), '-c', _DRIVER],
+        input=json.dumps(request),
+        capture_output=True,
+        encoding='utf-8',
+    )
+
+    try:
+        outputs: list[dict[str, Any]] = json.loads(process.stdout)
+
+    except ValueError:
+        # The interpreter itself failed (e.g., it was killed).
+        outputs = [{'stdout': '', 'stderr': process.stderr, 'passed': False}]
+
+    results = []
+
+    for position, index in enumerate(indices):
+        block = blocks[index]
+        line = block.lines[0] if block.lines else None
+
+        if position < len(outputs):
+            output = outputs[position]
+            results.append(
+                BlockResult(
+                    index,
+                    block.source,
+                    line,
+                    output['stdout'],
+                    output['stderr'],
+                    output['passed'],
+                )
+            )
+
+        else:
+            results.extend(_skipped(blocks, [index]))
+
+    return results
+
+
+def run_blocks(
+    blocks: Sequence[Sequence[str]],
+    python_bin: str | os.PathLike[str],
+    *,
+    jobs: int | None = None,
+    fail_fast: bool = False,
+) -> list[BlockResult]:
+    """Run the independent groups of ``blocks`` concurrently.
+
+    Arguments
+    ---------
+    blocks : Sequence[Sequence[str]]
+        The blocks of a document, in order.
+
+    python_bin : str | os.PathLike[str]
+        The python binary to run the blocks with.
+
+    jobs : int | None
+        The number of groups run at once. Defaults to the number of CPUs.
+
+    fail_fast : bool
+        Whether to start no new group once a block failed.
+
+    Returns
+    -------
+    list[BlockResult]
+        The result of every block, in document order.
+    """
+    prepared = _prepare(blocks)
+    groups = BlockGraph([block.code for block in prepared]).groups()
+
+    log.debug(
+        'Running blocks in parallel',
+        block_count=len(prepared),
+        group_count=len(groups),
+    )
+
+    # The largest groups start first; their size estimates their runtime.
+    group_results = run_until(
+        groups,
+        lambda group: _run_group(python_bin, prepared, group),
+        [sum(len(prepared[index].code) for index in g) for g in groups],
+        stop=(
+            (lambda results: not all(r.passed for r in results))
+            if fail_fast
+            else None
+        ),
+        workers=jobs,
+    )
+    results = [
+        result
+        for position, group in enumerate(groups)
+        for result in group_results.get(position) or _skipped(prepared, group)
+    ]
+
+    return sorted(results, key=lambda result: result.index)
+
+
+def run_document(
+    path: str | os.PathLike[str],
+    python_bin: str | os.PathLike[str],
+    *,
+    jobs: int | None = None,
+    doctest: bool = False,
+    include_graph: IncludeGraph | None = None,
+    fail_fast: bool = False,
+) -> list[BlockResult]:
+    """Run the blocks of the document at ``path``, see ``run_blocks``.
+
+    Raises
+    ------
+    OSError
+        If the document cannot be read.
+
+    IncludeCycleError
+        If the document (indirectly) includes itself.
+    """
+    if include_graph is None:
+        include_graph = IncludeGraph(doctest_registry() if doctest else None)
+
+    buffer = TextBuffer(Path(path).read_text(encoding='utf-8'), path)
+
+    return run_blocks(
+        include_graph.scan(buffer), python_bin, jobs=jobs, fail_fast=fail_fast
+    )
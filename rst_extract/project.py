@@ -0,0 +1,565 @@
+"""Sphinx project mode: extract a whole doc tree in toctree reading order.
+
+Sphinx itself is never invoked. ``conf.py`` is parsed, not executed, for
+the root document and source suffixes, and the toctree is resolved from the
+``toctree`` directives in the documents. The documents are then extracted in
+parallel worker processes (or threads, on free-threaded builds of Python),
+largest first (see ``scheduler``), and returned in reading order.
+"""
+
+import ast
+import dataclasses
+import fnmatch
+import functools
+import os
+import posixpath
+import re
+import sys
+import threading
+import time
+from collections.abc import Callable, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Literal, TypeVar
+
+import structlog
+
+from .assembler import DEFAULT_HEADER_TEMPLATE
+from .blockstore import BlockStore, detach_block
+from .directives import (
+    DirectiveMatch,
+    DirectiveRegistry,
+    read_body,
+    read_options,
+)
+from .doctests import doctest_registry
+from .extractor import extract_code, read_document
+from .includes import IncludeGraph
+from .scheduler import estimate_costs, run_scheduled
+from .sharding import shard_key
+from .sourcemap import SourceMap
+from .spans import SourceLines, TextBuffer
+
+log = structlog.get_logger()
+
+DEFAULT_ROOT_DOC = 'index'
+DEFAULT_SOURCE_SUFFIXES = ('.rst',)
+
+# Where conf.py is usually found, relative to the project root.
+_SOURCE_DIR_CANDIDATES = ('.', 'source', 'doc', 'docs', 'docs/source')
+
+_Result = TypeVar('_Result')
+
+_EXPLICIT_TITLE_RE = re.compile(r'^(.*?)\s*<([^<>]+)>$')
+_GLOB_CHARACTERS = frozenset('*?[')
+
+
+class ProjectError(ValueError):
+    """Error raised when a Sphinx project cannot be read."""
+
+
+@dataclasses.dataclass(frozen=True)
+class ProjectConfig:
+    """The parts of a Sphinx ``conf.py`` needed to find the documents."""
+
+    source_dir: Path
+    root_doc: str = DEFAULT_ROOT_DOC
+    source_suffixes: tuple[str, ...] = DEFAULT_SOURCE_SUFFIXES
+    exclude_patterns: tuple[str, ...] = ()
+
+
+def find_source_dir(path: str | os.PathLike[str]) -> Path:
+    """Find the Sphinx source directory (containing ``conf.py``) of ``path``.
+
+    ``path`` may be the ``conf.py`` file, the source directory, or a project
+    root with the sources in e.g. ``docs/`` or ``source/``.
+    """
+    path = Path(path)
+
+    if path.is_file() and path.name == 'conf.py':
+        return path.parent
+
+    for candidate in _SOURCE_DIR_CANDIDATES:
+        if (path / candidate / 'conf.py').is_file():
+            return (path / candidate).resolve()
+
+    raise ProjectError(f'No Sphinx conf.py found in {path}.')
+
+
+def read_config(source_dir: str | os.PathLike[str]) -> ProjectConfig:
+    """Read the project configuration from ``conf.py`` without executing it.
+
+    Only module-level assignments of literals are read. Anything computed is
+    ignored, and the Sphinx default is used instead.
+    """
+    source_dir = Path(source_dir)
+    conf = source_dir / 'conf.py'
+
+    try:
+        tree = ast.parse(conf.read_text(encoding='utf-8'), str(conf))
+
+    except (OSError, SyntaxError) as error:
+        raise ProjectError(f'Could not read {conf}: {error}') from error
+
+    values = {}
+    for node in tree.body:
+        if not (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+        ):
+            continue
+
+        try:
+            values[node.targets[0].id] = ast.literal_eval(node.value)
+
+        except ValueError:
+            continue
+
+    root_doc = values.get('root_doc', values.get('master_doc'))
+    suffixes = values.get('source_suffix', DEFAULT_SOURCE_SUFFIXES)
+
+    if isinstance(suffixes, str):
+        suffixes = (suffixes,)
+
+    elif isinstance(suffixes, dict):
+        # Suffixes of other parsers (e.g., markdown) are not reStructuredText;
+        # Sphinx reads a suffix without a file type as reStructuredText.
+        suffixes = [
+            suffix
+            for suffix, file_type in suffixes.items()
+            if file_type in (None, 'restructuredtext')
+        ]
+
+    return ProjectConfig(
+        source_dir=source_dir,
+        root_doc=root_doc if isinstance(root_doc, str) else DEFAULT_ROOT_DOC,
+        source_suffixes=tuple(suffixes),
+        exclude_patterns=tuple(values.get('exclude_patterns', ())),
+    )
+
+
+class _ToctreeEntries(SourceLines):
+    """Lines of a ``toctree`` body, and whether they are glob patterns."""
+
+    __slots__ = ('glob',)
+
+    glob: bool
+
+
+def _handle_toctree(
+    buffer: TextBuffer, directive: DirectiveMatch
+) -> tuple[_ToctreeEntries, int]:
+    """Collect the entries of a ``toctree`` directive."""
+    options, line = read_options(buffer, directive.line + 1, directive.indent)
+    span, next_line = read_body(buffer, line, directive.indent)
+    lines = buffer.lines(span)
+
+    entries = _ToctreeEntries(
+        [text.strip() for text in lines if text.strip()],
+        [n for n, text in zip(lines.line_numbers, lines) if text.strip()],
+        buffer.path,
+    )
+    entries.glob = 'glob' in options
+
+    return entries, next_line
+
+
+_TOCTREE_REGISTRY = DirectiveRegistry()
+_TOCTREE_REGISTRY.register('toctree', _handle_toctree)
+
+
+class SphinxProject:
+    """A Sphinx documentation project, read without running Sphinx."""
+
+    config: ProjectConfig
+
+    def __init__(self, path: str | os.PathLike[str]):
+        """Initialize the project from its root, source directory or conf.py.
+
+        Raises
+        ------
+        ProjectError
+            If no ``conf.py`` can be found or read.
+        """
+        self.config = read_config(find_source_dir(path))
+
+    @property
+    def source_dir(self) -> Path:
+        """The directory containing ``conf.py`` and the documents."""
+        return self.config.source_dir
+
+    def doc_path(self, docname: str) -> Path | None:
+        """Get the file of ``docname``, or None if it does not exist."""
+        for suffix in self.config.source_suffixes:
+            path = self.source_dir / f'{docname}{suffix}'
+
+            if path.is_file():
+                return path
+
+        return None
+
+    @functools.cached_property
+    def all_docnames(self) -> list[str]:
+        """All documents in the source directory, sorted by name."""
+        docnames = []
+
+        for suffix in self.config.source_suffixes:
+            for path in self.source_dir.rglob(f'*{suffix}'):
+                relative = path.relative_to(self.source_dir).as_posix()
+
+                if any(
+                    fnmatch.fnmatch(relative, pattern)
+                    for pattern in self.config.exclude_patterns
+                ):
+                    continue
+
+                docnames.append(relative[: -len(suffix)])
+
+        return sorted(docnames)
+
+    def _resolve(self, current: str, entry: str, glob: bool) -> list[str]:
+        """Resolve a toctree entry of ``current`` to docnames."""
+        if match := _EXPLICIT_TITLE_RE.match(entry):
+            entry = match.group(2)
+
+        if entry == 'self' or '://' in entry or entry.startswith('mailto:'):
+            return []
+
+        if entry.startswith('/'):
+            name = entry.lstrip('/')
+
+        else:
+            name = posixpath.join(posixpath.dirname(current), entry)
+
+        name = posixpath.normpath(name)
+
+        for suffix in self.config.source_suffixes:
+            if name.endswith(suffix):
+                name = name[: -len(suffix)]
+
+        if glob and _GLOB_CHARACTERS & set(name):
+            return [
+                docname
+                for docname in self.all_docnames
+                if fnmatch.fnmatchcase(docname, name) and docname != current
+            ]
+
+        return [name]
+
+    def toctree(self, docname: str) -> list[str]:
+        """Get the docnames in the toctrees of ``docname``, in order."""
+        path = self.doc_path(docname)
+
+        if path is None:
+            return []
+
+        buffer = TextBuffer(path.read_text(encoding='utf-8'), path)
+        children = []
+
+        for entries in _TOCTREE_REGISTRY.scan(buffer):
+            assert isinstance(entries, _ToctreeEntries)
+
+            for entry in entries:
+                children.extend(self._resolve(docname, entry, entries.glob))
+
+        return children
+
+    def docnames(self) -> list[str]:
+        """Get all documents reachable from the root, in reading order.
+
+        The toctree is followed depth-first, and each document is listed
+        the first time it is reached.
+        """
+        ordered: list[str] = []
+        seen = set()
+        pending = [self.config.root_doc]
+
+        while pending:
+            docname = pending.pop()
+
+            if docname in seen:
+                continue
+
+            seen.add(docname)
+
+            if self.doc_path(docname) is None:
+                log.warning('Document in toctree not found', docname=docname)
+                continue
+
+            ordered.append(docname)
+            pending.extend(reversed(self.toctree(docname)))
+
+        return ordered
+
+    def documents(self) -> list[Path]:
+        """Get the files of all documents, in reading order."""
+        paths = (self.doc_path(docname) for docname in self.docnames())
+
+        return [path for path in paths if path is not None]
+
+
+@functools.lru_cache(maxsize=2)
+def _worker_include_graph(doctest: bool) -> IncludeGraph:
+    """Get the include graph shared by the extractions of a worker process.
+
+    Only used in worker processes: elsewhere, the graph would outlive the
+    extraction, and be shared by the threads of the process.
+    """
+    return IncludeGraph(doctest_registry() if doctest else None)
+
+
+def _extract_document(
+    path: str | os.PathLike[str],
+    header_template: str,
+    doctest: bool,
+    keep_blocks: bool = False,
+) -> tuple[str, dict[str, object], list[Sequence[str]] | None]:
+    """Extract one document, in a worker process.
+
+    With ``keep_blocks``, the blocks of the document are also returned, to
+    be stored by the main process (see ``blockstore.detach_block``).
+    """
+    include_graph = _worker_include_graph(doctest)
+    _ = include_graph.invalidate()
+    blocks: list[Sequence[str]] | None = [] if keep_blocks else None
+
+    code, source_map = extract_code(
+        read_document(path),
+        path,
+        header_template=header_template,
+        include_graph=include_graph,
+        blocks=blocks,
+    )
+
+    if blocks is not None:
+        blocks = [detach_block(block) for block in blocks]
+
+    return code, source_map.to_dict(), blocks
+
+
+def _timed(
+    function: Callable[[str | os.PathLike[str]], _Result],
+    timings: dict[str, float] | None,
+) -> Callable[[str | os.PathLike[str]], _Result]:
+    """Wrap ``function`` to record its duration for each path in ``timings``."""
+    if timings is None:
+        return function
+
+    def _function(path: str | os.PathLike[str]) -> _Result:
+        start = time.perf_counter()
+
+        try:
+            return function(path)
+
+        finally:
+            timings[shard_key(path)] = time.perf_counter() - start
+
+    return _function
+
+
+def gil_disabled() -> bool:
+    """Check if this is a free-threaded Python running without the GIL."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+# Adds the blocks of a document to a block store, see ``_store_adder``.
+_AddDocument = Callable[[str | os.PathLike[str], list[Sequence[str]]], None]
+
+
+def _store_adder(store: BlockStore | None) -> _AddDocument | None:
+    """Get a function adding documents to ``store`` from any thread."""
+    if store is None:
+        return None
+
+    lock = threading.Lock()
+
+    def _add(
+        path: str | os.PathLike[str], blocks: list[Sequence[str]]
+    ) -> None:
+        with lock:
+            _ = store.add_document(path, blocks)
+
+    return _add
+
+
+def _graph_extractor(
+    header_template: str,
+    doctest: bool,
+    add_document: _AddDocument | None = None,
+) -> Callable[[str | os.PathLike[str]], tuple[str, SourceMap]]:
+    """Get a function extracting documents with an include graph of its own.
+
+    The included files are cached in the graph, for the documents extracted
+    with the function. If given, ``add_document`` is called with the blocks
+    of each document once extracted.
+    """
+    include_graph = IncludeGraph(doctest_registry() if doctest else None)
+
+    def _extract(path: str | os.PathLike[str]) -> tuple[str, SourceMap]:
+        blocks: list[Sequence[str]] | None = (
+            [] if add_document is not None else None
+        )
+        result = extract_code(
+            read_document(path),
+            path,
+            header_template=header_template,
+            include_graph=include_graph,
+            blocks=blocks,
+        )
+
+        if add_document is not None and blocks is not None:
+            add_document(path, blocks)
+
+        return result
+
+    return _extract
+
+
+def _extract_in_threads(
+    paths: Sequence[str | os.PathLike[str]],
+    costs: Sequence[float],
+    jobs: int | None,
+    header_template: str,
+    doctest: bool,
+    timings: dict[str, float] | None = None,
+    add_document: _AddDocument | None = None,
+) -> list[tuple[str, SourceMap]]:
+    """Extract documents in worker threads, each with its own include graph.
+
+    Include graphs are not thread-safe, so each thread caches the files it
+    includes separately.
+    """
+    local = threading.local()
+
+    def _extract(path: str | os.PathLike[str]) -> tuple[str, SourceMap]:
+        extract = getattr(local, 'extract', None)
+
+        if extract is None:
+            extract = _graph_extractor(header_template, doctest, add_document)
+            local.extract = extract
+
+        return extract(path)
+
+    return run_scheduled(paths, _timed(_extract, timings), costs, workers=jobs)
+
+
+def extract_documents(
+    paths: Sequence[str | os.PathLike[str]],
+    *,
+    jobs: int | None = None,
+    header_template: str = DEFAULT_HEADER_TEMPLATE,
+    doctest: bool = False,
+    pool: Literal['process', 'thread'] | None = None,
+    runtimes: Mapping[str, float] | None = None,
+    timings: dict[str, float] | None = None,
+    store: BlockStore | None = None,
+) -> list[tuple[str, SourceMap]]:
+    """Extract many documents in parallel worker processes or threads.
+
+    Arguments
+    ---------
+    paths : Sequence[str | os.PathLike[str]]
+        The documents to extract.
+
+    jobs : int | None
+        The number of workers. Defaults to the number of CPUs. With a single
+        job (or document), extraction runs in this thread.
+
+    header_template : str
+        Template for the header line written before each block.
+
+    doctest : bool
+        Whether to also extract doctest (``>>>``) examples.
+
+    pool : Literal['process', 'thread'] | None
+        Extract in worker processes, or in threads. Threads only run in
+        parallel without the GIL, so the default is threads on free-threaded
+        builds of Python, and processes otherwise.
+
+    runtimes : Mapping[str, float] | None
+        The runtimes of documents in an earlier run, by
+        ``sharding.shard_key``, to start the slowest documents first. The
+        cost of other documents is estimated from their size.
+
+    timings : dict[str, float] | None
+        If given, the time spent extracting each document is stored in it,
+        by ``sharding.shard_key``.
+
+    store : BlockStore | None
+        If given, the blocks of each document are added to it as soon as
+        the document is extracted, so each distinct block is kept once.
+
+    Returns
+    -------
+    list[tuple[str, SourceMap]]
+        The extracted code and source map of each document, in the same
+        order as ``paths``.
+    """
+    add_document = _store_adder(store)
+
+    if jobs == 1 or len(paths) <= 1:
+        extract = _timed(
+            _graph_extractor(header_template, doctest, add_document), timings
+        )
+        return [extract(path) for path in paths]
+
+    if pool is None:
+        pool = 'thread' if gil_disabled() else 'process'
+
+    costs = estimate_costs(paths, runtimes)
+
+    if pool == 'thread':
+        log.debug('Extracting in threads', document_count=len(paths))
+        return _extract_in_threads(
+            paths,
+            costs,
+            jobs,
+            header_template,
+            doctest,
+            timings,
+            add_document,
+        )
+
+    jobs = jobs or os.cpu_count() or 1
+
+    # Each scheduler thread keeps one worker process busy.
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+
+        def _extract(
+            path: str | os.PathLike[str],
+        ) -> tuple[str, dict[str, object]]:
+            code, data, blocks = executor.submit(
+                _extract_document,
+                path,
+                header_template,
+                doctest,
+                add_document is not None,
+            ).result()
+
+            if add_document is not None and blocks is not None:
+                add_document(path, blocks)
+
+            return code, data
+
+        results = run_scheduled(
+            paths, _timed(_extract, timings), costs, workers=jobs
+        )
+
+    return [(code, SourceMap.from_dict(data)) for code, data in results]
+
+
+def split_output_path(
+    document: str | os.PathLike[str],
+    source_dir: str | os.PathLike[str],
+    output_dir: str | os.PathLike[str],
+) -> Path:
+    """Get the script path of ``document`` in ``output_dir``.
+
+    The directory structure of the sources is kept.
+    """
+    relative = Path(document).resolve().relative_to(Path(source_dir).resolve())
+
+    return Path(output_dir) / relative.with_suffix('.py')
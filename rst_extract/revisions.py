@@ -0,0 +1,263 @@
+"""Extract documents at git revisions, without checking them out.
+
+Documents and the files they include are read straight from the object
+store, through one ``git cat-file --batch`` process for all revisions.
+Unchanged files keep their blob id across revisions, so a document is only
+extracted again if its blob, or the blob of a file it includes, changed.
+
+Source maps point at the paths of the documents in the work tree.
+"""
+
+import os
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import NamedTuple
+
+import structlog
+
+from .assembler import DEFAULT_HEADER_TEMPLATE, assemble
+from .doctests import doctest_registry
+from .extractor import ExtractionError
+from .git import DOCUMENT_SUFFIXES, BlobReader, repository_root, tree_files
+from .includes import IncludeCycleError, IncludeGraph
+from .sourcemap import SourceMap
+from .spans import TextBuffer
+
+log = structlog.get_logger()
+
+
+class RevisionPath(NamedTuple):
+    """A document at a revision, shown as ``rev:path``.
+
+    Attributes
+    ----------
+    rev : str
+        The revision, e.g. a tag or commit id.
+
+    path : str
+        The path of the document from the repository root, with ``/``
+        separators.
+    """
+
+    rev: str
+    path: str
+
+    def __str__(self) -> str:
+        """Get the ``rev:path`` form, as used by git."""
+        return f'{self.rev}:{self.path}'
+
+
+class _Extracted(NamedTuple):
+    """A cached extraction, and the blobs of the files it included."""
+
+    code: str
+    source_map: SourceMap
+    includes: dict[str, str | None]
+
+
+class RevisionExtractor:
+    """Extract documents at any number of revisions of a repository.
+
+    Extractions are cached by blob id for the lifetime of the extractor, so
+    extracting many revisions only processes what changed between them.
+    """
+
+    root: Path
+    header_template: str
+    suffixes: tuple[str, ...]
+
+    def __init__(
+        self,
+        cwd: str | os.PathLike[str] | None = None,
+        *,
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+        doctest: bool = False,
+        suffixes: Iterable[str] = DOCUMENT_SUFFIXES,
+    ):
+        """Initialize the extractor for the repository containing ``cwd``.
+
+        Raises
+        ------
+        GitError
+            If ``cwd`` is not in a git repository.
+        """
+        self.root = repository_root(cwd)
+        self.header_template = header_template
+        self.suffixes = tuple(suffixes)
+        self._doctest = doctest
+        self._blobs = BlobReader(self.root)
+        self._cache: dict[tuple[str, str], _Extracted] = {}
+
+    def relative(self, path: str | os.PathLike[str]) -> str:
+        """Get the path from the repository root, as used in trees.
+
+        Raises
+        ------
+        ValueError
+            If ``path`` is not in the repository.
+        """
+        return Path(path).resolve().relative_to(self.root).as_posix()
+
+    def _read(
+        self, files: dict[str, str], path: str | os.PathLike[str]
+    ) -> TextBuffer | None:
+        """Read the file at ``path`` (under the root) from a tree."""
+        try:
+            oid = files.get(self.relative(path))
+
+        except ValueError:
+            oid = None
+
+        data = self._blobs.read(oid) if oid is not None else None
+
+        if data is None:
+            log.warning('File not found at revision', filename=str(path))
+            return None
+
+        return TextBuffer(data.decode('utf-8'), self.root / path)
+
+    def _includes(self, graph: IncludeGraph, path: Path) -> set[Path]:
+        """Get every file ``path`` includes, directly or indirectly."""
+        found: set[Path] = set()
+        pending = [path]
+
+        while pending:
+            for included in graph.includes(pending.pop()):
+                if included not in found:
+                    found.add(included)
+                    pending.append(included)
+
+        return found
+
+    def extract(
+        self, rev: str, paths: Sequence[str] | None = None
+    ) -> dict[RevisionPath, tuple[str, SourceMap]]:
+        """Extract the documents at ``rev``.
+
+        Arguments
+        ---------
+        rev : str
+            The revision to read the documents from.
+
+        paths : Sequence[str] | None
+            The documents to extract, from the repository root. Defaults to
+            all documents with one of the ``suffixes``.
+
+        Returns
+        -------
+        dict[RevisionPath, tuple[str, SourceMap]]
+            The code and source map of each document, sorted by path.
+
+        Raises
+        ------
+        GitError
+            If ``rev`` does not exist.
+
+        ExtractionError
+            If documents include each other in a cycle.
+        """
+        files, graph = self._tree(rev)
+
+        results = {}
+        for path, oid in self._documents(rev, files, paths):
+            cached = self._cache.get((path, oid))
+
+            if cached is None or any(
+                files.get(included) != included_oid
+                for included, included_oid in cached.includes.items()
+            ):
+                cached = self._extract(graph, files, path, oid)
+
+            else:
+                log.debug('Blob already extracted', rev=rev, filename=path)
+
+            results[RevisionPath(rev, path)] = cached.code, cached.source_map
+
+        return results
+
+    def blocks(
+        self, rev: str, paths: Sequence[str] | None = None
+    ) -> dict[RevisionPath, list[Sequence[str]]]:
+        """Get the blocks of the documents at ``rev``, without assembling them.
+
+        See ``extract`` for the arguments. Blocks are not cached.
+        """
+        files, graph = self._tree(rev)
+
+        return {
+            RevisionPath(rev, path): self._scan(graph, path, oid)
+            for path, oid in self._documents(rev, files, paths)
+        }
+
+    def _tree(self, rev: str) -> tuple[dict[str, str], IncludeGraph]:
+        """Get the files at ``rev``, and an include graph reading them."""
+        files = tree_files(rev, self.root)
+        registry = doctest_registry() if self._doctest else None
+        graph = IncludeGraph(registry, lambda _, path: self._read(files, path))
+
+        return files, graph
+
+    def _documents(
+        self, rev: str, files: dict[str, str], paths: Sequence[str] | None
+    ) -> Iterator[tuple[str, str]]:
+        """Get the path and blob id of the documents to extract, sorted."""
+        if paths is None:
+            paths = [path for path in files if path.endswith(self.suffixes)]
+
+        for path in sorted(paths):
+            oid = files.get(path)
+
+            if oid is None:
+                log.warning('Document not found', rev=rev, filename=path)
+                continue
+
+            yield path, oid
+
+    def _scan(
+        self, graph: IncludeGraph, path: str, oid: str
+    ) -> list[Sequence[str]]:
+        """Scan the document ``path`` (with blob ``oid``)."""
+        data = self._blobs.read(oid)
+        assert data is not None
+        buffer = TextBuffer(data.decode('utf-8'), self.root / path)
+
+        try:
+            return graph.scan(buffer)
+
+        except IncludeCycleError as error:
+            raise ExtractionError(str(error)) from error
+
+    def _extract(
+        self, graph: IncludeGraph, files: dict[str, str], path: str, oid: str
+    ) -> _Extracted:
+        """Extract the document ``path`` (with blob ``oid``) and cache it."""
+        blocks = self._scan(graph, path, oid)
+        source_map = SourceMap()
+        code = assemble(blocks, self.header_template, source_map)
+
+        includes = {}
+        for included in self._includes(graph, self.root / path):
+            try:
+                relative = self.relative(included)
+
+            except ValueError:
+                continue
+
+            includes[relative] = files.get(relative)
+
+        extracted = _Extracted(code, source_map, includes)
+        self._cache[path, oid] = extracted
+
+        return extracted
+
+    def close(self) -> None:
+        """Stop the git process reading the blobs."""
+        self._blobs.close()
+
+    def __enter__(self) -> 'RevisionExtractor':
+        """Use the extractor as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Stop the git process reading the blobs."""
+        self.close()
@@ -0,0 +1,282 @@
+"""Longest-job-first scheduling of batch runs, with work stealing.
+
+A pool taking jobs in input order can be left waiting for one large file
+scheduled last. ``run_scheduled`` instead estimates the cost of each job,
+deals the jobs out to the workers largest first, balancing their expected
+load, and lets a worker that ran out of jobs take the largest job still
+queued on the busiest worker, so a bad estimate does not leave it idle.
+
+Costs are estimated from the size of each file and the number of blocks in
+it, or from the runtimes of an earlier run when known (see
+``estimate_costs``). ``run_until`` stops starting jobs once one gives a
+result it should stop on, e.g., a failure. With ``ordered``, the order of
+the jobs is a priority (e.g., the failures of the last run first), and
+workers start them in that order instead.
+"""
+
+import os
+import re
+import threading
+from collections import deque
+from collections.abc import Callable, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypeVar
+
+import structlog
+
+from .sharding import shard_key
+
+log = structlog.get_logger()
+
+# The cost of a block, in bytes of text: each block is compiled and run.
+BLOCK_COST = 4096
+
+# Lines starting a directive, or a doctest example.
+_BLOCK_RE = re.compile(rb'^[ \t]*(?:\.\.[ \t]+[\w:-]+::|>>>)', re.MULTILINE)
+
+_Item = TypeVar('_Item')
+_Result = TypeVar('_Result')
+
+
+def count_blocks(data: bytes) -> int:
+    """Count the directives and doctest examples in ``data``, roughly."""
+    return len(_BLOCK_RE.findall(data))
+
+
+def static_cost(path: str | os.PathLike[str]) -> float:
+    """Estimate the cost of a file from its size and number of blocks.
+
+    Unreadable files cost nothing: they fail straight away.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+    except OSError:
+        return 0.0
+
+    return float(len(data) + BLOCK_COST * count_blocks(data))
+
+
+def estimate_costs(
+    paths: Sequence[str | os.PathLike[str]],
+    runtimes: Mapping[str, float] | None = None,
+) -> list[float]:
+    """Estimate the cost of each of ``paths``.
+
+    Arguments
+    ---------
+    paths : Sequence[str | os.PathLike[str]]
+        The files to estimate.
+
+    runtimes : Mapping[str, float] | None
+        The runtimes of files in an earlier run, by ``shard_key``. Files
+        with a runtime cost their runtime; the static cost of the others
+        (see ``static_cost``) is scaled to the runtimes of the files with
+        one.
+
+    Returns
+    -------
+    list[float]
+        The cost of each file, in seconds if any runtime is known.
+    """
+    static = [static_cost(path) for path in paths]
+
+    if not runtimes:
+        return static
+
+    keys = [shard_key(path) for path in paths]
+    known = [(runtimes[k], s) for k, s in zip(keys, static) if k in runtimes]
+
+    if not known:
+        return static
+
+    known_runtime = sum(runtime for runtime, _ in known)
+    known_static = sum(cost for _, cost in known)
+
+    if known_static > 0:
+        return [
+            runtimes.get(key, cost * known_runtime / known_static)
+            for key, cost in zip(keys, static)
+        ]
+
+    return [runtimes.get(key, known_runtime / len(known)) for key in keys]
+
+
+class _WorkQueues:
+    """The queue of items of each worker, for ``run_scheduled``."""
+
+    queues: list[deque[int]]
+    loads: list[float]
+    costs: Sequence[float]
+    ordered: bool
+    stolen: int
+    stopped: threading.Event
+    _lock: threading.Lock
+
+    def __init__(
+        self, costs: Sequence[float], workers: int, ordered: bool = False
+    ):
+        """Deal the items out, largest first, to the least loaded worker.
+
+        With ``ordered``, the items stay in order, in the queue of the first
+        worker, which the other workers take from.
+        """
+        self.queues = [deque() for _ in range(workers)]
+        self.loads = [0.0] * workers
+        self.costs = costs
+        self.ordered = ordered
+        self.stolen = 0
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+
+        if ordered:
+            self.queues[0].extend(range(len(costs)))
+            self.loads[0] = sum(costs)
+            return
+
+        for index in sorted(range(len(costs)), key=lambda i: -costs[i]):
+            worker = min(range(workers), key=lambda w: (self.loads[w], w))
+            self.queues[worker].append(index)
+            self.loads[worker] += costs[index]
+
+    def take(self, worker: int) -> int | None:
+        """Take the next item of ``worker``, stealing one if it has none.
+
+        Returns None once all items are taken, or the run was stopped.
+        """
+        with self._lock:
+            if self.stopped.is_set():
+                return None
+
+            victim = worker
+
+            if not self.queues[worker]:
+                busy = [w for w, queue in enumerate(self.queues) if queue]
+
+                if not busy:
+                    return None
+
+                victim = max(busy, key=lambda w: self.loads[w])
+                self.stolen += not self.ordered
+
+            index = self.queues[victim].popleft()
+            self.loads[victim] -= self.costs[index]
+
+            return index
+
+
+def run_scheduled(
+    items: Sequence[_Item],
+    function: Callable[[_Item], _Result],
+    costs: Sequence[float],
+    *,
+    workers: int | None = None,
+    ordered: bool = False,
+) -> list[_Result]:
+    """Call ``function`` on every item in worker threads, largest first.
+
+    The items are dealt out largest first, each to the worker with the
+    lowest total cost so far. Each worker runs its items largest first;
+    once done, it takes the largest item queued on the worker with the
+    highest remaining cost.
+
+    Threads suit ``function`` waiting on a process (or running without the
+    GIL); to run in a process pool, submit to it and wait for the result.
+
+    Arguments
+    ---------
+    items : Sequence
+        The jobs.
+
+    function : Callable
+        Called on each item.
+
+    costs : Sequence[float]
+        The estimated cost of each item, e.g., from ``estimate_costs``.
+
+    workers : int | None
+        The number of worker threads. Defaults to the number of CPUs.
+
+    ordered : bool
+        Whether the order of ``items`` is a priority: the items are started
+        in order, whatever their cost.
+
+    Returns
+    -------
+    list
+        The result of each item, in the order of ``items``.
+
+    Raises
+    ------
+    Exception
+        The first exception raised by ``function``; no new item is started
+        once one was raised.
+    """
+    results = run_until(
+        items, function, costs, workers=workers, ordered=ordered
+    )
+
+    return [results[index] for index in range(len(items))]
+
+
+def run_until(
+    items: Sequence[_Item],
+    function: Callable[[_Item], _Result],
+    costs: Sequence[float],
+    *,
+    stop: Callable[[_Result], bool] | None = None,
+    workers: int | None = None,
+    ordered: bool = False,
+) -> dict[int, _Result]:
+    """Call ``function`` on the items, like ``run_scheduled``, until ``stop``.
+
+    Once ``stop`` is true of a result, no new item is started; the items
+    already started are run to the end.
+
+    Returns
+    -------
+    dict[int, Result]
+        The result of each item run, by its index in ``items``.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(items))
+    results: dict[int, _Result] = {}
+
+    if workers <= 1:
+        for index, item in enumerate(items):
+            results[index] = function(item)
+
+            if stop is not None and stop(results[index]):
+                break
+
+        return results
+
+    queues = _WorkQueues(costs, workers, ordered)
+
+    def _work(worker: int) -> None:
+        while (index := queues.take(worker)) is not None:
+            try:
+                results[index] = function(items[index])
+
+            except BaseException:
+                queues.stopped.set()
+                raise
+
+            if stop is not None and stop(results[index]):
+                queues.stopped.set()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_work, worker) for worker in range(workers)]
+
+        for future in futures:
+            future.result()
+
+    log.debug(
+        'Scheduled run done',
+        item_count=len(items),
+        run_count=len(results),
+        worker_count=workers,
+        stolen=queues.stolen,
+    )
+
+    return results
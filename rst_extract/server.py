@@ -0,0 +1,562 @@
+"""Long-lived extraction daemon, speaking JSON-RPC 2.0.
+
+``rst-extract serve`` starts an ``ExtractionService`` and serves it over a
+Unix domain socket (or stdin/stdout). Requests and responses are JSON
+objects, one per line. The service keeps its include graphs and extraction
+results in memory between requests; they are only dropped when the files
+they were read from change on disk.
+
+Methods
+-------
+``extract(path, header_template=..., doctest=False, source_map=False)``
+    Returns ``{'code': ...}``, with ``'source_map'`` if requested.
+
+``validate(path, header_template=..., doctest=False)``
+    Returns ``{'valid': ..., 'error': ..., 'filename': ..., 'line': ...}``;
+    the location of a syntax error is a reStructuredText line.
+
+``execute(path, header_template=..., doctest=False)``
+    Returns ``{'returncode': ..., 'stdout': ..., 'stderr': ...}``. Code runs
+    in a warm interpreter of the python binary the daemon was started with,
+    so a request does not pay for starting python.
+
+``ping()`` and ``shutdown()``
+    Check that the daemon is up, and stop it.
+"""
+
+import contextlib
+import inspect
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import typing
+from pathlib import Path
+
+import structlog
+
+from .assembler import DEFAULT_HEADER_TEMPLATE
+from .backends import WarmInterpreter
+from .doctests import doctest_registry
+from .extractor import ExtractionError, Extractor
+from .includes import IncludeGraph
+from .sourcemap import SourceMap
+from .validator import validate_extracted
+
+log = structlog.get_logger()
+
+JSONRPC_VERSION = '2.0'
+
+# Error codes defined by JSON-RPC 2.0.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# Errors raised while extracting, e.g. for a missing or empty file.
+EXTRACTION_ERROR = -32000
+
+
+class RPCError(Exception):
+    """Error returned to the client as a JSON-RPC error object."""
+
+    code: int
+
+    def __init__(self, code: int, message: str):
+        """Initialize the RPCError."""
+        super().__init__(message)
+        self.code = code
+
+
+class SocketInUseError(RuntimeError):
+    """Raised when the socket path is used by a daemon, or another file."""
+
+
+class ExtractionService:
+    """The methods of the daemon, and the caches they keep warm.
+
+    Every request first drops the cached results of files modified since
+    they were read (see ``IncludeGraph.invalidate``), so results are always
+    those of the files on disk. ``execute`` reuses a pool of warm
+    interpreters (see ``backends.WarmInterpreter``), stopped by ``close``.
+
+    Attributes
+    ----------
+    python_bin : str | os.PathLike[str]
+        The python binary ``execute`` runs code with. Clients cannot choose
+        another one.
+    """
+
+    python_bin: str | os.PathLike[str]
+    _graphs: dict[bool, IncludeGraph]
+    _results: dict[tuple[Path, str, bool], tuple[str, SourceMap]]
+    _lock: threading.Lock
+    _interpreter_count: int
+    _interpreters: 'queue.SimpleQueue[WarmInterpreter | None]'
+    _started: list[WarmInterpreter]
+    _closed: bool
+    shutdown_requested: threading.Event
+
+    def __init__(
+        self,
+        python_bin: str | os.PathLike[str] = sys.executable,
+        interpreters: int = 1,
+    ):
+        """Initialize the service with empty caches.
+
+        Arguments
+        ---------
+        python_bin : str | os.PathLike[str]
+            The python binary ``execute`` runs code with.
+
+        interpreters : int
+            The number of warm interpreters, i.e., of ``execute`` requests
+            run at once.
+        """
+        if interpreters < 1:
+            raise ValueError('The service needs at least one interpreter.')
+
+        self.python_bin = python_bin
+        self._graphs = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self._interpreter_count = interpreters
+        self._interpreters = queue.SimpleQueue()
+        self._started = []
+        self._closed = False
+        self.shutdown_requested = threading.Event()
+
+    def _graph(self, doctest: bool) -> IncludeGraph:
+        """Get the include graph for the given directives."""
+        if doctest not in self._graphs:
+            self._graphs[doctest] = IncludeGraph(
+                doctest_registry() if doctest else None
+            )
+
+        return self._graphs[doctest]
+
+    def _extract(
+        self, path: str, header_template: str, doctest: bool
+    ) -> tuple[str, SourceMap]:
+        """Extract ``path``, reusing the cached result if still valid."""
+        key = (Path(path).resolve(), header_template, doctest)
+
+        with self._lock:
+            graph = self._graph(doctest)
+            stale = graph.invalidate()
+
+            for cached in [k for k in self._results if k[0] in stale]:
+                del self._results[cached]
+
+            if key in self._results:
+                log.debug('Extraction cache hit', filename=path)
+                return self._results[key]
+
+            extractor = Extractor(
+                path, header_template=header_template, include_graph=graph
+            )
+
+            try:
+                code = extractor.extract()
+
+            except (ExtractionError, OSError, ValueError) as error:
+                raise RPCError(EXTRACTION_ERROR, str(error)) from error
+
+            self._results[key] = code, extractor.source_map
+
+            return code, extractor.source_map
+
+    def extract(
+        self,
+        path: str,
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+        doctest: bool = False,
+        source_map: bool = False,
+    ) -> dict[str, typing.Any]:
+        """Extract the code of ``path``."""
+        code, code_map = self._extract(path, header_template, doctest)
+        result: dict[str, typing.Any] = {'code': code}
+
+        if source_map:
+            result['source_map'] = code_map.to_dict()
+
+        return result
+
+    def validate(
+        self,
+        path: str,
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+        doctest: bool = False,
+    ) -> dict[str, typing.Any]:
+        """Check that the code of ``path`` is valid python."""
+        code, code_map = self._extract(path, header_template, doctest)
+
+        return validate_extracted(code, code_map)._asdict()
+
+    def _interpreter(self) -> WarmInterpreter:
+        """Take an idle warm interpreter, starting one if there is room.
+
+        Raises
+        ------
+        RPCError
+            If the service is closed, also while waiting for an
+            interpreter.
+        """
+        if self._closed:
+            raise RPCError(INTERNAL_ERROR, 'The daemon is shutting down.')
+
+        try:
+            interpreter = self._interpreters.get_nowait()
+
+        except queue.Empty:
+            with self._lock:
+                if len(self._started) < self._interpreter_count:
+                    interpreter = WarmInterpreter(self.python_bin)
+                    self._started.append(interpreter)
+
+                    return interpreter
+
+            interpreter = self._interpreters.get()
+
+        if interpreter is None:
+            # Put back by each waiting thread, so they all wake up.
+            self._interpreters.put(None)
+            raise RPCError(INTERNAL_ERROR, 'The daemon is shutting down.')
+
+        return interpreter
+
+    def execute(
+        self,
+        path: str,
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+        doctest: bool = False,
+    ) -> dict[str, typing.Any]:
+        """Run the code of ``path`` in a warm interpreter.
+
+        Tracebacks in the output point at the lines of the reStructuredText
+        files.
+        """
+        code, code_map = self._extract(path, header_template, doctest)
+        interpreter = self._interpreter()
+
+        try:
+            result = interpreter.run(code)
+
+        finally:
+            self._interpreters.put(interpreter)
+
+        if result.stderr:
+            result.stderr = code_map.rewrite_traceback(result.stderr)
+
+        return {
+            'returncode': result.returncode,
+            'stdout': result.stdout,
+            'stderr': result.stderr,
+        }
+
+    def ping(self) -> str:
+        """Check that the daemon is running."""
+        return 'pong'
+
+    def shutdown(self) -> str:
+        """Stop the daemon once the current requests are answered."""
+        self.shutdown_requested.set()
+
+        return 'shutting down'
+
+    def close(self) -> None:
+        """Stop the warm interpreters. Closing twice does nothing."""
+        with self._lock:
+            if self._closed:
+                return
+
+            self._closed = True
+            started, self._started = self._started, []
+
+        # Wakes up the threads waiting for an interpreter.
+        self._interpreters.put(None)
+
+        for interpreter in started:
+            interpreter.close()
+
+    def __enter__(self) -> 'ExtractionService':
+        """Use the service as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Stop the warm interpreters."""
+        self.close()
+
+    METHODS: typing.ClassVar[tuple[str, ...]] = (
+        'extract',
+        'validate',
+        'execute',
+        'ping',
+        'shutdown',
+    )
+
+    def call(self, method: str, params: typing.Any) -> typing.Any:
+        """Call ``method`` with JSON-RPC ``params`` (an object or array).
+
+        Raises
+        ------
+        RPCError
+            If the method does not exist, the parameters do not fit it, or
+            extraction fails.
+        """
+        if method not in self.METHODS:
+            raise RPCError(METHOD_NOT_FOUND, f'Method not found: {method}')
+
+        function = getattr(self, method)
+        args, kwargs = (
+            ((), params) if isinstance(params, dict) else (params, {})
+        )
+
+        try:
+            bound = inspect.signature(function).bind(*args, **kwargs)
+
+        except TypeError as error:
+            raise RPCError(INVALID_PARAMS, str(error)) from error
+
+        _check_param_types(function, bound.arguments)
+
+        return function(*args, **kwargs)
+
+    def handle(self, request: typing.Any) -> dict[str, typing.Any] | None:
+        """Handle one decoded request, returning its response.
+
+        Notifications (requests without an ``id``) get no response.
+        """
+        if not (
+            isinstance(request, dict)
+            and request.get('jsonrpc') == JSONRPC_VERSION
+            and isinstance(request.get('method'), str)
+            and isinstance(request.get('params', []), (list, dict))
+        ):
+            return _error(None, INVALID_REQUEST, 'Invalid request')
+
+        request_id = request.get('id')
+
+        try:
+            result = self.call(request['method'], request.get('params', []))
+
+        except RPCError as error:
+            log.info(
+                'Request failed', method=request['method'], error=str(error)
+            )
+            response = _error(request_id, error.code, str(error))
+
+        except Exception:
+            # A failing request must not take the daemon down.
+            log.exception('Request crashed', method=request['method'])
+            response = _error(request_id, INTERNAL_ERROR, 'Internal error')
+
+        else:
+            response = {
+                'jsonrpc': JSONRPC_VERSION,
+                'id': request_id,
+                'result': result,
+            }
+
+        return response if 'id' in request else None
+
+    def handle_line(self, line: str | bytes) -> str | None:
+        """Handle one line of JSON (a request or a batch of requests)."""
+        try:
+            request = json.loads(line)
+
+        except ValueError:
+            return json.dumps(_error(None, PARSE_ERROR, 'Parse error'))
+
+        if isinstance(request, list):
+            if not request:
+                return json.dumps(_error(None, INVALID_REQUEST, 'Empty batch'))
+
+            responses = [self.handle(item) for item in request]
+            responses = [response for response in responses if response]
+
+            return json.dumps(responses) if responses else None
+
+        response = self.handle(request)
+
+        return json.dumps(response) if response is not None else None
+
+
+def _check_param_types(
+    function: typing.Callable[..., typing.Any],
+    arguments: dict[str, typing.Any],
+) -> None:
+    """Check ``arguments`` against the annotations of ``function``.
+
+    Raises
+    ------
+    RPCError
+        If an argument has the wrong type.
+    """
+    hints = typing.get_type_hints(function)
+
+    for name, value in arguments.items():
+        expected = typing.get_args(hints[name]) or (hints[name],)
+
+        if not isinstance(value, expected):
+            names = ' or '.join(
+                'null' if t is type(None) else t.__name__ for t in expected
+            )
+            raise RPCError(INVALID_PARAMS, f'{name} must be {names}.')
+
+
+def _error(
+    request_id: typing.Any, code: int, message: str
+) -> dict[str, typing.Any]:
+    """Build a JSON-RPC error response."""
+    return {
+        'jsonrpc': JSONRPC_VERSION,
+        'id': request_id,
+        'error': {'code': code, 'message': message},
+    }
+
+
+def serve_stdio(
+    service: ExtractionService,
+    stdin: typing.TextIO | None = None,
+    stdout: typing.TextIO | None = None,
+) -> None:
+    """Serve requests read from ``stdin``, one per line, until EOF.
+
+    While serving, ``sys.stdout`` is redirected to stderr, so that nothing
+    but responses is written to ``stdout``.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+
+    with contextlib.redirect_stdout(sys.stderr):
+        for line in stdin:
+            if not line.strip():
+                continue
+
+            response = service.handle_line(line)
+
+            if response is not None:
+                stdout.write(response + '\n')
+                stdout.flush()
+
+            if service.shutdown_requested.is_set():
+                break
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Serve the requests of one client connection."""
+
+    server: '_UnixServer'
+
+    def handle(self) -> None:
+        """Answer requests until the client disconnects."""
+        service = self.server.service
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            response = service.handle_line(line)
+
+            if response is not None:
+                self.wfile.write(response.encode('utf-8') + b'\n')
+                self.wfile.flush()
+
+            if service.shutdown_requested.is_set():
+                # shutdown() waits for serve_forever(), so not on its thread.
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    """Threaded Unix socket server holding the service."""
+
+    daemon_threads = True
+    service: ExtractionService
+
+    def __init__(self, path: str, service: ExtractionService):
+        """Bind the server to ``path``."""
+        self.service = service
+        super().__init__(path, _RequestHandler)
+
+
+def _check_socket_path(path: str) -> None:
+    """Remove a stale socket file at ``path``.
+
+    Raises
+    ------
+    SocketInUseError
+        If a daemon accepts connections on the socket, or ``path`` is not a
+        socket.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(mode):
+        raise SocketInUseError(f'{path} exists and is not a socket.')
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        probe.settimeout(1)
+
+        try:
+            probe.connect(path)
+
+        except OSError:
+            log.info('Removing stale socket', socket=path)
+            os.unlink(path)
+            return
+
+    raise SocketInUseError(f'A daemon is already serving on {path}.')
+
+
+def serve_socket(
+    service: ExtractionService,
+    path: str | os.PathLike[str],
+    ready: threading.Event | None = None,
+) -> None:
+    """Serve requests on the Unix domain socket at ``path``.
+
+    A stale socket file at ``path`` is replaced, and the socket file is
+    removed when the server stops. Only the user can connect: the socket is
+    created without permissions for anyone else. ``ready`` is set once the
+    server accepts connections.
+
+    Raises
+    ------
+    SocketInUseError
+        If a daemon already serves on ``path``, or it is not a socket.
+    """
+    path = os.fspath(path)
+    _check_socket_path(path)
+
+    # Bound under this umask, the socket is never open to others.
+    umask = os.umask(0o177)
+
+    try:
+        server = _UnixServer(path, service)
+
+    finally:
+        _ = os.umask(umask)
+
+    with server:
+        log.info('Serving', socket=path)
+
+        if ready is not None:
+            ready.set()
+
+        try:
+            server.serve_forever()
+
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+            log.info('Stopped serving', socket=path)
@@ -0,0 +1,419 @@
+"""Extraction sessions, for programs extracting many times.
+
+``api.extract`` configures logging, builds an include graph and starts an
+interpreter on every call. An ``ExtractionSession`` does each of these
+once: it configures logging when created, keeps the extracted code of each
+document until the document (or a file it includes) changes, extracts many
+documents in a process pool it keeps, and runs code in warm interpreters
+(see ``backends.WarmInterpreter``).
+
+    with ExtractionSession(doctest=True) as session:
+        code = session.extract('index.rst').code
+        result = session.execute('index.rst')
+
+Sessions can be used from several threads at once.
+"""
+
+import functools
+import os
+import queue
+import subprocess
+import sys
+import threading
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, NamedTuple, cast
+
+import structlog
+
+from .assembler import DEFAULT_HEADER_TEMPLATE
+from .backends import WarmInterpreter
+from .doctests import doctest_registry
+from .execution import run_code
+from .extractor import extract_code, read_document
+from .includes import IncludeGraph
+from .logs import configure_logging
+from .scheduler import estimate_costs
+from .sourcemap import SourceMap
+from .validator import Validation, validate_extracted
+
+log = structlog.get_logger()
+
+# The modification time of each file a result was extracted from.
+_Dependencies = dict[str, int | None]
+
+
+class SessionClosedError(RuntimeError):
+    """Raised when a closed session is used."""
+
+
+class Extraction(NamedTuple):
+    """The extracted code of a document, and its source map."""
+
+    code: str
+    source_map: SourceMap
+
+
+def _mtime(path: str) -> int | None:
+    """Get the modification time of ``path``, or None if it is missing."""
+    try:
+        return os.stat(path).st_mtime_ns
+
+    except OSError:
+        return None
+
+
+def _dependencies(
+    include_graph: IncludeGraph, path: str | os.PathLike[str]
+) -> _Dependencies:
+    """Get ``path`` and the files it (indirectly) includes, with mtimes."""
+    found = {Path(path).resolve()}
+    pending = list(found)
+
+    while pending:
+        for included in include_graph.includes(pending.pop()):
+            if included not in found:
+                found.add(included)
+                pending.append(included)
+
+    return {os.fspath(file): _mtime(os.fspath(file)) for file in found}
+
+
+@functools.lru_cache(maxsize=2)
+def _worker_include_graph(doctest: bool) -> IncludeGraph:
+    """Get the include graph shared by the extractions of a worker."""
+    return IncludeGraph(doctest_registry() if doctest else None)
+
+
+def _extract_in_worker(
+    path: str, header_template: str, doctest: bool
+) -> tuple[str, dict[str, Any], _Dependencies]:
+    """Extract one document in a worker process of the pool."""
+    include_graph = _worker_include_graph(doctest)
+    _ = include_graph.invalidate()
+    code, source_map = extract_code(
+        read_document(path),
+        path,
+        header_template=header_template,
+        include_graph=include_graph,
+    )
+
+    return code, source_map.to_dict(), _dependencies(include_graph, path)
+
+
+class ExtractionSession:
+    """Extract, validate and execute documents, reusing work across calls.
+
+    Use as a context manager (or call ``close``) to stop the process pool
+    and the warm interpreters.
+
+    Attributes
+    ----------
+    header_template : str
+        Template for the header line written before each block.
+
+    doctest : bool
+        Whether doctest (``>>>``) examples are extracted as code.
+
+    python_bin : str | os.PathLike[str]
+        The python binary code is executed with.
+    """
+
+    header_template: str
+    doctest: bool
+    python_bin: str | os.PathLike[str]
+    _jobs: int | None
+    _interpreter_count: int
+    _include_graphs: 'queue.SimpleQueue[IncludeGraph]'
+    _results: dict[str, tuple[Extraction, _Dependencies]]
+    _lock: threading.Lock
+    _pool: ProcessPoolExecutor | None
+    _interpreters: 'queue.SimpleQueue[WarmInterpreter | None]'
+    _started: list[WarmInterpreter]
+    _closed: bool
+
+    def __init__(
+        self,
+        *,
+        verbose: int | None = None,
+        header_template: str = DEFAULT_HEADER_TEMPLATE,
+        doctest: bool = False,
+        python_bin: str | os.PathLike[str] = sys.executable,
+        jobs: int | None = None,
+        interpreters: int = 1,
+    ):
+        """Initialize the session.
+
+        Arguments
+        ---------
+        verbose : int | None
+            The verbosity level logging is configured with, once (see
+            ``configure_logging``). Logging is left as is by default.
+
+        header_template : str
+            Template for the header line written before each block.
+
+        doctest : bool
+            Whether to also extract doctest (``>>>``) examples as code.
+
+        python_bin : str | os.PathLike[str]
+            The python binary to execute code with.
+
+        jobs : int | None
+            The number of worker processes of ``extract_many``. Defaults to
+            the number of CPUs.
+
+        interpreters : int
+            The number of warm interpreters, i.e., of documents executed at
+            once.
+        """
+        if verbose is not None:
+            configure_logging(verbose)
+
+        if interpreters < 1:
+            raise ValueError('A session needs at least one interpreter.')
+
+        self.header_template = header_template
+        self.doctest = doctest
+        self.python_bin = python_bin
+        self._jobs = jobs
+        self._interpreter_count = interpreters
+        self._include_graphs = queue.SimpleQueue()
+        self._results = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._interpreters = queue.SimpleQueue()
+        self._started = []
+        self._closed = False
+
+        log.debug('Extraction session started', doctest=doctest, jobs=jobs)
+
+    def _check_open(self) -> None:
+        """Raise SessionClosedError if the session was closed."""
+        if self._closed:
+            raise SessionClosedError('The extraction session is closed.')
+
+    def _cached(self, key: str) -> Extraction | None:
+        """Get the cached result of ``key``, unless a file changed since."""
+        cached = self._results.get(key)
+
+        if cached is None:
+            return None
+
+        extraction, dependencies = cached
+
+        if any(_mtime(path) != mtime for path, mtime in dependencies.items()):
+            del self._results[key]
+            return None
+
+        log.debug('Extraction cache hit', filename=key)
+
+        return extraction
+
+    def _include_graph(self) -> IncludeGraph:
+        """Take an idle include graph, creating one if all are in use.
+
+        A graph scans one document at a time, so each thread extracting at
+        once uses its own.
+        """
+        try:
+            return self._include_graphs.get_nowait()
+
+        except queue.Empty:
+            return IncludeGraph(doctest_registry() if self.doctest else None)
+
+    def extract(self, path: str | os.PathLike[str]) -> Extraction:
+        """Extract the code of the document at ``path``.
+
+        The result is reused until the document, or a file it includes,
+        changes.
+
+        Raises
+        ------
+        ExtractionError
+            If the document is missing or empty, or includes itself.
+        """
+        self._check_open()
+        key = os.fspath(Path(path).resolve())
+
+        with self._lock:
+            extraction = self._cached(key)
+
+        if extraction is not None:
+            return extraction
+
+        include_graph = self._include_graph()
+
+        try:
+            _ = include_graph.invalidate()
+            extraction = Extraction(
+                *extract_code(
+                    read_document(path),
+                    path,
+                    header_template=self.header_template,
+                    include_graph=include_graph,
+                )
+            )
+            dependencies = _dependencies(include_graph, path)
+
+        finally:
+            self._include_graphs.put(include_graph)
+
+        with self._lock:
+            self._results[key] = (extraction, dependencies)
+
+        return extraction
+
+    def extract_many(
+        self, paths: Sequence[str | os.PathLike[str]]
+    ) -> list[Extraction]:
+        """Extract many documents, in the worker processes of the session.
+
+        Returns the results in the order of ``paths``. Documents unchanged
+        since they were extracted are not extracted again.
+        """
+        self._check_open()
+        keys = [os.fspath(Path(path).resolve()) for path in paths]
+        given = dict(zip(keys, map(os.fspath, paths)))
+
+        with self._lock:
+            found = {key: self._cached(key) for key in keys}
+
+        missing = list(dict.fromkeys(k for k, e in found.items() if e is None))
+
+        if len(missing) == 1 or self._jobs == 1:
+            for key in missing:
+                found[key] = self.extract(given[key])
+
+        elif missing:
+            # The pool takes jobs in order, so the largest go first.
+            costs = dict(zip(missing, estimate_costs(missing)))
+            missing.sort(key=lambda key: -costs[key])
+            futures = [
+                self._executor().submit(
+                    _extract_in_worker,
+                    given[key],
+                    self.header_template,
+                    self.doctest,
+                )
+                for key in missing
+            ]
+
+            for key, future in zip(missing, futures):
+                code, source_map, dependencies = future.result()
+                extraction = Extraction(code, SourceMap.from_dict(source_map))
+                found[key] = extraction
+
+                with self._lock:
+                    self._results[key] = (extraction, dependencies)
+
+        return [cast(Extraction, found[key]) for key in keys]
+
+    def _executor(self) -> ProcessPoolExecutor:
+        """Get the process pool, starting it on first use."""
+        with self._lock:
+            self._check_open()
+
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self._jobs)
+
+            return self._pool
+
+    def validate(self, path: str | os.PathLike[str]) -> Validation:
+        """Check that the code of the document at ``path`` is valid python.
+
+        The location of a syntax error is a line of the reStructuredText
+        file it comes from.
+        """
+        return validate_extracted(*self.extract(path))
+
+    def _interpreter(self) -> WarmInterpreter:
+        """Take an idle warm interpreter, starting one if there is room.
+
+        Raises
+        ------
+        SessionClosedError
+            If the session is closed, also while waiting for an
+            interpreter.
+        """
+        try:
+            interpreter = self._interpreters.get_nowait()
+
+        except queue.Empty:
+            with self._lock:
+                self._check_open()
+
+                if len(self._started) < self._interpreter_count:
+                    interpreter = WarmInterpreter(self.python_bin)
+                    self._started.append(interpreter)
+
+                    return interpreter
+
+            interpreter = self._interpreters.get()
+
+        if interpreter is None:
+            # Put back by each waiting thread, so they all wake up.
+            self._interpreters.put(None)
+            raise SessionClosedError('The extraction session is closed.')
+
+        return interpreter
+
+    def execute(
+        self, path: str | os.PathLike[str]
+    ) -> subprocess.CompletedProcess[str]:
+        """Run the code of the document at ``path`` in a warm interpreter.
+
+        Tracebacks in the output point at the lines of the reStructuredText
+        files.
+        """
+        code, source_map = self.extract(path)
+
+        if not WarmInterpreter.supported():
+            return run_code(self.python_bin, code, source_map)
+
+        interpreter = self._interpreter()
+
+        try:
+            result = interpreter.run(code)
+
+        finally:
+            self._interpreters.put(interpreter)
+
+        if result.stderr:
+            result.stderr = source_map.rewrite_traceback(result.stderr)
+
+        return result
+
+    def close(self) -> None:
+        """Stop the process pool and warm interpreters, and drop caches.
+
+        The session cannot be used afterwards. Closing twice does nothing.
+        """
+        with self._lock:
+            if self._closed:
+                return
+
+            self._closed = True
+            pool, self._pool = self._pool, None
+            started, self._started = self._started, []
+            self._results.clear()
+
+        # Wakes up the threads waiting for an interpreter.
+        self._interpreters.put(None)
+
+        if pool is not None:
+            pool.shutdown()
+
+        for interpreter in started:
+            interpreter.close()
+
+        log.debug('Extraction session closed')
+
+    def __enter__(self) -> 'ExtractionSession':
+        """Use the session as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the session."""
+        self.close()
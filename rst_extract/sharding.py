@@ -0,0 +1,405 @@
+"""Deterministic sharding of the documents of a run across machines.
+
+``rst-extract --shard INDEX/COUNT`` processes a stable subset of its input
+files: every machine given the same files computes the same assignment, so
+the shards together cover every file exactly once. Files are assigned by
+the hash of their path, or balanced by file size or by the runtime of each
+file in an earlier run.
+
+Each shard writes its partial result (``--result FILE``), and ``rst-extract
+merge`` combines the partial results into the result of the whole run, as
+a single machine would have produced it.
+"""
+
+import hashlib
+import json
+import os
+from collections.abc import Iterable, Mapping, Sequence
+from pathlib import Path
+from typing import Any, Literal, NamedTuple, TypeVar
+
+import structlog
+
+from .sourcemap import SourceMap
+
+log = structlog.get_logger()
+
+RESULT_VERSION = 1
+
+Balance = Literal['hash', 'size', 'runtime']
+BALANCES: tuple[Balance, ...] = ('hash', 'size', 'runtime')
+
+_File = TypeVar('_File', bound='str | os.PathLike[str]')
+
+
+class ShardError(ValueError):
+    """Raised for invalid shards, and results that cannot be merged."""
+
+
+class Shard(NamedTuple):
+    """The shard ``index`` (1-based) of ``count`` shards."""
+
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, text: str) -> 'Shard':
+        """Parse ``INDEX/COUNT``, e.g., ``2/4``.
+
+        Raises
+        ------
+        ShardError
+            If ``text`` is not a valid shard.
+        """
+        index, _, count = text.partition('/')
+
+        try:
+            shard = cls(int(index), int(count))
+
+        except ValueError:
+            raise ShardError(
+                f'Invalid shard {text!r}, expected INDEX/COUNT.'
+            ) from None
+
+        if not 1 <= shard.index <= shard.count:
+            raise ShardError(
+                f'Invalid shard {text!r}, INDEX must be between 1 and COUNT.'
+            )
+
+        return shard
+
+    def __str__(self) -> str:
+        """Format the shard as ``INDEX/COUNT``."""
+        return f'{self.index}/{self.count}'
+
+
+def shard_key(path: str | os.PathLike[str]) -> str:
+    """Get the name of a file used for sharding.
+
+    Paths are made relative to the current directory, so machines running
+    from the root of different checkouts agree.
+    """
+    return Path(os.path.relpath(path)).as_posix()
+
+
+def _key_hash(key: str) -> int:
+    """Hash ``key`` the same way on every machine."""
+    return int.from_bytes(
+        hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big'
+    )
+
+
+def _weights(
+    keys: Sequence[str],
+    files: Sequence[str | os.PathLike[str]],
+    balance: Balance,
+    runtimes: Mapping[str, float] | None,
+) -> list[float]:
+    """Get the cost of each file to balance."""
+    if balance == 'size':
+        return [float(os.path.getsize(file)) for file in files]
+
+    runtimes = runtimes or {}
+    known = [runtimes[key] for key in keys if key in runtimes]
+
+    # Files never run before are assumed to take the average time.
+    default = sum(known) / len(known) if known else 1.0
+
+    return [runtimes.get(key, default) for key in keys]
+
+
+def assign_shards(
+    files: Sequence[_File],
+    count: int,
+    *,
+    balance: Balance = 'hash',
+    runtimes: Mapping[str, float] | None = None,
+) -> list[list[_File]]:
+    """Split ``files`` into ``count`` shards.
+
+    Arguments
+    ---------
+    files : Sequence[str | os.PathLike[str]]
+        The files to split.
+
+    count : int
+        The number of shards.
+
+    balance : Balance
+        ``'hash'`` assigns each file by the hash of its path, so a file
+        stays in its shard when others are added or removed. ``'size'`` and
+        ``'runtime'`` give each file, largest first, to the shard with the
+        lowest total so far, balancing the shards by file size, or by the
+        ``runtimes`` of an earlier run.
+
+    runtimes : Mapping[str, float] | None
+        The runtime of files by ``shard_key``, for ``'runtime'``.
+
+    Returns
+    -------
+    list[list[str | os.PathLike[str]]]
+        The files of each shard, in their order in ``files``.
+    """
+    if count < 1:
+        raise ShardError('The number of shards must be at least 1.')
+
+    keys = [shard_key(file) for file in files]
+    hashes = [_key_hash(key) for key in keys]
+
+    if balance == 'hash':
+        assignment = [file_hash % count for file_hash in hashes]
+
+    else:
+        weights = _weights(keys, files, balance, runtimes)
+        totals = [0.0] * count
+        assignment = [0] * len(files)
+
+        # Ties are broken by hash, not by position, so the order in which
+        # files are given does not matter.
+        for position in sorted(
+            range(len(files)),
+            key=lambda i: (-weights[i], hashes[i], keys[i]),
+        ):
+            shard = min(range(count), key=lambda s: (totals[s], s))
+            assignment[position] = shard
+            totals[shard] += weights[position]
+
+    shards: list[list[_File]] = [[] for _ in range(count)]
+
+    for file, shard in zip(files, assignment):
+        shards[shard].append(file)
+
+    return shards
+
+
+def select_shard(
+    files: Sequence[_File],
+    shard: Shard,
+    *,
+    balance: Balance = 'hash',
+    runtimes: Mapping[str, float] | None = None,
+) -> list[_File]:
+    """Get the files of ``shard``, see ``assign_shards``."""
+    selected = assign_shards(
+        files, shard.count, balance=balance, runtimes=runtimes
+    )[shard.index - 1]
+
+    log.info(
+        'Shard selected',
+        shard=str(shard),
+        file_count=len(selected),
+        total=len(files),
+        balance=balance,
+    )
+
+    return selected
+
+
+class FileResult(NamedTuple):
+    """The result of one file of a run.
+
+    Attributes
+    ----------
+    code : str
+        The extracted code.
+
+    source_map : SourceMap
+        The source map of ``code``.
+
+    returncode : int | None
+        The exit status of the executed code, if executed.
+
+    duration : float
+        The time spent on the file, in seconds.
+
+    extract_duration : float
+        The part of ``duration`` spent extracting the code; the rest was
+        spent writing or executing it.
+    """
+
+    code: str
+    source_map: SourceMap
+    returncode: int | None = None
+    duration: float = 0.0
+    extract_duration: float = 0.0
+
+
+class RunResult:
+    """The result of a run, or of one shard of a run.
+
+    Attributes
+    ----------
+    files : list[str]
+        The ``shard_key`` of every input file of the run, in order,
+        including the files of other shards.
+
+    shards : list[Shard]
+        The shards whose results are included; empty for a run without
+        ``--shard``.
+
+    results : dict[str, FileResult]
+        The result of each file processed, by ``shard_key``.
+    """
+
+    files: list[str]
+    shards: list[Shard]
+    results: dict[str, FileResult]
+
+    def __init__(
+        self,
+        files: Iterable[str],
+        shards: Iterable[Shard] = (),
+        results: Mapping[str, FileResult] | None = None,
+    ):
+        """Initialize the result."""
+        self.files = list(files)
+        self.shards = sorted(shards)
+        self.results = dict(results or {})
+
+    @property
+    def complete(self) -> bool:
+        """Whether every input file has a result."""
+        return all(key in self.results for key in self.files)
+
+    def ordered(self) -> list[tuple[str, FileResult]]:
+        """Get the results in the order of the input files."""
+        return [
+            (key, self.results[key])
+            for key in self.files
+            if key in self.results
+        ]
+
+    def summary(self) -> dict[str, int]:
+        """Count the files, and the files executed that passed and failed."""
+        returncodes = [
+            result.returncode
+            for result in self.results.values()
+            if result.returncode is not None
+        ]
+
+        return {
+            'files': len(self.results),
+            'passed': sum(1 for code in returncodes if code == 0),
+            'failed': sum(1 for code in returncodes if code != 0),
+        }
+
+    def runtimes(self) -> dict[str, float]:
+        """Get the duration of each file, to balance later shards."""
+        return {key: result.duration for key, result in self.results.items()}
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get the result as a JSON-serializable ``dict``."""
+        return {
+            'version': RESULT_VERSION,
+            'files': self.files,
+            'shards': [list(shard) for shard in self.shards],
+            'summary': self.summary(),
+            'results': {
+                key: {
+                    'code': result.code,
+                    'source_map': result.source_map.to_dict(),
+                    'returncode': result.returncode,
+                    'duration': result.duration,
+                    'extract_duration': result.extract_duration,
+                }
+                for key, result in self.results.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> 'RunResult':
+        """Create a result from the output of ``to_dict``.
+
+        Raises
+        ------
+        ShardError
+            If ``data`` is not a result of this version.
+        """
+        if not isinstance(data, dict) or data.get('version') != RESULT_VERSION:
+            raise ShardError('Unsupported result version.')
+
+        try:
+            return cls(
+                data['files'],
+                [Shard(*shard) for shard in data['shards']],
+                {
+                    key: FileResult(
+                        result['code'],
+                        SourceMap.from_dict(result['source_map']),
+                        result['returncode'],
+                        result['duration'],
+                        result.get('extract_duration', 0.0),
+                    )
+                    for key, result in data['results'].items()
+                },
+            )
+
+        except (KeyError, TypeError, ValueError) as error:
+            raise ShardError(f'Invalid result: {error}') from error
+
+    def write(self, path: str | os.PathLike[str]) -> None:
+        """Write the result to ``path`` as JSON."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        _ = Path(path).write_text(json.dumps(self.to_dict()), encoding='utf-8')
+
+    @classmethod
+    def read(cls, path: str | os.PathLike[str]) -> 'RunResult':
+        """Read a result written by ``write``.
+
+        Raises
+        ------
+        ShardError
+            If the file is not a valid result.
+        """
+        try:
+            data = json.loads(Path(path).read_text(encoding='utf-8'))
+
+        except ValueError as error:
+            raise ShardError(f'{path}: invalid result: {error}') from error
+
+        return cls.from_dict(data)
+
+
+def merge_results(results: Sequence[RunResult]) -> RunResult:
+    """Combine the results of the shards of a run.
+
+    Raises
+    ------
+    ShardError
+        If the results are not the shards of one run, or a shard is
+        missing or given twice.
+    """
+    if not results:
+        raise ShardError('No results to merge.')
+
+    files = results[0].files
+    shards = [shard for result in results for shard in result.shards]
+
+    if any(result.files != files for result in results):
+        raise ShardError('The results are not from runs of the same files.')
+
+    if not shards:
+        if len(results) > 1:
+            raise ShardError('Only the results of shards can be merged.')
+
+        return results[0]
+
+    count = shards[0].count
+    expected = [Shard(index, count) for index in range(1, count + 1)]
+
+    if sorted(shards) != expected:
+        found = ', '.join(str(shard) for shard in sorted(shards))
+        raise ShardError(
+            f'Expected the results of shards 1/{count} to {count}/{count}, '
+            f'got {found}.'
+        )
+
+    merged = RunResult(files, shards)
+
+    for result in results:
+        merged.results.update(result.results)
+
+    if not merged.complete:
+        raise ShardError('The results of the shards do not cover all files.')
+
+    return merged
@@ -0,0 +1,194 @@
+"""Source maps from extracted python code back to the reStructuredText source.
+
+A ``SourceMap`` records, for every line of extracted output, the source file
+and line it came from. Lines generated by rst_extract itself (block headers
+and separators) map to nothing. The map is backed by two ``array.array``
+columns, so it stays small even for very large documents.
+"""
+
+import json
+import os
+import re
+from array import array
+from collections.abc import Iterable
+from pathlib import Path
+
+import structlog
+
+log = structlog.get_logger()
+
+SOURCE_MAP_SUFFIX = '.map.json'
+SOURCE_MAP_VERSION = 1
+
+# Marker for output lines that do not come from any source.
+_NO_SOURCE = -1
+
+
+class SourceMapError(ValueError):
+    """Error raised when a source map cannot be read."""
+
+
+class SourceMap:
+    """Map from 1-based output lines to ``(source file, 1-based line)``."""
+
+    __slots__ = ('sources', '_source_index', '_source_ids', '_lines')
+
+    sources: list[str]
+    _source_index: dict[str, int]
+    _source_ids: 'array[int]'
+    _lines: 'array[int]'
+
+    def __init__(self) -> None:
+        """Initialize an empty SourceMap."""
+        self.sources = []
+        self._source_index = {}
+        self._source_ids = array('i')
+        self._lines = array('i')
+
+    def __len__(self) -> int:
+        """Get the number of output lines in the map."""
+        return len(self._lines)
+
+    def add_source(self, source: str | os.PathLike[str]) -> int:
+        """Register ``source``, returning its id in the map."""
+        source = os.fspath(source)
+
+        if source not in self._source_index:
+            self._source_index[source] = len(self.sources)
+            self.sources.append(source)
+
+        return self._source_index[source]
+
+    def add_generated(self, count: int = 1) -> None:
+        """Record ``count`` output lines that have no source."""
+        self._source_ids.extend([_NO_SOURCE] * count)
+        self._lines.extend([0] * count)
+
+    def add_lines(self, source_id: int, lines: Iterable[int]) -> None:
+        """Record output lines coming from 0-based ``lines`` of a source."""
+        for line in lines:
+            self._source_ids.append(source_id)
+            self._lines.append(line + 1)
+
+    def extend(self, other: 'SourceMap') -> None:
+        """Append ``other``, e.g., for output concatenated after this map."""
+        source_ids = [self.add_source(source) for source in other.sources]
+
+        self._source_ids.extend(
+            _NO_SOURCE if source_id == _NO_SOURCE else source_ids[source_id]
+            for source_id in other._source_ids
+        )
+        self._lines.extend(other._lines)
+
+    def lookup(self, output_line: int) -> tuple[str, int] | None:
+        """Get the source and source line of a 1-based ``output_line``.
+
+        Returns ``None`` for generated lines or lines outside of the map.
+        """
+        index = output_line - 1
+
+        if not 0 <= index < len(self._lines):
+            return None
+
+        source_id = self._source_ids[index]
+
+        if source_id == _NO_SOURCE:
+            return None
+
+        return self.sources[source_id], self._lines[index]
+
+    def rewrite_traceback(self, text: str, filename: str = '<string>') -> str:
+        """Point ``File "<filename>", line N`` references at the source.
+
+        Arguments
+        ---------
+        text : str
+            The traceback (or any other text) to rewrite.
+
+        filename : str
+            The filename the extracted code was run as. Default is
+            ``'<string>'``, as for ``python -c``.
+
+        Returns
+        -------
+        str
+            The text, with every mapped output line replaced by its source
+            file and line. Unmapped lines are left as they are.
+        """
+        pattern = re.compile(rf'File "{re.escape(filename)}", line (\d+)')
+
+        def _replace(match: re.Match[str]) -> str:
+            location = self.lookup(int(match.group(1)))
+
+            if location is None:
+                return match.group(0)
+
+            source, line = location
+            return f'File "{source}", line {line}'
+
+        return pattern.sub(_replace, text)
+
+    def to_dict(self) -> dict[str, object]:
+        """Get a JSON-serializable representation of the map."""
+        return {
+            'version': SOURCE_MAP_VERSION,
+            'sources': list(self.sources),
+            'source_ids': self._source_ids.tolist(),
+            'lines': self._lines.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, object]) -> 'SourceMap':
+        """Create a SourceMap from the output of ``to_dict``."""
+        if data.get('version') != SOURCE_MAP_VERSION:
+            raise SourceMapError(
+                f'Unsupported source map version: {data.get("version")}.'
+            )
+
+        sources = data.get('sources')
+        source_ids = data.get('source_ids')
+        lines = data.get('lines')
+
+        if not (
+            isinstance(sources, list)
+            and isinstance(source_ids, list)
+            and isinstance(lines, list)
+            and len(source_ids) == len(lines)
+        ):
+            raise SourceMapError('Malformed source map.')
+
+        source_map = cls()
+
+        for source in sources:
+            _ = source_map.add_source(source)
+
+        source_map._source_ids.extend(source_ids)
+        source_map._lines.extend(lines)
+
+        return source_map
+
+    def write(self, path: str | os.PathLike[str]) -> None:
+        """Write the map to a JSON sidecar file at ``path``."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+
+        log.debug('Source map written', path=path)
+
+    @classmethod
+    def read(cls, path: str | os.PathLike[str]) -> 'SourceMap':
+        """Read a map written by ``write``."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+
+        except json.JSONDecodeError as error:
+            raise SourceMapError(f'Invalid source map: {path}') from error
+
+        return cls.from_dict(data)
+
+
+def sidecar_path(output: str | os.PathLike[str]) -> Path:
+    """Get the path of the source map sidecar for an ``output`` file."""
+    output = Path(output)
+
+    return output.with_name(output.name + SOURCE_MAP_SUFFIX)
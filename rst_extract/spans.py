@@ -0,0 +1,313 @@
+"""Span-based views of code blocks over a single source text buffer.
+
+Rather than copying every block into a fresh list of strings, blocks are
+stored as ``Span`` objects: character offsets into the original text, plus
+the indent to strip from each line. A ``TextBuffer`` keeps a precomputed
+index of where each line starts, which gives O(log n) offset-to-line lookups
+and lets the text of a line be sliced only when it is actually rendered.
+
+Large texts are indexed with array operations when numpy is installed (see
+``fastscan``); the results are the same either way.
+"""
+
+import os
+import re
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterator, Sequence
+from typing import NamedTuple, overload
+
+from . import fastscan
+
+_NEWLINE_RE = re.compile('\n')
+_INDENT_RE = re.compile(r'\s*')
+
+
+class Span(NamedTuple):
+    """Location of a block in a ``TextBuffer``.
+
+    Attributes
+    ----------
+    start : int
+        Offset of the first character of the first line of the block.
+
+    end : int
+        Offset of the start of the line following the block (or the end of
+        the text). ``start == end`` for an empty block.
+
+    indent : int
+        Number of leading characters to strip from each line.
+    """
+
+    start: int
+    end: int
+    indent: int
+
+
+class TextBuffer:
+    """Source text together with an index of where each line starts.
+
+    Lines follow ``str.splitlines`` for ``\\n`` and ``\\r\\n`` line endings:
+    a trailing newline does not start a new, empty line.
+    """
+
+    __slots__ = ('text', 'path', '_line_starts', '_indents', '_index')
+
+    text: str
+    path: str | os.PathLike[str] | None
+    _line_starts: 'array[int]'
+    _indents: 'array[int] | None'
+    _index: fastscan.LineIndex | None
+
+    def __init__(
+        self,
+        text: str,
+        path: str | os.PathLike[str] | None = None,
+        *,
+        fast: bool | None = None,
+    ):
+        """Initialize the TextBuffer, indexing the newlines in ``text``.
+
+        Arguments
+        ---------
+        text
+            The source text.
+
+        path
+            The file the text was read from, if any.
+
+        fast
+            Whether to index the lines with array operations (see
+            ``fastscan.LineIndex``). By default, they are if numpy is
+            installed and the text is at least ``fastscan.MIN_SIZE`` long.
+        """
+        self.text = text
+        self.path = path
+
+        if fast is None:
+            fast = len(text) >= fastscan.MIN_SIZE and fastscan.available()
+
+        if fast:
+            self._index = fastscan.LineIndex(text)
+            self._line_starts = self._index.starts
+            self._indents = self._index.indents
+            return
+
+        self._index = None
+        self._indents = None
+        line_starts = array('q', [0])
+        line_starts.extend(m.end() for m in _NEWLINE_RE.finditer(text))
+
+        if not text or line_starts[-1] == len(text):
+            _ = line_starts.pop()
+
+        self._line_starts = line_starts
+
+    def __len__(self) -> int:
+        """Get the number of lines in the buffer."""
+        return len(self._line_starts)
+
+    def line_of(self, offset: int) -> int:
+        """Get the 0-based line number containing the character ``offset``."""
+        if not 0 <= offset <= len(self.text):
+            raise IndexError(f'Offset {offset} is outside of the buffer.')
+
+        return bisect_right(self._line_starts, offset) - 1
+
+    def line_start(self, line: int) -> int:
+        """Get the offset of the first character of ``line``.
+
+        ``line`` may be one past the last line, which gives the length of the
+        text.
+        """
+        if line == len(self._line_starts):
+            return len(self.text)
+
+        return self._line_starts[line]
+
+    def line_end(self, line: int) -> int:
+        """Get the offset just past the last character of ``line``.
+
+        The line ending itself is not included.
+        """
+        end = self.line_start(line + 1)
+        text = self.text
+
+        if end > self._line_starts[line] and text[end - 1] == '\n':
+            end -= 1
+
+            if end > self._line_starts[line] and text[end - 1] == '\r':
+                end -= 1
+
+        return end
+
+    def line(self, line: int) -> str:
+        """Get the text of ``line``, without its line ending."""
+        return self.text[self._line_starts[line] : self.line_end(line)]
+
+    def indent_of(self, line: int) -> int:
+        """Get the number of leading whitespace characters of ``line``."""
+        if self._indents is not None:
+            return self._indents[line]
+
+        start = self._line_starts[line]
+        match = _INDENT_RE.match(self.text, start, self.line_end(line))
+
+        # _INDENT_RE always matches, but may be empty.
+        assert match is not None
+
+        return match.end() - start
+
+    def is_blank(self, line: int) -> bool:
+        """Check if ``line`` only contains whitespace."""
+        return self._line_starts[line] + self.indent_of(line) == self.line_end(
+            line
+        )
+
+    def next_line(self, line: int, indent: int | None = None) -> int:
+        """Get the first non-blank line from ``line``, indented <= ``indent``.
+
+        Any non-blank line matches if ``indent`` is None. Returns the number
+        of lines if no line matches.
+        """
+        if self._index is not None:
+            return self._index.next_line(line, indent)
+
+        for line in range(line, len(self._line_starts)):
+            if not self.is_blank(line) and (
+                indent is None or self.indent_of(line) <= indent
+            ):
+                return line
+
+        return len(self._line_starts)
+
+    def span(self, first: int, stop: int, indent: int) -> Span:
+        """Get the span of lines ``first`` up to (excluding) ``stop``."""
+        if stop <= first:
+            start = self.line_start(first)
+            return Span(start, start, indent)
+
+        return Span(self.line_start(first), self.line_start(stop), indent)
+
+    def lines(self, span: Span) -> 'SpanLines':
+        """Get a lazy sequence of the (dedented) lines in ``span``."""
+        return SpanLines(self, span)
+
+
+class SpanLines(Sequence[str]):
+    """Lazy, read-only sequence of the lines of a ``Span``.
+
+    Line text is only sliced out of the buffer when it is accessed.
+    """
+
+    __slots__ = ('buffer', 'span', 'first_line', '_count')
+
+    buffer: TextBuffer
+    span: Span
+    first_line: int
+    _count: int
+
+    def __init__(self, buffer: TextBuffer, span: Span):
+        """Initialize the view of ``span`` in ``buffer``."""
+        self.buffer = buffer
+        self.span = span
+        self.first_line = buffer.line_of(span.start)
+
+        if span.end > span.start:
+            self._count = buffer.line_of(span.end - 1) + 1 - self.first_line
+
+        else:
+            self._count = 0
+
+    def __len__(self) -> int:
+        """Get the number of lines in the span."""
+        return self._count
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        """Get the dedented text of one line (or a list, for a slice)."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+
+        if index < 0:
+            index += self._count
+
+        if not 0 <= index < self._count:
+            raise IndexError('SpanLines index out of range')
+
+        buffer = self.buffer
+        line = self.first_line + index
+        end = buffer.line_end(line)
+        start = min(buffer.line_start(line) + self.span.indent, end)
+
+        return buffer.text[start:end]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the dedented lines."""
+        for i in range(self._count):
+            yield self[i]
+
+    @property
+    def line_numbers(self) -> range:
+        """The 0-based line numbers in the buffer covered by the span."""
+        return range(self.first_line, self.first_line + self._count)
+
+    @property
+    def source(self) -> str | os.PathLike[str] | None:
+        """The file the lines come from, if known."""
+        return self.buffer.path
+
+    def __repr__(self) -> str:
+        """Get a representation of the SpanLines."""
+        return f'{type(self).__name__}({list(self)!r})'
+
+
+class SourceLines(Sequence[str]):
+    """Lines that were rewritten from their source, e.g., to remove prompts.
+
+    Unlike ``SpanLines``, the text of each line is stored, together with the
+    0-based source line it came from.
+    """
+
+    __slots__ = ('lines', 'line_numbers', 'source')
+
+    lines: list[str]
+    line_numbers: list[int]
+    source: str | os.PathLike[str] | None
+
+    def __init__(
+        self,
+        lines: list[str],
+        line_numbers: list[int],
+        source: str | os.PathLike[str] | None = None,
+    ):
+        """Initialize the SourceLines."""
+        if len(lines) != len(line_numbers):
+            raise ValueError('Expected a line number for every line.')
+
+        self.lines = lines
+        self.line_numbers = line_numbers
+        self.source = source
+
+    def __len__(self) -> int:
+        """Get the number of lines."""
+        return len(self.lines)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        """Get one line (or a list, for a slice)."""
+        return self.lines[index]
+
+    def __repr__(self) -> str:
+        """Get a representation of the SourceLines."""
+        return f'{type(self).__name__}({self.lines!r})'
@@ -0,0 +1,155 @@
+"""Sphinx extension writing the extracted code of every document.
+
+Add ``'rst_extract.sphinx'`` to the ``extensions`` in ``conf.py``, and build
+with the ``rst-extract`` builder::
+
+    sphinx-build -b rst-extract docs docs/_build/rst-extract
+
+The builder does not read any source file itself: it collects the python
+``literal_block`` nodes of the doctrees Sphinx has already parsed (and
+pickled), so includes, ``literalinclude`` and substitutions are resolved the
+same way as for the HTML build. Like the other Sphinx builders, it only
+writes the scripts of documents that changed since the last build.
+
+Configuration values:
+
+``rst_extract_header_template``
+    Header line written before each block. Default is ``'# Block {number}:'``.
+
+``rst_extract_doctest``
+    Whether to also extract doctest (``>>>``) examples. Default is ``False``.
+"""
+
+import os
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import Any
+
+import structlog
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.builders import Builder
+
+from .assembler import DEFAULT_HEADER_TEMPLATE, assemble
+from .directives import is_python
+from .doctests import parse_doctest
+
+log = structlog.get_logger()
+
+# Highlight languages of doctest blocks, e.g. from ``sphinx.ext.doctest``.
+DOCTEST_LANGUAGES = frozenset({'pycon', 'python-console'})
+
+
+def _is_code_node(node: nodes.Node) -> bool:
+    """Check if ``node`` holds (possibly non-python) code."""
+    return isinstance(node, (nodes.literal_block, nodes.doctest_block))
+
+
+def _is_python_include(node: nodes.Element) -> bool:
+    """Check if ``node`` is a ``literalinclude`` of a python file."""
+    source = node.get('source')
+
+    return source is not None and Path(source).suffix == '.py'
+
+
+def collect_blocks(
+    doctree: nodes.document, doctest: bool = False
+) -> Iterator[Sequence[str]]:
+    """Yield the lines of every python block of ``doctree``, in order.
+
+    Code blocks are found by their highlight language. ``literalinclude``
+    blocks without a language are python if the included file is. With
+    ``doctest``, doctest blocks are converted to code.
+    """
+    for node in doctree.findall(_is_code_node):
+        language = node.get('language', '')
+        lines = node.astext().splitlines()
+
+        if isinstance(node, nodes.doctest_block) or (
+            language in DOCTEST_LANGUAGES
+        ):
+            if doctest and (block := parse_doctest(lines, range(len(lines)))):
+                yield block
+
+        elif is_python(language) or (
+            language in ('', 'default') and _is_python_include(node)
+        ):
+            yield lines
+
+
+class ScriptBuilder(Builder):
+    """Builder writing one python script per document."""
+
+    name = 'rst-extract'
+    format = 'python'
+    epilog = 'The extracted scripts are in %(outdir)s.'
+    out_suffix = '.py'
+    allow_parallel = True
+
+    def init(self) -> None:
+        """Initialize the builder."""
+
+    def get_outdated_docs(self) -> Iterator[str]:
+        """Get the documents whose script is older than their source."""
+        for docname in self.env.found_docs:
+            if docname not in self.env.all_docs:
+                yield docname
+                continue
+
+            try:
+                target = os.stat(self.script_path(docname)).st_mtime_ns
+
+            except OSError:
+                yield docname
+                continue
+
+            try:
+                if os.stat(self.env.doc2path(docname)).st_mtime_ns > target:
+                    yield docname
+
+            except OSError:
+                continue
+
+    def get_target_uri(self, docname: str, typ: str | None = None) -> str:
+        """Get the script of ``docname``, relative to the output directory."""
+        return f'{docname}{self.out_suffix}'
+
+    def prepare_writing(self, docnames: set[str]) -> None:
+        """Prepare writing the scripts of ``docnames``."""
+
+    def script_path(self, docname: str) -> Path:
+        """Get the path of the script of ``docname``."""
+        return Path(self.outdir) / self.get_target_uri(docname)
+
+    def write_doc(self, docname: str, doctree: nodes.document) -> None:
+        """Write the script of ``docname`` from its doctree."""
+        blocks = list(collect_blocks(doctree, self.config.rst_extract_doctest))
+        code = assemble(blocks, self.config.rst_extract_header_template)
+
+        path = self.script_path(docname)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _ = path.write_text(code, encoding='utf-8')
+
+        log.debug(
+            'Script written',
+            docname=docname,
+            filename=str(path),
+            block_count=len(blocks),
+        )
+
+    def finish(self) -> None:
+        """Finish the build."""
+
+
+def setup(app: Sphinx) -> dict[str, Any]:
+    """Register the builder and its configuration values with Sphinx."""
+    app.add_config_value(
+        'rst_extract_header_template', DEFAULT_HEADER_TEMPLATE, 'env', [str]
+    )
+    app.add_config_value('rst_extract_doctest', False, 'env', [bool])
+    app.add_builder(ScriptBuilder)
+
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -2,9 +2,33 @@
 
 import logging
 from ast import parse
+from typing import NamedTuple
 
 from pydantic import BaseModel, StrictStr
 
+from .sourcemap import SourceMap
+
+
+class Validation(NamedTuple):
+    """Whether the code of a document is valid python.
+
+    Attributes
+    ----------
+    valid : bool
+        Whether the code could be parsed.
+
+    error : str | None
+        The message of the syntax error.
+
+    filename, line : str | None, int | None
+        The reStructuredText file and line of the syntax error.
+    """
+
+    valid: bool
+    error: str | None = None
+    filename: str | None = None
+    line: int | None = None
+
 
 class Validator(BaseModel):
     """Validator class that evaluates to True if given code is valid python/follows
@@ -19,17 +43,44 @@ class Validator(BaseModel):
         return self.is_valid_python(self.code)
 
     @staticmethod
-    def is_valid_python(code: str) -> bool:
-        """Return True if the code is valid python code, False otherwise."""
+    def syntax_error(code: str) -> SyntaxError | None:
+        """Return the syntax error of the code, None if it is valid python."""
         try:
             _ = parse(code, type_comments=True)
-            return True
+            return None
 
         except SyntaxError as err:
-            logging.info(
-                'Got a syntax error while parsing code: %s("%s").',
-                err.__class__.__name__,
-                err.msg,
-            )
+            return err
+
+    @staticmethod
+    def is_valid_python(code: str) -> bool:
+        """Return True if the code is valid python code, False otherwise."""
+        err = Validator.syntax_error(code)
+
+        if err is None:
+            return True
+
+        logging.info(
+            'Got a syntax error while parsing code: %s("%s").',
+            err.__class__.__name__,
+            err.msg,
+        )
+
+        return False
+
+
+def validate_extracted(code: str, source_map: SourceMap) -> Validation:
+    """Check that extracted code is valid python.
+
+    The location of a syntax error is a line of the reStructuredText file
+    it comes from.
+    """
+    err = Validator.syntax_error(code)
+
+    if err is None:
+        return Validation(True)
+
+    location = source_map.lookup(err.lineno) if err.lineno else None
+    filename, line = location or (None, None)
 
-            return False
+    return Validation(False, err.msg, filename, line)
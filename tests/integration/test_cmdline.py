@@ -6,6 +6,8 @@
 # Ignore type hinting in mypy
 # mypy: ignore-errors
 import glob
+import json
+import os
 import subprocess
 import sys
 from pathlib import Path
@@ -213,3 +215,682 @@ def run_cli_on_all_test_files(test_file: Path):
     assert not result.stderr
     assert result.returncode == 0
     assert result.stdout
+
+
+def test_output_file_with_source_map(
+    complex_code_block_rst: Path,
+    tmp_path: Path,
+):
+    """Test that the source map sidecar is written next to the output."""
+    output_file = tmp_path / 'output.py'
+    _ = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'rst_extract',
+            str(complex_code_block_rst),
+            '-o',
+            str(output_file),
+            '--source-map',
+        ],
+        check=True,
+    )
+
+    sidecar = json.loads((tmp_path / 'output.py.map.json').read_text())
+
+    assert sidecar['sources'] == [str(complex_code_block_rst)]
+    assert len(sidecar['lines']) == len(output_file.read_text().splitlines())
+
+
+def test_check_doctests(tmp_path: Path):
+    """Test that doctest failures are reported with a non-zero exit code."""
+    passing = tmp_path / 'passing.rst'
+    passing.write_text('>>> print("Hello, World!")\nHello, World!\n')
+    failing = tmp_path / 'failing.rst'
+    failing.write_text('Text.\n\n>>> 1 + 1\n3\n')
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'rst_extract',
+            str(passing),
+            str(failing),
+            '--check-doctests',
+            '--jobs',
+            '2',
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 1
+    assert f'{passing}: 1 examples, 0 failures' in result.stdout
+    assert f'File "{failing}", line 3' in result.stdout
+
+
+def test_project_split_output(tmp_path: Path):
+    """Test that a Sphinx project is extracted to one script per document."""
+    source = tmp_path / 'docs'
+    (source / 'guide').mkdir(parents=True)
+    (source / 'conf.py').write_text("root_doc = 'index'\n")
+    (source / 'index.rst').write_text(
+        '.. toctree::\n\n   guide/usage\n\n'
+        '.. code-block:: python\n\n    x = 1\n'
+    )
+    (source / 'guide' / 'usage.rst').write_text(
+        '.. code-block:: python\n\n    y = 2\n'
+    )
+
+    _ = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'rst_extract',
+            '--project',
+            str(tmp_path),
+            '--split-output',
+            str(tmp_path / 'out'),
+        ],
+        check=True,
+    )
+
+    assert (tmp_path / 'out' / 'index.py').read_text() == '# Block 1:\nx = 1\n'
+    assert (tmp_path / 'out' / 'guide' / 'usage.py').read_text() == (
+        '# Block 1:\ny = 2\n'
+    )
+
+
+def test_explicit_extract_command(code_only_rst: Path):
+    """Test that extract can also be named explicitly."""
+    result = subprocess.run(
+        [sys.executable, '-m', 'rst_extract', 'extract', str(code_only_rst)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert '# Block 1:' in result.stdout
+
+
+@pytest.mark.parametrize('separator', [[], ['--']])
+def test_file_named_like_command(
+    code_only_rst: Path, tmp_path: Path, separator: list[str]
+):
+    """Test that a file named like a command is extracted, not run."""
+    (tmp_path / 'diff').write_text(Path(code_only_rst).read_text())
+    env = {**os.environ, 'PYTHONPATH': str(Path(__file__).parents[2])}
+
+    result = subprocess.run(
+        [sys.executable, '-m', 'rst_extract', *separator, 'diff'],
+        capture_output=True,
+        text=True,
+        cwd=tmp_path,
+        env=env,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert '# Block 1:' in result.stdout
+
+
+def test_serve_stdio(code_only_rst: Path):
+    """Test that the daemon answers JSON-RPC requests on stdin."""
+    requests = [
+        {
+            'jsonrpc': '2.0',
+            'id': 1,
+            'method': 'extract',
+            'params': {'path': str(code_only_rst)},
+        },
+        {'jsonrpc': '2.0', 'id': 2, 'method': 'ping'},
+    ]
+
+    result = subprocess.run(
+        [sys.executable, '-m', 'rst_extract', 'serve', '--stdio'],
+        input=''.join(json.dumps(request) + '\n' for request in requests),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    responses = [json.loads(line) for line in result.stdout.splitlines()]
+    assert '# Block 1:' in responses[0]['result']['code']
+    assert responses[1]['result'] == 'pong'
+
+
+def test_changed_since(tmp_path: Path):
+    """Test that only documents changed in git are processed."""
+
+    def _git(*args: str) -> None:
+        _ = subprocess.run(
+            ['git', *args], cwd=tmp_path, check=True, capture_output=True
+        )
+
+    _git('init', '-q')
+    _git('config', 'user.email', 'docs@example.com')
+    _git('config', 'user.name', 'Docs')
+    for name in ('first', 'second'):
+        (tmp_path / f'{name}.rst').write_text(
+            f'.. code-block:: python\n\n    print("{name}")\n'
+        )
+    _git('add', '.')
+    _git('commit', '-q', '-m', 'Initial commit')
+
+    command = [sys.executable, '-m', 'rst_extract', '--changed-since', 'HEAD']
+    options = {
+        'cwd': tmp_path,
+        'env': {**os.environ, 'PYTHONPATH': str(Path(__file__).parents[2])},
+        'capture_output': True,
+        'text': True,
+        'check': True,
+    }
+    unchanged = subprocess.run(command, **options)
+
+    (tmp_path / 'second.rst').write_text(
+        '.. code-block:: python\n\n    print("changed")\n'
+    )
+    changed = subprocess.run(command, **options)
+
+    assert not unchanged.stdout
+    assert 'print("changed")' in changed.stdout
+    assert 'first' not in changed.stdout
+
+
+def test_revisions(tmp_path: Path):
+    """Test that documents are extracted at several git revisions."""
+
+    def _git(*args: str) -> None:
+        _ = subprocess.run(
+            ['git', *args], cwd=tmp_path, check=True, capture_output=True
+        )
+
+    _git('init', '-q')
+    _git('config', 'user.email', 'docs@example.com')
+    _git('config', 'user.name', 'Docs')
+    for version in ('1', '2'):
+        (tmp_path / 'index.rst').write_text(
+            f'.. code-block:: python\n\n    version = {version}\n'
+        )
+        _git('add', '.')
+        _git('commit', '-q', '-m', f'Version {version}')
+        _git('tag', f'v{version}')
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'rst_extract',
+            '--rev',
+            'v1',
+            '--rev',
+            'v2',
+            '--split-output',
+            str(tmp_path / 'out'),
+        ],
+        cwd=tmp_path,
+        env={**os.environ, 'PYTHONPATH': str(Path(__file__).parents[2])},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert 'v1:index.rst' in result.stdout
+    assert 'version = 2' in result.stdout
+    assert (tmp_path / 'out' / 'v1' / 'index.py').read_text() == (
+        '# Block 1:\nversion = 1\n'
+    )
+
+
+def test_diff(tmp_path: Path):
+    """Test that diff reports changed blocks and exits with 1."""
+    old = tmp_path / 'old.rst'
+    old.write_text('.. code-block:: python\n\n    x = 1\n')
+    new = tmp_path / 'new.rst'
+    new.write_text('.. code-block:: python\n\n    x = 2\n')
+
+    command = [sys.executable, '-m', 'rst_extract', 'diff']
+    changed = subprocess.run(
+        [*command, '--json', str(old), str(new)],
+        capture_output=True,
+        text=True,
+    )
+    unchanged = subprocess.run(
+        [*command, str(old), str(old)], capture_output=True, text=True
+    )
+
+    assert changed.returncode == 1
+    assert json.loads(changed.stdout)[0]['kind'] == 'modified'
+    assert json.loads(changed.stdout)[0]['new']['line'] == 3
+    assert unchanged.returncode == 0
+    assert not unchanged.stdout
+
+
+def test_block_store_and_dedup(tmp_path: Path):
+    """Test that shared blocks are stored once and identical code run once."""
+    code = ".. code-block:: python\n\n    print('run')\n"
+    documents = []
+    for name in ('a.rst', 'b.rst'):
+        documents.append(tmp_path / name)
+        documents[-1].write_text(code)
+
+    store = tmp_path / 'blocks.json'
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'rst_extract',
+            '-v',
+            '--execute',
+            '--dedup',
+            '--block-store',
+            str(store),
+            *map(str, documents),
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.count('Executing') == 1
+    assert result.stdout.count('run\n') == 2
+    data = json.loads(store.read_text())
+    assert len(data['blocks']) == 1
+    assert sorted(data['documents']) == sorted(map(str, documents))
+
+
+def test_index_query(tmp_path: Path):
+    """Test that indexed documents can be queried."""
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'random.rst').write_text(
+        '.. code-block:: python\n\n    import numpy.random\n'
+    )
+    index = tmp_path / 'index.sqlite3'
+    command = [sys.executable, '-m', 'rst_extract']
+
+    indexed = subprocess.run(
+        [*command, 'index', '--index', str(index), str(docs)],
+        capture_output=True,
+        text=True,
+    )
+    found = subprocess.run(
+        [*command, 'query', '--index', str(index), '--json', 'numpy'],
+        capture_output=True,
+        text=True,
+    )
+    missing = subprocess.run(
+        [*command, 'query', '--index', str(index), 'pandas'],
+        capture_output=True,
+        text=True,
+    )
+
+    assert 'Indexed 1 documents' in indexed.stdout, indexed.stderr
+    assert json.loads(found.stdout)[0]['line'] == 3
+    assert missing.returncode == 1
+
+
+def test_incremental(tmp_path: Path):
+    """Test that only changed blocks and their dependents are executed."""
+    document = tmp_path / 'doc.rst'
+    code = '.. code-block:: python\n\n    {}\n'
+    command = [
+        sys.executable,
+        '-m',
+        'rst_extract',
+        '-v',
+        '--execute',
+        '--incremental',
+        str(document),
+    ]
+    env = {**os.environ, 'PYTHONPATH': str(Path(__file__).parents[2])}
+
+    def _run(*blocks: str) -> str:
+        document.write_text('\n'.join(code.format(b) for b in blocks))
+        result = subprocess.run(
+            command, capture_output=True, text=True, cwd=tmp_path, env=env
+        )
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+
+    first = _run("print('a')", "print('b')")
+    second = _run("print('a')", "print('b')")
+    third = _run("print('a')", "print('c')")
+    # Only the second block runs: the traceback points at its line in the
+    # document, not in the code that ran.
+    fourth = _run("print('a')", "print('c'); 1 / 0")
+
+    assert 'Executing blocks 1, 2 of 2' in first
+    assert 'no block changed' in second
+    assert 'Executing blocks 2 of 2' in third
+    assert 'a\n' not in third
+    assert 'Executing blocks 2 of 2' in fourth
+    assert f'File "{document}", line 7' in fourth
+    assert '<string>' not in fourth
+    assert (tmp_path / '.rst-extract' / 'last-run.json').is_file()
+
+
+def test_incremental_record(tmp_path: Path):
+    """Test that --record keeps the runs wherever rst-extract runs from."""
+    document = tmp_path / 'doc.rst'
+    document.write_text(".. code-block:: python\n\n    print('a')\n")
+    record = tmp_path / 'runs.json'
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    command = [
+        sys.executable,
+        '-m',
+        'rst_extract',
+        '-v',
+        '--execute',
+        '--incremental',
+        '--record',
+        str(record),
+        str(document),
+    ]
+    env = {**os.environ, 'PYTHONPATH': str(Path(__file__).parents[2])}
+
+    first = subprocess.run(
+        command, capture_output=True, text=True, cwd=tmp_path, env=env
+    )
+    second = subprocess.run(
+        command, capture_output=True, text=True, cwd=elsewhere, env=env
+    )
+    without_incremental = subprocess.run(
+        [sys.executable, '-m', 'rst_extract', '--record', str(record)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+
+    assert 'Executing blocks 1 of 1' in first.stdout, first.stderr
+    assert 'no block changed' in second.stdout, second.stderr
+    assert record.is_file()
+    assert not (tmp_path / '.rst-extract').exists()
+    assert without_incremental.returncode == 2
+    assert '--record needs --incremental' in without_incremental.stderr
+
+
+def test_parallel_blocks(tmp_path: Path):
+    """Test that block output is reported in document order."""
+    document = tmp_path / 'doc.rst'
+    document.write_text(
+        '\n'.join(
+            f'.. code-block:: python\n\n    print({number})\n'
+            for number in range(5)
+        )
+    )
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'rst_extract',
+            '--execute',
+            '--parallel-blocks',
+            '-j',
+            '2',
+            str(document),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    conflicting = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'rst_extract',
+            '--parallel-blocks',
+            str(document),
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['0', '1', '2', '3', '4']
+    assert conflicting.returncode == 2
+    assert '--parallel-blocks needs --execute' in conflicting.stderr
+
+
+def test_subinterpreter_backend(tmp_path: Path):
+    """Test that documents run with the subinterpreter backend."""
+    documents = []
+    for number in range(2):
+        documents.append(tmp_path / f'doc{number}.rst')
+        documents[-1].write_text(
+            f'.. code-block:: python\n\n    print({number})\n'
+        )
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'rst_extract',
+            '--execute',
+            '--backend',
+            'subinterpreter',
+            *map(str, documents),
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['0', '1']
+
+
+def test_journal_resume(tmp_path: Path):
+    """Test that --resume skips the files recorded by --journal."""
+    documents = []
+    for number in range(3):
+        documents.append(tmp_path / f'doc{number}.rst')
+        documents[-1].write_text(
+            f'.. code-block:: python\n\n    print({number})\n'
+        )
+
+    journal = tmp_path / 'journal.jsonl'
+    command = [
+        sys.executable,
+        '-m',
+        'rst_extract',
+        '--execute',
+        '--journal',
+        str(journal),
+    ]
+
+    first = subprocess.run(
+        [*command, *map(str, documents[:2])], capture_output=True, text=True
+    )
+    resumed = subprocess.run(
+        [*command, '--resume', *map(str, documents)],
+        capture_output=True,
+        text=True,
+    )
+    entries = [json.loads(line) for line in journal.read_text().splitlines()]
+    without_journal = subprocess.run(
+        [sys.executable, '-m', 'rst_extract', '--resume', str(documents[0])],
+        capture_output=True,
+        text=True,
+    )
+
+    assert first.returncode == 0, first.stderr
+    assert first.stdout.split() == ['0', '1']
+    assert resumed.returncode == 0, resumed.stderr
+    assert resumed.stdout.split() == ['2']
+    assert [entry['document'] for entry in entries] == [
+        str(document.resolve()) for document in documents
+    ]
+    assert {entry['status'] for entry in entries} == {'passed'}
+    assert without_journal.returncode == 2
+    assert '--resume needs --journal' in without_journal.stderr
+
+
+def test_journal_resume_output(tmp_path: Path):
+    """Test that a resumed run keeps the output of the files done before."""
+    documents = []
+    for number in range(2):
+        documents.append(tmp_path / f'doc{number}.rst')
+        documents[-1].write_text(
+            f'.. code-block:: python\n\n    x = {number}\n'
+        )
+
+    output = tmp_path / 'out.py'
+    output.write_text('kept\n')
+    split = tmp_path / 'split'
+    command = [
+        sys.executable,
+        '-m',
+        'rst_extract',
+        '--journal',
+        str(tmp_path / 'journal.jsonl'),
+    ]
+
+    combined = subprocess.run(
+        [*command, '-o', str(output), str(documents[0])],
+        capture_output=True,
+        text=True,
+    )
+    first = subprocess.run(
+        [*command, '--split-output', str(split), str(documents[0])],
+        capture_output=True,
+        text=True,
+    )
+    resumed = subprocess.run(
+        [
+            *command,
+            '--resume',
+            '--split-output',
+            str(split),
+            *map(str, documents),
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    assert combined.returncode == 2
+    assert '--journal cannot be used with --output' in combined.stderr
+    assert output.read_text() == 'kept\n'
+    assert first.returncode == 0, first.stderr
+    assert resumed.returncode == 0, resumed.stderr
+    assert sorted(path.name for path in split.iterdir()) == [
+        'doc0.py',
+        'doc1.py',
+    ]
+    assert (split / 'doc0.py').read_text() == '# Block 1:\nx = 0\n'
+    assert (split / 'doc1.py').read_text() == '# Block 1:\nx = 1\n'
+
+
+def test_shard_merge(tmp_path: Path):
+    """Test that merged shards give the output of a single run."""
+    documents = []
+    for number in range(5):
+        documents.append(f'doc{number}.rst')
+        (tmp_path / documents[-1]).write_text(
+            f'.. code-block:: python\n\n    print({number})\n'
+        )
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, '-m', 'rst_extract', *args],
+            capture_output=True,
+            text=True,
+            cwd=tmp_path,
+            env={**os.environ, 'PYTHONPATH': os.getcwd()},
+        )
+
+    single = run('-o', 'single.py', *documents)
+    shards = [
+        run('--shard', f'{index}/2', '--result', f'{index}.json', *documents)
+        for index in (1, 2)
+    ]
+    merged = run('merge', '1.json', '2.json', '-o', 'merged.py')
+    incomplete = run('merge', '1.json')
+
+    assert single.returncode == 0, single.stderr
+    assert all(shard.returncode == 0 for shard in shards)
+    assert merged.returncode == 0, merged.stderr
+    assert (tmp_path / 'merged.py').read_text() == (
+        tmp_path / 'single.py'
+    ).read_text()
+    assert (
+        merged.stdout
+        == single.stdout + '\U0001f3c3 5 files: 0 passed, 0 failed.\n'
+    )
+    assert incomplete.returncode == 1
+    assert 'Expected the results of shards' in incomplete.stderr
+
+
+def test_history_stats(tmp_path: Path):
+    """Test that runs recorded in a history are shown by stats."""
+    for name in ('a.rst', 'b.rst'):
+        (tmp_path / name).write_text(
+            '.. code-block:: python\n\n    print(1)\n'
+        )
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, '-m', 'rst_extract', *args],
+            capture_output=True,
+            text=True,
+            cwd=tmp_path,
+            env={**os.environ, 'PYTHONPATH': os.getcwd()},
+        )
+
+    missing = run('stats')
+    runs = [
+        run('--execute', '--history', 'history.sqlite3', 'a.rst', 'b.rst')
+        for _ in range(2)
+    ]
+    text = run('stats', '--history', 'history.sqlite3')
+    stats = run('stats', '--history', 'history.sqlite3', '--json', 'a.rst')
+
+    assert missing.returncode == 1
+    assert 'No history at' in missing.stderr
+    assert all(result.returncode == 0 for result in runs), runs[0].stderr
+    assert 'Slowest files of run 2:' in text.stdout, text.stderr
+    assert 'Last 2 runs:' in text.stdout
+    assert [
+        summary['files'] for summary in json.loads(stats.stdout)['runs']
+    ] == [2, 2]
+    assert [
+        (timing['run'], timing['blocks'], timing['returncode'])
+        for timing in json.loads(stats.stdout)['trends']['a.rst']
+    ] == [(1, 1, 0), (2, 1, 0)]
+
+
+def test_fail_fast_failed_first(tmp_path: Path):
+    """Test that --fail-fast stops at a failure, run first next time."""
+    documents = ['a.rst', 'b.rst', 'c.rst']
+    for name in documents:
+        code = (
+            'raise ValueError' if name == 'b.rst' else f'print({name!r} * 2)'
+        )
+        (tmp_path / name).write_text(f'.. code-block:: python\n\n    {code}\n')
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, '-m', 'rst_extract', '--execute', *args],
+            capture_output=True,
+            text=True,
+            cwd=tmp_path,
+            env={**os.environ, 'PYTHONPATH': os.getcwd()},
+        )
+
+    first = run('--fail-fast', '--history', 'history.sqlite3', *documents)
+    second = run('--failed-first', '--history', 'history.sqlite3', *documents)
+    usage = run('--failed-first', *documents)
+
+    assert first.returncode == 1, first.stderr
+    assert 'a.rsta.rst' in first.stdout
+    assert 'c.rstc.rst' not in first.stdout
+    assert '1 files not executed' in first.stdout
+    # b.rst failed, and c.rst was never run: both run before a.rst.
+    assert second.returncode == 0, second.stderr
+    assert second.stdout.index('ValueError') < second.stdout.index(
+        'c.rstc.rst'
+    )
+    assert second.stdout.index('c.rstc.rst') < second.stdout.index(
+        'a.rsta.rst'
+    )
+    assert usage.returncode == 2
+    assert '--failed-first needs --history' in usage.stderr
@@ -0,0 +1,115 @@
+"""Tests for the analysis of code blocks."""
+
+import pytest
+
+from rst_extract.analysis import BlockGraph, BlockNames, block_names, def_use
+
+
+@pytest.mark.parametrize(
+    ('code', 'imports', 'defines'),
+    [
+        ('import os', {'os'}, set()),
+        ('import os.path', {'os.path'}, set()),
+        ('import numpy as np', {'numpy'}, set()),
+        (
+            'from numpy.random import default_rng as rng',
+            {'numpy.random', 'numpy.random.default_rng'},
+            set(),
+        ),
+        ('from . import utils', {'.', '.utils'}, set()),
+        ('from os import *', {'os'}, set()),
+        ('x, (y, z) = 1, (2, 3)', set(), {'x', 'y', 'z'}),
+        ('for i in range(3):\n    total = i', set(), {'i', 'total'}),
+        (
+            '@decorator(name := 1)\ndef f(a):\n    local = a',
+            set(),
+            {'f', 'name'},
+        ),
+        ('class A:\n    attribute = 1', set(), {'A'}),
+        ('squares = [n * n for n in range(3)]', set(), {'squares'}),
+        ('print(x)', set(), set()),
+    ],
+)
+def test_block_names(code: str, imports: set, defines: set) -> None:
+    names = block_names(code)
+
+    assert names == BlockNames(frozenset(imports), frozenset(defines))
+
+
+def test_block_names_invalid() -> None:
+    names = block_names('def f(:')
+
+    assert not names.valid
+    assert not names.imports
+    assert not names.defines
+
+
+@pytest.mark.parametrize(
+    ('code', 'binds', 'uses'),
+    [
+        ('import numpy as np\nx = np.zeros(3)', {'np', 'x'}, {'np'}),
+        ('total += value', {'total'}, {'total', 'value'}),
+        ('del cache', {'cache'}, set()),
+        ('print(len(items))', set(), {'items'}),
+        (
+            'def f():\n    global counter\n    counter = helper()',
+            {'f', 'counter'},
+            {'helper'},
+        ),
+    ],
+)
+def test_def_use(code: str, binds: set, uses: set) -> None:
+    names = def_use(code)
+
+    assert names.binds == binds
+    assert names.uses == uses
+    assert names.valid
+
+
+def test_block_graph() -> None:
+    graph = BlockGraph(
+        [
+            'import numpy as np',
+            'data = np.arange(3)',
+            'other = 1',
+            'data.sort()',
+            'print(data, other)',
+            'from os.path import *',
+            'print(join)',
+        ]
+    )
+
+    assert graph.dependencies == [
+        set(),
+        {0},
+        set(),
+        {1},
+        {1, 2, 3},
+        set(),
+        {5},
+    ]
+    assert graph.dependents([2]) == {2, 4}
+    assert graph.dependents([0]) == {0, 1, 3, 4}
+    assert graph.prerequisites([4]) == {0, 1, 2, 3, 4}
+
+
+def test_block_graph_invalid_block() -> None:
+    graph = BlockGraph(['x = 1', 'def f(:', 'y = 2'])
+
+    assert graph.dependencies == [set(), set(), {1}]
+
+
+def test_block_graph_groups() -> None:
+    graph = BlockGraph(
+        ['a = 1', 'b = 2', 'print(a)', 'c = 3', 'print(b)', 'print(a, b)']
+    )
+
+    assert graph.groups() == [[0, 1, 2, 4, 5], [3]]
+    assert BlockGraph(['x = 1', 'y = 2']).groups() == [[0], [1]]
+
+
+def test_block_graph_late_bound_global() -> None:
+    graph = BlockGraph(['def f():\n    return x', 'x = 2', 'print(f())'])
+
+    assert graph.dependencies == [set(), {0}, {0}]
+    assert graph.groups() == [[0, 1, 2]]
@@ -1,5 +1,7 @@
 """Test the API for rst-extract."""
 
+import subprocess
+import sys
 from pathlib import Path
 
 import pytest
@@ -104,3 +106,20 @@ def test_execute_code_with_imported_decorators(
     assert not err
 
     assert code_with_imported_decorators_rst_stdout.strip() == out.strip()
+
+
+def test_api_imports() -> None:
+    """The API does not import click and the command line interface."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-c',
+            'import sys, rst_extract.api; '
+            'print(sorted({"click", "rst_extract.cli"} & set(sys.modules)))',
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout == '[]\n'
@@ -0,0 +1,92 @@
+"""Tests for the output assembler."""
+
+import io
+
+import pytest
+
+from rst_extract.assembler import OutputAssembler, assemble, trim_bounds
+from rst_extract.sourcemap import SourceMap
+from rst_extract.spans import SourceLines
+
+
+@pytest.mark.parametrize(
+    'lines, bounds',
+    [
+        ([], (0, 0)),
+        (['', '  ', ''], (3, 3)),
+        (['a'], (0, 1)),
+        (['', '', 'a', '', 'b', '  ', ''], (2, 5)),
+    ],
+)
+def test_trim_bounds(lines: list[str], bounds: tuple[int, int]) -> None:
+    assert trim_bounds(lines) == bounds
+
+
+def test_trim_bounds_many_leading_empty_lines() -> None:
+    lines = [''] * 100_000 + ['print("Hello, World!")']
+    assert trim_bounds(lines) == (100_000, 100_001)
+
+
+def test_assemble_blocks() -> None:
+    blocks = [['', 'a = 1', ''], ['', ''], ['print(a)']]
+
+    result = assemble(blocks)
+
+    assert (
+        result == '# Block 1:\na = 1\n\n# Block 2:\n\n# Block 3:\nprint(a)\n'
+    )
+
+
+def test_assemble_no_blocks() -> None:
+    assert assemble([]) == ''
+
+
+def test_assembler_custom_header() -> None:
+    result = assemble([['a = 1']], header_template='#%% Example {number}')
+
+    assert result == '#%% Example 1\na = 1\n'
+
+
+def test_assembler_multiline_header() -> None:
+    source_map = SourceMap()
+    blocks = [
+        SourceLines(['a = 1'], [4], 'doc.rst'),
+        SourceLines(['b = 2'], [9], 'doc.rst'),
+    ]
+
+    result = assemble(
+        blocks, header_template='# %%\n# Block {number}', source_map=source_map
+    )
+
+    assert result.splitlines()[6] == 'b = 2'
+    assert source_map.lookup(3) == ('doc.rst', 5)
+    assert source_map.lookup(7) == ('doc.rst', 10)
+
+
+@pytest.mark.parametrize(
+    'template', ['{}', '{name}', '{number', '{number.x}', '{number[0]}']
+)
+def test_assembler_bad_header(template: str) -> None:
+    with pytest.raises(ValueError):
+        OutputAssembler(header_template=template)
+
+
+def test_assembler_writes_to_stream(tmp_path) -> None:
+    output = tmp_path / 'output.py'
+
+    with open(output, 'w') as f:
+        assembler = OutputAssembler(f)
+        assembler.write_blocks([['a = 1'], ['b = 2']])
+
+        with pytest.raises(TypeError):
+            assembler.getvalue()
+
+    assert output.read_text() == '# Block 1:\na = 1\n\n# Block 2:\nb = 2\n'
+
+
+def test_assembler_does_not_modify_input() -> None:
+    block = ['', 'a = 1', '']
+
+    _ = OutputAssembler(io.StringIO()).write_block(block)
+
+    assert block == ['', 'a = 1', '']
@@ -0,0 +1,214 @@
+"""Tests for the execution backends."""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from rst_extract import backends
+from rst_extract.backends import (
+    ProcessBackend,
+    SubinterpreterBackend,
+    WarmInterpreter,
+    get_backend,
+    run_in_interpreters,
+    subinterpreters_supported,
+)
+
+CODES = [
+    'print("first")',
+    'import sys\nprint("error", file=sys.stderr)\nraise SystemExit(3)',
+    '1 / 0',
+]
+
+
+def _check(results) -> None:
+    assert [result.returncode for result in results] == [0, 3, 1]
+    assert results[0].stdout == 'first\n'
+    assert results[1].stderr == 'error\n'
+    assert 'File "<string>", line 1' in results[2].stderr
+    assert 'ZeroDivisionError' in results[2].stderr
+
+
+def test_process_backend() -> None:
+    _check(ProcessBackend().run(CODES))
+
+
+def test_subinterpreter_backend() -> None:
+    # Falls back to processes where subinterpreters are not supported.
+    _check(SubinterpreterBackend(jobs=2).run(CODES))
+
+
+@pytest.mark.parametrize(
+    'backend', [ProcessBackend(), SubinterpreterBackend(jobs=1)]
+)
+def test_backend_fail_fast(
+    backend: ProcessBackend | SubinterpreterBackend,
+) -> None:
+    results = backend.run(CODES, fail_fast=True)
+
+    assert [result and result.returncode for result in results] == [
+        0,
+        3,
+        None,
+    ]
+
+
+@pytest.mark.skipif(
+    not subinterpreters_supported(), reason='Needs subinterpreters.'
+)
+def test_subinterpreters_are_isolated() -> None:
+    outputs = run_in_interpreters(
+        [
+            'import sys\nsys.shared = 1',
+            'import sys\nprint(hasattr(sys, "shared"))',
+        ]
+    )
+
+    assert outputs[1] is not None
+    assert outputs[1]['stdout'] == 'False\n'
+
+
+def test_run_in_interpreters(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    # Run the wrapper in fresh namespaces of this interpreter instead; one
+    # at a time, as they share its stdout and stderr.
+    monkeypatch.setattr(
+        backends,
+        '_interpreter_runner',
+        lambda: lambda script: exec(script, {}),
+    )
+    (tmp_path / 'no_subinterpreters.py').write_text(
+        'raise ImportError("module no_subinterpreters does not support '
+        'loading in subinterpreters")\n'
+    )
+    (tmp_path / 'prints.py').write_text('print("imported")\n')
+    (tmp_path / 'later').mkdir()
+    (tmp_path / 'later' / 'found_later.py').write_text('')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    marker = tmp_path / 'ran.txt'
+    side_effect = f'open({str(marker)!r}, "a").write("x")\n'
+
+    outputs = run_in_interpreters(
+        [
+            *CODES,
+            side_effect + 'import no_subinterpreters',
+            side_effect + '__import__("no_subinterpreters")',
+            'print("before")\nimport prints',
+            f'import sys\nsys.path.append({str(tmp_path / "later")!r})\n'
+            'import found_later',
+        ],
+        jobs=1,
+    )
+
+    assert [output and output['returncode'] for output in outputs] == [
+        0,
+        3,
+        1,
+        None,
+        None,
+        0,
+        0,
+    ]
+    assert outputs[0] is not None and outputs[0]['stdout'] == 'first\n'
+    # Both ran up to the import, which is when the module fails.
+    assert marker.read_text() == 'xx'
+    # Modules are imported when the code gets to them.
+    assert outputs[5] is not None
+    assert outputs[5]['stdout'] == 'before\nimported\n'
+
+
+def test_run_in_interpreters_ordered(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    def _run_in_interpreter(run: object, code: str) -> dict[str, object]:
+        if code != 'fail':
+            time.sleep(0.2)
+
+        return {'returncode': int(code == 'fail'), 'stdout': '', 'stderr': ''}
+
+    monkeypatch.setattr(backends, '_interpreter_runner', lambda: print)
+    monkeypatch.setattr(backends, '_run_in_interpreter', _run_in_interpreter)
+    # The failures of the last run first (--failed-first), though they are
+    # the smallest.
+    codes = ['fail', 'pass', 'pass' * 10, 'pass' * 20]
+
+    outputs = run_in_interpreters(codes, 2, fail_fast=True, ordered=True)
+
+    assert outputs[0] is not None and outputs[0]['returncode'] == 1
+    assert [output and output['returncode'] for output in outputs[2:]] == [
+        None,
+        None,
+    ]
+
+    # Largest first otherwise.
+    outputs = run_in_interpreters(codes, 2, fail_fast=True)
+
+    assert [output and output['returncode'] for output in outputs[2:]] == [
+        0,
+        0,
+    ]
+
+
+def test_run_in_interpreters_unsupported(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(backends, '_interpreter_runner', lambda: None)
+
+    assert run_in_interpreters(CODES) == [None, None, None]
+
+
+@pytest.mark.parametrize(
+    ('supported', 'python_bin', 'expected'),
+    [
+        (True, sys.executable, SubinterpreterBackend),
+        (False, sys.executable, ProcessBackend),
+        (True, '/usr/bin/other-python', ProcessBackend),
+    ],
+)
+def test_get_backend(
+    monkeypatch: pytest.MonkeyPatch,
+    supported: bool,
+    python_bin: str,
+    expected: type,
+) -> None:
+    monkeypatch.setattr(
+        backends, 'subinterpreters_supported', lambda: supported
+    )
+
+    backend = get_backend('subinterpreter', python_bin)
+
+    assert isinstance(backend, expected)
+    assert isinstance(get_backend('process'), ProcessBackend)
+
+
+@pytest.mark.skipif(not WarmInterpreter.supported(), reason='needs os.fork')
+def test_warm_interpreter() -> None:
+    interpreter = WarmInterpreter()
+
+    try:
+        _check([interpreter.run(code) for code in CODES])
+
+        # Each run forks the idle interpreter, so runs do not share state.
+        _ = interpreter.run('import json\njson.leak = 1')
+        result = interpreter.run('import json\nprint(hasattr(json, "leak"))')
+
+        assert result.stdout == 'False\n'
+
+        # As at the end of a process, the threads started are joined.
+        result = interpreter.run(
+            'import threading, time\n'
+            'def work():\n'
+            '    time.sleep(0.1)\n'
+            '    print("thread done")\n'
+            'threading.Thread(target=work).start()\n'
+            'print("main")\n'
+        )
+
+        assert result.stdout == 'main\nthread done\n'
+
+    finally:
+        interpreter.close()
+        interpreter.close()
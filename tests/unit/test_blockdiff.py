@@ -0,0 +1,142 @@
+"""Tests for the block-level diff."""
+
+import subprocess
+from collections.abc import Sequence
+from pathlib import Path
+
+import pytest
+
+from rst_extract.blockdiff import (
+    BlockRecord,
+    block_hash,
+    diff_blocks,
+    diff_files,
+    diff_revisions,
+    hash_blocks,
+)
+from rst_extract.spans import TextBuffer
+
+
+class _Unreadable(Sequence[str]):
+    """A block whose text must never be read."""
+
+    def __len__(self) -> int:
+        raise AssertionError('Block text was read.')
+
+    def __getitem__(self, index):
+        raise AssertionError('Block text was read.')
+
+
+def _records(*hashes: str) -> list[BlockRecord]:
+    return [
+        BlockRecord(hash, index, 'doc.rst', index + 1, _Unreadable())
+        for index, hash in enumerate(hashes)
+    ]
+
+
+def _summary(changes) -> list[tuple[str, int | None, int | None]]:
+    return [
+        (
+            change.kind,
+            change.old.index if change.old else None,
+            change.new.index if change.new else None,
+        )
+        for change in changes
+    ]
+
+
+def test_block_hash_normalises_whitespace() -> None:
+    assert block_hash(['x = 1', '', 'y = 2']) == block_hash(
+        ['', 'x = 1   ', '   ', 'y = 2', '']
+    )
+    assert block_hash(['x = 1']) != block_hash(['    x = 1'])
+
+
+def test_hash_blocks_locations() -> None:
+    buffer = TextBuffer('Text.\n\n    \n    x = 1\n', 'doc.rst')
+    block = buffer.lines(buffer.span(2, 4, 4))
+
+    (record,) = hash_blocks([block])
+
+    assert record.location == 'doc.rst:4'
+    assert record.hash == block_hash(['x = 1'])
+    assert hash_blocks([['x = 1']])[0].location == '<unknown> (block 1)'
+
+
+@pytest.mark.parametrize(
+    ('old', 'new', 'expected'),
+    [
+        ('abc', 'abc', []),
+        ('abc', 'cab', []),
+        ('abc', 'axc', [('modified', 1, 1)]),
+        ('abc', 'ac', [('removed', 1, None)]),
+        ('ac', 'abc', [('added', None, 1)]),
+        (
+            'abc',
+            'xyz',
+            [('modified', 0, 0), ('modified', 1, 1), ('modified', 2, 2)],
+        ),
+        ('ab', 'aab', [('added', None, 0)]),
+        ('ab', 'bxa', [('added', None, 1)]),
+        ('', 'a', [('added', None, 0)]),
+    ],
+)
+def test_diff_blocks(old: str, new: str, expected: list) -> None:
+    assert _summary(diff_blocks(_records(*old), _records(*new))) == expected
+
+
+def _code(*lines: str) -> str:
+    return '.. code-block:: python\n\n' + ''.join(f'    {x}\n' for x in lines)
+
+
+def test_diff_files(tmp_path: Path) -> None:
+    old = tmp_path / 'old.rst'
+    old.write_text(_code('import os') + '\n' + _code('x = 1'))
+    new = tmp_path / 'new.rst'
+    new.write_text(
+        'Intro.\n\n' + _code('import os  ') + '\n' + _code('x = 2', 'y = 3')
+    )
+
+    (change,) = diff_files(old, new)
+
+    assert change.kind == 'modified'
+    assert change.location == f'{old}:7 -> {new}:9'
+    assert list(change.unified_diff())[2:] == [
+        '@@ -1 +1,2 @@',
+        '-x = 1',
+        '+x = 2',
+        '+y = 3',
+    ]
+    assert [c.kind for c in diff_files(old, tmp_path / 'missing.rst')] == [
+        'removed',
+        'removed',
+    ]
+
+
+def test_diff_revisions(tmp_path: Path) -> None:
+    def _git(*args: str) -> None:
+        _ = subprocess.run(
+            ['git', *args], cwd=tmp_path, check=True, capture_output=True
+        )
+
+    _git('init', '-q')
+    _git('config', 'user.email', 'docs@example.com')
+    _git('config', 'user.name', 'Docs')
+    (tmp_path / 'same.rst').write_text(_code('same = 1'))
+    (tmp_path / 'setup.rst').write_text(_code('setup = 1'))
+    (tmp_path / 'index.rst').write_text('.. include:: setup.rst\n')
+    _git('add', '.')
+    _git('commit', '-q', '-m', 'First')
+    (tmp_path / 'setup.rst').write_text(_code('setup = 2'))
+    (tmp_path / 'new.rst').write_text(_code('new = 1'))
+    _git('add', '.')
+    _git('commit', '-q', '-m', 'Second')
+
+    changes = diff_revisions('HEAD~1', 'HEAD', cwd=tmp_path)
+
+    assert sorted(changes) == ['index.rst', 'new.rst', 'setup.rst']
+    assert changes['index.rst'][0].location == (
+        'HEAD~1:setup.rst:3 -> HEAD:setup.rst:3'
+    )
+    assert changes['new.rst'][0].kind == 'added'
+    assert diff_revisions('HEAD~1', 'HEAD', ['same.rst'], cwd=tmp_path) == {}
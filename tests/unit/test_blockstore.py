@@ -0,0 +1,151 @@
+"""Tests for the content-addressed block store."""
+
+import ast
+import json
+from pathlib import Path
+from typing import Literal
+
+import pytest
+
+from rst_extract.blockstore import (
+    BlockReference,
+    BlockStore,
+    BlockStoreError,
+    content_hash,
+    store_documents,
+)
+from rst_extract.extractor import Extractor
+from rst_extract.project import extract_documents
+
+
+def _code(*lines: str) -> str:
+    return '.. code-block:: python\n\n' + ''.join(f'    {x}\n' for x in lines)
+
+
+@pytest.fixture
+def documents(tmp_path: Path) -> list[Path]:
+    first = tmp_path / 'first.rst'
+    first.write_text(_code('import os') + '\n' + _code('x = 1'))
+    second = tmp_path / 'second.rst'
+    second.write_text('Text.\n\n' + _code('import os') + '\n' + _code('x = 2'))
+
+    return [first, second]
+
+
+def test_add_stores_blocks_once() -> None:
+    store = BlockStore()
+
+    first = store.add(['', 'import os', ''])
+    second = store.add(['import os'])
+
+    assert first == second == content_hash('import os')
+    assert len(store) == 1
+    assert store.uses(first) == 2
+    assert store.text(first) == 'import os'
+    assert store.shared() == [first]
+
+
+def test_store_documents(documents: list[Path]) -> None:
+    store = store_documents(documents)
+    first, second = (store.documents[str(path)] for path in documents)
+
+    assert len(store) == 3
+    assert first[0].hash == second[0].hash
+    assert store.shared() == [first[0].hash]
+    assert second[0] == BlockReference(first[0].hash, str(documents[1]), 5)
+
+    for path in documents:
+        assert store.assemble(path) == Extractor(path).extract()
+
+
+@pytest.mark.parametrize(
+    ('jobs', 'pool'), [(1, None), (2, 'process'), (2, 'thread')]
+)
+def test_store_extracted_blocks(
+    documents: list[Path], jobs: int, pool: Literal['process', 'thread'] | None
+) -> None:
+    expected = store_documents(documents).to_dict()
+    store = BlockStore()
+    _ = extract_documents(documents, jobs=jobs, pool=pool, store=store)
+
+    # Each distinct block is kept once.
+    assert len(store) == 3
+    assert sorted(store.documents) == sorted(map(str, documents))
+
+    # The extracted documents are not read again.
+    del store.documents[str(documents[1])]
+    documents[0].unlink()
+
+    assert store_documents(documents, store=store).to_dict() == expected
+
+
+def test_add_document_replaces_blocks() -> None:
+    store = BlockStore()
+    _ = store.add_document('doc.rst', [['x = 1'], ['y = 2']])
+    _ = store.add_document('doc.rst', [['x = 1']])
+
+    assert len(store) == 1
+    assert store.uses(content_hash('x = 1')) == 1
+
+
+def test_syntax_errors_parse_blocks_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    store = BlockStore()
+    for document in ('a.rst', 'b.rst', 'c.rst'):
+        _ = store.add_document(document, [['import os'], ['def f(:']])
+
+    parsed = []
+    parse = ast.parse
+
+    def _parse(text: str, **kwargs: object) -> ast.Module:
+        parsed.append(text)
+        return parse(text, **kwargs)
+
+    monkeypatch.setattr(ast, 'parse', _parse)
+
+    errors = store.syntax_errors()
+
+    assert sorted(parsed) == ['def f(:', 'import os']
+    assert [document for document, _, _ in errors] == [
+        'a.rst',
+        'b.rst',
+        'c.rst',
+    ]
+    assert all(isinstance(error, SyntaxError) for _, _, error in errors)
+
+
+def test_write_read(tmp_path: Path, documents: list[Path]) -> None:
+    store = store_documents(documents)
+    path = tmp_path / 'blocks.json'
+    store.write(path)
+
+    copy = BlockStore.read(path)
+
+    assert copy.to_dict() == store.to_dict()
+    assert copy.shared() == store.shared()
+    assert copy.assemble(documents[1]) == store.assemble(documents[1])
+
+
+@pytest.mark.parametrize(
+    'data',
+    [
+        [],
+        {'version': 0},
+        {'version': 1, 'blocks': {}},
+        {'version': 1, 'blocks': {}, 'documents': {'a.rst': [{'hash': 'x'}]}},
+        {
+            'version': 1,
+            'blocks': {},
+            'documents': {
+                'a.rst': [{'hash': 'x', 'source': None, 'line': None}]
+            },
+        },
+    ],
+)
+def test_read_invalid(tmp_path: Path, data: object) -> None:
+    path = tmp_path / 'blocks.json'
+    path.write_text(json.dumps(data))
+
+    with pytest.raises(BlockStoreError):
+        _ = BlockStore.read(path)
@@ -0,0 +1,277 @@
+"""Tests for the directive registry and single-pass scanner."""
+
+from pathlib import Path
+
+import pytest
+
+from rst_extract.directives import (
+    DirectiveRegistry,
+    default_registry,
+    handle_code,
+)
+from rst_extract.extractor import Extractor
+from rst_extract.spans import TextBuffer
+
+
+def _scan(text: str, path: Path | None = None) -> list[list[str]]:
+    buffer = TextBuffer(text, path)
+    return [list(block) for block in default_registry().scan(buffer)]
+
+
+@pytest.mark.parametrize(
+    'directive',
+    [
+        '.. code-block:: python',
+        '.. code-block:: py',
+        '.. code-block:: Python3',
+        '.. code:: python',
+        '.. code-block::python',
+        '.. sourcecode:: py3',
+        '.. ipython::',
+        '.. ipython:: python',
+    ],
+)
+def test_python_directives(directive: str) -> None:
+    text = f'{directive}\n\n    x = 1\n'
+
+    assert _scan(text) == [['x = 1']]
+
+
+@pytest.mark.parametrize(
+    'directive',
+    [
+        '.. code-block:: c',
+        '.. code::',
+        '.. code-block:: pythonic',
+        '.. highlight:: python',
+        '..code-block:: python',
+    ],
+)
+def test_ignored_directives(directive: str) -> None:
+    text = f'{directive}\n\n    x = 1\n'
+
+    assert _scan(text) == []
+
+
+def test_pattern_classifies_markup() -> None:
+    pattern = default_registry().pattern
+
+    def groups(line: str) -> tuple[str | None, str | None]:
+        match = pattern.match(line)
+        assert match is not None
+        comment = match.group('comment')
+        return match.group('name'), comment and comment.strip()
+
+    assert groups('.. code-block:: python') == ('code-block', None)
+    assert groups('   .. code:: py') == ('code', None)
+    assert groups('.. code-block::python') == ('code-block', None)
+    assert pattern.match('.. code-block::python').group('argument') == (
+        'python'
+    )
+    assert groups('..') == (None, '')
+    assert groups('.. a comment') == (None, 'a comment')
+
+    for line in ('.. note::', '.. _target:', '.. |sub| replace:: x', '.. [1]'):
+        assert pattern.match(line) is None
+
+
+def test_nested_directives() -> None:
+    text = (
+        '.. note::\n'
+        '\n'
+        '    .. code-block:: python\n'
+        '\n'
+        '        x = 1\n'
+        '\n'
+        '    Some text in the note.\n'
+        '\n'
+        '..\n'
+        '    .. code-block:: python\n'
+        '\n'
+        '        commented_out = True\n'
+        '\n'
+        '.. code-block:: rst\n'
+        '\n'
+        '    .. code-block:: python\n'
+        '\n'
+        '        not_python = True\n'
+        '\n'
+        '.. code-block:: python\n'
+        '\n'
+        '    y = 2\n'
+    )
+
+    assert _scan(text) == [['x = 1'], ['y = 2']]
+
+
+def test_ipython_session() -> None:
+    text = (
+        '.. ipython::\n'
+        '    :suppress:\n'
+        '\n'
+        '    In [1]: x = [1, 2]\n'
+        '\n'
+        '    In [2]: for i in x:\n'
+        '       ...:     print(i)\n'
+        '       ...:\n'
+        '    1\n'
+        '    2\n'
+        '\n'
+        '    In [3]: %timeit x\n'
+        '\n'
+        '    In [4]: x\n'
+        '    Out[4]: [1, 2]\n'
+    )
+
+    blocks = default_registry().scan(TextBuffer(text))
+    (block,) = list(blocks)
+
+    assert list(block) == [
+        'x = [1, 2]',
+        'for i in x:',
+        '    print(i)',
+        '',
+        '# %timeit x',
+        'x',
+    ]
+    assert block.line_numbers == [3, 5, 6, 7, 11, 13]
+
+
+def test_ipython_plain_code() -> None:
+    text = '.. ipython:: python\n\n    @savefig plot.png\n    plot(x)\n'
+
+    assert _scan(text) == [['plot(x)']]
+
+
+def test_literalinclude(tmp_path: Path) -> None:
+    (tmp_path / 'example.py').write_text('import os\nprint(os.sep)\n')
+    (tmp_path / 'example.txt').write_text('not code\n')
+    document = tmp_path / 'doc.rst'
+
+    text = (
+        '.. literalinclude:: example.py\n'
+        '\n'
+        '.. literalinclude:: example.txt\n'
+        '\n'
+        '.. literalinclude:: example.txt\n'
+        '    :language: python\n'
+        '\n'
+        '.. literalinclude:: missing.py\n'
+    )
+
+    assert _scan(text, document) == [
+        ['import os', 'print(os.sep)'],
+        ['not code'],
+    ]
+
+
+EXAMPLE = """\
+import os
+
+
+@decorator
+def helper():
+    return os.sep
+
+
+class Example:
+    # start here
+    def method(self):
+        return 1
+
+    # end here
+"""
+
+
+@pytest.mark.parametrize(
+    ('options', 'expected'),
+    [
+        (':lines: 1, 4-5', ['import os', '@decorator', 'def helper():']),
+        (':lines: 12-', ['        return 1', '', '    # end here']),
+        (
+            ':pyobject: helper',
+            ['@decorator', 'def helper():', '    return os.sep'],
+        ),
+        (
+            ':pyobject: Example.method\n    :dedent:',
+            ['def method(self):', '    return 1'],
+        ),
+        (
+            ':start-after: start here\n    :end-before: end here\n'
+            '    :dedent: 4',
+            ['def method(self):', '    return 1', ''],
+        ),
+        (
+            ':start-at: class Example\n    :end-at: def method',
+            ['class Example:', '    # start here', '    def method(self):'],
+        ),
+        (':linenos:\n    :emphasize-lines: 1', EXAMPLE.splitlines()),
+    ],
+)
+def test_literalinclude_options(
+    tmp_path: Path, options: str, expected: list[str]
+) -> None:
+    (tmp_path / 'example.py').write_text(EXAMPLE)
+    text = f'.. literalinclude:: example.py\n    {options}\n'
+
+    assert _scan(text, tmp_path / 'doc.rst') == [expected]
+
+
+@pytest.mark.parametrize(
+    'options',
+    [
+        ':pyobject: missing',
+        ':start-after: no such line',
+        ':lines: 40-50',
+        ':lines: 1-x',
+        ':dedent: 8',
+        ':pyobject: helper\n    :lines: 1',
+        ':prepend: import sys',
+        ':diff: other.py',
+        ':encoding: latin-1',
+    ],
+)
+def test_literalinclude_unsupported_options(
+    tmp_path: Path, options: str
+) -> None:
+    (tmp_path / 'example.py').write_text(EXAMPLE)
+    text = f'.. literalinclude:: example.py\n    {options}\n'
+
+    assert _scan(text, tmp_path / 'doc.rst') == []
+
+
+def test_literalinclude_source_map(tmp_path: Path) -> None:
+    (tmp_path / 'example.py').write_text('\n\nx = 1\n')
+    document = tmp_path / 'doc.rst'
+    document.write_text('.. literalinclude:: example.py\n')
+
+    ext = Extractor(document)
+
+    assert ext.extract() == '# Block 1:\nx = 1\n'
+    assert ext.source_map.lookup(2) == (str(tmp_path / 'example.py'), 3)
+
+    (tmp_path / 'example.py').write_text(EXAMPLE)
+    document.write_text(
+        '.. literalinclude:: example.py\n    :pyobject: Example.method\n'
+        '    :dedent:\n'
+    )
+    ext = Extractor(document)
+
+    assert ext.extract() == ('# Block 1:\ndef method(self):\n    return 1\n')
+    assert ext.source_map.lookup(3) == (str(tmp_path / 'example.py'), 12)
+
+
+def test_custom_registry(tmp_path: Path) -> None:
+    registry = DirectiveRegistry()
+    registry.register('example', handle_code)
+    document = tmp_path / 'doc.rst'
+    document.write_text(
+        '.. example:: python\n\n    x = 1\n\n'
+        '.. code-block:: python\n\n    y = 2\n'
+    )
+
+    assert 'example' in registry
+    assert registry.names == ['example']
+    assert Extractor(document, registry=registry).extract() == (
+        '# Block 1:\nx = 1\n'
+    )
@@ -0,0 +1,160 @@
+"""Tests for doctest extraction and execution."""
+
+from pathlib import Path
+
+import pytest
+
+from rst_extract.doctests import (
+    DoctestLines,
+    check_file,
+    doctest_registry,
+    run_doctests,
+)
+from rst_extract.extractor import Extractor
+from rst_extract.spans import TextBuffer
+
+_PASSING = (
+    'Some text.\n'
+    '\n'
+    '>>> x = 1\n'
+    '>>> for i in range(2):\n'
+    '...     print(i + x)\n'
+    '1\n'
+    '2\n'
+    '\n'
+    '.. note::\n'
+    '\n'
+    '    >>> x\n'
+    '    1\n'
+    '\n'
+    '.. doctest::\n'
+    '    :options: +SKIP\n'
+    '\n'
+    '    >>> print("a long line")  # doctest: +ELLIPSIS\n'
+    '    a ... line\n'
+    '\n'
+    '.. code-block:: python\n'
+    '\n'
+    '    >>> not_a_doctest = True\n'
+)
+
+_FAILING = '>>> 1 + 1\n3\n\nText.\n\n>>> 2 + 2\n4\n'
+
+
+@pytest.fixture()
+def passing_rst(tmp_path: Path) -> Path:
+    path = tmp_path / 'passing.rst'
+    path.write_text(_PASSING)
+    return path
+
+
+@pytest.fixture()
+def failing_rst(tmp_path: Path) -> Path:
+    path = tmp_path / 'failing.rst'
+    path.write_text(_FAILING)
+    return path
+
+
+def test_doctest_blocks_are_scanned() -> None:
+    blocks = list(doctest_registry().scan(TextBuffer(_PASSING)))
+
+    doctests = [block for block in blocks if isinstance(block, DoctestLines)]
+
+    assert [list(block) for block in doctests] == [
+        ['x = 1', 'for i in range(2):', '    print(i + x)'],
+        ['x'],
+        ['print("a long line")  # doctest: +ELLIPSIS'],
+    ]
+    assert doctests[0].line_numbers == [2, 3, 4]
+    assert [example.want for example in doctests[0].examples] == [
+        '',
+        '1\n2\n',
+    ]
+    assert [example.lineno for example in doctests[0].examples] == [2, 3]
+    assert len(blocks) == 4
+
+
+def test_extract_with_doctests(passing_rst: Path) -> None:
+    default = Extractor(passing_rst).extract()
+    with_doctests = Extractor(passing_rst, registry=doctest_registry())
+
+    assert 'x = 1' not in default
+    assert with_doctests.extract().startswith('# Block 1:\nx = 1\n')
+    assert with_doctests.source_map.lookup(2) == (str(passing_rst), 3)
+
+
+def test_invalid_doctest_is_skipped() -> None:
+    blocks = list(doctest_registry().scan(TextBuffer('>>> x = 1\n...x\n')))
+
+    assert blocks == []
+
+
+def test_check_file(passing_rst: Path, failing_rst: Path) -> None:
+    passing = check_file(passing_rst)
+    failing = check_file(failing_rst)
+
+    # The example in the python code block is checked too.
+    assert (passing.attempted, passing.failed) == (5, 0)
+    assert not passing.report
+
+    assert (failing.attempted, failing.failed) == (2, 1)
+    assert f'File "{failing_rst}", line 1' in failing.report
+
+
+def test_check_file_code_blocks(tmp_path: Path) -> None:
+    path = tmp_path / 'blocks.rst'
+    path.write_text(
+        '>>> x = 1\n'
+        '\n'
+        '.. code-block:: pycon\n'
+        '\n'
+        '    >>> x + 1\n'
+        '    3\n'
+        '\n'
+        '.. code:: python\n'
+        '\n'
+        '    >>> print(x)\n'
+        '    1\n'
+        '\n'
+        '.. code-block:: text\n'
+        '\n'
+        '    >>> not run\n'
+    )
+
+    result = check_file(path)
+
+    assert (result.attempted, result.failed) == (3, 1)
+    assert 'line 5' in result.report
+    # Extraction still skips pycon code blocks.
+    code = Extractor(path, registry=doctest_registry()).extract()
+    assert 'x + 1' not in code
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_doctests(passing_rst: Path, failing_rst: Path, jobs: int) -> None:
+    results = run_doctests([failing_rst, passing_rst], jobs=jobs)
+
+    assert [result.filename for result in results] == [
+        str(failing_rst),
+        str(passing_rst),
+    ]
+    assert [result.failed for result in results] == [1, 0]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_doctests_unreadable(
+    passing_rst: Path, tmp_path: Path, jobs: int
+) -> None:
+    latin1 = tmp_path / 'latin1.rst'
+    latin1.write_bytes('>>> "é"\n'.encode('latin-1'))
+    missing = tmp_path / 'missing.rst'
+
+    results = run_doctests([latin1, missing, passing_rst], jobs=jobs)
+
+    assert [(result.attempted, result.failed) for result in results] == [
+        (0, 1),
+        (0, 1),
+        (5, 0),
+    ]
+    assert 'codec' in results[0].report
+    assert 'No such file' in results[1].report
@@ -2,13 +2,20 @@
 
 # Ignore type hinting in mypy
 # mypy: ignore-errors
+import io
+from concurrent.futures import ThreadPoolExecutor
 from os.path import join
 
 import pytest
 from hypothesis import given
 from hypothesis import strategies as st
 
-from rst_extract.extractor import ExtractionError, Extractor
+from rst_extract.extractor import (
+    ExtractionError,
+    Extractor,
+    extract_blocks,
+    extract_code,
+)
 
 _NUMBER_ST = st.one_of(st.integers(), st.floats())
 
@@ -103,6 +110,29 @@ class _CodeBlockLiterals:
         'print("Hello, world!")\n'
     )
 
+    _literal5 = (
+        '.. code-block:: python\n'
+        '    :caption: Greeting\n'
+        '    :emphasize-lines: 2\n'
+        '\n'
+        '    print("Hello, world!")\n'
+        '    print("Goodbye, world!")\n'
+        'Some text right after the block.\n'
+    )
+
+    _literal5_result = (
+        '# Block 1:\nprint("Hello, world!")\nprint("Goodbye, world!")\n'
+    )
+
+    _literal6 = (
+        '.. code-block:: python\r\n'
+        '\r\n'
+        '    if True:\r\n'
+        '        print("Hello, world!")\r\n'
+    )
+
+    _literal6_result = '# Block 1:\nif True:\n    print("Hello, world!")\n'
+
     @classmethod
     def literals(cls):
         all_attrs = dir(cls)
@@ -127,7 +157,7 @@ def test_extract_code_blocks_literals(number, prompt, result, tmp_path):
     """Test the Extractor class with code block literals."""
     temp_file = join(tmp_path, f'literal{number}.rst')
 
-    with open(temp_file, 'w+') as f:
+    with open(temp_file, 'w+', newline='') as f:
         f.write(prompt)
 
     ext = Extractor(temp_file)
@@ -135,3 +165,55 @@ def test_extract_code_blocks_literals(number, prompt, result, tmp_path):
     extracted = ext.extract()
 
     assert extracted == result
+
+
+def test_extract_to_stream(
+    complex_code_block_rst, complex_code_block_rst_result
+):
+    """Test extracting straight to a stream."""
+    stream = io.StringIO()
+
+    Extractor(complex_code_block_rst).extract_to(stream)
+
+    assert complex_code_block_rst_result in stream.getvalue()
+    assert stream.getvalue() == Extractor(complex_code_block_rst).extract()
+
+
+def test_extract_header_template(code_only_rst):
+    """Test the Extractor class with a custom header template."""
+    ext = Extractor(code_only_rst, header_template='# %% {number}')
+
+    assert ext.extract().startswith('# %% 1\n')
+
+
+def test_extract_code(complex_code_block_rst, complex_code_block_rst_result):
+    """Test that extract_code matches the Extractor, with no file."""
+    with open(complex_code_block_rst) as f:
+        text = f.read()
+
+    code, source_map = extract_code(text, complex_code_block_rst)
+    unnamed, _ = extract_code(text)
+
+    assert complex_code_block_rst_result in code
+    assert code == Extractor(complex_code_block_rst).extract()
+    assert code == unnamed
+    assert len(source_map) == len(code.splitlines())
+    assert extract_blocks('no code here\n') == []
+
+
+def test_extract_code_concurrently():
+    """Test that concurrent extractions do not affect each other."""
+    texts = [
+        ''.join(
+            f'.. code-block:: python\n\n    x_{number}_{block} = {block}\n\n'
+            for block in range(number % 7 + 1)
+        )
+        for number in range(500)
+    ]
+    expected = [extract_code(text)[0] for text in texts]
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        for _ in range(4):
+            results = list(executor.map(extract_code, texts))
+
+            assert [code for code, _ in results] == expected
@@ -0,0 +1,113 @@
+"""Tests for the vectorised line scan, against the pure-python scan."""
+
+import pytest
+
+from rst_extract.directives import default_registry
+from rst_extract.spans import TextBuffer
+
+_ = pytest.importorskip('numpy')
+
+_DOCUMENT = """\
+Title
+=====
+
+.. code-block:: python
+
+    def f(x):
+        if x:
+
+            return x
+    \\t
+        return 0
+
+Text.
+
+.. note::
+
+   .. code:: python
+
+      print('nested')
+
+   More text.
+
+.. code-block:: javascript
+
+    let x = 1;
+
+.. ipython:: python
+
+    In [1]: x = 1
+
+Literal::
+
+    y = 2
+"""
+
+_TEXTS = [
+    '',
+    'a',
+    'a\n',
+    '\n\n',
+    '   ',
+    'a\r\nb\r\n  c\r\n',
+    'a\rb\n  \r\n\r',
+    '\t\tx\n \t y\n',
+    '　 x\n \nété\n',
+    '\U0001f600\n  \U0001f600\n',
+    ' ' * 100 + 'deep\n' + ' ' * 70 + '\n' + '\t' * 65,
+    '\xa0 x\n\u2003\n  \u3000\ty\n\x85\n é\n',
+    ' ' * 70 + '\xa0x\n' + ' ' * 66 + 'é\n',
+    'a\n  b\n    c\n      d\n   e\n\n f\n      g\ng\n',
+    _DOCUMENT,
+    _DOCUMENT.replace('\n', '\r\n'),
+    _DOCUMENT.replace('    ', '\t'),
+    _DOCUMENT.replace('Text.', 'Été ☃.'),
+    _DOCUMENT * 3 + '.. code:: python\n\n' + '    x = 1\n' * 500,
+]
+
+
+@pytest.mark.parametrize('text', _TEXTS, ids=range(len(_TEXTS)))
+def test_lines_match_pure_scan(text: str) -> None:
+    pure = TextBuffer(text, fast=False)
+    fast = TextBuffer(text, fast=True)
+    lines = range(len(pure))
+
+    assert len(fast) == len(pure)
+    assert [fast.line(i) for i in lines] == [pure.line(i) for i in lines]
+    assert [fast.indent_of(i) for i in lines] == [
+        pure.indent_of(i) for i in lines
+    ]
+    assert [fast.is_blank(i) for i in lines] == [
+        pure.is_blank(i) for i in lines
+    ]
+
+    for line in range(len(pure) + 1):
+        for indent in (None, 0, 1, 3, 4, 8, 100):
+            assert fast.next_line(line, indent) == pure.next_line(line, indent)
+
+
+@pytest.mark.parametrize('text', _TEXTS, ids=range(len(_TEXTS)))
+def test_blocks_match_pure_scan(text: str) -> None:
+    registry = default_registry()
+
+    fast = registry.scan(TextBuffer(text, fast=True))
+    pure = registry.scan(TextBuffer(text, fast=False))
+
+    assert [(list(b), b.line_numbers) for b in fast] == [
+        (list(b), b.line_numbers) for b in pure
+    ]
+
+
+def test_large_text_is_scanned_fast(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr('rst_extract.fastscan.MIN_SIZE', len(_DOCUMENT))
+
+    assert TextBuffer(_DOCUMENT)._index is not None
+    assert TextBuffer(_DOCUMENT[:-1])._index is None
+
+
+def test_buffer_uses_index_arrays() -> None:
+    buffer = TextBuffer(_DOCUMENT, fast=True)
+
+    assert buffer._index is not None
+    assert buffer._line_starts is buffer._index.starts
+    assert buffer._indents is buffer._index.indents
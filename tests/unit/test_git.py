@@ -0,0 +1,132 @@
+"""Tests for finding the documents affected by git changes."""
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from rst_extract import git
+from rst_extract.git import (
+    BlobReader,
+    GitError,
+    affected_documents,
+    changed_files,
+    including_documents,
+    tree_files,
+)
+
+_CODE = '.. code-block:: python\n\n    x = 1\n'
+
+
+def _run(repo: Path, *args: str) -> None:
+    _ = subprocess.run(
+        ['git', *args], cwd=repo, check=True, capture_output=True
+    )
+
+
+@pytest.fixture()
+def repo(tmp_path: Path) -> Path:
+    _run(tmp_path, 'init', '-q')
+    _run(tmp_path, 'config', 'user.email', 'docs@example.com')
+    _run(tmp_path, 'config', 'user.name', 'Docs')
+
+    (tmp_path / 'docs').mkdir()
+    (tmp_path / 'docs' / 'index.rst').write_text(_CODE)
+    (tmp_path / 'docs' / 'setup.rst').write_text(_CODE)
+    (tmp_path / 'docs' / 'usage.rst').write_text(
+        '.. include:: setup.rst\n\n.. literalinclude:: ../example.py\n'
+    )
+    (tmp_path / 'docs' / 'other.rst').write_text(_CODE)
+    (tmp_path / 'example.py').write_text('print("example")\n')
+
+    _run(tmp_path, 'add', '.')
+    _run(tmp_path, 'commit', '-q', '-m', 'Initial commit')
+
+    return tmp_path.resolve()
+
+
+def test_no_changes(repo: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def _fail(*args: object) -> None:
+        raise AssertionError('Documents were scanned.')
+
+    monkeypatch.setattr(git, 'including_documents', _fail)
+
+    assert changed_files(cwd=repo) == []
+    assert affected_documents(cwd=repo) == []
+    assert affected_documents(staged=True, cwd=repo) == []
+
+    # Files no document mentions cannot be included.
+    (repo / 'setup.cfg').write_text('[metadata]\n')
+    (repo / 'example.txt').write_text('example\n')
+
+    assert affected_documents(cwd=repo) == []
+
+
+def test_changed_document(repo: Path) -> None:
+    (repo / 'docs' / 'other.rst').write_text(_CODE + '    y = 2\n')
+    (repo / 'docs' / 'new.rst').write_text(_CODE)
+
+    assert affected_documents(cwd=repo) == [
+        repo / 'docs' / 'new.rst',
+        repo / 'docs' / 'other.rst',
+    ]
+    assert affected_documents(staged=True, cwd=repo) == []
+
+
+def test_included_files(repo: Path) -> None:
+    (repo / 'docs' / 'setup.rst').write_text(_CODE + '    y = 2\n')
+    _run(repo, 'add', 'docs/setup.rst')
+    (repo / 'example.py').write_text('print("changed")\n')
+
+    assert affected_documents(staged=True, cwd=repo) == [
+        repo / 'docs' / 'setup.rst',
+        repo / 'docs' / 'usage.rst',
+    ]
+
+    _run(repo, 'reset', '-q')
+    _run(repo, 'checkout', '-q', '--', 'docs/setup.rst')
+
+    assert affected_documents(cwd=repo) == [repo / 'docs' / 'usage.rst']
+
+
+def test_changed_since(repo: Path) -> None:
+    (repo / 'docs' / 'index.rst').write_text(_CODE + '    y = 2\n')
+    _run(repo, 'commit', '-q', '-am', 'Change index')
+
+    assert affected_documents(cwd=repo) == []
+    assert affected_documents('HEAD~1', cwd=repo) == [
+        repo / 'docs' / 'index.rst'
+    ]
+
+
+def test_deleted_files(repo: Path) -> None:
+    (repo / 'docs' / 'other.rst').unlink()
+    (repo / 'example.py').unlink()
+
+    assert affected_documents(cwd=repo) == [repo / 'docs' / 'usage.rst']
+
+
+def test_including_documents(repo: Path) -> None:
+    assert including_documents(repo) == [repo / 'docs' / 'usage.rst']
+
+
+def test_not_a_repository(tmp_path: Path) -> None:
+    with pytest.raises(GitError):
+        _ = changed_files(cwd=tmp_path)
+
+
+def test_blob_reader(repo: Path) -> None:
+    files = tree_files('HEAD', repo)
+
+    with BlobReader(repo) as reader:
+        assert reader.read(files['example.py']) == b'print("example")\n'
+        assert reader.read('HEAD:docs/index.rst') == _CODE.encode()
+        assert reader.read('HEAD:missing.rst') is None
+
+    assert sorted(files) == [
+        'docs/index.rst',
+        'docs/other.rst',
+        'docs/setup.rst',
+        'docs/usage.rst',
+        'example.py',
+    ]
@@ -0,0 +1,183 @@
+"""Tests for the SQLite run history."""
+
+import os
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from rst_extract.history import (
+    LastRun,
+    RunHistory,
+    RunHistoryError,
+    failures_first,
+)
+from rst_extract.sharding import FileResult
+from rst_extract.sourcemap import SourceMap
+
+
+def _result(
+    duration: float, extract: float = 0.0, returncode: int | None = 0
+) -> FileResult:
+    return FileResult('', SourceMap(), returncode, duration, extract)
+
+
+@pytest.fixture
+def history(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[RunHistory]:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'doc.rst').write_text(
+        '.. code-block:: python\n\n    x = 1\n\n>>> x\n'
+    )
+
+    with RunHistory(tmp_path / 'history.sqlite3') as history:
+        yield history
+
+
+def test_record(history: RunHistory) -> None:
+    first = history.record(
+        {'doc.rst': _result(2.0, 0.5), 'missing.rst': _result(1.0, 1.0, None)},
+        started=100.0,
+    )
+    second = history.record({'doc.rst': _result(3.0, 0.5, 1)}, started=200.0)
+
+    doc, missing = history.timings(first)
+
+    assert (first, second) == (1, 2)
+    assert (doc.size, doc.blocks) == (41, 2)
+    assert (doc.extract_time, doc.execute_time, doc.duration) == (0.5, 1.5, 2)
+    assert (missing.size, missing.execute_time, missing.duration) == (
+        None,
+        None,
+        1.0,
+    )
+    assert [tuple(run) for run in history.runs()] == [
+        (1, 100.0, 2, 0, 3.0),
+        (2, 200.0, 1, 1, 3.0),
+    ]
+    assert [run.id for run in history.runs(1)] == [2]
+    assert [t.duration for t in history.trend('doc.rst')] == [2.0, 3.0]
+    assert [t.document for t in history.timings()] == ['doc.rst']
+
+
+def test_record_keeps_last_runs(history: RunHistory) -> None:
+    for duration in range(5):
+        _ = history.record({'doc.rst': _result(duration)}, keep=3)
+
+    assert [run.id for run in history.runs()] == [3, 4, 5]
+    assert [t.run for t in history.trend('doc.rst')] == [3, 4, 5]
+
+
+def test_slowest(history: RunHistory) -> None:
+    _ = history.record({'a.rst': _result(9.0), 'b.rst': _result(1.0)})
+    _ = history.record(
+        {'a.rst': _result(1.0), 'b.rst': _result(2.0), 'c.rst': _result(3.0)}
+    )
+
+    assert [t.document for t in history.slowest(2)] == ['c.rst', 'b.rst']
+    assert [t.document for t in history.slowest(run=1)] == ['a.rst', 'b.rst']
+
+
+def test_regressions(history: RunHistory) -> None:
+    for durations in ([1.0, 1.0, 0.001], [1.2, 1.0, 0.001], [1.1, 1.0, 0.1]):
+        _ = history.record(
+            {
+                'slower.rst': _result(durations[0]),
+                'steady.rst': _result(durations[1]),
+                'fast.rst': _result(durations[2]),
+            }
+        )
+
+    _ = history.record(
+        {
+            'slower.rst': _result(3.3),
+            'steady.rst': _result(1.2),
+            'fast.rst': _result(0.005),
+            'new.rst': _result(5.0),
+        }
+    )
+
+    # fast.rst is 5x slower than its median, but by less than 10 ms.
+    assert [tuple(r) for r in history.regressions()] == [
+        ('slower.rst', 1.1, 3.3),
+    ]
+    assert history.regressions()[0].ratio == pytest.approx(3.0)
+    assert [r.document for r in history.regressions(1.1)] == [
+        'slower.rst',
+        'steady.rst',
+    ]
+    assert history.regressions(window=1) == history.regressions()
+
+
+def test_runtimes(history: RunHistory) -> None:
+    for duration in (1.0, 5.0, 2.0):
+        _ = history.record(
+            {
+                'doc.rst': _result(duration, 0.1 * duration),
+                'old.rst': _result(9.0),
+            }
+        )
+
+    assert history.runtimes() == {'doc.rst': 2.0, 'old.rst': 9.0}
+    assert history.runtimes(window=1) == {'doc.rst': 2.0, 'old.rst': 9.0}
+    assert history.runtimes(execution=False)['doc.rst'] == pytest.approx(0.2)
+
+
+def test_last_runs(history: RunHistory) -> None:
+    _ = history.record(
+        {'a.rst': _result(1.0, returncode=1), 'b.rst': _result(1.0)},
+        started=100.0,
+    )
+    _ = history.record({'a.rst': _result(1.0, returncode=None)}, started=200.0)
+
+    assert history.last_runs() == {
+        'a.rst': LastRun(200.0, None),
+        'b.rst': LastRun(100.0, 0),
+    }
+
+
+def test_failures_first(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    names = ['same', 'failed', 'changed', 'new', 'failed_recently', 'older']
+    paths = [tmp_path / f'{name}.rst' for name in names]
+
+    for age, path in enumerate(reversed(paths)):
+        path.write_text('')
+        os.utime(path, (1000 - age, 1000 - age))
+
+    last_runs = {
+        'same.rst': LastRun(2000.0, 0),
+        'failed.rst': LastRun(2000.0, 1),
+        'changed.rst': LastRun(500.0, 0),
+        'failed_recently.rst': LastRun(3000.0, 1),
+        'older.rst': LastRun(2000.0, None),
+    }
+
+    ordered = failures_first(paths, last_runs)
+
+    assert [path.stem for path in ordered] == [
+        'failed_recently',
+        'failed',
+        'new',
+        'changed',
+        'same',
+        'older',
+    ]
+
+
+def test_empty_history(history: RunHistory) -> None:
+    assert history.runs() == []
+    assert history.slowest() == []
+    assert history.regressions() == []
+    assert history.runtimes() == {}
+
+
+def test_invalid_history(tmp_path: Path) -> None:
+    path = tmp_path / 'history.sqlite3'
+    path.write_bytes(os.urandom(512))
+
+    with pytest.raises(RunHistoryError, match='Cannot open'):
+        _ = RunHistory(path)
@@ -0,0 +1,136 @@
+"""Tests for include resolution and the include graph."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from rst_extract import includes
+from rst_extract.extractor import ExtractionError, Extractor
+from rst_extract.includes import IncludeCycleError, IncludeGraph
+
+_SETUP = '.. code-block:: python\n\n    import os\n'
+
+
+@pytest.fixture()
+def docs(tmp_path: Path) -> Path:
+    (tmp_path / 'shared').mkdir()
+    (tmp_path / 'shared' / 'setup.rst').write_text(_SETUP)
+    (tmp_path / 'shared' / 'helper.py').write_text('def helper(): ...\n')
+
+    for name in ('first', 'second'):
+        (tmp_path / f'{name}.rst').write_text(
+            '.. include:: shared/setup.rst\n'
+            '\n'
+            '.. literalinclude:: shared/helper.py\n'
+            '\n'
+            '.. code-block:: python\n'
+            '\n'
+            f'    print("{name}")\n'
+        )
+
+    (tmp_path / 'other.rst').write_text('.. code-block:: python\n\n    x\n')
+
+    return tmp_path
+
+
+def test_include_is_inlined(docs: Path) -> None:
+    ext = Extractor(docs / 'first.rst')
+
+    assert ext.extract() == (
+        '# Block 1:\n'
+        'import os\n'
+        '\n'
+        '# Block 2:\n'
+        'def helper(): ...\n'
+        '\n'
+        '# Block 3:\n'
+        'print("first")\n'
+    )
+    assert ext.source_map.lookup(2) == (str(docs / 'shared' / 'setup.rst'), 3)
+
+
+def test_included_files_read_once(
+    docs: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    reads: list[Path] = []
+    read_text_buffer = includes.read_text_buffer
+
+    def _counting_read(buffer, path):
+        reads.append(Path(path).resolve())
+        return read_text_buffer(buffer, path)
+
+    monkeypatch.setattr(includes, 'read_text_buffer', _counting_read)
+
+    graph = IncludeGraph()
+    results = [
+        Extractor(docs / name, include_graph=graph).extract()
+        for name in ('first.rst', 'second.rst')
+    ]
+
+    assert sorted(reads) == sorted(
+        [
+            (docs / 'shared' / 'setup.rst').resolve(),
+            (docs / 'shared' / 'helper.py').resolve(),
+        ]
+    )
+    assert 'import os' in results[0]
+    assert 'import os' in results[1]
+
+
+def test_include_cycle(tmp_path: Path) -> None:
+    (tmp_path / 'a.rst').write_text('.. include:: b.rst\n')
+    (tmp_path / 'b.rst').write_text('.. include:: a.rst\n')
+
+    with pytest.raises(ExtractionError, match='cycle'):
+        Extractor(tmp_path / 'a.rst').extract()
+
+    with pytest.raises(IncludeCycleError):
+        IncludeGraph().blocks(tmp_path / 'a.rst')
+
+
+def test_include_options(tmp_path: Path) -> None:
+    (tmp_path / 'code.txt').write_text('x = 1\n')
+    (tmp_path / 'doc.rst').write_text(
+        '.. include:: code.txt\n'
+        '    :code: python\n'
+        '\n'
+        '.. include:: code.txt\n'
+        '    :literal:\n'
+        '\n'
+        '.. include:: <isonum.txt>\n'
+        '\n'
+        '.. include:: missing.rst\n'
+    )
+
+    assert Extractor(tmp_path / 'doc.rst').extract() == '# Block 1:\nx = 1\n'
+
+
+def test_invalidate_dependents(docs: Path) -> None:
+    graph = IncludeGraph()
+    for name in ('first.rst', 'second.rst', 'other.rst'):
+        _ = graph.blocks(docs / name)
+
+    setup = docs / 'shared' / 'setup.rst'
+    assert graph.includes(docs / 'first.rst') == {
+        setup.resolve(),
+        (docs / 'shared' / 'helper.py').resolve(),
+    }
+    assert graph.changed() == set()
+
+    setup.write_text(_SETUP.replace('os', 'sys'))
+    stat = os.stat(setup)
+    os.utime(setup, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    stale = graph.invalidate()
+
+    assert stale == {
+        setup.resolve(),
+        (docs / 'first.rst').resolve(),
+        (docs / 'second.rst').resolve(),
+    }
+    assert (docs / 'other.rst') in graph
+    assert setup not in graph
+
+    (block,) = graph.blocks(docs / 'first.rst')[:1]
+    assert list(block) == ['import sys']
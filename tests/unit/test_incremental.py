@@ -0,0 +1,107 @@
+"""Tests for incremental execution."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+from rst_extract.analysis import BlockGraph
+from rst_extract.incremental import (
+    IncrementalRunner,
+    RecordedBlock,
+    RunRecord,
+    changed_blocks,
+)
+
+
+def _code(*lines: str) -> str:
+    return '.. code-block:: python\n\n' + ''.join(f'    {x}\n' for x in lines)
+
+
+def _document(path: Path, *blocks: str) -> None:
+    path.write_text('\n'.join(_code(block) for block in blocks))
+
+
+def test_changed_blocks() -> None:
+    previous = [
+        RecordedBlock('a', ('x',)),
+        RecordedBlock('b', ('y',)),
+        RecordedBlock('c', ()),
+    ]
+    graph = BlockGraph(['x = 1', 'z = 2', 'print(y)', 'print(x)'])
+
+    changed = changed_blocks(previous, ['a', 'new', 'c', 'd'], graph)
+
+    # 'b' bound y, so block 2 is affected by its removal.
+    assert changed == {1, 2, 3}
+
+
+def test_run_record(tmp_path: Path) -> None:
+    path = tmp_path / 'record.json'
+    record = RunRecord(path)
+    record.set('passed.rst', [RecordedBlock('a', ('x',))], passed=True)
+    record.set('failed.rst', [RecordedBlock('b', ())], passed=False)
+    record.save()
+
+    loaded = RunRecord(path)
+
+    assert loaded.get('passed.rst') == [RecordedBlock('a', ('x',))]
+    assert loaded.get('failed.rst') is None
+    assert loaded.get('missing.rst') is None
+
+
+def test_invalid_run_record(tmp_path: Path) -> None:
+    path = tmp_path / 'record.json'
+    path.write_text('{"version": 0, "documents": {"a.rst": {}}}')
+
+    assert RunRecord(path).get('a.rst') is None
+
+
+def test_runner(tmp_path: Path) -> None:
+    document = tmp_path / 'doc.rst'
+    record = tmp_path / 'record.json'
+    _document(document, 'import math', 'x = math.pi', 'y = 2', 'print(x)')
+
+    def _run():
+        with IncrementalRunner(record) as runner:
+            return runner.run(document, sys.executable)
+
+    plan, result = _run()
+    assert plan.selected == [0, 1, 2, 3]
+    assert result is not None and result.stdout == '3.141592653589793\n'
+
+    plan, result = _run()
+    assert plan.selected == []
+    assert result is None
+
+    _document(document, 'import math', 'x = math.e', 'y = 2', 'print(x)')
+    plan, result = _run()
+    assert plan.selected == [0, 1, 3]
+    assert result is not None and result.stdout == '2.718281828459045\n'
+
+
+def test_runner_reruns_failed_documents(tmp_path: Path) -> None:
+    document = tmp_path / 'doc.rst'
+    record = tmp_path / 'record.json'
+    _document(
+        document, 'x = 1', 'raise SystemExit(int(open("status").read()))'
+    )
+    status = tmp_path / 'status'
+    status.write_text('1')
+
+    with IncrementalRunner(record) as runner:
+        plan, result = runner.run(document, sys.executable)
+
+    assert result is not None and result.returncode == 1
+
+    status.write_text('0')
+
+    with IncrementalRunner(record) as runner:
+        plan, _ = runner.run(document, sys.executable)
+
+    assert plan.selected == [0, 1]
+
+
+@pytest.fixture(autouse=True)
+def _chdir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
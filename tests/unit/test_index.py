@@ -0,0 +1,133 @@
+"""Tests for the SQLite block index."""
+
+import os
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from rst_extract.analysis import BlockNames, block_names
+from rst_extract.index import BlockIndex, BlockIndexError
+
+
+def _code(*lines: str) -> str:
+    return '.. code-block:: python\n\n' + ''.join(f'    {x}\n' for x in lines)
+
+
+@pytest.fixture
+def documents(tmp_path: Path) -> list[Path]:
+    setup = tmp_path / 'setup.rst'
+    setup.write_text(_code('import numpy.random'))
+    first = tmp_path / 'first.rst'
+    first.write_text(
+        '.. include:: setup.rst\n\n'
+        + _code('from rst_extract import configure_logging')
+    )
+    second = tmp_path / 'second.rst'
+    second.write_text(
+        'Text.\n\n' + _code('def configure_logging():', '    pass')
+    )
+
+    return [first, second]
+
+
+def test_query(tmp_path: Path, documents: list[Path]) -> None:
+    first, second = documents
+
+    with BlockIndex(tmp_path / 'index.sqlite3') as index:
+        update = index.update(documents)
+        numpy = index.query('numpy')
+        configure = index.query('configure_logging')
+        defines = index.query('configure_logging', 'define')
+
+    assert update.indexed == [str(first), str(second)]
+    assert [(m.document, m.location, m.name) for m in numpy] == [
+        (str(first), f'{tmp_path / "setup.rst"}:3', 'numpy.random'),
+    ]
+    assert [(m.location, m.kind) for m in configure] == [
+        (f'{first}:5', 'import'),
+        (f'{second}:5', 'define'),
+    ]
+    assert [m.document for m in defines] == [str(second)]
+
+
+def test_query_escapes_wildcards(tmp_path: Path) -> None:
+    document = tmp_path / 'doc.rst'
+    document.write_text(_code('configureXlogging = 1'))
+
+    with BlockIndex(tmp_path / 'index.sqlite3') as index:
+        _ = index.update([document])
+
+        assert not index.query('configure_logging')
+        assert not index.query('%')
+
+
+def test_update_is_incremental(tmp_path: Path, documents: list[Path]) -> None:
+    first, second = documents
+    path = tmp_path / 'index.sqlite3'
+
+    with BlockIndex(path) as index:
+        _ = index.update(documents)
+
+    setup = tmp_path / 'setup.rst'
+    setup.write_text(_code('import pandas'))
+    os.utime(setup, ns=(0, 0))
+
+    with BlockIndex(path) as index:
+        update = index.update(documents)
+
+        assert update.indexed == [str(first)]
+        assert update.unchanged == [str(second)]
+        assert index.query('pandas')
+        assert not index.query('numpy')
+
+    second.unlink()
+
+    with BlockIndex(path) as index:
+        update = index.update([])
+
+        assert update.removed == [str(second)]
+        assert index.documents() == [str(first)]
+        assert not index.query('configure_logging', 'define')
+
+
+def test_shared_blocks_analysed_once(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    documents = []
+    for name in ('a.rst', 'b.rst', 'c.rst'):
+        documents.append(tmp_path / name)
+        documents[-1].write_text(_code('import os'))
+
+    analysed = []
+
+    def _block_names(text: str) -> BlockNames:
+        analysed.append(text)
+        return block_names(text)
+
+    monkeypatch.setattr('rst_extract.index.block_names', _block_names)
+
+    with BlockIndex(tmp_path / 'index.sqlite3') as index:
+        _ = index.update(documents)
+
+        assert analysed == ['import os']
+        assert len(index.query('os')) == len(documents)
+
+
+def test_invalid_index(tmp_path: Path) -> None:
+    path = tmp_path / 'index.sqlite3'
+    path.write_text('Not a database.' * 100)
+
+    with pytest.raises(BlockIndexError):
+        _ = BlockIndex(path)
+
+
+def test_old_schema_is_rebuilt(tmp_path: Path) -> None:
+    path = tmp_path / 'index.sqlite3'
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE documents (name TEXT)')
+    connection.commit()
+    connection.close()
+
+    with BlockIndex(path) as index:
+        assert index.documents() == []
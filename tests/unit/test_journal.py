@@ -0,0 +1,54 @@
+"""Tests for the journal of completed documents."""
+
+import json
+from pathlib import Path
+
+from rst_extract.journal import Journal, file_hash
+
+
+def test_record_and_entries(tmp_path: Path) -> None:
+    document = tmp_path / 'doc.rst'
+    document.write_text('text\n')
+    journal = Journal(tmp_path / 'state' / 'journal.jsonl')
+
+    assert journal.entries() == {}
+
+    first = journal.record(document, 'failed', returncode=1)
+    second = journal.record(document, 'passed', output='doc.py', returncode=0)
+
+    assert first.document == str(document.resolve())
+    assert first.hash == file_hash(document)
+    # The journal is only appended to; the last entry of a document wins.
+    assert len(journal.path.read_text().splitlines()) == 2
+    assert journal.entries() == {second.document: second}
+    assert second.output == 'doc.py'
+
+
+def test_truncated_line_skipped(tmp_path: Path) -> None:
+    document = tmp_path / 'doc.rst'
+    document.write_text('text\n')
+    journal = Journal(tmp_path / 'journal.jsonl')
+    entry = journal.record(document, 'extracted')
+
+    # A run killed while writing leaves half a line.
+    with open(journal.path, 'a') as f:
+        f.write(json.dumps(entry._asdict())[:20])
+
+    assert journal.entries() == {entry.document: entry}
+
+
+def test_pending(tmp_path: Path) -> None:
+    documents = [tmp_path / f'doc{number}.rst' for number in range(3)]
+    for document in documents:
+        document.write_text(f'{document.name}\n')
+
+    journal = Journal(tmp_path / 'journal.jsonl')
+    _ = journal.record(documents[0], 'passed', returncode=0)
+    _ = journal.record(documents[1], 'failed', returncode=1)
+
+    assert journal.pending(documents) == [documents[2]]
+
+    # Documents changed since they were recorded are done again.
+    documents[0].write_text('changed\n')
+
+    assert journal.pending(documents) == [documents[0], documents[2]]
@@ -0,0 +1,77 @@
+"""Tests for the parallel execution of independent blocks."""
+
+import sys
+from pathlib import Path
+
+from rst_extract.parallel import run_blocks, run_document
+
+
+def test_run_blocks_in_document_order() -> None:
+    blocks = [
+        ['import os', 'first = os.getpid()'],
+        ['from os import getpid', 'second = getpid()'],
+        ['print(first)'],
+        ['print(second)'],
+    ]
+
+    results = run_blocks(blocks, sys.executable, jobs=2)
+
+    assert [result.index for result in results] == [0, 1, 2, 3]
+    assert all(result.passed for result in results)
+    # The two independent groups ran in different processes.
+    assert results[2].stdout != results[3].stdout
+
+
+def test_failure_only_stops_its_group() -> None:
+    blocks = [['x = 1'], ['y = 1 / 0'], ['print(x)'], ['print(y)']]
+
+    results = run_blocks(blocks, sys.executable)
+
+    assert [(r.passed, r.ran) for r in results] == [
+        (True, True),
+        (False, True),
+        (True, True),
+        (False, False),
+    ]
+    assert results[2].stdout == '1\n'
+    assert 'ZeroDivisionError' in results[1].stderr
+    assert '<block 2>' in results[1].stderr
+
+
+def test_late_bound_global_runs_in_one_group() -> None:
+    blocks = [['def f():', '    return x'], ['x = 2'], ['print(f())']]
+
+    results = run_blocks(blocks, sys.executable, jobs=2)
+
+    assert all(result.passed for result in results)
+    assert results[2].stdout == '2\n'
+
+
+def test_fail_fast_skips_groups() -> None:
+    # With one job, the groups run in order: the first one fails.
+    blocks = [['y = 1 / 0'], ['x = 1'], ['print(x)']]
+
+    results = run_blocks(blocks, sys.executable, jobs=1, fail_fast=True)
+
+    assert [(r.passed, r.ran) for r in results] == [
+        (False, True),
+        (False, False),
+        (False, False),
+    ]
+    assert run_blocks(blocks, sys.executable, jobs=1)[2].stdout == '1\n'
+
+
+def test_tracebacks_point_at_source(tmp_path: Path) -> None:
+    document = tmp_path / 'doc.rst'
+    document.write_text(
+        'Title\n\n.. code-block:: python\n\n    x = 1\n    raise ValueError(x)\n'
+        '\n.. code-block:: python\n\n    def f(:\n'
+    )
+
+    results = run_document(document, sys.executable)
+
+    assert f'File "{document}", line 6' in results[0].stderr
+    assert 'raise ValueError(x)' in results[0].stderr
+    assert 'SyntaxError' in results[1].stderr
+    assert 'line 10' in results[1].stderr
+    assert [result.line for result in results] == [5, 10]
@@ -0,0 +1,198 @@
+"""Tests for Sphinx project mode."""
+
+from pathlib import Path
+
+import pytest
+
+from rst_extract.project import (
+    ProjectError,
+    SphinxProject,
+    _worker_include_graph,
+    extract_documents,
+    find_source_dir,
+    read_config,
+    split_output_path,
+)
+from rst_extract.sharding import shard_key
+
+
+def _code(text: str) -> str:
+    return f'.. code-block:: python\n\n    {text}\n'
+
+
+@pytest.fixture()
+def project(tmp_path: Path) -> Path:
+    source = tmp_path / 'docs'
+    (source / 'guide').mkdir(parents=True)
+    (source / 'api').mkdir()
+
+    (source / 'conf.py').write_text(
+        'import os\n'
+        "project = 'Example'\n"
+        "exclude_patterns = ['_build', 'drafts/*']\n"
+        'version = os.environ.get("VERSION")\n'
+    )
+    (source / 'index.rst').write_text(
+        'Example\n'
+        '=======\n'
+        '\n'
+        '.. toctree::\n'
+        '   :maxdepth: 2\n'
+        '\n'
+        '   self\n'
+        '   guide/index\n'
+        '   Reference <api/index>\n'
+        '   https://example.com\n'
+        '   missing\n'
+        '\n' + _code('index = 1')
+    )
+    (source / 'guide' / 'index.rst').write_text(
+        '.. toctree::\n\n   second\n   first\n   /api/index\n\n'
+        + _code('guide = 1')
+    )
+    (source / 'guide' / 'first.rst').write_text(_code('first = 1'))
+    (source / 'guide' / 'second.rst').write_text(_code('second = 1'))
+    (source / 'api' / 'index.rst').write_text(
+        '.. toctree::\n   :glob:\n\n   *\n\n' + _code('api = 1')
+    )
+    (source / 'api' / 'b.rst').write_text(_code('b = 1'))
+    (source / 'api' / 'a.rst').write_text(_code('a = 1'))
+    (source / 'orphan.rst').write_text(_code('orphan = 1'))
+
+    return tmp_path
+
+
+def test_find_source_dir(project: Path) -> None:
+    source = (project / 'docs').resolve()
+
+    assert find_source_dir(project) == source
+    assert find_source_dir(project / 'docs') == source
+    assert find_source_dir(project / 'docs' / 'conf.py') == project / 'docs'
+
+    with pytest.raises(ProjectError):
+        _ = find_source_dir(project / 'docs' / 'api')
+
+
+def test_read_config(tmp_path: Path) -> None:
+    (tmp_path / 'conf.py').write_text(
+        "master_doc = 'contents'\n"
+        "source_suffix = {'.rst': 'restructuredtext', '.md': 'markdown',\n"
+        "                 '.txt': None}\n"
+        'extensions = [name for name in ()]\n'
+    )
+
+    config = read_config(tmp_path)
+
+    assert config.root_doc == 'contents'
+    assert config.source_suffixes == ('.rst', '.txt')
+    assert config.exclude_patterns == ()
+
+
+def test_read_config_defaults(project: Path) -> None:
+    config = read_config(project / 'docs')
+
+    assert config.root_doc == 'index'
+    assert config.source_suffixes == ('.rst',)
+    assert config.exclude_patterns == ('_build', 'drafts/*')
+
+
+def test_read_config_invalid(tmp_path: Path) -> None:
+    (tmp_path / 'conf.py').write_text('project = (\n')
+
+    with pytest.raises(ProjectError):
+        _ = read_config(tmp_path)
+
+
+def test_docnames_in_toctree_order(project: Path) -> None:
+    sphinx_project = SphinxProject(project)
+
+    assert sphinx_project.docnames() == [
+        'index',
+        'guide/index',
+        'guide/second',
+        'guide/first',
+        'api/index',
+        'api/a',
+        'api/b',
+    ]
+
+
+def test_documents(project: Path) -> None:
+    sphinx_project = SphinxProject(project)
+    documents = sphinx_project.documents()
+
+    assert documents[0] == sphinx_project.source_dir / 'index.rst'
+    assert sphinx_project.source_dir / 'orphan.rst' not in documents
+
+
+@pytest.mark.parametrize('pool', ['process', 'thread'])
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_extract_documents(project: Path, jobs: int, pool: str) -> None:
+    documents = SphinxProject(project).documents()
+
+    timings: dict[str, float] = {}
+
+    results = extract_documents(
+        documents, jobs=jobs, pool=pool, timings=timings
+    )
+
+    assert sorted(timings) == sorted(map(shard_key, documents))
+    assert all(duration >= 0 for duration in timings.values())
+    assert [code.splitlines()[1] for code, _ in results] == [
+        'index = 1',
+        'guide = 1',
+        'second = 1',
+        'first = 1',
+        'api = 1',
+        'a = 1',
+        'b = 1',
+    ]
+    assert results[2][1].lookup(2) == (str(documents[2]), 3)
+
+
+def test_split_output_path(project: Path) -> None:
+    source = project / 'docs'
+
+    assert split_output_path(
+        source / 'guide' / 'first.rst', source, project / 'out'
+    ) == (project / 'out' / 'guide' / 'first.py')
+
+    with pytest.raises(ValueError):
+        _ = split_output_path(project / 'other.rst', source, project / 'out')
+
+
+def test_extract_documents_threads_stress(tmp_path: Path) -> None:
+    (tmp_path / 'shared.rst').write_text(_code('shared = 1'))
+    documents = []
+    for number in range(200):
+        documents.append(tmp_path / f'doc{number}.rst')
+        documents[-1].write_text(
+            '.. include:: shared.rst\n\n'
+            + _code(f'value = {number}')
+            + _code('\n    '.join(f'line_{i} = {number}' for i in range(20)))
+        )
+
+    expected = extract_documents(documents, jobs=1)
+
+    for _ in range(5):
+        results = extract_documents(documents, jobs=16, pool='thread')
+
+        assert [code for code, _ in results] == [code for code, _ in expected]
+        assert [m.to_dict() for _, m in results] == [
+            m.to_dict() for _, m in expected
+        ]
+
+
+def test_extract_documents_in_process(tmp_path: Path) -> None:
+    included = tmp_path / 'included.rst'
+    included.write_text(_code('x = 1'))
+    document = tmp_path / 'doc.rst'
+    document.write_text('.. include:: included.rst\n')
+
+    assert 'x = 1' in extract_documents([document], jobs=1)[0][0]
+
+    # Each call reads the included files again, with a graph of its own.
+    included.write_text(_code('x = 2'))
+
+    assert 'x = 2' in extract_documents([document], jobs=1)[0][0]
+    assert _worker_include_graph.cache_info().currsize == 0
@@ -0,0 +1,122 @@
+"""Tests for extracting documents at git revisions."""
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from rst_extract.extractor import ExtractionError
+from rst_extract.git import GitError
+from rst_extract.revisions import RevisionExtractor, RevisionPath
+
+
+def _run(repo: Path, *args: str) -> None:
+    _ = subprocess.run(
+        ['git', *args], cwd=repo, check=True, capture_output=True
+    )
+
+
+def _code(text: str) -> str:
+    return f'.. code-block:: python\n\n    {text}\n'
+
+
+@pytest.fixture()
+def repo(tmp_path: Path) -> Path:
+    _run(tmp_path, 'init', '-q')
+    _run(tmp_path, 'config', 'user.email', 'docs@example.com')
+    _run(tmp_path, 'config', 'user.name', 'Docs')
+
+    (tmp_path / 'docs').mkdir()
+    (tmp_path / 'docs' / 'index.rst').write_text(
+        '.. include:: setup.rst\n\n' + _code('index = 1')
+    )
+    (tmp_path / 'docs' / 'setup.rst').write_text(_code('setup = 1'))
+    (tmp_path / 'docs' / 'other.rst').write_text(_code('other = 1'))
+    _run(tmp_path, 'add', '.')
+    _run(tmp_path, 'commit', '-q', '-m', 'Version 1')
+    _run(tmp_path, 'tag', 'v1')
+
+    (tmp_path / 'docs' / 'setup.rst').write_text(_code('setup = 2'))
+    _run(tmp_path, 'commit', '-q', '-am', 'Version 2')
+    _run(tmp_path, 'tag', 'v2')
+
+    # Not committed: never seen by the extractor.
+    (tmp_path / 'docs' / 'other.rst').write_text(_code('work_tree = 1'))
+
+    return tmp_path
+
+
+def test_extract_revisions(repo: Path) -> None:
+    with RevisionExtractor(repo) as extractor:
+        first = extractor.extract('v1')
+        second = extractor.extract('v2')
+
+    assert list(first) == [
+        RevisionPath('v1', 'docs/index.rst'),
+        RevisionPath('v1', 'docs/other.rst'),
+        RevisionPath('v1', 'docs/setup.rst'),
+    ]
+    assert str(next(iter(second))) == 'v2:docs/index.rst'
+
+    code, source_map = first[RevisionPath('v1', 'docs/index.rst')]
+    assert code == '# Block 1:\nsetup = 1\n\n# Block 2:\nindex = 1\n'
+    assert source_map.lookup(2) == (
+        str(repo.resolve() / 'docs' / 'setup.rst'),
+        3,
+    )
+
+    code, _ = second[RevisionPath('v2', 'docs/index.rst')]
+    assert code == '# Block 1:\nsetup = 2\n\n# Block 2:\nindex = 1\n'
+    assert second[RevisionPath('v2', 'docs/other.rst')][0] == (
+        '# Block 1:\nother = 1\n'
+    )
+
+
+def test_unchanged_blobs_extracted_once(
+    repo: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    extracted: list[str] = []
+    extract = RevisionExtractor._extract
+
+    def _counting_extract(self, graph, files, path, oid):
+        extracted.append(path)
+        return extract(self, graph, files, path, oid)
+
+    monkeypatch.setattr(RevisionExtractor, '_extract', _counting_extract)
+
+    with RevisionExtractor(repo) as extractor:
+        _ = extractor.extract('v1')
+        _ = extractor.extract('v2')
+        _ = extractor.extract('v2')
+
+    assert extracted == [
+        'docs/index.rst',
+        'docs/other.rst',
+        'docs/setup.rst',
+        # Changed, and including a changed file.
+        'docs/index.rst',
+        'docs/setup.rst',
+    ]
+
+
+def test_selected_documents(repo: Path) -> None:
+    with RevisionExtractor(repo) as extractor:
+        paths = [extractor.relative(repo / 'docs' / 'other.rst'), 'missing']
+        results = extractor.extract('v1', paths)
+
+    assert list(results) == [RevisionPath('v1', 'docs/other.rst')]
+
+
+def test_include_cycle(repo: Path) -> None:
+    (repo / 'docs' / 'setup.rst').write_text('.. include:: index.rst\n')
+    _run(repo, 'commit', '-q', '-am', 'Cycle')
+
+    with RevisionExtractor(repo) as extractor:
+        with pytest.raises(ExtractionError):
+            _ = extractor.extract('HEAD')
+
+
+def test_unknown_revision(repo: Path) -> None:
+    with RevisionExtractor(repo) as extractor:
+        with pytest.raises(GitError):
+            _ = extractor.extract('v3')
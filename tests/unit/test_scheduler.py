@@ -0,0 +1,152 @@
+"""Tests for longest-job-first scheduling."""
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from rst_extract.scheduler import (
+    BLOCK_COST,
+    count_blocks,
+    estimate_costs,
+    run_scheduled,
+    run_until,
+    static_cost,
+)
+
+
+@pytest.fixture(autouse=True)
+def _chdir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+
+
+def test_static_cost() -> None:
+    text = (
+        'Title\n\n.. code-block:: python\n\n    x = 1\n\n'
+        '  .. ipython::\n\n>>> x\n1\n.. note::\n'
+    )
+    Path('doc.rst').write_text(text)
+
+    assert count_blocks(text.encode()) == 4
+    assert static_cost('doc.rst') == len(text) + 4 * BLOCK_COST
+    assert static_cost('missing.rst') == 0.0
+
+
+def test_estimate_costs() -> None:
+    for name, size in (('a.rst', 100), ('b.rst', 300), ('c.rst', 200)):
+        Path(name).write_text('x' * size)
+
+    paths = ['a.rst', 'b.rst', 'c.rst']
+
+    assert estimate_costs(paths) == [100.0, 300.0, 200.0]
+    assert estimate_costs(paths, {'other.rst': 1.0}) == [100.0, 300.0, 200.0]
+
+    # c.rst has no runtime: its size is scaled like those of a and b.
+    costs = estimate_costs(paths, {'a.rst': 2.0, 'b.rst': 6.0})
+
+    assert costs == [2.0, 6.0, pytest.approx(4.0)]
+
+
+def test_run_scheduled_largest_first() -> None:
+    started = []
+    lock = threading.Lock()
+
+    def _run(item: int) -> int:
+        with lock:
+            started.append(item)
+
+        time.sleep(0.01)
+        return item * 10
+
+    costs = [1.0, 5.0, 2.0, 9.0, 3.0]
+    results = run_scheduled(range(5), _run, costs, workers=2)
+
+    assert results == [0, 10, 20, 30, 40]
+    assert set(started[:2]) == {3, 1}
+    assert run_scheduled([1, 2], lambda x: -x, [1.0, 2.0], workers=1) == [
+        -1,
+        -2,
+    ]
+    assert run_scheduled([], lambda x: x, []) == []
+
+
+def test_run_scheduled_ordered() -> None:
+    started = []
+    lock = threading.Lock()
+
+    def _run(item: int) -> int:
+        with lock:
+            started.append(item)
+
+        time.sleep(0.01)
+        return item
+
+    # The order is a priority: the costs do not reorder the items.
+    costs = [1.0, 5.0, 2.0, 9.0, 3.0]
+    results = run_scheduled(range(5), _run, costs, workers=2, ordered=True)
+
+    assert results == [0, 1, 2, 3, 4]
+    assert set(started[:2]) == {0, 1}
+
+
+def test_run_scheduled_steals_work() -> None:
+    threads = {}
+
+    def _run(item: int) -> None:
+        threads[item] = threading.get_ident()
+
+        # The estimates are wrong: item 0 is much slower than the others.
+        if item == 0:
+            time.sleep(0.3)
+
+    _ = run_scheduled(range(8), _run, [1.0] * 8, workers=2)
+
+    # Items 2, 4 and 6 were queued behind item 0, and taken by the worker
+    # of item 1 instead of waiting.
+    assert threads[0] != threads[1]
+    assert {threads[2], threads[4], threads[6]} == {threads[1]}
+
+
+def test_run_scheduled_failure() -> None:
+    def _run(item: int) -> int:
+        if item == 2:
+            raise ValueError(item)
+
+        return item
+
+    with pytest.raises(ValueError):
+        _ = run_scheduled(range(6), _run, [1.0] * 6, workers=3)
+
+
+def test_run_until() -> None:
+    results = run_until(
+        range(6), lambda x: -x, [1.0] * 6, stop=lambda x: x <= -3, workers=1
+    )
+
+    assert results == {0: 0, 1: -1, 2: -2, 3: -3}
+    assert run_until([1, 2], lambda x: -x, [1.0, 1.0]) == {0: -1, 1: -2}
+
+
+def test_run_until_stops_workers() -> None:
+    started = threading.Barrier(3, timeout=5)
+
+    def _run(item: int) -> int:
+        _ = started.wait()
+
+        if item != 5:
+            time.sleep(0.2)
+
+        return item
+
+    # Item 5 runs first, on its own worker, and stops the run; the other
+    # workers finish the item they started, and start no other.
+    results = run_until(
+        range(6),
+        _run,
+        [1.0, 1.0, 1.0, 1.0, 1.0, 9.0],
+        stop=lambda item: item == 5,
+        workers=3,
+    )
+
+    assert sorted(results) == [0, 1, 5]
@@ -0,0 +1,273 @@
+"""Tests for the extraction daemon and its client."""
+
+import io
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+import rst_extract.client as client
+from rst_extract.client import Client, ClientError
+from rst_extract.server import (
+    EXTRACTION_ERROR,
+    INTERNAL_ERROR,
+    INVALID_PARAMS,
+    INVALID_REQUEST,
+    METHOD_NOT_FOUND,
+    PARSE_ERROR,
+    ExtractionService,
+    RPCError,
+    SocketInUseError,
+    serve_socket,
+    serve_stdio,
+)
+
+
+@pytest.fixture()
+def document(tmp_path: Path) -> Path:
+    path = tmp_path / 'doc.rst'
+    path.write_text('Title\n\n.. code-block:: python\n\n    print("hello")\n')
+
+    return path
+
+
+def _request(method: str, request_id: int = 1, **params: object) -> str:
+    return json.dumps(
+        {
+            'jsonrpc': '2.0',
+            'id': request_id,
+            'method': method,
+            'params': params,
+        }
+    )
+
+
+def test_extract(document: Path) -> None:
+    service = ExtractionService()
+
+    result = service.extract(str(document), source_map=True)
+
+    assert result['code'] == '# Block 1:\nprint("hello")\n'
+    assert result['source_map']['lines'][1] == 5
+
+
+def test_extract_cached_until_modified(
+    document: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    service = ExtractionService()
+    assert 'hello' in service.extract(str(document))['code']
+
+    def _fail(self: object) -> str:
+        raise AssertionError('Extracted again.')
+
+    monkeypatch.setattr('rst_extract.server.Extractor.extract', _fail)
+    assert 'hello' in service.extract(str(document))['code']
+
+    monkeypatch.undo()
+    document.write_text('.. code-block:: python\n\n    print("changed")\n')
+    stat = document.stat()
+    os.utime(document, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert 'changed' in service.extract(str(document))['code']
+
+
+def test_validate(tmp_path: Path) -> None:
+    path = tmp_path / 'invalid.rst'
+    path.write_text('.. code-block:: python\n\n    x = 1\n    def f(:\n')
+
+    result = ExtractionService().validate(str(path))
+
+    assert not result['valid']
+    assert result['filename'] == str(path)
+    assert result['line'] == 4
+
+
+def test_execute(document: Path) -> None:
+    with ExtractionService() as service:
+        result = service.execute(str(document))
+
+    assert result == {'returncode': 0, 'stdout': 'hello\n', 'stderr': ''}
+
+
+def test_execute_reuses_interpreter(tmp_path: Path) -> None:
+    path = tmp_path / 'fails.rst'
+    path.write_text('.. code-block:: python\n\n    x = 1\n    1 / 0\n')
+
+    with ExtractionService() as service:
+        first = service.execute(str(path))
+        second = service.execute(str(path))
+
+        assert len(service._started) == 1
+
+    assert first == second
+    assert first['returncode'] == 1
+    assert f'File "{path}", line 4' in first['stderr']
+
+    with pytest.raises(RPCError, match='shutting down'):
+        service.execute(str(path))
+
+
+@pytest.mark.parametrize(
+    ('line', 'code'),
+    [
+        ('{', PARSE_ERROR),
+        ('{"jsonrpc": "2.0", "id": 1}', INVALID_REQUEST),
+        ('[]', INVALID_REQUEST),
+        (_request('unknown'), METHOD_NOT_FOUND),
+        (_request('extract', unknown=1), INVALID_PARAMS),
+        (_request('extract', path='missing.rst'), EXTRACTION_ERROR),
+        (_request('extract', path=123), INVALID_PARAMS),
+        (_request('extract', path='doc.rst', doctest='yes'), INVALID_PARAMS),
+        (_request('execute', path='doc.rst', python_bin='sh'), INVALID_PARAMS),
+    ],
+)
+def test_errors(line: str, code: int) -> None:
+    response = ExtractionService().handle_line(line)
+
+    assert response is not None
+    assert json.loads(response)['error']['code'] == code
+
+
+def test_internal_error(document: Path) -> None:
+    service = ExtractionService(python_bin='/nonexistent/python')
+
+    response = service.handle_line(_request('execute', path=str(document)))
+
+    assert response is not None
+    assert json.loads(response)['error']['code'] == INTERNAL_ERROR
+    assert service.handle_line(_request('ping')) == json.dumps(
+        {'jsonrpc': '2.0', 'id': 1, 'result': 'pong'}
+    )
+
+
+def test_notifications_and_batches() -> None:
+    service = ExtractionService()
+    notification = json.dumps({'jsonrpc': '2.0', 'method': 'ping'})
+
+    assert service.handle_line(notification) is None
+
+    response = service.handle_line(
+        f'[{notification}, {_request("ping", 7)}, '
+        '{"jsonrpc": "2.0", "id": 8, "method": "ping", "params": []}]'
+    )
+
+    assert response is not None
+    assert [item['result'] for item in json.loads(response)] == [
+        'pong',
+        'pong',
+    ]
+
+
+def test_serve_stdio(document: Path) -> None:
+    stdin = io.StringIO(
+        f'{_request("extract", path=str(document))}\n'
+        '\n'
+        f'{_request("shutdown", 2)}\n'
+        f'{_request("ping", 3)}\n'
+    )
+    stdout = io.StringIO()
+
+    serve_stdio(ExtractionService(), stdin, stdout)
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [response['id'] for response in responses] == [1, 2]
+    assert 'hello' in responses[0]['result']['code']
+
+
+def test_serve_socket(
+    document: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    socket_path = tmp_path / 'daemon.sock'
+    monkeypatch.setenv(client.SOCKET_ENV_VAR, str(socket_path))
+
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=serve_socket, args=(ExtractionService(), socket_path, ready)
+    )
+    thread.start()
+    assert ready.wait(5)
+
+    assert stat.S_IMODE(socket_path.stat().st_mode) == 0o600
+
+    # The socket of a running daemon is not taken over.
+    with pytest.raises(SocketInUseError, match='already serving'):
+        serve_socket(ExtractionService(), socket_path)
+
+    with Client(timeout=5) as daemon:
+        assert daemon.call('ping') == 'pong'
+        assert 'hello' in daemon.call('extract', path=str(document))['code']
+
+        with pytest.raises(ClientError) as error:
+            _ = daemon.call('unknown')
+
+        assert error.value.code == METHOD_NOT_FOUND
+
+    assert client.main(['validate', str(document)]) == 0
+    assert client.main(['shutdown']) == 0
+
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not socket_path.exists()
+
+
+def test_serve_socket_path(tmp_path: Path) -> None:
+    stale = tmp_path / 'stale.sock'
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(str(stale))
+
+    other = tmp_path / 'other.txt'
+    other.write_text('')
+    service = ExtractionService()
+    _ = service.shutdown()
+
+    # The daemon of a stale socket is gone: the socket is replaced.
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=serve_socket, args=(service, stale, ready)
+    )
+    thread.start()
+    assert ready.wait(5)
+
+    with Client(str(stale), timeout=5) as daemon:
+        assert daemon.call('ping') == 'pong'
+
+    thread.join(5)
+    assert not thread.is_alive()
+
+    with pytest.raises(SocketInUseError, match='not a socket'):
+        serve_socket(service, other)
+
+    assert other.exists()
+
+
+def test_client_without_daemon(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    status = client.main(['--socket', str(tmp_path / 'none.sock'), 'ping'])
+
+    assert status == 2
+    assert 'could not reach the daemon' in capsys.readouterr().err
+
+
+def test_client_imports() -> None:
+    """The client starts without importing structlog, click or pydantic."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-c',
+            'import sys, rst_extract.client; '
+            'print(sorted({"structlog", "click", "pydantic"} & set(sys.modules)))',
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout == '[]\n'
@@ -0,0 +1,174 @@
+"""Tests for extraction sessions."""
+
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from rst_extract import session as session_module
+from rst_extract.backends import WarmInterpreter
+from rst_extract.extractor import ExtractionError
+from rst_extract.session import (
+    Extraction,
+    ExtractionSession,
+    SessionClosedError,
+    Validation,
+)
+
+
+def _code(*lines: str) -> str:
+    return '.. code-block:: python\n\n' + ''.join(f'    {x}\n' for x in lines)
+
+
+def _touch(path: Path, text: str) -> None:
+    """Rewrite ``path``, making sure its modification time changes."""
+    mtime = path.stat().st_mtime_ns
+    path.write_text(text)
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+
+@pytest.fixture()
+def session():
+    with ExtractionSession(jobs=2) as session:
+        yield session
+
+
+def test_extract_cached(session: ExtractionSession, tmp_path: Path) -> None:
+    included = tmp_path / 'included.rst'
+    included.write_text(_code('x = 1'))
+    document = tmp_path / 'doc.rst'
+    document.write_text('.. include:: included.rst\n\n' + _code('y = x'))
+
+    first = session.extract(document)
+
+    assert isinstance(first, Extraction)
+    assert 'x = 1' in first.code and 'y = x' in first.code
+    assert session.extract(document) is first
+
+    # A change to an included file invalidates the result.
+    _touch(included, _code('x = 2'))
+    second = session.extract(document)
+
+    assert second is not first
+    assert 'x = 2' in second.code
+
+    with pytest.raises(ExtractionError):
+        _ = session.extract(tmp_path / 'missing.rst')
+
+
+def test_extract_in_threads(
+    session: ExtractionSession,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    slow = tmp_path / 'slow.rst'
+    slow.write_text(_code('x = 1'))
+    fast = tmp_path / 'fast.rst'
+    fast.write_text(_code('y = 2'))
+    started, release = threading.Event(), threading.Event()
+    extract_code = session_module.extract_code
+
+    def _extract_code(text: str, path: Path, **options: Any) -> object:
+        if path == slow:
+            started.set()
+            assert release.wait(5)
+
+        return extract_code(text, path, **options)
+
+    monkeypatch.setattr('rst_extract.session.extract_code', _extract_code)
+    thread = threading.Thread(target=session.extract, args=(slow,))
+    thread.start()
+    assert started.wait(5)
+
+    # Not held up by the extraction of the other thread.
+    assert 'y = 2' in session.extract(fast).code
+
+    release.set()
+    thread.join(5)
+    assert 'x = 1' in session.extract(slow).code
+
+
+def test_extract_many(session: ExtractionSession, tmp_path: Path) -> None:
+    documents = []
+    for number in range(6):
+        documents.append(tmp_path / f'doc{number}.rst')
+        documents[-1].write_text(_code(f'value = {number}'))
+
+    cached = session.extract(documents[2])
+    results = session.extract_many(documents)
+
+    assert [r.code.splitlines()[1] for r in results] == [
+        f'value = {number}' for number in range(6)
+    ]
+    assert results[2] is cached
+    assert results[4].source_map.lookup(2) == (str(documents[4]), 3)
+    assert session.extract_many(documents)[5] is results[5]
+
+
+def test_validate(session: ExtractionSession, tmp_path: Path) -> None:
+    valid = tmp_path / 'valid.rst'
+    valid.write_text(_code('x = 1'))
+    invalid = tmp_path / 'invalid.rst'
+    invalid.write_text('Title\n\n' + _code('x = 1', 'x = (', ''))
+
+    assert session.validate(valid) == Validation(True)
+
+    result = session.validate(invalid)
+
+    assert not result.valid
+    assert result.filename == str(invalid)
+    assert result.line == 6
+
+
+def test_execute(tmp_path: Path) -> None:
+    document = tmp_path / 'doc.rst'
+    document.write_text(_code('print("hello")', '1 / 0'))
+
+    with ExtractionSession(interpreters=2) as session:
+        results = [session.execute(document) for _ in range(3)]
+
+    assert all(result.returncode == 1 for result in results)
+    assert all(result.stdout == 'hello\n' for result in results)
+    assert f'File "{document}", line 4' in results[0].stderr
+
+
+@pytest.mark.skipif(not WarmInterpreter.supported(), reason='needs os.fork')
+def test_close_wakes_waiting_threads() -> None:
+    session = ExtractionSession(interpreters=1)
+    _ = session._interpreter()
+    errors = []
+
+    def _wait() -> None:
+        try:
+            _ = session._interpreter()
+
+        except SessionClosedError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=_wait) for _ in range(2)]
+
+    for thread in threads:
+        thread.start()
+
+    session.close()
+
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 2
+
+
+def test_closed(tmp_path: Path) -> None:
+    document = tmp_path / 'doc.rst'
+    document.write_text(_code('x = 1'))
+    session = ExtractionSession()
+    session.close()
+    session.close()
+
+    with pytest.raises(SessionClosedError):
+        _ = session.extract(document)
+
+    with pytest.raises(ValueError):
+        _ = ExtractionSession(interpreters=0)
@@ -0,0 +1,100 @@
+"""Tests for sharding runs across machines."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from rst_extract.sharding import (
+    FileResult,
+    RunResult,
+    Shard,
+    ShardError,
+    assign_shards,
+    merge_results,
+    select_shard,
+)
+from rst_extract.sourcemap import SourceMap
+
+
+@pytest.fixture(autouse=True)
+def _chdir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+
+
+def test_shard_parse() -> None:
+    assert Shard.parse('2/4') == Shard(2, 4)
+    assert str(Shard(2, 4)) == '2/4'
+
+    for text in ('0/4', '5/4', '1', 'a/b'):
+        with pytest.raises(ShardError):
+            _ = Shard.parse(text)
+
+
+def test_assign_shards_by_hash() -> None:
+    files = [f'doc{number}.rst' for number in range(20)]
+
+    shards = assign_shards(files, 3)
+
+    assert sorted(file for shard in shards for file in shard) == sorted(files)
+    # Each shard keeps the input order, and the assignment does not depend
+    # on it, or on the other files.
+    assert all(shard == sorted(shard, key=files.index) for shard in shards)
+    assert assign_shards(files[::-1], 3) == [s[::-1] for s in shards]
+    assert select_shard(files[:10], Shard(1, 3)) == [
+        file for file in shards[0] if file in files[:10]
+    ]
+
+
+def test_assign_shards_balanced() -> None:
+    sizes = [900, 500, 400, 300, 200, 100]
+    files = []
+    for number, size in enumerate(sizes):
+        files.append(f'doc{number}.rst')
+        Path(files[-1]).write_text('x' * size)
+
+    by_size = assign_shards(files, 2, balance='size')
+    totals = [sum(os.path.getsize(file) for file in s) for s in by_size]
+
+    assert by_size == [['doc0.rst', 'doc3.rst'], [*files[1:3], *files[4:]]]
+    assert totals == [1200, 1200]
+
+    # Files without a runtime take the average of the others.
+    runtimes = {'doc0.rst': 10.0, 'doc1.rst': 1.0, 'doc2.rst': 1.0}
+    by_runtime = assign_shards(files, 2, balance='runtime', runtimes=runtimes)
+
+    assert by_runtime == [files[:3], files[3:]]
+
+
+def _result(files: list[str], shard: Shard | None, done: list[str]):
+    return RunResult(
+        files,
+        [shard] if shard else [],
+        {key: FileResult(f'# {key}\n', SourceMap(), 0, 1.0) for key in done},
+    )
+
+
+def test_merge_results(tmp_path: Path) -> None:
+    files = ['a.rst', 'b.rst', 'c.rst']
+    first = _result(files, Shard(1, 2), ['c.rst', 'a.rst'])
+    second = _result(files, Shard(2, 2), ['b.rst'])
+    first.write(tmp_path / 'first.json')
+
+    merged = merge_results([second, RunResult.read(tmp_path / 'first.json')])
+
+    assert merged.complete
+    assert [key for key, _ in merged.ordered()] == files
+    assert merged.summary() == {'files': 3, 'passed': 3, 'failed': 0}
+    assert merged.runtimes() == dict.fromkeys(files, 1.0)
+
+    with pytest.raises(ShardError, match='Expected the results'):
+        _ = merge_results([first])
+
+    with pytest.raises(ShardError, match='Expected the results'):
+        _ = merge_results([first, first])
+
+    with pytest.raises(ShardError, match='same files'):
+        _ = merge_results([first, _result(files[:2], Shard(2, 2), [])])
+
+    with pytest.raises(ShardError, match='cover all files'):
+        _ = merge_results([first, _result(files, Shard(2, 2), [])])
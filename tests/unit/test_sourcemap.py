@@ -0,0 +1,149 @@
+"""Tests for source maps from extracted code to reStructuredText."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from rst_extract.api import extract
+from rst_extract.assembler import assemble
+from rst_extract.execution import execute_command
+from rst_extract.extractor import Extractor
+from rst_extract.sourcemap import SourceMap, SourceMapError, sidecar_path
+
+_RST = (
+    'Some text.\n'
+    '\n'
+    '.. code-block:: python\n'
+    '\n'
+    '    x = 1\n'
+    '\n'
+    '    y = 2\n'
+    '\n'
+    'More text.\n'
+    '\n'
+    '.. code-block:: python\n'
+    '    :linenos:\n'
+    '\n'
+    '    raise ValueError(x + y)\n'
+)
+
+
+@pytest.fixture()
+def mapped_rst(tmp_path: Path) -> Path:
+    path = tmp_path / 'mapped.rst'
+    path.write_text(_RST)
+
+    return path
+
+
+def test_extractor_source_map(mapped_rst: Path) -> None:
+    ext = Extractor(mapped_rst)
+    result = ext.extract()
+    source_map = ext.source_map
+
+    assert len(source_map) == len(result.splitlines())
+
+    # '# Block 1:', 'x = 1', '', 'y = 2', '', '# Block 2:', 'raise ...'
+    assert source_map.lookup(1) is None
+    assert source_map.lookup(2) == (str(mapped_rst), 5)
+    assert source_map.lookup(3) == (str(mapped_rst), 6)
+    assert source_map.lookup(4) == (str(mapped_rst), 7)
+    assert source_map.lookup(5) is None
+    assert source_map.lookup(6) is None
+    assert source_map.lookup(7) == (str(mapped_rst), 14)
+    assert source_map.lookup(8) is None
+    assert source_map.lookup(0) is None
+
+
+def test_source_map_without_line_numbers() -> None:
+    source_map = SourceMap()
+
+    _ = assemble([['a = 1']], source_map=source_map)
+
+    assert len(source_map) == 2
+    assert source_map.lookup(2) is None
+
+
+def test_rewrite_traceback(mapped_rst: Path) -> None:
+    ext = Extractor(mapped_rst)
+    _ = ext.extract()
+
+    traceback = (
+        'Traceback (most recent call last):\n'
+        '  File "<string>", line 7, in <module>\n'
+        '  File "other.py", line 7, in <module>\n'
+        '  File "<string>", line 1, in <module>\n'
+    )
+
+    rewritten = ext.source_map.rewrite_traceback(traceback)
+
+    assert f'File "{mapped_rst}", line 14, in <module>' in rewritten
+    assert 'File "other.py", line 7' in rewritten
+    assert 'File "<string>", line 1' in rewritten
+
+
+def test_source_map_round_trip(mapped_rst: Path, tmp_path: Path) -> None:
+    ext = Extractor(mapped_rst)
+    _ = ext.extract()
+    path = tmp_path / 'map.json'
+
+    ext.source_map.write(path)
+    loaded = SourceMap.read(path)
+
+    assert loaded.to_dict() == ext.source_map.to_dict()
+
+
+@pytest.mark.parametrize(
+    'content',
+    ['not json', json.dumps({'version': 0}), json.dumps({'version': 1})],
+)
+def test_bad_source_map(content: str, tmp_path: Path) -> None:
+    path = tmp_path / 'map.json'
+    path.write_text(content)
+
+    with pytest.raises(SourceMapError):
+        SourceMap.read(path)
+
+
+def test_extend_source_maps() -> None:
+    first, second = SourceMap(), SourceMap()
+    first.add_lines(first.add_source('a.rst'), [0])
+    second.add_generated()
+    second.add_lines(second.add_source('b.rst'), [4])
+    second.add_lines(second.add_source('a.rst'), [9])
+
+    first.extend(second)
+
+    assert first.sources == ['a.rst', 'b.rst']
+    assert [first.lookup(i) for i in range(1, 5)] == [
+        ('a.rst', 1),
+        None,
+        ('b.rst', 5),
+        ('a.rst', 10),
+    ]
+
+
+def test_api_writes_sidecar(mapped_rst: Path, tmp_path: Path) -> None:
+    output = tmp_path / 'output.py'
+
+    _ = extract(mapped_rst, output, source_map=True)
+
+    assert sidecar_path(output) == tmp_path / 'output.py.map.json'
+    assert SourceMap.read(sidecar_path(output)).lookup(7) == (
+        str(mapped_rst),
+        14,
+    )
+
+
+def test_execute_rewrites_traceback(
+    mapped_rst: Path, capfd: pytest.CaptureFixture[str]
+) -> None:
+    ext = Extractor(mapped_rst)
+    result = ext.extract()
+
+    execute_command('python', result, source_map=ext.source_map)
+
+    out, _ = capfd.readouterr()
+    assert f'File "{mapped_rst}", line 14' in out
+    assert 'ValueError: 3' in out
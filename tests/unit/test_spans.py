@@ -0,0 +1,84 @@
+"""Tests for the span-based block representation."""
+
+import pytest
+
+from rst_extract.spans import Span, SpanLines, TextBuffer
+
+
+@pytest.mark.parametrize(
+    'text',
+    [
+        '',
+        'a',
+        'a\n',
+        'a\nb',
+        'a\n\nb\n',
+        '\n\n',
+        'a\r\nb\r\n',
+        '  indented\n\tline\n',
+    ],
+)
+def test_buffer_lines_match_splitlines(text: str) -> None:
+    buffer = TextBuffer(text)
+    expected = text.splitlines()
+
+    assert len(buffer) == len(expected)
+    assert [buffer.line(i) for i in range(len(buffer))] == expected
+
+
+def test_line_of() -> None:
+    text = 'first\nsecond\n\nfourth'
+    buffer = TextBuffer(text)
+
+    for offset in range(len(text)):
+        assert buffer.line_of(offset) == text.count('\n', 0, offset)
+
+    with pytest.raises(IndexError):
+        buffer.line_of(len(text) + 1)
+
+
+def test_indent_and_blank_lines() -> None:
+    buffer = TextBuffer('    a\n\n   \nb')
+
+    assert [buffer.indent_of(i) for i in range(4)] == [4, 0, 3, 0]
+    assert [buffer.is_blank(i) for i in range(4)] == [
+        False,
+        True,
+        True,
+        False,
+    ]
+
+
+def test_next_line() -> None:
+    buffer = TextBuffer('a\n    b\n\n      \n  c\nd\n')
+
+    assert buffer.next_line(1) == 1
+    assert buffer.next_line(2) == 4
+    assert buffer.next_line(1, 2) == 4
+    assert buffer.next_line(1, 1) == 5
+    assert buffer.next_line(6) == 6
+
+
+def test_span_lines_are_dedented() -> None:
+    buffer = TextBuffer('text\n    if x:\n        y\n  \n    z\nmore text\n')
+    span = buffer.span(1, 5, 4)
+
+    lines = buffer.lines(span)
+
+    assert isinstance(lines, SpanLines)
+    assert list(lines) == ['if x:', '    y', '', 'z']
+    assert lines[-1] == 'z'
+    assert lines[1:3] == ['    y', '']
+    assert lines.line_numbers == range(1, 5)
+
+    with pytest.raises(IndexError):
+        _ = lines[4]
+
+
+def test_empty_span() -> None:
+    buffer = TextBuffer('a\nb\n')
+    span = buffer.span(1, 1, 0)
+
+    assert span == Span(2, 2, 0)
+    assert len(buffer.lines(span)) == 0
+    assert list(buffer.lines(buffer.span(2, 2, 0))) == []
@@ -0,0 +1,114 @@
+"""Tests for the Sphinx extension."""
+
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('sphinx')
+
+from sphinx.application import Sphinx  # noqa: E402
+
+from rst_extract.sphinx import ScriptBuilder  # noqa: E402
+
+
+@pytest.fixture()
+def source(tmp_path: Path) -> Path:
+    source = tmp_path / 'docs'
+    (source / 'guide').mkdir(parents=True)
+    (source / 'conf.py').write_text(
+        "extensions = ['rst_extract.sphinx', 'sphinx.ext.doctest']\n"
+        "exclude_patterns = ['shared.rst']\n"
+    )
+    (source / 'helper.py').write_text('def helper(): ...\n')
+    (source / 'shared.rst').write_text(
+        '.. code-block:: python\n\n    import os\n'
+    )
+    (source / 'index.rst').write_text(
+        'Title\n'
+        '=====\n'
+        '\n'
+        '.. toctree::\n'
+        '\n'
+        '   guide/usage\n'
+        '\n'
+        '.. include:: shared.rst\n'
+        '\n'
+        '.. literalinclude:: helper.py\n'
+        '\n'
+        '.. code-block:: bash\n'
+        '\n'
+        '    echo no\n'
+        '\n'
+        '::\n'
+        '\n'
+        '    not_extracted = True\n'
+        '\n'
+        '>>> x = 1\n'
+        '\n'
+        '.. code-block:: python\n'
+        '\n'
+        '    print(os.sep)\n'
+    )
+    (source / 'guide' / 'usage.rst').write_text(
+        'Usage\n=====\n\n.. code-block:: py\n\n    y = 2\n'
+    )
+    (source / 'notes.rst').write_text(':orphan:\n\nNo code.\n')
+
+    return source
+
+
+def _build(source: Path, **overrides: object) -> Path:
+    outdir = source.parent / 'out'
+    app = Sphinx(
+        source,
+        source,
+        outdir,
+        source.parent / 'doctrees',
+        ScriptBuilder.name,
+        confoverrides=overrides,
+        status=None,
+        warning=None,
+    )
+    app.build()
+
+    return outdir
+
+
+def test_build(source: Path) -> None:
+    outdir = _build(source)
+
+    assert (outdir / 'index.py').read_text() == (
+        '# Block 1:\n'
+        'import os\n'
+        '\n'
+        '# Block 2:\n'
+        'def helper(): ...\n'
+        '\n'
+        '# Block 3:\n'
+        'print(os.sep)\n'
+    )
+    assert (outdir / 'guide' / 'usage.py').read_text() == '# Block 1:\ny = 2\n'
+
+
+def test_build_options(source: Path) -> None:
+    outdir = _build(
+        source,
+        rst_extract_doctest=True,
+        rst_extract_header_template='# {number}',
+    )
+
+    assert '# 3\nx = 1\n' in (outdir / 'index.py').read_text()
+
+
+def test_incremental_build(source: Path) -> None:
+    outdir = _build(source)
+    usage = (outdir / 'guide' / 'usage.py').stat().st_mtime_ns
+
+    (source / 'notes.rst').write_text(
+        ':orphan:\n\n.. code-block:: python\n\n    z = 3\n'
+    )
+    _ = _build(source)
+
+    assert (outdir / 'notes.py').read_text() == '# Block 1:\nz = 3\n'
+    assert not (outdir / 'shared.py').exists()
+    assert (outdir / 'guide' / 'usage.py').stat().st_mtime_ns == usage
@@ -14,6 +14,8 @@ from hypothesis import given
 from hypothesis import strategies as st
 
 from rst_extract import Validator
+from rst_extract.sourcemap import SourceMap
+from rst_extract.validator import Validation, validate_extracted
 
 
 def test_validator() -> None:
@@ -71,3 +73,18 @@ def test_validator_hypothesis_invalid_name(bad_code: str) -> None:
     # floated for a bit and discarded. NameErrors are caught at execution time.
     validator = Validator(code=bad_code)
     assert bool(validator) is True
+
+
+def test_validate_extracted() -> None:
+    source_map = SourceMap()
+    source_map.add_generated()
+    source_map.add_lines(source_map.add_source('doc.rst'), [4, 5])
+
+    assert validate_extracted('# Block 1:\nx = 1\ny = 2\n', source_map) == (
+        Validation(True)
+    )
+
+    result = validate_extracted('# Block 1:\nx = 1\ndef f(:\n', source_map)
+
+    assert not result.valid
+    assert (result.filename, result.line) == ('doc.rst', 6)